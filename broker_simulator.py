@@ -0,0 +1,549 @@
+# broker_simulator.py
+# Mercado local que reemplaza a pyRofex para pruebas de carga sin conexión.
+# - Misma superficie que usa ws_rofex.MarketDataManager: initialize, init_websocket_connection,
+#   market_data_subscription, order_report_subscription, send_order_via_websocket,
+#   cancel_order_via_websocket, close_websocket_connection y los enums
+# - Motor de matching por prioridad precio-tiempo, con ejecuciones parciales, IOC/FOK y MARKET
+# - Rechazos (instrumento desconocido, cantidad/precio inválidos, tasa configurable)
+# - Latencia configurable: un hilo despachador entrega órdenes al motor y reportes/market data
+#   a los handlers en orden, como el hilo del websocket de pyRofex
+# - Market maker opcional que mueve precios y repone liquidez
+#
+# Uso:
+#     sim = BrokerSimulator(latency_ms=5)
+#     sim.seed_book("MERV - XMEV - TX26 - 24hs", bids=[(1000, 5000)], offers=[(1001, 5000)])
+#     ws_rofex.manager.start(user="sim", password="-", account="SIM", instrumentos=[...], pyrofex=sim)
+
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from enum import Enum
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+PRINT_PREFIX = "[broker_sim]"
+
+SIM_LATENCY_MS        = float(os.getenv("SIM_LATENCY_MS", "5"))
+SIM_LATENCY_JITTER_MS = float(os.getenv("SIM_LATENCY_JITTER_MS", "0"))
+SIM_REJECT_RATE       = float(os.getenv("SIM_REJECT_RATE", "0"))
+SIM_MM_INTERVAL       = float(os.getenv("SIM_MM_INTERVAL", "1.0"))   # 0 = sin market maker
+SIM_MM_LEVELS         = int(os.getenv("SIM_MM_LEVELS", "5"))
+SIM_DEFAULT_PRICE     = float(os.getenv("SIM_DEFAULT_PRICE", "1000"))
+
+MAKER = "__maker__"
+
+
+# ------------------------------ Enums (pyRofex) ------------------------------
+class Environment(Enum):
+    REMARKET = "REMARKET"
+    LIVE = "LIVE"
+
+
+class MarketDataEntry(Enum):
+    BIDS = "BI"
+    OFFERS = "OF"
+    LAST = "LA"
+    OPENING_PRICE = "OP"
+    CLOSING_PRICE = "CL"
+
+
+class Side(Enum):
+    BUY = "Buy"
+    SELL = "Sell"
+
+
+class OrderType(Enum):
+    LIMIT = "Limit"
+    MARKET = "Market"
+
+
+class TimeInForce(Enum):
+    DAY = "Day"
+    IMMEDIATE_OR_CANCEL = "IOC"
+    FILL_OR_KILL = "FOK"
+
+
+def _enum_value(v: Any, enum_cls) -> str:
+    if isinstance(v, enum_cls):
+        return v.value
+    s = str(v or "")
+    for member in enum_cls:
+        if s.upper() in (member.name, member.value.upper()):
+            return member.value
+    return s
+
+
+# ------------------------------ Motor de matching -----------------------------
+class SimOrder:
+    __slots__ = ("order_id", "cl_ord_id", "ws_cl_ord_id", "account", "symbol", "side", "otype", "tif",
+                 "price", "qty", "cum_qty", "notional", "status", "text")
+
+    def __init__(self, order_id: str, symbol: str, side: str, qty: float, price: Optional[float],
+                 otype: str = OrderType.LIMIT.value, tif: str = TimeInForce.DAY.value,
+                 account: str = MAKER, ws_cl_ord_id: Optional[str] = None) -> None:
+        self.order_id = order_id
+        self.cl_ord_id = order_id
+        self.ws_cl_ord_id = ws_cl_ord_id
+        self.account = account
+        self.symbol = symbol
+        self.side = side
+        self.otype = otype
+        self.tif = tif
+        self.price = price
+        self.qty = qty
+        self.cum_qty = 0.0
+        self.notional = 0.0
+        self.status = "NEW"
+        self.text = ""
+
+    @property
+    def leaves(self) -> float:
+        return self.qty - self.cum_qty
+
+    @property
+    def avg_px(self) -> float:
+        return self.notional / self.cum_qty if self.cum_qty else 0.0
+
+
+class OrderBook:
+    """Libro de un instrumento. Precios ordenados ascendentes; cola FIFO por nivel."""
+
+    def __init__(self, symbol: str) -> None:
+        self.symbol = symbol
+        self.levels: Dict[str, Dict[float, Deque[SimOrder]]] = {Side.BUY.value: {}, Side.SELL.value: {}}
+        self.prices: Dict[str, List[float]] = {Side.BUY.value: [], Side.SELL.value: []}
+        self.last: Optional[Tuple[float, float]] = None
+
+    def best(self, side: str) -> Optional[float]:
+        prices = self.prices[side]
+        if not prices:
+            return None
+        return prices[-1] if side == Side.BUY.value else prices[0]
+
+    def add(self, order: SimOrder) -> None:
+        levels, prices = self.levels[order.side], self.prices[order.side]
+        q = levels.get(order.price)
+        if q is None:
+            q = levels[order.price] = deque()
+            insort(prices, order.price)
+        q.append(order)
+
+    def remove(self, order: SimOrder) -> bool:
+        levels, prices = self.levels[order.side], self.prices[order.side]
+        q = levels.get(order.price)
+        if not q or order not in q:
+            return False
+        q.remove(order)
+        if not q:
+            del levels[order.price]
+            del prices[bisect_left(prices, order.price)]
+        return True
+
+    def _crosses(self, order: SimOrder, level_price: float) -> bool:
+        if order.otype == OrderType.MARKET.value or order.price is None:
+            return True
+        return level_price <= order.price if order.side == Side.BUY.value else level_price >= order.price
+
+    def available(self, order: SimOrder) -> float:
+        """Cantidad contra la que cruzaría la orden (para FOK)."""
+        opp = Side.SELL.value if order.side == Side.BUY.value else Side.BUY.value
+        prices = self.prices[opp]
+        seq = prices if opp == Side.SELL.value else reversed(prices)
+        total = 0.0
+        for p in seq:
+            if not self._crosses(order, p):
+                break
+            total += sum(o.leaves for o in self.levels[opp][p])
+            if total >= order.leaves:
+                break
+        return total
+
+    def match(self, order: SimOrder) -> List[Tuple[SimOrder, float, float]]:
+        """Cruza la orden entrante contra el lado opuesto. Devuelve [(orden pasiva, precio, cantidad)]."""
+        opp = Side.SELL.value if order.side == Side.BUY.value else Side.BUY.value
+        levels, prices = self.levels[opp], self.prices[opp]
+        fills = []
+        while order.leaves > 0 and prices:
+            price = prices[0] if opp == Side.SELL.value else prices[-1]
+            if not self._crosses(order, price):
+                break
+            q = levels[price]
+            while q and order.leaves > 0:
+                maker = q[0]
+                qty = min(order.leaves, maker.leaves)
+                for o in (order, maker):
+                    o.cum_qty += qty
+                    o.notional += qty * price
+                fills.append((maker, price, qty))
+                self.last = (price, qty)
+                if maker.leaves <= 0:
+                    maker.status = "FILLED"
+                    q.popleft()
+                else:
+                    maker.status = "PARTIALLY_FILLED"
+            if not q:
+                del levels[price]
+                if opp == Side.SELL.value:
+                    prices.pop(0)
+                else:
+                    prices.pop()
+        return fills
+
+    def depth(self, side: str, n: int) -> List[Dict[str, float]]:
+        prices = self.prices[side]
+        seq = reversed(prices) if side == Side.BUY.value else prices
+        out = []
+        for p in seq:
+            out.append({"price": p, "size": sum(o.leaves for o in self.levels[side][p])})
+            if len(out) >= n:
+                break
+        return out
+
+
+# --------------------------------- Simulador ----------------------------------
+class BrokerSimulator:
+    """Reemplazo de pyRofex (instancia con la misma interfaz que el módulo)."""
+
+    Environment = Environment
+    MarketDataEntry = MarketDataEntry
+    Side = Side
+    OrderType = OrderType
+    TimeInForce = TimeInForce
+
+    def __init__(
+        self,
+        *,
+        latency_ms: float = SIM_LATENCY_MS,
+        jitter_ms: float = SIM_LATENCY_JITTER_MS,
+        reject_rate: float = SIM_REJECT_RATE,
+        max_order_size: float = 10_000_000,
+        mm_interval: float = SIM_MM_INTERVAL,
+        mm_levels: int = SIM_MM_LEVELS,
+        default_price: float = SIM_DEFAULT_PRICE,
+        seed: int = 0,
+    ) -> None:
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.reject_rate = reject_rate
+        self.max_order_size = max_order_size
+        self.mm_interval = mm_interval
+        self.mm_levels = mm_levels
+        self.default_price = default_price
+        self._rnd = random.Random(seed)
+
+        self._lock = threading.RLock()  # protege libros y órdenes (el matching corre en el despachador)
+        self._books: Dict[str, OrderBook] = {}
+        self._orders: Dict[str, SimOrder] = {}        # clOrdId/wsClOrdId -> orden
+        self._md_subs: Dict[str, int] = {}            # símbolo -> profundidad pedida
+        self._mids: Dict[str, float] = {}
+        self._ids = itertools.count(1)
+        self.account: Optional[str] = None
+
+        self._md_handler: Optional[Callable] = None
+        self._or_handler: Optional[Callable] = None
+        self._error_handler: Optional[Callable] = None
+        self._exception_handler: Optional[Callable] = None
+        self._or_subscribed = False
+
+        # Despachador: (vence, seq, fn, args)
+        self._events: List[Tuple[float, int, Callable, tuple]] = []
+        self._events_cond = threading.Condition()
+        self._event_seq = itertools.count()
+        self._last_due = 0.0
+        self._running = False
+        self._dispatcher: Optional[threading.Thread] = None
+        self._mm_thread: Optional[threading.Thread] = None
+        self._mm_stop = threading.Event()
+        self.stats = {"orders": 0, "fills": 0, "rejected": 0, "cancelled": 0, "reports": 0, "md": 0}
+
+    # ----------------------------- API pyRofex -------------------------------
+    def initialize(self, user: str = "", password: str = "", account: str = "", environment: Any = None, **_: Any) -> None:
+        self.account = account or "SIM"
+
+    def init_websocket_connection(self, market_data_handler=None, order_report_handler=None,
+                                  error_handler=None, exception_handler=None, **_: Any) -> None:
+        self._md_handler = market_data_handler
+        self._or_handler = order_report_handler
+        self._error_handler = error_handler
+        self._exception_handler = exception_handler
+        self._start()
+
+    def close_websocket_connection(self, **_: Any) -> None:
+        self._stop()
+
+    def order_report_subscription(self, *_, **__) -> None:
+        self._or_subscribed = True
+
+    def market_data_subscription(self, tickers: Iterable[str], entries: Any = None, depth: int = 1, **_: Any) -> None:
+        for sym in tickers:
+            with self._lock:
+                self._md_subs[sym] = max(1, int(depth or 1))
+                book = self._books.get(sym)
+            if book is None:
+                mid = self._initial_mid(sym)
+                self.seed_around(sym, mid)
+            else:
+                self._schedule(self._publish_md, sym)
+
+    def send_order_via_websocket(self, ticker: str, size: float, side: Any, order_type: Any = OrderType.LIMIT,
+                                 price: Optional[float] = None, time_in_force: Any = TimeInForce.DAY,
+                                 ws_client_order_id: Optional[str] = None, account: Optional[str] = None,
+                                 **_: Any) -> None:
+        """Como pyRofex: no devuelve nada; el resultado llega por order reports."""
+        if not self._running:
+            raise Exception("Connection is already closed.")
+        order = SimOrder(
+            f"SIM-{next(self._ids)}", ticker, _enum_value(side, Side), float(size),
+            float(price) if price is not None else None,
+            _enum_value(order_type, OrderType), _enum_value(time_in_force, TimeInForce),
+            account or self.account or "SIM", ws_client_order_id,
+        )
+        with self._lock:
+            self._orders[order.cl_ord_id] = order
+            if ws_client_order_id:
+                self._orders[str(ws_client_order_id)] = order
+        self._schedule(self._on_new_order, order)
+
+    def cancel_order_via_websocket(self, client_order_id: str, proprietary: Any = None, **_: Any) -> None:
+        if not self._running:
+            raise Exception("Connection is already closed.")
+        self._schedule(self._on_cancel, str(client_order_id))
+
+    # ------------------------------ Liquidez ---------------------------------
+    def seed_book(self, symbol: str, bids: Iterable[Tuple[float, float]] = (), offers: Iterable[Tuple[float, float]] = ()) -> None:
+        """Reemplaza la liquidez del market maker del símbolo (las órdenes de clientes quedan)."""
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None:
+                book = self._books[symbol] = OrderBook(symbol)
+            for side in (Side.BUY.value, Side.SELL.value):
+                for p in list(book.prices[side]):
+                    for o in [o for o in book.levels[side][p] if o.account == MAKER]:
+                        book.remove(o)
+            for side, levels in ((Side.BUY.value, bids), (Side.SELL.value, offers)):
+                for price, size in levels:
+                    book.add(SimOrder(f"MM-{next(self._ids)}", symbol, side, float(size), float(price)))
+            best_bid, best_offer = book.best(Side.BUY.value), book.best(Side.SELL.value)
+            if best_bid and best_offer:
+                self._mids[symbol] = (best_bid + best_offer) / 2
+        if self._running:
+            self._schedule(self._publish_md, symbol)
+
+    def seed_around(self, symbol: str, mid: float, levels: Optional[int] = None, tick_bps: float = 5.0) -> None:
+        """Libro simétrico alrededor de mid con cantidades aleatorias."""
+        n = levels or self.mm_levels
+        step = mid * tick_bps / 10000.0
+        rnd = self._rnd
+        bids = [(round(mid - step * (i + 0.5), 2), rnd.randint(1, 50) * 1000) for i in range(n)]
+        offers = [(round(mid + step * (i + 0.5), 2), rnd.randint(1, 50) * 1000) for i in range(n)]
+        self.seed_book(symbol, bids, offers)
+
+    def _initial_mid(self, symbol: str) -> float:
+        # Arrancar desde la última cotización conocida si la hay
+        try:
+            from quotes_cache import quotes_cache
+            q = quotes_cache.get(symbol)
+            if q and q.get("bid") and q.get("offer"):
+                return (q["bid"] + q["offer"]) / 2
+            if q and q.get("last"):
+                return q["last"]
+        except Exception:
+            pass
+        return self.default_price
+
+    def _mm_loop(self) -> None:
+        while not self._mm_stop.wait(self.mm_interval):
+            with self._lock:
+                symbols = list(self._md_subs)
+            for sym in symbols:
+                mid = self._mids.get(sym) or self._initial_mid(sym)
+                self.seed_around(sym, mid * (1 + self._rnd.gauss(0, 0.0005)))
+
+    # ------------------------------ Despachador ------------------------------
+    def _start(self) -> None:
+        if self._running:
+            return
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="broker-sim", daemon=True)
+        self._dispatcher.start()
+        if self.mm_interval > 0:
+            self._mm_stop.clear()
+            self._mm_thread = threading.Thread(target=self._mm_loop, name="broker-sim-mm", daemon=True)
+            self._mm_thread.start()
+        print(f"{PRINT_PREFIX} Simulador iniciado (latencia {self.latency_ms} ms, rechazo {self.reject_rate:.1%})")
+
+    def _stop(self) -> None:
+        self._mm_stop.set()
+        with self._events_cond:
+            self._running = False
+            self._events.clear()
+            self._events_cond.notify_all()
+        for t in (self._dispatcher, self._mm_thread):
+            if t and t.is_alive() and t is not threading.current_thread():
+                t.join(timeout=2)
+        self._dispatcher = self._mm_thread = None
+
+    def _schedule(self, fn: Callable, *args: Any) -> None:
+        """Encola un evento con la latencia configurada, sin reordenar respecto de los anteriores."""
+        delay = self.latency_ms
+        if self.jitter_ms:
+            delay += self._rnd.uniform(0, self.jitter_ms)
+        with self._events_cond:
+            due = max(time.monotonic() + delay / 1000.0, self._last_due)
+            self._last_due = due
+            heapq.heappush(self._events, (due, next(self._event_seq), fn, args))
+            self._events_cond.notify()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._events_cond:
+                while self._running and (not self._events or self._events[0][0] > time.monotonic()):
+                    timeout = self._events[0][0] - time.monotonic() if self._events else None
+                    self._events_cond.wait(timeout)
+                if not self._running:
+                    return
+                _, _, fn, args = heapq.heappop(self._events)
+            try:
+                fn(*args)
+            except Exception as e:
+                if self._exception_handler:
+                    self._exception_handler(e)
+                else:
+                    print(f"{PRINT_PREFIX} error en evento: {e}")
+
+    # ------------------------------ Órdenes ----------------------------------
+    def _reject(self, order: SimOrder, text: str) -> None:
+        order.status = "REJECTED"
+        order.text = text
+        self.stats["rejected"] += 1
+        self._emit_report(order)
+
+    def _on_new_order(self, order: SimOrder) -> None:
+        self.stats["orders"] += 1
+        with self._lock:
+            book = self._books.get(order.symbol)
+            if book is None:
+                return self._reject(order, f"Unknown instrument {order.symbol}")
+            if order.qty <= 0 or order.qty > self.max_order_size:
+                return self._reject(order, f"Invalid order size {order.qty}")
+            if order.otype == OrderType.LIMIT.value and (order.price is None or order.price <= 0):
+                return self._reject(order, "Invalid price")
+            if self.reject_rate and self._rnd.random() < self.reject_rate:
+                return self._reject(order, "Simulated rejection")
+
+            if order.tif == TimeInForce.FILL_OR_KILL.value and book.available(order) < order.qty:
+                order.status = "CANCELLED"
+                order.text = "FOK not filled"
+                self.stats["cancelled"] += 1
+                return self._emit_report(order)
+
+            self._emit_report(order)  # NEW
+            fills = book.match(order)
+            for maker, price, qty in fills:
+                self.stats["fills"] += 1
+                if maker.account != MAKER:
+                    self._emit_report(maker, price, qty)
+            if fills:
+                last_px, last_qty = fills[-1][1], fills[-1][2]
+                order.status = "FILLED" if order.leaves <= 0 else "PARTIALLY_FILLED"
+                self._emit_report(order, last_px, sum(q for _, _, q in fills))
+
+            if order.leaves > 0:
+                if order.otype == OrderType.MARKET.value or order.tif == TimeInForce.IMMEDIATE_OR_CANCEL.value:
+                    order.status = "CANCELLED"
+                    self.stats["cancelled"] += 1
+                    self._emit_report(order)
+                else:
+                    book.add(order)
+        self._schedule(self._publish_md, order.symbol)
+
+    def _on_cancel(self, client_order_id: str) -> None:
+        with self._lock:
+            order = self._orders.get(client_order_id)
+            if order is None or order.status in ("FILLED", "CANCELLED", "REJECTED"):
+                if self._error_handler:
+                    self._error_handler({"status": "ERROR", "description": f"Order {client_order_id} not cancellable"})
+                return
+            book = self._books.get(order.symbol)
+            if book:
+                book.remove(order)
+            order.status = "CANCELLED"
+            self.stats["cancelled"] += 1
+            self._emit_report(order)
+        self._schedule(self._publish_md, order.symbol)
+
+    def _emit_report(self, order: SimOrder, last_px: Optional[float] = None, last_qty: float = 0.0) -> None:
+        if order.account == MAKER:
+            return
+        report = {
+            "orderId": order.order_id,
+            "clOrdId": order.cl_ord_id,
+            "proprietary": "PBCP",
+            "execId": f"EX-{next(self._ids)}",
+            "accountId": {"id": order.account},
+            "instrumentId": {"marketId": "ROFX", "symbol": order.symbol},
+            "price": order.price,
+            "orderQty": order.qty,
+            "ordType": order.otype.upper(),
+            "side": order.side.upper(),
+            "timeInForce": order.tif.upper(),
+            "transactTime": time.strftime("%Y%m%d-%H:%M:%S"),
+            "avgPx": round(order.avg_px, 6),
+            "lastPx": last_px,
+            "lastQty": last_qty,
+            "cumQty": order.cum_qty,
+            "leavesQty": order.leaves if order.status not in ("CANCELLED", "REJECTED") else 0.0,
+            "status": order.status,
+            "text": order.text,
+        }
+        if order.ws_cl_ord_id:
+            report["wsClOrdId"] = order.ws_cl_ord_id
+        self.stats["reports"] += 1
+        if self._or_handler and self._or_subscribed:
+            # Cada reporte viaja con su propia latencia hacia el cliente
+            self._schedule(self._or_handler, {"type": "or", "orderReport": report})
+
+    # ------------------------------ Market data ------------------------------
+    def md_message(self, symbol: str, depth: int = 1) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None:
+                return None
+            md: Dict[str, Any] = {
+                "BI": book.depth(Side.BUY.value, depth),
+                "OF": book.depth(Side.SELL.value, depth),
+            }
+            if book.last:
+                md["LA"] = {"price": book.last[0], "size": book.last[1], "date": int(time.time() * 1000)}
+        return {"type": "Md", "timestamp": int(time.time() * 1000),
+                "instrumentId": {"marketId": "ROFX", "symbol": symbol}, "marketData": md}
+
+    def _publish_md(self, symbol: str) -> None:
+        depth = self._md_subs.get(symbol)
+        if not depth or not self._md_handler:
+            return
+        msg = self.md_message(symbol, depth)
+        if msg:
+            self.stats["md"] += 1
+            self._md_handler(msg)
+
+    # -------------------------------- Estado ---------------------------------
+    def order(self, client_order_id: str) -> Optional[SimOrder]:
+        return self._orders.get(client_order_id)
+
+    def book(self, symbol: str) -> Optional[OrderBook]:
+        return self._books.get(symbol)
+
+    def status(self) -> Dict[str, Any]:
+        with self._events_cond:
+            pending = len(self._events)
+        return {"running": self._running, "symbols": sorted(self._books), "pending_events": pending, **self.stats}
+
+
+simulator = BrokerSimulator()
@@ -0,0 +1,130 @@
+# depth_book.py
+# Libro de profundidad por símbolo (BI/OF completos de pyRofex).
+# - Representación compacta: precios y cantidades en array('d') por lado
+# - Inmutable: cada mensaje de market data reemplaza el libro entero (lecturas sin lock)
+# - Consultas desde el lado que toma liquidez: "sell" recorre bids, "buy" recorre offers
+
+from __future__ import annotations
+
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+# Niveles por lado que se piden a pyRofex y se guardan en el libro
+MD_DEPTH_LEVELS = max(1, int(os.getenv("MD_DEPTH_LEVELS", "5")))
+
+
+def _level(lv: Any) -> Tuple[Optional[float], Optional[float]]:
+    if isinstance(lv, dict):
+        p = lv.get("price")
+        if p is None:
+            p = lv.get("p")
+        s = lv.get("size")
+        if s is None:
+            s = lv.get("s")
+    elif isinstance(lv, (list, tuple)) and len(lv) >= 2:
+        p, s = lv[0], lv[1]
+    else:
+        return None, None
+    try:
+        return (float(p) if p is not None else None), (float(s) if s is not None else None)
+    except (TypeError, ValueError):
+        return None, None
+
+
+def _pack(levels: Any, max_levels: int) -> Tuple[array, array]:
+    prices, sizes = array("d"), array("d")
+    if isinstance(levels, dict):
+        levels = [levels]
+    if not isinstance(levels, (list, tuple)):
+        return prices, sizes
+    for lv in levels:
+        p, s = _level(lv)
+        # Niveles sin precio o sin cantidad no aportan liquidez
+        if not p or not s or s <= 0:
+            continue
+        prices.append(p)
+        sizes.append(s)
+        if len(prices) >= max_levels:
+            break
+    return prices, sizes
+
+
+class DepthBook:
+    """Profundidad de un símbolo: bids de mejor a peor precio, offers ídem."""
+
+    __slots__ = ("symbol", "bid_px", "bid_sz", "offer_px", "offer_sz", "ts_ms")
+
+    def __init__(self, symbol: str, bid_px: array, bid_sz: array, offer_px: array, offer_sz: array, ts_ms: int = 0) -> None:
+        set_ = object.__setattr__
+        set_(self, "symbol", symbol)
+        set_(self, "bid_px", bid_px)
+        set_(self, "bid_sz", bid_sz)
+        set_(self, "offer_px", offer_px)
+        set_(self, "offer_sz", offer_sz)
+        set_(self, "ts_ms", ts_ms)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("DepthBook es inmutable")
+
+    @classmethod
+    def from_levels(cls, symbol: str, bids: Any, offers: Any, max_levels: int = MD_DEPTH_LEVELS, ts_ms: int = 0) -> "DepthBook":
+        """Arma el libro desde listas de niveles ({"price","size"}, {"p","s"} o (precio, cantidad))."""
+        bid_px, bid_sz = _pack(bids, max_levels)
+        offer_px, offer_sz = _pack(offers, max_levels)
+        return cls(symbol, bid_px, bid_sz, offer_px, offer_sz, ts_ms)
+
+    def _side(self, side: str) -> Tuple[array, array, bool]:
+        # Devuelve (precios, cantidades, es_venta)
+        s = side.lower()
+        if s in ("sell", "bid", "bids"):
+            return self.bid_px, self.bid_sz, True
+        if s in ("buy", "offer", "offers", "ask"):
+            return self.offer_px, self.offer_sz, False
+        raise ValueError(f"lado inválido: {side}")
+
+    def levels(self, side: str) -> List[Tuple[float, float]]:
+        prices, sizes, _ = self._side(side)
+        return list(zip(prices, sizes))
+
+    def volume_up_to(self, side: str, price: float) -> float:
+        """Cantidad ejecutable con una orden límite a `price`.
+
+        Venta: suma de bids con precio >= price. Compra: suma de offers con precio <= price.
+        """
+        prices, sizes, selling = self._side(side)
+        total = 0.0
+        for i in range(len(prices)):
+            p = prices[i]
+            if (p < price) if selling else (p > price):
+                break
+            total += sizes[i]
+        return total
+
+    def vwap_for_size(self, side: str, size: float) -> Tuple[Optional[float], float]:
+        """(VWAP, cantidad cubierta) recorriendo el libro hasta `size`.
+
+        Si la profundidad no alcanza, la cantidad cubierta es menor que `size`.
+        """
+        prices, sizes, _ = self._side(side)
+        remaining = float(size)
+        notional = filled = 0.0
+        for i in range(len(prices)):
+            if remaining <= 0:
+                break
+            take = sizes[i] if sizes[i] < remaining else remaining
+            notional += take * prices[i]
+            filled += take
+            remaining -= take
+        return (notional / filled if filled else None), filled
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "symbol": self.symbol,
+            "bids": self.levels("bid"),
+            "offers": self.levels("offer"),
+            "ts_ms": self.ts_ms,
+        }
+
+    def __repr__(self) -> str:
+        return f"DepthBook({self.symbol!r}, bids={len(self.bid_px)}, offers={len(self.offer_px)})"
@@ -0,0 +1,239 @@
+# execution_algos.py
+# Algoritmos de ejecución para las operaciones de ratio (RealRatioOperationManager).
+# - Cada algoritmo decide cuánto ejecutar ahora y cuánto esperar como máximo la próxima cotización
+# - El manager re-evalúa con cada cambio del par en el quote store (seq por símbolo), no con sleeps
+# - adaptive:  comportamiento histórico (80% de la liquidez, optimización del ratio ponderado, espera acotada)
+# - twap:      reparte los nominales en tramos iguales a lo largo de una duración
+# - pov:       participa con un % de la liquidez visible, solo sobre libros nuevos
+# - threshold: oportunista, toma toda la liquidez libre mientras el ratio mejore el objetivo en N bps
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple, Type
+
+PRINT_PREFIX = "[execution_algos]"
+
+
+def check_condition(ratio: float, target: float, condition: str) -> bool:
+    """¿El ratio cumple la condición contra el objetivo?"""
+    if condition in ("less_than_or_equal", "<="):
+        return ratio <= target
+    if condition in ("greater_than_or_equal", ">="):
+        return ratio >= target
+    if condition in ("less_than", "<"):
+        return ratio < target
+    if condition in ("greater_than", ">"):
+        return ratio > target
+    if condition in ("equal", "=="):
+        return abs(ratio - target) < 0.001
+    print(f"{PRINT_PREFIX} Condición no reconocida: {condition}")
+    return False
+
+
+def improvement_bps(ratio: float, target: float, condition: str) -> float:
+    """Cuánto mejora el ratio al objetivo (bps, positivo = mejor) según el sentido de la condición."""
+    if not target:
+        return 0.0
+    diff = (ratio - target) / target * 10000.0
+    return -diff if condition in ("less_than_or_equal", "less_than", "<=", "<") else diff
+
+
+@dataclass
+class AlgoContext:
+    """Estado de la operación y del mercado en el momento de decidir."""
+    nominales: float
+    remaining: float
+    executed: float
+    lots: int                # lotes ya ejecutados
+    sell_liquidity: float    # liquidez libre (descontadas reservas de otras operaciones)
+    buy_liquidity: float
+    current_ratio: float
+    weighted_ratio: float
+    target_ratio: float
+    condition: str
+    quote_seq: int           # crece con cada cotización nueva del par
+
+
+@dataclass
+class Decision:
+    quantity: float          # nominales a ejecutar ahora (0 = esperar)
+    reason: str
+    wait_s: float = 5.0      # espera máxima por la próxima cotización antes de re-evaluar
+    stop: bool = False       # el algoritmo no puede seguir (p.ej. sin liquidez)
+
+
+class ExecutionAlgo:
+    """Interfaz: decide() con cada cotización nueva; on_lot() después de cada lote ejecutado."""
+
+    name = ""
+
+    def __init__(self, **params: Any) -> None:
+        self.params = params
+        self.started_at = time.monotonic()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def decide(self, ctx: AlgoContext) -> Decision:
+        raise NotImplementedError
+
+    def on_lot(self, ctx: AlgoContext, executed: float) -> None:
+        pass
+
+    def describe(self) -> str:
+        params = ", ".join(f"{k}={v}" for k, v in self.params.items())
+        return f"{self.name}({params})"
+
+
+def _available(ctx: AlgoContext) -> float:
+    return max(0.0, min(ctx.sell_liquidity, ctx.buy_liquidity))
+
+
+class AdaptiveAlgo(ExecutionAlgo):
+    """Lote = safety_factor de la liquidez; decide con la heurística de ratio ponderado del manager.
+
+    Si la heurística pide esperar más de max_wait_s seguidos, ejecuta igual.
+    """
+
+    name = "adaptive"
+
+    def __init__(self, safety_factor: float = 0.8, max_wait_s: float = 50.0, retry_wait_s: float = 5.0,
+                 should_execute: Optional[Callable[..., Tuple[bool, str]]] = None) -> None:
+        super().__init__(safety_factor=safety_factor, max_wait_s=max_wait_s, retry_wait_s=retry_wait_s)
+        self.safety_factor = float(safety_factor)
+        self.max_wait_s = float(max_wait_s)
+        self.retry_wait_s = float(retry_wait_s)
+        self.should_execute = should_execute
+        self._waiting_since: Optional[float] = None
+
+    def decide(self, ctx: AlgoContext) -> Decision:
+        available = _available(ctx)
+        if available <= 0:
+            return Decision(0.0, "Sin liquidez suficiente para continuar", stop=True)
+        lot = min(available * self.safety_factor, ctx.remaining)
+        if self.should_execute is not None:
+            ok, reason = self.should_execute(ctx.current_ratio, ctx.target_ratio, ctx.condition, ctx.weighted_ratio,
+                                             ctx.lots, lot, ctx.remaining, ctx.executed)
+        else:
+            ok = check_condition(ctx.current_ratio, ctx.target_ratio, ctx.condition)
+            reason = f"Condición {'cumplida' if ok else 'no cumple'}: {ctx.current_ratio:.6f} vs {ctx.target_ratio:.6f}"
+        if ok:
+            self._waiting_since = None
+            return Decision(lot, reason)
+        now = time.monotonic()
+        if self._waiting_since is None:
+            self._waiting_since = now
+        waited = now - self._waiting_since
+        if waited >= self.max_wait_s:
+            self._waiting_since = None
+            return Decision(lot, f"TIMEOUT: ejecutando después de {waited:.0f}s de espera ({reason})")
+        return Decision(0.0, reason, wait_s=self.retry_wait_s)
+
+
+class TWAPAlgo(ExecutionAlgo):
+    """Objetivo acumulado lineal en el tiempo: slices tramos iguales en duration_s.
+
+    Solo ejecuta si el ratio cumple la condición; lo atrasado se recupera en el próximo tramo favorable.
+    """
+
+    name = "twap"
+
+    def __init__(self, duration_s: float = 300.0, slices: int = 10, max_fraction: float = 1.0) -> None:
+        super().__init__(duration_s=duration_s, slices=slices, max_fraction=max_fraction)
+        self.duration_s = max(0.0, float(duration_s))
+        self.slices = max(1, int(slices))
+        self.max_fraction = float(max_fraction)
+
+    def decide(self, ctx: AlgoContext) -> Decision:
+        slice_s = self.duration_s / self.slices
+        elapsed = self.elapsed()
+        n = self.slices if slice_s <= 0 else min(self.slices, int(elapsed // slice_s) + 1)
+        due = ctx.nominales * n / self.slices - ctx.executed
+        next_slice = max(0.05, slice_s * n - elapsed) if n < self.slices else 5.0
+        if due <= 0:
+            return Decision(0.0, f"Tramo {n}/{self.slices} cubierto", wait_s=next_slice)
+        if not check_condition(ctx.current_ratio, ctx.target_ratio, ctx.condition):
+            return Decision(0.0, f"Tramo {n}/{self.slices}: ratio {ctx.current_ratio:.6f} no cumple", wait_s=next_slice)
+        qty = min(due, ctx.remaining, _available(ctx) * self.max_fraction)
+        if qty <= 0:
+            return Decision(0.0, f"Tramo {n}/{self.slices}: sin liquidez libre", wait_s=next_slice)
+        return Decision(qty, f"Tramo {n}/{self.slices}: {qty:.0f} de {due:.0f} pendientes", wait_s=next_slice)
+
+
+class POVAlgo(ExecutionAlgo):
+    """Participación: participation de la liquidez visible, una vez por estado del libro.
+
+    Después de un lote espera una cotización nueva del par antes de volver a tomar.
+    """
+
+    name = "pov"
+
+    def __init__(self, participation: float = 0.2, min_lot: float = 1.0) -> None:
+        super().__init__(participation=participation, min_lot=min_lot)
+        self.participation = min(1.0, max(0.0, float(participation)))
+        self.min_lot = float(min_lot)
+        self._last_seq: Optional[int] = None
+
+    def decide(self, ctx: AlgoContext) -> Decision:
+        if self._last_seq is not None and ctx.quote_seq <= self._last_seq:
+            return Decision(0.0, "Esperando un libro nuevo")
+        if not check_condition(ctx.current_ratio, ctx.target_ratio, ctx.condition):
+            return Decision(0.0, f"Ratio {ctx.current_ratio:.6f} no cumple")
+        qty = min(_available(ctx) * self.participation, ctx.remaining)
+        if qty < self.min_lot:
+            return Decision(0.0, f"Participación {self.participation:.0%} menor al lote mínimo ({qty:.2f})")
+        return Decision(qty, f"Participación {self.participation:.0%} de {_available(ctx):.0f} visibles")
+
+    def on_lot(self, ctx: AlgoContext, executed: float) -> None:
+        self._last_seq = ctx.quote_seq
+
+
+class ThresholdAlgo(ExecutionAlgo):
+    """Oportunista: toma max_fraction de la liquidez libre cuando el ratio mejora el objetivo en improve_bps."""
+
+    name = "threshold"
+
+    def __init__(self, improve_bps: float = 0.0, max_fraction: float = 1.0) -> None:
+        super().__init__(improve_bps=improve_bps, max_fraction=max_fraction)
+        self.improve_bps = float(improve_bps)
+        self.max_fraction = float(max_fraction)
+
+    def decide(self, ctx: AlgoContext) -> Decision:
+        if not check_condition(ctx.current_ratio, ctx.target_ratio, ctx.condition):
+            return Decision(0.0, f"Ratio {ctx.current_ratio:.6f} no cumple")
+        edge = improvement_bps(ctx.current_ratio, ctx.target_ratio, ctx.condition)
+        if edge < self.improve_bps:
+            return Decision(0.0, f"Mejora {edge:.1f} bps < {self.improve_bps:g} bps")
+        qty = min(_available(ctx) * self.max_fraction, ctx.remaining)
+        if qty <= 0:
+            return Decision(0.0, "Sin liquidez libre")
+        return Decision(qty, f"Mejora {edge:.1f} bps: tomando {qty:.0f}")
+
+
+ALGOS: Dict[str, Type[ExecutionAlgo]] = {}
+
+
+def register_algo(cls: Type[ExecutionAlgo]) -> Type[ExecutionAlgo]:
+    """Registra un algoritmo por su name (usable como decorador)."""
+    ALGOS[cls.name] = cls
+    return cls
+
+
+for _cls in (AdaptiveAlgo, TWAPAlgo, POVAlgo, ThresholdAlgo):
+    register_algo(_cls)
+
+
+def create_algo(name: str, params: Optional[Dict[str, Any]] = None, **hooks: Any) -> ExecutionAlgo:
+    """Instancia el algoritmo `name` con sus parámetros. ValueError si no existe o los parámetros no sirven."""
+    cls = ALGOS.get((name or "").lower())
+    if cls is None:
+        raise ValueError(f"algoritmo de ejecución desconocido: {name} (disponibles: {', '.join(sorted(ALGOS))})")
+    kwargs = dict(params or {})
+    if cls is AdaptiveAlgo:
+        kwargs.update(hooks)
+    try:
+        return cls(**kwargs)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"parámetros inválidos para {name}: {e}") from e
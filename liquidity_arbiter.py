@@ -0,0 +1,90 @@
+# liquidity_arbiter.py
+# Arbitraje de liquidez por instrumento entre operaciones concurrentes.
+# - Cada operación reserva la cantidad que va a tomar de un (instrumento, lado) antes de enviar la orden
+# - Lo que ve una operación es la liquidez publicada menos lo reservado por las demás
+# - La reserva se libera cuando llega el order report decisivo o termina la pata
+# - Thread-safe: se llama desde el event loop y desde los callbacks de pyRofex
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+PRINT_PREFIX = "[liquidity_arbiter]"
+
+Key = Tuple[str, str]
+
+
+def _key(instrument: str, side: str) -> Key:
+    s = side.lower()
+    # "sell" toma bids, "buy" toma offers: se normaliza al lado que se consume
+    return instrument, ("sell" if s in ("sell", "bid", "bids") else "buy")
+
+
+class LiquidityArbiter:
+    """Reservas de cantidad por (instrumento, lado) y por dueño (operation_id)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._reserved: Dict[Key, Dict[str, float]] = {}
+        self._stats = {"reservations": 0, "trimmed": 0, "denied": 0}
+
+    def reserved(self, instrument: str, side: str, exclude: Optional[str] = None) -> float:
+        """Cantidad reservada en (instrumento, lado), sin contar la de `exclude`."""
+        with self._lock:
+            owners = self._reserved.get(_key(instrument, side))
+            if not owners:
+                return 0.0
+            return sum(q for owner, q in owners.items() if owner != exclude)
+
+    def available(self, owner: str, instrument: str, side: str, published: float) -> float:
+        """Liquidez publicada menos lo reservado por otras operaciones."""
+        return max(0.0, float(published or 0) - self.reserved(instrument, side, exclude=owner))
+
+    def reserve(self, owner: str, instrument: str, side: str, quantity: float, published: float) -> float:
+        """Reserva hasta `quantity` de lo que queda libre en `published`. Devuelve lo concedido.
+
+        La reserva reemplaza la anterior del mismo dueño en ese (instrumento, lado).
+        """
+        key = _key(instrument, side)
+        with self._lock:
+            owners = self._reserved.setdefault(key, {})
+            others = sum(q for o, q in owners.items() if o != owner)
+            granted = max(0.0, min(float(quantity), float(published or 0) - others))
+            self._stats["reservations"] += 1
+            if granted <= 0:
+                self._stats["denied"] += 1
+                owners.pop(owner, None)
+                if not owners:
+                    del self._reserved[key]
+                return 0.0
+            if granted < quantity:
+                self._stats["trimmed"] += 1
+            owners[owner] = granted
+            return granted
+
+    def release(self, owner: str, instrument: Optional[str] = None, side: Optional[str] = None) -> None:
+        """Libera la reserva de `owner` en (instrumento, lado), o todas si no se indica."""
+        with self._lock:
+            if instrument is not None and side is not None:
+                keys = [_key(instrument, side)]
+            else:
+                keys = [k for k, owners in self._reserved.items() if owner in owners]
+            for key in keys:
+                owners = self._reserved.get(key)
+                if owners is None:
+                    continue
+                owners.pop(owner, None)
+                if not owners:
+                    del self._reserved[key]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "reserved": {f"{inst}|{side}": dict(owners) for (inst, side), owners in self._reserved.items()},
+                **self._stats,
+            }
+
+
+# Instancia global compartida por todas las operaciones
+arbiter = LiquidityArbiter()
@@ -19,7 +19,11 @@ try:
 except ImportError:
 	pass
 
-from supabase_client import get_active_pairs
+from supabase_client import get_active_pairs, get_lote_stats
+from ws_hub import WSHub, DROP_OLDEST
+from quotes_cache import get_snapshot_records as get_quotes_snapshot, get_stale as get_stale_quotes
+import quotes_cache
+import broker_simulator
 import uuid
 
 
@@ -125,6 +129,12 @@ async def lifespan(app: FastAPI):
     else:
         print("[main] Telegram polling deshabilitado por TELEGRAM_POLLING!=1")
     
+    # Barrido de cotizaciones viejas
+    try:
+        quotes_cache.start_stale_sweep()
+    except Exception as e:
+        print(f"[main] No se pudo iniciar barrido de cotizaciones: {e}")
+    
     # Iniciar worker de refresh de dashboard (si está disponible)
     try:
         start_refresh_worker()
@@ -156,10 +166,14 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"[shutdown] Error deteniendo dashboard worker: {e}")
     
+    try:
+        quotes_cache.stop_stale_sweep()
+    except Exception as e:
+        print(f"[shutdown] Error deteniendo barrido de cotizaciones: {e}")
+    
     # Limpiar conexiones WebSocket
     try:
-        with _websocket_lock:
-            _websocket_connections.clear()
+        _ws_hub.clear()
         with _dashboard_lock:
             _dashboard_subscribers.clear()
     except Exception as e:
@@ -357,9 +371,12 @@ def _instruments_from_pairs(pairs) -> list[str]:
 
 class IniciarRequest(BaseModel):
     user: str
-    password: str
-    account: str
+    password: str = ""
+    account: str = ""
     instrumentos: List[str]
+    source: str = "rofex"            # rofex | replay | simulator
+    replay_path: str | None = None   # archivo o directorio grabado por md_recorder
+    replay_speed: float | str = 1.0  # 1 = tiempos originales, N = N veces, "max" = sin esperas
 
 class OrderSubscribeRequest(BaseModel):
     account: str
@@ -379,14 +396,38 @@ class SendOrderRequest(BaseModel):
 @app.post("/cotizaciones/iniciar")
 def iniciar(req: IniciarRequest):
     try:
-        # Iniciar WebSocket Rofex
-        ws_result = ws_rofex.manager.start(
-            user=req.user,
-            password=req.password,
-            account=req.account,
-            instrumentos=req.instrumentos,
-            force_ws=True
-        )
+        if req.source == "replay":
+            # Replay de una grabación en lugar de la sesión ROFEX
+            if not req.replay_path:
+                return {"status": "error", "message": "replay_path es obligatorio con source=replay"}
+            ws_result = ws_rofex.manager.start_replay(
+                path=req.replay_path,
+                speed=req.replay_speed,
+                instrumentos=req.instrumentos,
+                user=req.user,
+            )
+        elif req.source == "simulator":
+            # Mercado local (broker_simulator): órdenes y market data sin conexión a ROFEX
+            ws_result = ws_rofex.manager.start(
+                user=req.user,
+                password=req.password,
+                account=req.account or "SIM",
+                instrumentos=req.instrumentos,
+                pyrofex=broker_simulator.simulator,
+            )
+        elif req.source == "rofex":
+            if not req.password or not req.account:
+                return {"status": "error", "message": "password y account son obligatorios con source=rofex"}
+            # Iniciar WebSocket Rofex
+            ws_result = ws_rofex.manager.start(
+                user=req.user,
+                password=req.password,
+                account=req.account,
+                instrumentos=req.instrumentos,
+                force_ws=True
+            )
+        else:
+            return {"status": "error", "message": f"source inválido: {req.source} (rofex | replay | simulator)"}
         
         if ws_result.get("status") == "started":
             # Iniciar worker solo si WebSocket se conectó exitosamente
@@ -401,7 +442,7 @@ def iniciar(req: IniciarRequest):
                 account=req.account,
                 instruments=req.instrumentos,
                 worker_running=True,
-                ws_connected=True
+                ws_connected=req.source != "replay"
             )
             
             print(f"[main] Servicio iniciado para usuario {req.user}")
@@ -509,6 +550,19 @@ def orders_last_report():
         _append_order_log({"endpoint": "last_report", "error": str(e)})
         return {"status": "error", "message": str(e)}
 
+@app.get("/cotizaciones/orders/report/{client_order_id}")
+def orders_report(client_order_id: str):
+    """Último reporte e historial de estados de una orden puntual."""
+    try:
+        return {
+            "status": "ok",
+            "client_order_id": client_order_id,
+            "report": ws_rofex.manager.order_report(client_order_id),
+            "history": ws_rofex.manager.order_report_history(client_order_id),
+        }
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
 @app.get("/cotizaciones/orders/logs")
 def orders_logs(limit: int = 100):
     try:
@@ -533,6 +587,7 @@ def estado():
         status.update({
             "worker_status": worker_status,
             "ws_details": ws_status,
+            "db_writes": get_lote_stats(),
             "uptime": time.time() - status["started_at"] if status["started_at"] else None
         })
         
@@ -543,6 +598,61 @@ def estado():
         print(f"[main] Error al obtener estado: {e}")
         return {"status": "error", "message": f"Error al obtener estado: {str(e)}"}
 
+@app.get("/cotizaciones/ratios/live")
+def ratios_live():
+    """Último cálculo en memoria de cada par (en modo eventos se actualiza con cada tick)."""
+    try:
+        from ratios_worker import get_live_ratios, EVENT_MODE
+        rows = get_live_ratios()
+        return {"status": "ok", "event_mode": EVENT_MODE, "count": len(rows), "ratios": rows}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/cotizaciones/rules/status")
+def rules_status():
+    """Estado del cache de reglas y reglas rechazadas por expr inválida."""
+    try:
+        from strategy_engine import rules_cache_stats, invalid_rules
+        return {"status": "ok", "cache": rules_cache_stats(), "invalid_rules": invalid_rules()}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/cotizaciones/rules/state")
+def rules_state():
+    """Estado por regla de las alertas por flanco (activa, armada, cooldown, disparos)."""
+    try:
+        from strategy_engine import rule_states
+        states = rule_states()
+        return {"status": "ok", "count": len(states), "rules": states, "timestamp": time.time()}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/cotizaciones/quotes/stale")
+def quotes_stale():
+    """Instrumentos sin cotizar hace más de QUOTES_MAX_AGE_MS (marcados por el barrido)."""
+    stale = get_stale_quotes()
+    return {
+        "status": "ok",
+        "max_age_ms": quotes_cache.QUOTES_MAX_AGE_MS,
+        "count": len(stale),
+        "stale": stale,
+        "timestamp": time.time()
+    }
+
+@app.get("/cotizaciones/quotes/depth/{symbol}")
+def quotes_depth(symbol: str):
+    """Libro de profundidad del instrumento (MD_DEPTH_LEVELS niveles por lado)."""
+    book = quotes_cache.get_depth(symbol)
+    if book is None:
+        return {"status": "error", "message": f"Sin libro de profundidad para {symbol}"}
+    return {"status": "ok", "depth": book.to_dict(), "timestamp": time.time()}
+
+@app.get("/cotizaciones/ratio_operations/scheduler")
+def ratio_operations_scheduler():
+    """Operaciones de ratio corriendo / encoladas y reservas de liquidez por instrumento."""
+    from ratio_operations_real import real_ratio_manager
+    return {"status": "ok", "scheduler": real_ratio_manager.get_scheduler_status(), "timestamp": time.time()}
+
 @app.get("/cotizaciones/health")
 def health():
     """Endpoint de salud simple para verificar que la API está funcionando"""
@@ -556,8 +666,7 @@ def health():
 def detailed_health():
     """Endpoint de salud detallado con información del sistema."""
     try:
-        with _websocket_lock:
-            ws_count = len(_websocket_connections)
+        ws_count = len(_ws_hub)
         with _dashboard_lock:
             dashboard_subs = len(_dashboard_subscribers)
         
@@ -573,15 +682,25 @@ def detailed_health():
         return {"status": "error", "error": str(e), "timestamp": time.time()}
 
 
-# WebSocket connections
-_websocket_connections = []
-_websocket_lock = threading.Lock()
-_event_loop: Optional[asyncio.AbstractEventLoop] = None
-
 # Límites de seguridad para conexiones
 MAX_WEBSOCKET_CONNECTIONS = 100  # Máximo 100 conexiones WebSocket
 MAX_DASHBOARD_SUBSCRIBERS = 50   # Máximo 50 suscriptores del dashboard
 
+# Cola de envío por conexión y política ante clientes lentos (drop_oldest | conflate | disconnect)
+WS_SEND_QUEUE_MAX = int(os.getenv("WS_SEND_QUEUE_MAX", "1000"))
+WS_SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", DROP_OLDEST)
+# Conflación por símbolo: máximo de envíos por segundo por símbolo y conexión (0 = cada tick)
+WS_CONFLATE_HZ = float(os.getenv("WS_CONFLATE_HZ", "0"))
+
+# WebSocket connections (con suscripciones por símbolo/canal)
+_ws_hub = WSHub(
+    max_connections=MAX_WEBSOCKET_CONNECTIONS,
+    max_queue=WS_SEND_QUEUE_MAX,
+    slow_policy=WS_SLOW_CONSUMER_POLICY,
+    conflate_hz=WS_CONFLATE_HZ,
+)
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
 # Dashboard subscribers
 _dashboard_subscribers = []
 _dashboard_lock = threading.Lock()
@@ -747,14 +866,12 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"[websocket] Nueva conexión desde {websocket.client.host}:{websocket.client.port}")
         
         # Verificar límite de conexiones antes de agregar
-        with _websocket_lock:
-            if len(_websocket_connections) >= MAX_WEBSOCKET_CONNECTIONS:
-                await websocket.close(code=1013, reason="Too many connections")
-                print(f"[websocket] Conexión rechazada: límite de {MAX_WEBSOCKET_CONNECTIONS} alcanzado")
-                return
-            
-            _websocket_connections.append(websocket)
-            print(f"[websocket] Conexiones activas: {len(_websocket_connections)}/{MAX_WEBSOCKET_CONNECTIONS}")
+        if not _ws_hub.add(websocket):
+            await websocket.close(code=1013, reason="Too many connections")
+            print(f"[websocket] Conexión rechazada: límite de {MAX_WEBSOCKET_CONNECTIONS} alcanzado")
+            return
+        print(f"[websocket] Conexiones activas: {len(_ws_hub)}/{MAX_WEBSOCKET_CONNECTIONS}")
+        _ws_hub.start_writer(websocket)
         
         # Enviar mensaje de bienvenida
         await websocket.send_text(json.dumps({
@@ -796,17 +913,73 @@ async def websocket_endpoint(websocket: WebSocket):
                             "type": "pong",
                             "timestamp": time.time()
                         }))
-                    elif message.get("type") == "subscribe":
-                        # Suscribir a cotizaciones específicas
+                    elif _cmd in ("subscribe", "unsubscribe"):
+                        # Suscribir/desuscribir símbolos y canales (ticks, order_reports, ratios);
+                        # "ratios" requiere user_id (y opcionalmente client_id) para acotar los pares
+                        symbols = message.get("instruments") or message.get("symbols") or []
+                        channels = message.get("channels")
+                        try:
+                            if _cmd == "subscribe":
+                                sub = _ws_hub.subscribe(websocket, symbols, channels, message.get("mode"),
+                                                        message.get("user_id"), message.get("client_id"),
+                                                        message.get("max_rate_hz"))
+                            else:
+                                sub = _ws_hub.unsubscribe(websocket, symbols, channels)
+                        except (ValueError, TypeError, KeyError) as e:
+                            await websocket.send_text(json.dumps({
+                                "type": "error",
+                                "message": str(e),
+                                "timestamp": time.time()
+                            }))
+                            continue
+                        await websocket.send_text(json.dumps({
+                            "type": "subscribed" if _cmd == "subscribe" else "unsubscribed",
+                            "instruments": sub["symbols"],
+                            "channels": sub["channels"],
+                            "mode": sub.get("mode", "full"),
+                            "timestamp": time.time()
+                        }))
+                        # Estado actual de cada símbolo desde quotes_cache; luego solo ticks con seq mayor
+                        if _cmd == "subscribe" and "ticks" in sub["channels"] and message.get("snapshot", True):
+                            _ws_hub.send_snapshot(websocket, symbols, get_quotes_snapshot())
+                    elif _cmd == "resync":
+                        # El cliente detectó un hueco de seq: reenviar estado completo
+                        try:
+                            count = _ws_hub.send_snapshot(
+                                websocket, message.get("instruments") or message.get("symbols"),
+                                get_quotes_snapshot()
+                            )
+                        except KeyError as e:
+                            await websocket.send_text(json.dumps({
+                                "type": "error",
+                                "message": str(e),
+                                "timestamp": time.time()
+                            }))
+                            continue
+                        await websocket.send_text(json.dumps({
+                            "type": "resync",
+                            "count": count,
+                            "timestamp": time.time()
+                        }))
+                    elif _cmd == "set_conflation":
+                        # Último estado por símbolo a lo sumo max_rate_hz veces por segundo (0 = apagado)
+                        try:
+                            rate = _ws_hub.set_conflation(websocket, message.get("max_rate_hz", 0))
+                        except (ValueError, TypeError, KeyError) as e:
+                            await websocket.send_text(json.dumps({
+                                "type": "error",
+                                "message": str(e),
+                                "timestamp": time.time()
+                            }))
+                            continue
                         await websocket.send_text(json.dumps({
-                            "type": "subscribed",
-                            "instruments": message.get("instruments", []),
+                            "type": "conflation",
+                            "max_rate_hz": rate,
                             "timestamp": time.time()
                         }))
                     elif _cmd in ("get_status", "dashboard_status"):
                         # Estado básico del canal WS
-                        with _websocket_lock:
-                            conn_count = len(_websocket_connections)
+                        conn_count = len(_ws_hub)
                         await websocket.send_text(json.dumps({
                             "type": "status",
                             "active_connections": conn_count,
@@ -908,8 +1081,8 @@ async def websocket_endpoint(websocket: WebSocket):
                     elif _cmd in ("start_ratio_operation", "ratio_operation"):
                         try:
                             from ratio_operations import ratio_manager
-                            from ratio_operations_simple import simple_ratio_manager, RatioOperationRequest
-                            from ratio_operations_real import real_ratio_manager
+                            from ratio_operations_simple import simple_ratio_manager
+                            from ratio_operations_real import real_ratio_manager, RatioOperationRequest
                             import uuid
                             required_params = ["pair", "instrument_to_sell", "nominales", "target_ratio", "condition", "client_id", "operation_id"]
                             missing_params = [p for p in required_params if p not in message]
@@ -934,7 +1107,11 @@ async def websocket_endpoint(websocket: WebSocket):
                                 condition=message["condition"],
                                 client_id=message["client_id"],
                                 operation_id=operation_id,
-                                buy_qty=buy_qty
+                                buy_qty=buy_qty,
+                                leg_mode=str(message.get("leg_mode", "")),          # sequential | parallel | on_fill
+                                hedge_policy=str(message.get("hedge_policy", "")),  # chase | unwind | none
+                                algo=str(message.get("algo", "")),                  # adaptive | twap | pov | threshold
+                                algo_params=message.get("algo_params") or {}
                             )
                             async def progress_callback(progress):
                                 # Calcular nominales comprados sumando las cantidades de las órdenes de compra
@@ -965,7 +1142,7 @@ async def websocket_endpoint(websocket: WebSocket):
                                     "timestamp": time.time()
                                 }))
                             real_ratio_manager.register_callback(operation_id, progress_callback)
-                            asyncio.create_task(real_ratio_manager.execute_ratio_operation_batch(request))
+                            real_ratio_manager.submit_operation(request)
                             await websocket.send_text(json.dumps({
                                 "type": "ratio_operation_started",
                                 "operation_id": operation_id,
@@ -1118,10 +1295,8 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         print(f"[websocket] Error al aceptar conexión: {e}")
     finally:
-        # Remover de la lista de conexiones activas
-        with _websocket_lock:
-            if websocket in _websocket_connections:
-                _websocket_connections.remove(websocket)
+        # Remover de las conexiones activas (y de sus suscripciones)
+        _ws_hub.remove(websocket)
         
         # Remover de suscriptores del dashboard
         _unsubscribe_from_dashboard(websocket)
@@ -1129,40 +1304,16 @@ async def websocket_endpoint(websocket: WebSocket):
         print(f"[websocket] Conexión cerrada: {websocket.client.host}:{websocket.client.port}")
 
 
-def broadcast_to_websockets(message: dict):
-    """Envía un mensaje a todos los clientes WebSocket conectados"""
-    disconnected = []
-    
-    with _websocket_lock:
-        for websocket in _websocket_connections:
-            try:
-                # Verificar si la conexión sigue activa
-                if websocket.client_state.value == 1:  # WebSocketState.CONNECTED
-                    try:
-                        # Enviar desde cualquier hilo usando el loop principal
-                        if _event_loop is not None:
-                            asyncio.run_coroutine_threadsafe(
-                                websocket.send_text(json.dumps(message)), _event_loop
-                            )
-                        else:
-                            # Fallback si no hay loop registrado
-                            asyncio.create_task(websocket.send_text(json.dumps(message)))
-                    except Exception as e:
-                        print(f"[websocket] Error programando envío: {e}")
-                        disconnected.append(websocket)
-                else:
-                    disconnected.append(websocket)
-            except Exception as e:
-                print(f"[websocket] Error enviando mensaje: {e}")
-                disconnected.append(websocket)
-    
-    # Limpiar conexiones desconectadas
-    if disconnected:
-        with _websocket_lock:
-            for ws in disconnected:
-                if ws in _websocket_connections:
-                    _websocket_connections.remove(ws)
-        print(f"[websocket] {len(disconnected)} conexiones desconectadas removidas")
+def broadcast_to_websockets(message: dict, owner: Optional[tuple] = None):
+    """Envía un mensaje a los clientes WebSocket suscriptos a su símbolo/canal.
+
+    Se serializa una sola vez y se encola en la cola acotada de cada conexión;
+    una tarea por socket hace los envíos. owner = (user_id, client_id) acota los ratios.
+    """
+    try:
+        _ws_hub.publish(message, owner=owner)
+    except Exception as e:
+        print(f"[websocket] Error difundiendo mensaje: {e}")
 
 # Registrar callback para difundir ticks provenientes de ws_rofex
 def _tick_broadcast_callback(tick: dict):
@@ -1177,39 +1328,53 @@ try:
 except Exception as e:
     print(f"[main] No se pudo registrar broadcast_callback: {e}")
 
+# Difundir ratios recalculados (canal "ratios")
+def _ratio_broadcast_callback(row: dict):
+    try:
+        # La identidad del dueño no viaja en el mensaje: solo decide quién lo recibe
+        owner = (row.get("user_id"), row.get("client_id"))
+        payload = {k: v for k, v in row.items() if k not in ("user_id", "client_id")}
+        broadcast_to_websockets({"type": "ratio", **payload}, owner=owner)
+    except Exception as e:
+        print(f"[websocket] error enviando ratio: {e}")
+
+try:
+    import ratios_worker
+    ratios_worker.add_ratio_listener(_ratio_broadcast_callback)
+except Exception as e:
+    print(f"[main] No se pudo registrar listener de ratios: {e}")
+
 
 @app.get("/cotizaciones/websocket_status")
 def websocket_status():
     """Obtiene el estado de las conexiones WebSocket"""
-    with _websocket_lock:
-        active_connections = len(_websocket_connections)
-        connections_info = []
-        
-        for ws in _websocket_connections:
-            try:
-                connections_info.append({
-                    "host": ws.client.host,
-                    "port": ws.client.port,
-                    "state": ws.client_state.value
-                })
-            except Exception:
-                pass
+    websockets = _ws_hub.websockets()
+    active_connections = len(websockets)
+    connections_info = []
+    
+    for ws in websockets:
+        try:
+            connections_info.append({
+                "host": ws.client.host,
+                "port": ws.client.port,
+                "state": ws.client_state.value,
+                "subscription": _ws_hub.connection_stats(ws)
+            })
+        except Exception:
+            pass
     
     return {
         "active_connections": active_connections,
         "connections": connections_info,
+        "hub": _ws_hub.stats(),
         "timestamp": time.time()
     }
 
 @app.get("/cotizaciones/telegram_diag")
 def telegram_diag():
     try:
-        import importlib
+        # Sin importlib.reload: recargar el módulo pierde el bot activo y la cola de notificaciones
         import telegram_control as tg
-        try:
-            tg = importlib.reload(tg)
-        except Exception:
-            pass
         # evitar depender de atributos nuevos si el modulo no esta actualizado en runtime
         info = {
             "has_library": getattr(tg, "telebot", None) is not None,
@@ -1249,12 +1414,7 @@ def telegram_restart():
 @app.post("/cotizaciones/telegram_sync_commands")
 def telegram_sync_commands():
     try:
-        import importlib
         import telegram_control as tg
-        try:
-            tg = importlib.reload(tg)
-        except Exception:
-            pass
         # Intento 1: usar la función del módulo si existe
         if hasattr(tg, "sync_commands"):
             return tg.sync_commands()
@@ -0,0 +1,249 @@
+# md_parser.py
+# Parser de mensajes de market data de pyRofex.
+# - Detecta el esquema una vez por conexión (nativo ROFEX o formatos alternativos)
+# - Esquema nativo: un solo recorrido con claves fijas (instrumentId/marketData/BI/OF/LA/CL/OP)
+# - Formatos alternativos: extractores genéricos con claves de respaldo
+# - Devuelve un registro compacto (MDRecord) con los niveles completos de BI/OF para el libro
+
+from __future__ import annotations
+
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+SCHEMA_NATIVE = "rofex"
+SCHEMA_GENERIC = "generic"
+
+
+class MDRecord(NamedTuple):
+    symbol: str
+    bid: Optional[float]
+    bid_size: Optional[float]
+    offer: Optional[float]
+    offer_size: Optional[float]
+    last: Optional[float]
+    last_size: Optional[float]
+    cl: Optional[float]
+    op: Optional[float]
+    ts_ms: int
+    bids: Any = None    # niveles tal como vienen en el mensaje (None si no hay)
+    offers: Any = None
+
+
+# ------------------------- Extractores genéricos -----------------------------
+def _first_price_and_size(levels: Any) -> Tuple[Optional[float], Optional[float]]:
+    if not levels:
+        return None, None
+    if isinstance(levels, dict):
+        price = levels.get("price") or levels.get("p")
+        size = levels.get("size") or levels.get("s")
+        try:
+            return float(price) if price else None, float(size) if size else None
+        except Exception:
+            return None, None
+    if isinstance(levels, list):
+        first = levels[0]
+        if isinstance(first, dict):
+            price = first.get("price") or first.get("p")
+            size = first.get("size") or first.get("s")
+            try:
+                return float(price) if price else None, float(size) if size else None
+            except Exception:
+                return None, None
+    return None, None
+
+def _extract_symbol(message: Dict[str, Any]) -> Optional[str]:
+    inst = message.get("instrumentId")
+    if isinstance(inst, dict) and "symbol" in inst:
+        return inst["symbol"]
+    return message.get("symbol")
+
+def _extract_ts(message: Dict[str, Any]) -> int:
+    for k in ("timestamp", "ts", "mdTimestamp", "time"):
+        v = message.get(k)
+        if isinstance(v, (int, float)):
+            if v < 10_000_000_000:
+                return int(v * 1000)
+            return int(v)
+    return int(time.time() * 1000)
+
+def _extract_levels(message: Dict[str, Any]):
+    md = message.get("marketData") or message.get("md") or message
+    bids = md.get("BI") or md.get("bids") or md.get("bid")
+    offs = md.get("OF") or md.get("offers") or md.get("ask") or md.get("offer")
+    last = md.get("LA") or md.get("last")
+    b_price, b_size = _first_price_and_size(bids)
+    a_price, a_size = _first_price_and_size(offs)
+    l_price, l_size = _first_price_and_size(last)
+    return (b_price, b_size), (a_price, a_size), (l_price, l_size), bids or None, offs or None
+
+def _extract_closing_price(message: Dict[str, Any]) -> Optional[float]:
+    """Intenta extraer el precio de cierre de la rueda anterior.
+    Soporta varias claves posibles según la fuente del mensaje.
+    """
+    md = message.get("marketData") or message.get("md") or message
+    for key in ("CL", "cl", "closingPrice", "previousClose", "prev_close"):
+        v = md.get(key)
+        try:
+            if v is None:
+                continue
+            # Puede venir como dict {"price": x}
+            if isinstance(v, dict):
+                vp = v.get("price") or v.get("p")
+                return float(vp) if vp is not None else None
+            # O valor directo
+            return float(v)
+        except Exception:
+            continue
+    return None
+
+def _extract_opening_price(message: Dict[str, Any]) -> Optional[float]:
+    """Intenta extraer el precio de apertura de la rueda actual.
+    Acepta claves comunes: OP/op/openPrice/open.
+    """
+    md = message.get("marketData") or message.get("md") or message
+    for key in ("OP", "op", "openPrice", "open"):
+        v = md.get(key)
+        try:
+            if v is None:
+                continue
+            if isinstance(v, dict):
+                vp = v.get("price") or v.get("p")
+                return float(vp) if vp is not None else None
+            return float(v)
+        except Exception:
+            continue
+    return None
+
+def parse_generic(message: Dict[str, Any]) -> Optional[MDRecord]:
+    """Extractores con claves de respaldo (cualquier formato conocido)."""
+    symbol = _extract_symbol(message)
+    if not symbol:
+        return None
+    (bid_p, bid_sz), (ask_p, ask_sz), (last_p, last_sz), bids, offs = _extract_levels(message)
+    return MDRecord(symbol, bid_p, bid_sz, ask_p, ask_sz, last_p, last_sz,
+                    _extract_closing_price(message), _extract_opening_price(message),
+                    _extract_ts(message), bids, offs)
+
+
+# --------------------------- Esquema nativo ROFEX -----------------------------
+_new_record = tuple.__new__  # evita el __new__ con argumentos nombrados de NamedTuple
+
+def _native_price(v: Any) -> Optional[float]:
+    # CL/OP: {"price": x, ...} o número
+    if v is None:
+        return None
+    if v.__class__ is dict:
+        v = v.get("price") or v.get("p")
+        return float(v) if v is not None else None
+    return float(v)
+
+def parse_native(message: Dict[str, Any]) -> Optional[MDRecord]:
+    """{"type": "Md", "timestamp": ms, "instrumentId": {"symbol"}, "marketData": {"BI": [...], ...}}
+
+    Mismos resultados que parse_generic para este esquema, en un solo recorrido
+    (incluye las listas BI/OF completas para el libro de profundidad).
+    """
+    md = message["marketData"]
+    symbol = message["instrumentId"]["symbol"]
+    if not symbol:
+        return None
+    get = md.get
+
+    bids = lv = get("BI")
+    if lv:
+        lv = lv[0]
+        p = lv["price"]
+        s = lv["size"]
+        bid_p = float(p) if p else None
+        bid_sz = float(s) if s else None
+    else:
+        bids = bid_p = bid_sz = None
+    offs = lv = get("OF")
+    if lv:
+        lv = lv[0]
+        p = lv["price"]
+        s = lv["size"]
+        ask_p = float(p) if p else None
+        ask_sz = float(s) if s else None
+    else:
+        offs = ask_p = ask_sz = None
+    lv = get("LA")
+    if lv:
+        p = lv["price"]
+        s = lv["size"]
+        last_p = float(p) if p else None
+        last_sz = float(s) if s else None
+    else:
+        last_p = last_sz = None
+
+    ts = message.get("timestamp")
+    cls = ts.__class__
+    if cls is int:
+        ts_ms = ts if ts >= 10_000_000_000 else ts * 1000
+    elif cls is float:
+        ts_ms = int(ts * 1000) if ts < 10_000_000_000 else int(ts)
+    else:
+        ts_ms = _extract_ts(message)
+
+    cl = get("CL")
+    if cl is not None:
+        cl = _native_price(cl)
+    op = get("OP")
+    if op is not None:
+        op = _native_price(op)
+    return _new_record(MDRecord, (symbol, bid_p, bid_sz, ask_p, ask_sz, last_p, last_sz, cl, op, ts_ms, bids, offs))
+
+
+def detect_schema(message: Dict[str, Any]) -> str:
+    inst = message.get("instrumentId")
+    md = message.get("marketData")
+    if isinstance(inst, dict) and "symbol" in inst and isinstance(md, dict):
+        la = md.get("LA")
+        # En el nativo BI/OF son listas de {"price","size"} y LA un dict
+        for key in ("BI", "OF"):
+            lv = md.get(key)
+            if lv is not None and not (isinstance(lv, list) and (not lv or isinstance(lv[0], dict))):
+                return SCHEMA_GENERIC
+        if la is not None and not isinstance(la, dict):
+            return SCHEMA_GENERIC
+        if not any(k in md for k in ("bids", "offers", "bid", "ask", "offer", "last", "md")):
+            return SCHEMA_NATIVE
+    return SCHEMA_GENERIC
+
+
+class MDParser:
+    """Parser con esquema detectado en el primer mensaje (uno por conexión).
+
+    Si un mensaje no encaja en el extractor especializado se parsea con el genérico
+    y se vuelve a detectar el esquema en el siguiente.
+    """
+
+    __slots__ = ("schema", "_parse", "parsed", "fallbacks")
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.schema: Optional[str] = None
+        self._parse: Optional[Callable[[Dict[str, Any]], Optional[MDRecord]]] = None
+        self.parsed = 0
+        self.fallbacks = 0
+
+    def parse(self, message: Dict[str, Any]) -> Optional[MDRecord]:
+        parse = self._parse
+        if parse is None:
+            self.schema = detect_schema(message)
+            parse = self._parse = parse_native if self.schema == SCHEMA_NATIVE else parse_generic
+        self.parsed += 1
+        if parse is parse_generic:
+            return parse_generic(message)
+        try:
+            return parse(message)
+        except (KeyError, TypeError, AttributeError, IndexError, ValueError):
+            # Cambió el formato: este mensaje por el genérico y re-detectar en el próximo
+            self.fallbacks += 1
+            self._parse = None
+            return parse_generic(message)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"schema": self.schema, "parsed": self.parsed, "fallbacks": self.fallbacks}
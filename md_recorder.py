@@ -0,0 +1,270 @@
+# md_recorder.py
+# Grabación del feed crudo de pyRofex (market data y order reports) para replay y post-mortems.
+# - El callback de pyRofex solo encola (O(1)); un hilo serializa y escribe
+# - Archivos NDJSON comprimidos (gzip), solo append, rotados por tamaño en disco, tiempo y día
+# - Índice por día (index.ndjson) con rango de tiempo y cantidad de registros por archivo
+# - Cada línea: {"t": ms de recepción, "k": "md" | "or", "m": mensaje original}
+
+from __future__ import annotations
+
+import glob
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+PRINT_PREFIX = "[md_recorder]"
+
+KIND_MD = "md"
+KIND_OR = "or"
+
+INDEX_FILE = "index.ndjson"
+FILE_SUFFIX = ".ndjson.gz"
+
+MD_RECORD_DIR            = os.getenv("MD_RECORD_DIR", "")  # vacío = sin grabación
+MD_RECORD_QUEUE_MAX      = int(os.getenv("MD_RECORD_QUEUE_MAX", "100000"))
+MD_RECORD_ROTATE_MB      = float(os.getenv("MD_RECORD_ROTATE_MB", "64"))  # tamaño comprimido
+MD_RECORD_ROTATE_SECONDS = float(os.getenv("MD_RECORD_ROTATE_SECONDS", "3600"))
+MD_RECORD_FLUSH_SECONDS  = float(os.getenv("MD_RECORD_FLUSH_SECONDS", "1.0"))
+
+
+def _day(ts_ms: int) -> str:
+    return time.strftime("%Y%m%d", time.localtime(ts_ms / 1000.0))
+
+
+class MDRecorder:
+    """Grabador append-only con hilo escritor y cola acotada (descarta lo nuevo si se llena)."""
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        max_queue: int = MD_RECORD_QUEUE_MAX,
+        rotate_bytes: int = int(MD_RECORD_ROTATE_MB * 1024 * 1024),
+        rotate_seconds: float = MD_RECORD_ROTATE_SECONDS,
+        flush_interval: float = MD_RECORD_FLUSH_SECONDS,
+    ) -> None:
+        self.directory = directory
+        self.max_queue = max_queue
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Tuple[int, str, Any]]" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {"enqueued": 0, "dropped": 0, "written": 0, "errors": 0, "files": 0}
+        # Archivo abierto (solo lo toca el hilo escritor)
+        self._fh = None
+        self._path: Optional[str] = None
+        self._file_day: Optional[str] = None
+        self._opened_at = 0.0
+        self._file_meta: Dict[str, Any] = {}
+
+    # ------------------------------ Control ---------------------------------
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="md-recorder", daemon=True)
+        self._thread.start()
+        print(f"{PRINT_PREFIX} Grabando en {self.directory} (rotación {self.rotate_bytes / (1024 * 1024):g} MB / {self.rotate_seconds:.0f}s)")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Escribe lo pendiente, cierra el archivo y actualiza el índice."""
+        self._stop_event.set()
+        t = self._thread
+        if t and t.is_alive():
+            t.join(timeout=timeout)
+            if t.is_alive():
+                print(f"{PRINT_PREFIX} Escritor no terminó en {timeout}s")
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ------------------------------- Entrada --------------------------------
+    def record(self, kind: str, message: Any) -> bool:
+        """Encola un mensaje crudo sin bloquear. Devuelve False si se descartó."""
+        try:
+            self._queue.put_nowait((int(time.time() * 1000), kind, message))
+        except queue.Full:
+            self._incr("dropped")
+            return False
+        self._incr("enqueued")
+        return True
+
+    # ------------------------------- Escritor -------------------------------
+    def _run(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    self._maybe_rotate(None)
+                    continue
+                self._write_batch(item)
+            # Vaciar lo pendiente al detener
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self._write_batch(item)
+        finally:
+            self._close()
+
+    def _write_batch(self, first: Tuple[int, str, Any]) -> None:
+        item: Optional[Tuple[int, str, Any]] = first
+        n = 0
+        while item is not None:
+            self._write(item)
+            n += 1
+            if n >= 1000:
+                break
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                item = None
+        if self._fh is not None:
+            try:
+                self._fh.flush()  # sync flush de zlib: lo escrito se puede leer aunque el proceso muera
+            except Exception as e:
+                self._incr("errors")
+                print(f"{PRINT_PREFIX} error en flush: {e}")
+
+    def _write(self, item: Tuple[int, str, Any]) -> None:
+        ts_ms, kind, message = item
+        try:
+            line = json.dumps({"t": ts_ms, "k": kind, "m": message}, separators=(",", ":"), default=str)
+        except Exception as e:
+            self._incr("errors")
+            print(f"{PRINT_PREFIX} mensaje no serializable: {e}")
+            return
+        data = (line + "\n").encode("utf-8")
+        try:
+            self._maybe_rotate(ts_ms)
+            if self._fh is None:
+                self._open(ts_ms)
+            self._fh.write(data)
+        except Exception as e:
+            self._incr("errors")
+            print(f"{PRINT_PREFIX} error escribiendo: {e}")
+            return
+        meta = self._file_meta
+        if meta["first_ms"] is None:
+            meta["first_ms"] = ts_ms
+        meta["last_ms"] = ts_ms
+        meta["records"] += 1
+        meta[kind] = meta.get(kind, 0) + 1
+        meta["bytes"] += len(data)
+        self._incr("written")
+
+    def _compressed_bytes(self) -> int:
+        """Bytes comprimidos ya escritos en el archivo (lo que zlib todavía no vació no cuenta)."""
+        try:
+            return self._fh.fileobj.tell()
+        except Exception:
+            return os.path.getsize(self._path)
+
+    def _maybe_rotate(self, ts_ms: Optional[int]) -> None:
+        if self._fh is None:
+            return
+        # rotate_bytes (MD_RECORD_ROTATE_MB) es tamaño en disco, no el NDJSON sin comprimir
+        if (self._compressed_bytes() >= self.rotate_bytes
+                or (self.rotate_seconds and time.time() - self._opened_at >= self.rotate_seconds)
+                or (ts_ms is not None and _day(ts_ms) != self._file_day)):
+            self._close()
+
+    def _open(self, ts_ms: int) -> None:
+        day = _day(ts_ms)
+        day_dir = os.path.join(self.directory, day)
+        os.makedirs(day_dir, exist_ok=True)
+        stamp = time.strftime("%H%M%S", time.localtime(ts_ms / 1000.0))
+        n = len(glob.glob(os.path.join(day_dir, f"*{FILE_SUFFIX}")))
+        path = os.path.join(day_dir, f"md-{day}-{stamp}-{n:04d}{FILE_SUFFIX}")
+        self._fh = gzip.open(path, "ab")
+        self._path = path
+        self._file_day = day
+        self._opened_at = time.time()
+        self._file_meta = {"file": os.path.basename(path), "first_ms": None, "last_ms": None,
+                           "records": 0, "bytes": 0}
+        self._incr("files")
+
+    def _close(self) -> None:
+        fh, self._fh = self._fh, None
+        if fh is None:
+            return
+        try:
+            fh.close()
+        except Exception as e:
+            self._incr("errors")
+            print(f"{PRINT_PREFIX} error cerrando {self._path}: {e}")
+        meta = self._file_meta
+        if not meta.get("records"):
+            return
+        try:
+            meta["compressed_bytes"] = os.path.getsize(self._path)
+            with open(os.path.join(os.path.dirname(self._path), INDEX_FILE), "a", encoding="utf-8") as idx:
+                idx.write(json.dumps(meta, separators=(",", ":")) + "\n")
+        except Exception as e:
+            self._incr("errors")
+            print(f"{PRINT_PREFIX} error actualizando índice: {e}")
+
+    # -------------------------------- Stats ---------------------------------
+    def _incr(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["queue_size"] = self._queue.qsize()
+        out["queue_max"] = self.max_queue
+        out["directory"] = self.directory
+        out["current_file"] = self._path if self._fh is not None else None
+        out["running"] = self.is_running()
+        return out
+
+
+# --------------------------------- Lectura ----------------------------------
+def read_index(day_dir: str) -> List[Dict[str, Any]]:
+    """Entradas del índice de un día (un archivo cerrado por línea)."""
+    path = os.path.join(day_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def recorded_files(path: str) -> List[str]:
+    """Archivos grabados bajo `path` (archivo, directorio de un día o raíz), en orden de grabación."""
+    if os.path.isfile(path):
+        return [path]
+    files = glob.glob(os.path.join(path, f"*{FILE_SUFFIX}")) + glob.glob(os.path.join(path, "*", f"*{FILE_SUFFIX}"))
+    # El nombre lleva día, hora y número: el orden alfabético es el de grabación
+    return sorted(files, key=os.path.basename)
+
+
+def iter_records(paths: Iterable[str], kinds: Optional[Iterable[str]] = None) -> Iterator[Tuple[int, str, Any]]:
+    """(ms de recepción, tipo, mensaje) de los archivos dados, en orden.
+
+    Tolera un archivo truncado (proceso cortado durante la grabación): se lee hasta donde se pueda.
+    """
+    wanted = set(kinds) if kinds else None
+    for path in paths:
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if wanted is None or rec.get("k") in wanted:
+                        yield rec.get("t", 0), rec.get("k"), rec.get("m")
+        except (EOFError, OSError) as e:
+            print(f"{PRINT_PREFIX} {os.path.basename(path)} truncado: {e}")
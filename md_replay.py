@@ -0,0 +1,296 @@
+# md_replay.py
+# Replay determinístico de market data grabado (md_recorder) a través de MarketDataManager.
+# - Mismo orden que la grabación; un solo hilo llama a _handle_md / _handle_or
+# - Velocidad: 1 = tiempos originales, N = N veces más rápido, 0 = lo más rápido posible
+# - Mide throughput y latencia por etapa:
+#     decode        lectura + descompresión + json de cada registro
+#     handle_md     _handle_md completo (parser, libro, cache, listeners, difusión)
+#     parse_store   desde que entra el mensaje hasta que los tick listeners lo reciben
+#     tick_to_ratio desde que entra el tick hasta que ratios_worker publica un ratio del par
+#
+# Uso por línea de comandos (benchmark sin sesión ROFEX):
+#     python md_replay.py /ruta/grabaciones --speed 0
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from md_recorder import KIND_MD, KIND_OR, iter_records, recorded_files
+
+PRINT_PREFIX = "[md_replay]"
+
+SPEED_MAX = 0.0
+
+
+class LatencyStats:
+    """count/mean/max exactos y percentiles sobre un reservorio acotado (semilla fija)."""
+
+    __slots__ = ("count", "total", "max", "_samples", "_cap", "_rnd")
+
+    def __init__(self, cap: int = 100_000) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: List[float] = []
+        self._cap = cap
+        self._rnd = random.Random(0)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if len(self._samples) < self._cap:
+            self._samples.append(seconds)
+        else:
+            j = self._rnd.randrange(self.count)
+            if j < self._cap:
+                self._samples[j] = seconds
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {"count": 0}
+        s = sorted(self._samples)
+
+        def pct(p: float) -> float:
+            return round(s[min(len(s) - 1, int(p * len(s)))] * 1e6, 1)
+
+        return {
+            "count": self.count,
+            "mean_us": round(self.total / self.count * 1e6, 1),
+            "p50_us": pct(0.50),
+            "p99_us": pct(0.99),
+            "max_us": round(self.max * 1e6, 1),
+        }
+
+
+def parse_speed(speed: Any) -> float:
+    """1/"1x"/"realtime" = tiempos originales, N = N veces, 0/"max" = sin esperas."""
+    if isinstance(speed, str):
+        s = speed.strip().lower()
+        if s in ("max", "asap", "fast"):
+            return SPEED_MAX
+        if s in ("realtime", "original"):
+            return 1.0
+        speed = s[:-1] if s.endswith("x") else s
+    value = float(speed)
+    if value < 0:
+        raise ValueError(f"velocidad inválida: {speed}")
+    return value
+
+
+class MDReplay:
+    """Empuja los mensajes grabados por el manager en un hilo propio."""
+
+    def __init__(
+        self,
+        manager: Any,
+        path: str,
+        *,
+        speed: Any = 1.0,
+        symbols: Optional[Iterable[str]] = None,
+        kinds: Iterable[str] = (KIND_MD, KIND_OR),
+    ) -> None:
+        self.manager = manager
+        self.path = path
+        self.speed = parse_speed(speed)
+        self.symbols = set(symbols) if symbols else None
+        self.kinds = tuple(kinds)
+        self.files = recorded_files(path)
+        if not self.files:
+            raise FileNotFoundError(f"No hay grabaciones en {path}")
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self.stages = {name: LatencyStats() for name in ("decode", "handle_md", "parse_store", "tick_to_ratio")}
+        self.counts = {KIND_MD: 0, KIND_OR: 0, "skipped": 0}
+        self.max_lag_ms = 0.0
+        self._started_at: Optional[float] = None
+        self._finished_at: Optional[float] = None
+        self.error: Optional[str] = None
+        # Inicio (perf_counter) del mensaje en curso y de los ticks pendientes de ratio por símbolo
+        self._current_t0 = 0.0
+        self._pending_ratio: Dict[str, float] = {}
+
+    # ------------------------------ Control ---------------------------------
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._done.clear()
+        self._hook()
+        self._thread = threading.Thread(target=self._run, name="md-replay", daemon=True)
+        self._thread.start()
+        speed = "máx" if self.speed == SPEED_MAX else f"{self.speed:g}x"
+        print(f"{PRINT_PREFIX} Replay de {len(self.files)} archivo(s) de {self.path} a velocidad {speed}")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop_event.set()
+        t = self._thread
+        if t and t.is_alive() and t is not threading.current_thread():
+            t.join(timeout=timeout)
+        self._thread = None
+        self._unhook()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que termine el replay. Devuelve False si venció el timeout."""
+        return self._done.wait(timeout)
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # --------------------------- Hooks de medición ---------------------------
+    def _hook(self) -> None:
+        import ws_rofex
+        ws_rofex.add_tick_listener(self._on_tick)
+        try:
+            import ratios_worker
+            ratios_worker.add_ratio_listener(self._on_ratio)
+        except Exception as e:
+            print(f"{PRINT_PREFIX} sin medición tick→ratio: {e}")
+
+    def _unhook(self) -> None:
+        import ws_rofex
+        ws_rofex.remove_tick_listener(self._on_tick)
+        try:
+            import ratios_worker
+            ratios_worker.remove_ratio_listener(self._on_ratio)
+        except Exception:
+            pass
+
+    def _on_tick(self, tick: Dict[str, Any]) -> None:
+        # Corre dentro de _handle_md, en el hilo del replay
+        t0 = self._current_t0
+        if not t0:
+            return
+        self.stages["parse_store"].add(time.perf_counter() - t0)
+        symbol = tick.get("symbol")
+        with self._lock:
+            self._pending_ratio.setdefault(symbol, t0)
+
+    def _on_ratio(self, row: Dict[str, Any]) -> None:
+        # Corre en el hilo de ratios_worker: latencia desde el tick más viejo sin ratio del par
+        now = time.perf_counter()
+        with self._lock:
+            starts = [self._pending_ratio.pop(s) for s in (row.get("base_symbol"), row.get("quote_symbol"))
+                      if s in self._pending_ratio]
+            if starts:
+                self.stages["tick_to_ratio"].add(now - min(starts))
+
+    # -------------------------------- Replay --------------------------------
+    def _symbol(self, message: Dict[str, Any]) -> Optional[str]:
+        inst = message.get("instrumentId")
+        if isinstance(inst, dict):
+            return inst.get("symbol")
+        return message.get("symbol")
+
+    def _run(self) -> None:
+        manager = self.manager
+        decode = self.stages["decode"]
+        handle = self.stages["handle_md"]
+        speed = self.speed
+        first_t: Optional[int] = None
+        perf = time.perf_counter
+        self._started_at = perf()
+        try:
+            records = iter_records(self.files, kinds=self.kinds)
+            while not self._stop_event.is_set():
+                t_read = perf()
+                try:
+                    ts_ms, kind, message = next(records)
+                except StopIteration:
+                    break
+                decode.add(perf() - t_read)
+
+                if not isinstance(message, dict):
+                    self.counts["skipped"] += 1
+                    continue
+                if kind == KIND_MD and self.symbols is not None and self._symbol(message) not in self.symbols:
+                    self.counts["skipped"] += 1
+                    continue
+
+                # Respetar los tiempos originales (escalados)
+                if speed != SPEED_MAX:
+                    if first_t is None:
+                        first_t = ts_ms
+                    due = self._started_at + (ts_ms - first_t) / 1000.0 / speed
+                    delay = due - perf()
+                    if delay > 0:
+                        if self._stop_event.wait(delay):
+                            break
+                    elif -delay * 1000.0 > self.max_lag_ms:
+                        self.max_lag_ms = -delay * 1000.0
+
+                try:
+                    if kind == KIND_MD:
+                        t0 = self._current_t0 = perf()
+                        manager._handle_md(message)
+                        handle.add(perf() - t0)
+                        self._current_t0 = 0.0
+                    else:
+                        manager._handle_or(message)
+                    self.counts[kind] += 1
+                except Exception as e:
+                    self._current_t0 = 0.0
+                    self.counts["skipped"] += 1
+                    print(f"{PRINT_PREFIX} error procesando mensaje: {e}")
+        except Exception as e:
+            self.error = str(e)
+            print(f"{PRINT_PREFIX} replay interrumpido: {e}")
+        finally:
+            self._finished_at = perf()
+            self._done.set()
+            done = self.counts[KIND_MD] + self.counts[KIND_OR]
+            print(f"{PRINT_PREFIX} Replay terminado: {done} mensajes en {self._finished_at - self._started_at:.2f}s")
+
+    # -------------------------------- Stats ---------------------------------
+    def stats(self) -> Dict[str, Any]:
+        elapsed = 0.0
+        if self._started_at is not None:
+            elapsed = (self._finished_at or time.perf_counter()) - self._started_at
+        done = self.counts[KIND_MD] + self.counts[KIND_OR]
+        with self._lock:
+            stages = {name: st.summary() for name, st in self.stages.items()}
+        return {
+            "path": self.path,
+            "files": len(self.files),
+            "speed": "max" if self.speed == SPEED_MAX else self.speed,
+            "running": self.is_running(),
+            "done": self._done.is_set(),
+            "error": self.error,
+            "messages": dict(self.counts),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_msgs_s": round(done / elapsed, 1) if elapsed > 0 else None,
+            "max_lag_ms": round(self.max_lag_ms, 1),
+            "stages": stages,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    import ws_rofex
+
+    ap = argparse.ArgumentParser(description="Replay de market data grabado a través de MarketDataManager")
+    ap.add_argument("path", help="archivo, directorio de un día o raíz de grabaciones")
+    ap.add_argument("--speed", default="max", help="1 = original, N = N veces, max = sin esperas")
+    ap.add_argument("--symbols", nargs="*", help="solo estos instrumentos")
+    ap.add_argument("--ratios", action="store_true", help="correr ratios_worker (mide tick→ratio)")
+    args = ap.parse_args()
+
+    if args.ratios:
+        import ratios_worker
+        ratios_worker.start()
+    result = ws_rofex.manager.start_replay(path=args.path, speed=args.speed, instrumentos=args.symbols or [])
+    if result.get("status") != "started":
+        raise SystemExit(result)
+    ws_rofex.manager.wait_replay()
+    if args.ratios:
+        time.sleep(1.0)  # dejar que ratios_worker procese lo último
+    print(json.dumps(ws_rofex.manager.stop()["replay"], indent=2))
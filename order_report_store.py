@@ -0,0 +1,213 @@
+# order_report_store.py
+# Índice de order reports por client order id.
+# - LRU acotado: id -> historial de estados de la orden
+# - Alias: wsClOrdId (nuestro) y clOrdId (del broker) apuntan a la misma orden
+# - Futures por orden para esperar un reporte con timeout (sin polling)
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+ID_KEYS = ("wsClOrdId", "clOrdId", "clientId", "client_order_id")
+
+# Estados finales del broker
+TERMINAL_STATUSES = frozenset({"FILLED", "CANCELLED", "REJECTED", "EXPIRED"})
+
+
+def unwrap_report(message: Dict[str, Any]) -> Dict[str, Any]:
+    """pyRofex entrega {"type": "or", "orderReport": {...}}; algunos flujos el reporte plano."""
+    inner = message.get("orderReport") if isinstance(message, dict) else None
+    return inner if isinstance(inner, dict) else message
+
+
+def report_ids(report: Dict[str, Any]) -> List[str]:
+    ids = []
+    for k in ID_KEYS:
+        v = report.get(k)
+        if v is not None and str(v) not in ids:
+            ids.append(str(v))
+    return ids
+
+
+class _Order:
+    __slots__ = ("ids", "history", "updated_at")
+
+    def __init__(self) -> None:
+        self.ids: set = set()
+        self.history: List[Dict[str, Any]] = []
+        self.updated_at = 0.0
+
+    @property
+    def last(self) -> Optional[Dict[str, Any]]:
+        return self.history[-1] if self.history else None
+
+
+class OrderReportStore:
+    def __init__(self, max_orders: int = 2000, max_history: int = 50) -> None:
+        self.max_orders = max_orders
+        self.max_history = max_history
+        self._lock = threading.Lock()
+        self._orders: "OrderedDict[int, _Order]" = OrderedDict()  # id(_Order) -> _Order (orden LRU)
+        self._by_id: Dict[str, _Order] = {}
+        # client_order_id -> [(loop, future, statuses)]
+        self._waiters: Dict[str, List[tuple]] = {}
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.received = 0
+        self.unmatched = 0
+
+    # ------------------------------- Escritura ------------------------------
+    def add(self, message: Dict[str, Any]) -> Optional[str]:
+        """Registra un order report (hilo de pyRofex). Devuelve el id principal."""
+        report = unwrap_report(message)
+        ids = report_ids(report)
+        to_wake = []
+        with self._lock:
+            self.received += 1
+            if not ids:
+                self.unmatched += 1
+                return None
+
+            # Los ids del reporte pueden apuntar a entradas distintas (p.ej. una por
+            # wsClOrdId y otra por clOrdId): se fusionan en una sola
+            matches = []
+            for oid in ids:
+                found = self._by_id.get(oid)
+                if found is not None and found not in matches:
+                    matches.append(found)
+            if not matches:
+                order = _Order()
+                self._orders[id(order)] = order
+            else:
+                order = self._merge(matches)
+                self._orders.move_to_end(id(order))
+            for oid in ids:
+                order.ids.add(oid)
+                self._by_id[oid] = order
+            order.history.append(report)
+            if len(order.history) > self.max_history:
+                del order.history[: len(order.history) - self.max_history]
+            order.updated_at = time.time()
+
+            self._evict()
+
+            status = report.get("status")
+            for oid in order.ids:
+                waiters = self._waiters.get(oid)
+                if not waiters:
+                    continue
+                keep = []
+                for w in waiters:
+                    loop, fut, statuses = w
+                    if statuses is None or status in statuses:
+                        to_wake.append((loop, fut))
+                    else:
+                        keep.append(w)
+                if keep:
+                    self._waiters[oid] = keep
+                else:
+                    del self._waiters[oid]
+            listeners = list(self._listeners)
+
+        for loop, fut in to_wake:
+            try:
+                loop.call_soon_threadsafe(_resolve, fut, report)
+            except RuntimeError:
+                pass  # loop cerrado
+        for cb in listeners:
+            try:
+                cb(report)
+            except Exception as e:
+                print(f"[order_reports] error en listener: {e}")
+        return ids[0]
+
+    def _merge(self, orders: List[_Order]) -> _Order:
+        """Fusiona entradas de la misma orden en la más reciente (historial en orden temporal)."""
+        if len(orders) == 1:
+            return orders[0]
+        orders = sorted(orders, key=lambda o: o.updated_at)
+        target = orders[-1]
+        history = [r for o in orders for r in o.history]
+        target.history = history[-self.max_history:]
+        for other in orders[:-1]:
+            self._orders.pop(id(other), None)
+            for oid in other.ids:
+                target.ids.add(oid)
+                self._by_id[oid] = target
+        return target
+
+    def _evict(self) -> None:
+        while len(self._orders) > self.max_orders:
+            _, old = self._orders.popitem(last=False)
+            for oid in old.ids:
+                if self._by_id.get(oid) is old:
+                    del self._by_id[oid]
+
+    # -------------------------------- Lectura -------------------------------
+    def get(self, client_order_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            order = self._by_id.get(str(client_order_id))
+            return order.last if order else None
+
+    def history(self, client_order_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            order = self._by_id.get(str(client_order_id))
+            return list(order.history) if order else []
+
+    async def wait_for(self, client_order_id: str, timeout: float,
+                       statuses: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Espera un reporte de la orden (opcionalmente con status en statuses).
+
+        Si ya hay uno que cumple, vuelve enseguida. Devuelve None al vencer el timeout.
+        """
+        oid = str(client_order_id)
+        wanted = frozenset(statuses) if statuses is not None else None
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        with self._lock:
+            order = self._by_id.get(oid)
+            last = order.last if order else None
+            if last is not None and (wanted is None or last.get("status") in wanted):
+                return last
+            entry = (loop, fut, wanted)
+            self._waiters.setdefault(oid, []).append(entry)
+        try:
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(oid)
+                if waiters and entry in waiters:
+                    waiters.remove(entry)
+                    if not waiters:
+                        del self._waiters[oid]
+
+    # ------------------------------- Listeners ------------------------------
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        """callback(report) por cada reporte; corre en el hilo de pyRofex."""
+        with self._lock:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[Dict[str, Any]], None]) -> None:
+        with self._lock:
+            self._listeners = [cb for cb in self._listeners if cb is not callback]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "orders": len(self._orders),
+                "max_orders": self.max_orders,
+                "received": self.received,
+                "unmatched": self.unmatched,
+                "waiters": sum(len(w) for w in self._waiters.values()),
+            }
+
+
+def _resolve(fut: "asyncio.Future", report: Dict[str, Any]) -> None:
+    if not fut.done():
+        fut.set_result(report)
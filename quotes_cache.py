@@ -1,27 +1,276 @@
+# quotes_cache.py
+# Cache de cotizaciones en memoria.
+# - Registros inmutables de campos fijos (Quote) con seq por símbolo y versión global
+# - Escrituras bajo lock; lecturas sin lock (se reemplaza el registro entero)
+# - changed_since(version) devuelve solo lo que cambió desde una versión dada
+# - Compatible con el uso tipo dict: quotes_cache[sym] = {...}, .get(sym), in, len
+# - Frescura: edad por símbolo, lecturas con max_age_ms y barrido que marca viejos
+# - Profundidad: libro por símbolo (DepthBook) con volumen hasta un precio y VWAP por cantidad
+
+import os
 import time
 import threading
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from depth_book import DepthBook
+
+# Campos de una cotización (mismo orden que el tick de ws_rofex)
+FIELDS = ("bid", "bid_size", "offer", "offer_size", "last", "last_size", "cl", "op")
 
-quotes_cache: Dict[str, Dict[str, Any]] = {}
-_lock = threading.RLock()
+# Edad máxima (desde la recepción) para considerar una cotización vigente; 0 = sin límite
+QUOTES_MAX_AGE_MS = int(os.getenv("QUOTES_MAX_AGE_MS", "900000"))
+QUOTES_SWEEP_SECONDS = float(os.getenv("QUOTES_SWEEP_SECONDS", "30"))
 
 def now_ms() -> int:
     return int(time.time() * 1000)
 
+
+class Quote(Mapping):
+    """Cotización inmutable. Se lee como dict (q["bid"], q.get("offer"), dict(q))."""
+
+    __slots__ = FIELDS + ("symbol", "ts_ms", "seq", "version", "received_ms", "_extra")
+
+    def __init__(self, symbol: str, data: Mapping, seq: int, version: int) -> None:
+        set_ = object.__setattr__
+        set_(self, "symbol", symbol)
+        for f in FIELDS:
+            set_(self, f, data.get(f))
+        ts = data.get("ts_ms", data.get("timestamp"))
+        set_(self, "ts_ms", int(ts) if isinstance(ts, (int, float)) and not isinstance(ts, bool) else now_ms())
+        set_(self, "seq", seq)
+        set_(self, "version", version)
+        set_(self, "received_ms", now_ms())
+        # Campos no estándar (simuladores, etc.) se conservan tal cual
+        extra = {k: v for k, v in data.items() if k not in _KNOWN}
+        set_(self, "_extra", extra or None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Quote es inmutable")
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _FIELD_SET:
+            return getattr(self, key)
+        if key == "timestamp":
+            return self.ts_ms
+        if self._extra and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from _KEYS
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return len(_KEYS) + (len(self._extra) if self._extra else 0)
+
+    def age_ms(self, now: Optional[int] = None) -> int:
+        """Milisegundos desde que llegó la cotización."""
+        return (now_ms() if now is None else now) - self.received_ms
+
+    def __repr__(self) -> str:
+        return f"Quote({self.symbol!r}, seq={self.seq}, bid={self.bid}, offer={self.offer}, last={self.last})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self)
+
+
+_KEYS = FIELDS + ("timestamp", "ts_ms", "seq", "version", "received_ms")
+_FIELD_SET = frozenset(_KEYS) - {"timestamp"}
+_KNOWN = frozenset(_KEYS) | {"symbol"}
+
+
+class QuoteStore(MutableMapping):
+    """Símbolo -> Quote. Escrituras serializadas; lecturas sin lock."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[str, Quote] = {}
+        self._order: "OrderedDict[str, int]" = OrderedDict()  # símbolo -> versión, por versión creciente
+        self._version = 0
+        self._stale: Dict[str, int] = {}  # símbolo -> received_ms de la cotización marcada vieja
+        self._books: Dict[str, DepthBook] = {}
+
+    # ------------------------------- Escritura ------------------------------
+    def set(self, symbol: str, data: Optional[Mapping] = None, **fields: Any) -> Quote:
+        """Reemplaza la cotización del símbolo; asigna seq por símbolo y versión global."""
+        if fields:
+            data = {**(data or {}), **fields}
+        data = data or {}
+        with self._lock:
+            prev = self._data.get(symbol)
+            self._version += 1
+            quote = Quote(symbol, data, (prev.seq + 1) if prev else 1, self._version)
+            self._data[symbol] = quote
+            self._order[symbol] = self._version
+            self._order.move_to_end(symbol)
+            if symbol in self._stale:
+                del self._stale[symbol]
+                print(f"[quotes_cache] {symbol} volvió a cotizar")
+        return quote
+
+    def __setitem__(self, symbol: str, data: Mapping) -> None:
+        self.set(symbol, data)
+
+    def set_depth(self, book: DepthBook) -> None:
+        """Reemplaza el libro de profundidad del símbolo (se escribe junto con su cotización)."""
+        self._books[book.symbol] = book
+
+    def __delitem__(self, symbol: str) -> None:
+        with self._lock:
+            del self._data[symbol]
+            self._order.pop(symbol, None)
+            self._stale.pop(symbol, None)
+            self._books.pop(symbol, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._order.clear()
+            self._stale.clear()
+            self._books.clear()
+
+    # -------------------------------- Lectura -------------------------------
+    def __getitem__(self, symbol: str) -> Quote:
+        return self._data[symbol]
+
+    def get(self, symbol: str, default: Any = None, max_age_ms: Optional[int] = None) -> Any:
+        """Cotización del símbolo; con max_age_ms devuelve default si es más vieja."""
+        quote = self._data.get(symbol)
+        if quote is None:
+            return default
+        if max_age_ms and quote.age_ms() > max_age_ms:
+            return default
+        return quote
+
+    def __contains__(self, symbol: object) -> bool:
+        return symbol in self._data
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._data))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def depth(self, symbol: str, max_age_ms: Optional[int] = None) -> Optional[DepthBook]:
+        """Libro del símbolo; con max_age_ms None si la cotización es más vieja."""
+        book = self._books.get(symbol)
+        if book is None or (max_age_ms and self.get(symbol, max_age_ms=max_age_ms) is None):
+            return None
+        return book
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def snapshot(self) -> Dict[str, Quote]:
+        """Copia superficial: los registros son inmutables, no hace falta copiarlos."""
+        return dict(self._data)
+
+    def changed_since(self, version: int) -> Tuple[List[Quote], int]:
+        """Cotizaciones con versión > version y la versión actual (para la próxima consulta)."""
+        with self._lock:
+            out = []
+            for symbol in reversed(self._order):
+                if self._order[symbol] <= version:
+                    break
+                out.append(self._data[symbol])
+            current = self._version
+        out.reverse()
+        return out, current
+
+    # ------------------------------- Frescura -------------------------------
+    def sweep(self, max_age_ms: int = QUOTES_MAX_AGE_MS) -> List[str]:
+        """Marca como viejos los símbolos sin cotización en max_age_ms. Devuelve los recién marcados."""
+        if not max_age_ms:
+            return []
+        now = now_ms()
+        nuevos = []
+        with self._lock:
+            for symbol, quote in self._data.items():
+                if quote.age_ms(now) > max_age_ms and symbol not in self._stale:
+                    self._stale[symbol] = quote.received_ms
+                    nuevos.append(symbol)
+        return nuevos
+
+    def stale(self) -> Dict[str, Dict[str, Any]]:
+        """Símbolos marcados viejos con su edad actual."""
+        now = now_ms()
+        with self._lock:
+            return {
+                symbol: {"age_ms": now - received, "last_update_ms": received}
+                for symbol, received in self._stale.items()
+            }
+
+
+quotes_cache = QuoteStore()
+
 def set_quote(symbol: str, data: Dict[str, Any]) -> None:
     if not symbol:
         return
-    d = dict(data or {})
-    if "ts_ms" not in d or not isinstance(d["ts_ms"], int):
-        d["ts_ms"] = now_ms()
-    with _lock:
-        quotes_cache[symbol] = d
+    quotes_cache.set(symbol, data)
 
-def get_quote(symbol: str) -> Optional[Dict[str, Any]]:
-    with _lock:
-        q = quotes_cache.get(symbol)
-        return dict(q) if q else None
+def get_quote(symbol: str, max_age_ms: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """Copia (dict) de la cotización: el llamador puede modificarla sin tocar el cache."""
+    q = quotes_cache.get(symbol, max_age_ms=max_age_ms)
+    return dict(q) if q is not None else None
 
 def get_snapshot() -> Dict[str, Dict[str, Any]]:
-    with _lock:
-        return {k: dict(v) for k, v in quotes_cache.items()}
+    """Copia (dicts) de todas las cotizaciones."""
+    return {k: dict(v) for k, v in quotes_cache.snapshot().items()}
+
+def get_quote_record(symbol: str, max_age_ms: Optional[int] = None) -> Optional[Quote]:
+    """Registro inmutable (Quote) sin copiar; para lectores internos que solo leen."""
+    return quotes_cache.get(symbol, max_age_ms=max_age_ms)
+
+def get_snapshot_records() -> Dict[str, Quote]:
+    """Símbolo -> Quote sin copiar los registros."""
+    return quotes_cache.snapshot()
+
+def get_stale() -> Dict[str, Dict[str, Any]]:
+    return quotes_cache.stale()
+
+def get_depth(symbol: str, max_age_ms: Optional[int] = None) -> Optional[DepthBook]:
+    return quotes_cache.depth(symbol, max_age_ms)
+
+def volume_up_to(symbol: str, side: str, price: float, max_age_ms: Optional[int] = None) -> Optional[float]:
+    """Cantidad ejecutable con una orden límite a `price` ("sell" contra bids, "buy" contra offers).
+    None si no hay libro para el símbolo."""
+    book = quotes_cache.depth(symbol, max_age_ms)
+    return book.volume_up_to(side, price) if book else None
+
+def vwap_for_size(symbol: str, side: str, size: float, max_age_ms: Optional[int] = None) -> Tuple[Optional[float], float]:
+    """(VWAP, cantidad cubierta) para ejecutar `size` contra el libro del símbolo."""
+    book = quotes_cache.depth(symbol, max_age_ms)
+    return book.vwap_for_size(side, size) if book else (None, 0.0)
+
+# --------------------------- Barrido de viejos -------------------------------
+_sweep_thread: Optional[threading.Thread] = None
+_sweep_stop = threading.Event()
+
+def _sweep_loop(max_age_ms: int, interval: float) -> None:
+    while not _sweep_stop.wait(interval):
+        try:
+            nuevos = quotes_cache.sweep(max_age_ms)
+            if nuevos:
+                print(f"[quotes_cache] Sin cotizar hace más de {max_age_ms / 1000:.0f}s: {', '.join(nuevos)}")
+        except Exception as e:
+            print(f"[quotes_cache] error en barrido: {e}")
+
+def start_stale_sweep(max_age_ms: int = QUOTES_MAX_AGE_MS, interval: float = QUOTES_SWEEP_SECONDS) -> None:
+    global _sweep_thread
+    if not max_age_ms or (_sweep_thread and _sweep_thread.is_alive()):
+        return
+    _sweep_stop.clear()
+    _sweep_thread = threading.Thread(target=_sweep_loop, args=(max_age_ms, interval), daemon=True)
+    _sweep_thread.start()
+    print(f"[quotes_cache] Barrido de cotizaciones viejas cada {interval}s (máx {max_age_ms} ms)")
+
+def stop_stale_sweep() -> None:
+    global _sweep_thread
+    _sweep_stop.set()
+    if _sweep_thread and _sweep_thread.is_alive():
+        _sweep_thread.join(timeout=2)
+    _sweep_thread = None
@@ -10,9 +10,41 @@ from typing import Dict, List, Optional, TYPE_CHECKING
 from dataclasses import dataclass
 from enum import Enum
 import asyncio
+import os
 import time
 import ws_rofex
 import ratios_worker
+import quotes_cache
+from liquidity_arbiter import arbiter
+from order_report_store import TERMINAL_STATUSES
+from execution_algos import AlgoContext, ExecutionAlgo, create_algo
+
+# Tiempo máximo esperando el order report de una orden antes de la verificación alternativa
+ORDER_REPORT_TIMEOUT = 5.0
+# Estados que deciden el destino de una orden recién enviada (despiertan al que espera)
+DECISIVE_STATUSES = ("FILLED", "PARTIALLY_FILLED", "REJECTED", "CANCELLED")
+# Edad máxima de una cotización para mandar órdenes reales con ella
+ORDERS_MAX_QUOTE_AGE_MS = int(os.getenv("ORDERS_MAX_QUOTE_AGE_MS", "300000"))
+# Deslizamiento aceptado (bps sobre el mejor precio) para tomar niveles más profundos del libro; 0 = solo el mejor precio
+ORDERS_DEPTH_SLIPPAGE_BPS = float(os.getenv("ORDERS_DEPTH_SLIPPAGE_BPS", "0"))
+# Operaciones de ratio ejecutándose a la vez; las demás quedan encoladas (PENDING)
+RATIO_MAX_CONCURRENT_OPS = max(1, int(os.getenv("RATIO_MAX_CONCURRENT_OPS", "8")))
+# Envío de las patas de cada lote: sequential (venta y después compra), parallel (ambas a la vez),
+# on_fill (la compra sale apenas llega el fill de la venta, por la cantidad ejecutada)
+RATIO_LEG_MODE = os.getenv("RATIO_LEG_MODE", "sequential").lower()
+LEG_MODES = ("sequential", "parallel", "on_fill")
+# Qué hacer si una pata se ejecuta y la otra no: chase (completar la pata corta a mercado),
+# unwind (deshacer el exceso de la pata larga) o none (solo informar)
+RATIO_HEDGE_POLICY = os.getenv("RATIO_HEDGE_POLICY", "chase").lower()
+HEDGE_POLICIES = ("chase", "unwind", "none")
+# Deslizamiento máximo (bps sobre el precio original de la pata) aceptado al cubrir
+RATIO_HEDGE_MAX_BPS = float(os.getenv("RATIO_HEDGE_MAX_BPS", "50"))
+# Algoritmo de ejecución por defecto (execution_algos): adaptive | twap | pov | threshold
+RATIO_EXEC_ALGO = os.getenv("RATIO_EXEC_ALGO", "adaptive").lower()
+# Espera máxima por una nueva cotización de la operación (reintento por precio / entre lotes)
+RATIO_QUOTE_WAIT_SECONDS = float(os.getenv("RATIO_QUOTE_WAIT_SECONDS", "5"))
+# Re-evaluación cuando la liquidez publicada está toda reservada por otras operaciones en curso
+RATIO_RESERVATION_WAIT_SECONDS = float(os.getenv("RATIO_RESERVATION_WAIT_SECONDS", "0.25"))
 
 # Enums y clases de datos
 class OperationStatus(Enum):
@@ -32,6 +64,7 @@ class OperationStep(Enum):
     VERIFYING_RATIO = "verifying_ratio"
     FINALIZING = "finalizing"
     WAITING_FOR_BETTER_PRICES = "waiting_for_better_prices"
+    QUEUED = "queued"
 
 @dataclass
 class OrderExecution:
@@ -76,12 +109,15 @@ class OperationProgress:
     market_condition: str = ""
     real_quotes: Dict = None
     original_request: Optional[RatioOperationRequest] = None
+    hedge_orders: List[OrderExecution] = None  # Órdenes de cobertura que deshacen exceso (unwind)
 
     def __post_init__(self):
         if self.messages is None:
             self.messages = []
         if self.real_quotes is None:
             self.real_quotes = {}
+        if self.hedge_orders is None:
+            self.hedge_orders = []
 
 @dataclass
 class RatioOperationRequest:
@@ -94,14 +130,192 @@ class RatioOperationRequest:
     condition: str
     max_attempts: int = 0
     buy_qty: float = 0.0  # Cantidad específica a comprar (0 = calcular automáticamente)
+    leg_mode: str = ""  # sequential | parallel | on_fill ("" = RATIO_LEG_MODE)
+    hedge_policy: str = ""  # chase | unwind | none ("" = RATIO_HEDGE_POLICY)
+    algo: str = ""  # adaptive | twap | pov | threshold ("" = RATIO_EXEC_ALGO)
+    algo_params: Optional[Dict] = None  # Parámetros del algoritmo (ver execution_algos)
 
 class RealRatioOperationManager:
     def __init__(self):
         self.active_operations: Dict[str, OperationProgress] = {}
         self.callbacks: Dict[str, callable] = {}
-        self.operation_lock = asyncio.Lock()
         self.pending_orders_monitor: Dict[str, List[OrderExecution]] = {}  # operation_id -> pending orders
         self.monitoring_tasks: Dict[str, asyncio.Task] = {}  # operation_id -> monitoring task
+        # Eventos de order reports: client_order_id -> operation_id y un Event por operación
+        self._order_owner: Dict[str, str] = {}
+        self._order_events: Dict[str, asyncio.Event] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._order_listener_registered = False
+        # Scheduler: una tarea por operación, a lo sumo RATIO_MAX_CONCURRENT_OPS corriendo a la vez
+        self.operation_tasks: Dict[str, asyncio.Task] = {}  # operation_id -> tarea de la operación
+        self._running_operations: set = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        # Esperas por cotización: símbolo -> Events de las operaciones que esperan un tick de ese símbolo
+        self._quote_waiters: Dict[str, set] = {}
+        self._tick_listener_registered = False
+        self._order_seq = 0  # Sufijo de client order ids (varios lotes por segundo)
+    
+    def _ensure_order_listener(self):
+        """Suscribe el manager a los order reports de ws_rofex (una sola vez)"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if self._order_listener_registered:
+            return
+        manager = getattr(ws_rofex, 'manager', None)
+        if manager is not None and hasattr(manager, 'add_order_report_listener'):
+            manager.add_order_report_listener(self._on_order_report)
+            self._order_listener_registered = True
+    
+    def _on_order_report(self, report: Dict):
+        """Callback de ws_rofex (hilo de pyRofex): despierta al monitoreo de la operación dueña"""
+        loop = self._loop
+        if loop is None:
+            return
+        for key in ("wsClOrdId", "clOrdId"):
+            operation_id = self._order_owner.get(str(report.get(key)))
+            if operation_id:
+                try:
+                    loop.call_soon_threadsafe(self._set_order_event, operation_id)
+                except RuntimeError:
+                    pass  # loop cerrado
+                return
+    
+    def _order_event(self, operation_id: str) -> asyncio.Event:
+        event = self._order_events.get(operation_id)
+        if event is None:
+            event = self._order_events[operation_id] = asyncio.Event()
+        return event
+    
+    def _set_order_event(self, operation_id: str):
+        self._order_event(operation_id).set()
+    
+    def _forget_operation_orders(self, operation_id: str):
+        """Libera el índice de órdenes y el Event de una operación terminada"""
+        self._order_events.pop(operation_id, None)
+        for cid in [c for c, op in self._order_owner.items() if op == operation_id]:
+            del self._order_owner[cid]
+    
+    async def _wait_order_event(self, operation_id: str, timeout: float) -> bool:
+        """Espera un order report de la operación; True si llegó antes del timeout"""
+        event = self._order_event(operation_id)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            event.clear()
+    
+    def _ensure_tick_listener(self):
+        """Suscribe el manager a los ticks de ws_rofex (una sola vez)"""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if not self._tick_listener_registered:
+            ws_rofex.add_tick_listener(self._on_tick)
+            self._tick_listener_registered = True
+    
+    def _on_tick(self, tick: Dict):
+        """Callback de ws_rofex (hilo de pyRofex): solo agenda el aviso si alguien espera ese símbolo"""
+        symbol = tick.get("symbol")
+        loop = self._loop
+        if loop is None or not self._quote_waiters.get(symbol):
+            return
+        try:
+            loop.call_soon_threadsafe(self._wake_quote_waiters, symbol)
+        except RuntimeError:
+            pass  # loop cerrado
+    
+    def _wake_quote_waiters(self, symbol: str):
+        for event in self._quote_waiters.get(symbol, ()):
+            event.set()
+    
+    def _quote_seqs(self, instruments: List[str]) -> Dict[str, int]:
+        """seq actual de la cotización de cada instrumento (0 si no hay)"""
+        seqs = {}
+        for symbol in instruments:
+            quote = quotes_cache.get_quote_record(symbol)
+            seqs[symbol] = quote.seq if quote is not None else 0
+        return seqs
+    
+    async def _wait_quote_change(self, instruments: List[str], timeout: float, since: Optional[Dict[str, int]] = None) -> bool:
+        """Espera un tick de cualquiera de los instrumentos; True si llegó antes del timeout.
+
+        Con `since` (seqs leídos antes) vuelve enseguida si alguna cotización ya cambió desde entonces.
+        """
+        self._ensure_tick_listener()
+        event = asyncio.Event()
+        for symbol in instruments:
+            self._quote_waiters.setdefault(symbol, set()).add(event)
+        try:
+            if since is not None:
+                current = self._quote_seqs(instruments)
+                if any(current[symbol] > since.get(symbol, 0) for symbol in instruments):
+                    return True
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            for symbol in instruments:
+                waiters = self._quote_waiters.get(symbol)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._quote_waiters[symbol]
+    
+    def submit_operation(self, request: RatioOperationRequest) -> asyncio.Task:
+        """Encola la operación en el scheduler; arranca cuando hay lugar (RATIO_MAX_CONCURRENT_OPS)"""
+        self._create_algo(request)  # validar algoritmo y parámetros antes de encolar
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(RATIO_MAX_CONCURRENT_OPS)
+        operation_id = request.operation_id
+        progress = self._new_progress(request)
+        progress.current_step = OperationStep.QUEUED
+        self.active_operations[operation_id] = progress
+        if self._slots.locked():
+            self._add_message(operation_id, f"⏳ En cola: {len(self._running_operations)} operaciones en curso (máximo {RATIO_MAX_CONCURRENT_OPS})")
+        task = asyncio.create_task(self._run_scheduled_operation(request))
+        self.operation_tasks[operation_id] = task
+        return task
+    
+    async def _run_scheduled_operation(self, request: RatioOperationRequest) -> Optional[OperationProgress]:
+        operation_id = request.operation_id
+        try:
+            async with self._slots:
+                self._running_operations.add(operation_id)
+                try:
+                    progress = await self.execute_ratio_operation_batch(request)
+                    # El monitoreo de órdenes pendientes es parte de la operación: conserva el
+                    # lugar en el scheduler y las reservas de liquidez hasta terminar
+                    monitor = self.monitoring_tasks.get(operation_id)
+                    if monitor is not None:
+                        await monitor
+                    return progress
+                finally:
+                    self._running_operations.discard(operation_id)
+                    monitor = self.monitoring_tasks.pop(operation_id, None)
+                    if monitor is not None and not monitor.done():
+                        monitor.cancel()
+        except Exception as e:
+            progress = self.active_operations.get(operation_id)
+            if progress is not None:
+                progress.status = OperationStatus.FAILED
+                progress.error = str(e)
+                self._add_message(operation_id, f"❌ Error en la operación: {e}")
+                await self._notify_progress(operation_id, progress)
+            return progress
+        finally:
+            arbiter.release(operation_id)
+            self.operation_tasks.pop(operation_id, None)
+    
+    def get_scheduler_status(self) -> Dict:
+        """Operaciones corriendo / encoladas y reservas de liquidez por instrumento"""
+        return {
+            "max_concurrent": RATIO_MAX_CONCURRENT_OPS,
+            "running": sorted(self._running_operations),
+            "queued": sorted(op for op in self.operation_tasks if op not in self._running_operations),
+            "liquidity": arbiter.snapshot(),
+        }
     
     def register_callback(self, operation_id: str, callback: callable):
         """Registra un callback para notificar progreso"""
@@ -141,13 +355,13 @@ class RealRatioOperationManager:
             quotes = {}
             for instrument in instruments:
                 # Intentar obtener cotizaciones reales desde ratios_worker
-                market_data = ratios_worker.obtener_datos_mercado(instrument)
+                market_data = ratios_worker.obtener_datos_mercado(instrument, max_age_ms=ORDERS_MAX_QUOTE_AGE_MS)
                 if market_data and 'bid' in market_data and 'offer' in market_data:
                     quotes[instrument] = market_data
                     print(f"[DEBUG] Cotización real para {instrument}: bid={market_data['bid']}, offer={market_data['offer']}")
                 else:
-                    # Sin datos reales - operación fallida
-                    print(f"[DEBUG] Sin cotizaciones reales para {instrument} - operación fallida")
+                    # Sin datos reales (o viejos) - operación fallida
+                    print(f"[DEBUG] Sin cotizaciones reales vigentes para {instrument} (máx {ORDERS_MAX_QUOTE_AGE_MS} ms) - operación fallida")
                     return {}
             return quotes
         except Exception as e:
@@ -220,7 +434,7 @@ class RealRatioOperationManager:
     
     def _should_execute_now(self, current_ratio: float, target_ratio: float, condition: str, 
                            weighted_ratio: float, executed_lots: int, lot_size: float, 
-                           remaining_nominales: float) -> tuple[bool, str]:
+                           remaining_nominales: float, executed_nominales: float) -> tuple[bool, str]:
         """Determina si es el momento óptimo de ejecutar basado en la condición y optimización mejorada"""
         try:
             # Si no hay lotes ejecutados, verificar condición simple
@@ -234,7 +448,7 @@ class RealRatioOperationManager:
             # Si ya hay lotes ejecutados, usar lógica mejorada
             # Calcular el nuevo promedio ponderado si ejecutáramos este lote
             # Fórmula: nuevo_promedio = (promedio_actual * nominales_actuales + ratio_actual * lot_size) / (nominales_actuales + lot_size)
-            total_executed = 100.0 - remaining_nominales  # Nominales ya ejecutados
+            total_executed = executed_nominales  # Nominales ya ejecutados
             if total_executed > 0:
                 new_weighted_ratio = (weighted_ratio * total_executed + current_ratio * lot_size) / (total_executed + lot_size)
             else:
@@ -300,12 +514,49 @@ class RealRatioOperationManager:
             print(f"[DEBUG] Error en optimización: {e}")
             return False, f"Error en optimización: {e}"
     
-    def _calculate_lot_size(self, sell_quotes: Dict, buy_quotes: Dict, remaining_nominales: float, operation_id: str = "") -> float:
+    def _limit_price(self, price: float, side: str) -> float:
+        """Precio límite aceptando ORDERS_DEPTH_SLIPPAGE_BPS desde el mejor precio."""
+        if not price or ORDERS_DEPTH_SLIPPAGE_BPS <= 0:
+            return price
+        factor = ORDERS_DEPTH_SLIPPAGE_BPS / 10000.0
+        return price * (1 - factor) if side.lower() == "sell" else price * (1 + factor)
+    
+    def _depth_liquidity(self, instrument: str, side: str, price: Optional[float]) -> Optional[float]:
+        """Cantidad ejecutable hasta el precio límite según el libro de profundidad (None si no hay libro)"""
+        if not instrument or not price:
+            return None
+        return quotes_cache.volume_up_to(instrument, side, self._limit_price(price, side), ORDERS_MAX_QUOTE_AGE_MS)
+    
+    def _published_liquidity(self, sell_quotes: Dict, buy_quotes: Dict,
+                             sell_instrument: Optional[str] = None, buy_instrument: Optional[str] = None):
+        """(liquidez para vender, liquidez para comprar) publicadas, sin descontar reservas"""
+        # Libro de profundidad si lo hay, si no el mejor nivel
+        sell_liquidity = self._depth_liquidity(sell_instrument, "sell", sell_quotes.get('bid'))
+        if sell_liquidity is None:
+            sell_liquidity = sell_quotes.get('bid_size') or 0    # Liquidez en bid TX26 (cantidad disponible para vender)
+        buy_liquidity = self._depth_liquidity(buy_instrument, "buy", buy_quotes.get('offer'))
+        if buy_liquidity is None:
+            buy_liquidity = buy_quotes.get('offer_size') or 0    # Liquidez en offer TX28 (cantidad disponible para comprar)
+        return sell_liquidity, buy_liquidity
+    
+    def _available_liquidity(self, sell_quotes: Dict, buy_quotes: Dict, operation_id: str = "",
+                             sell_instrument: Optional[str] = None, buy_instrument: Optional[str] = None):
+        """(liquidez para vender, liquidez para comprar) libres para esta operación"""
+        sell_liquidity, buy_liquidity = self._published_liquidity(sell_quotes, buy_quotes, sell_instrument, buy_instrument)
+        # Descontar lo que ya reservaron otras operaciones sobre los mismos instrumentos
+        if sell_instrument:
+            sell_liquidity = arbiter.available(operation_id, sell_instrument, "sell", sell_liquidity)
+        if buy_instrument:
+            buy_liquidity = arbiter.available(operation_id, buy_instrument, "buy", buy_liquidity)
+        return sell_liquidity, buy_liquidity
+    
+    def _calculate_lot_size(self, sell_quotes: Dict, buy_quotes: Dict, remaining_nominales: float, operation_id: str = "",
+                            sell_instrument: Optional[str] = None, buy_instrument: Optional[str] = None) -> float:
         """Calcula el tamaño de lote basado en la liquidez disponible con factor de seguridad"""
         try:
-            # Obtener liquidez disponible
-            sell_liquidity = sell_quotes.get('bid_size', 0)    # Liquidez en bid TX26 (cantidad disponible para vender)
-            buy_liquidity = buy_quotes.get('offer_size', 0)    # Liquidez en offer TX28 (cantidad disponible para comprar)
+            sell_liquidity, buy_liquidity = self._available_liquidity(
+                sell_quotes, buy_quotes, operation_id, sell_instrument, buy_instrument
+            )
             
             self._add_message(operation_id, f"📊 Liquidez disponible:")
             self._add_message(operation_id, f"   📈 TX26 (vender): {sell_liquidity} nominales")
@@ -335,26 +586,43 @@ class RealRatioOperationManager:
             self._add_message(operation_id, f"   📦 Lote seguro: {safe_lot_size:.0f}")
             self._add_message(operation_id, f"   ✅ Lote final: {lot_size:.0f}")
             
+            # Precio promedio esperado recorriendo el libro
+            if sell_instrument and buy_instrument and lot_size > 0:
+                sell_vwap, _ = quotes_cache.vwap_for_size(sell_instrument, "sell", lot_size)
+                buy_vwap, _ = quotes_cache.vwap_for_size(buy_instrument, "buy", lot_size)
+                if sell_vwap and buy_vwap:
+                    self._add_message(operation_id, f"   📐 VWAP esperado: venta {sell_vwap:.4f} / compra {buy_vwap:.4f} (ratio {sell_vwap / buy_vwap:.6f})")
+            
             return lot_size
             
         except Exception as e:
             self._add_message(operation_id, f"❌ Error calculando tamaño de lote: {e}")
             return 0.0
     
-    def _get_current_liquidity(self, instrument: str, side: str) -> float:
-        """Obtiene la liquidez actual de un instrumento en tiempo real"""
+    def _get_current_liquidity(self, instrument: str, side: str, price: Optional[float] = None) -> float:
+        """Obtiene la liquidez actual de un instrumento en tiempo real.
+
+        `price` es el precio límite de la orden (ya con _limit_price): así el chequeo previo
+        cuenta los mismos niveles que _depth_liquidity usó para dimensionar el lote.
+        """
         try:
+            # Con precio límite y libro de profundidad: todo lo ejecutable hasta ese precio
+            if price:
+                depth_liquidity = quotes_cache.volume_up_to(instrument, side, price, ORDERS_MAX_QUOTE_AGE_MS)
+                if depth_liquidity is not None:
+                    return depth_liquidity
+            
             # Obtener cotizaciones actuales
-            market_data = ratios_worker.obtener_datos_mercado(instrument)
+            market_data = ratios_worker.obtener_datos_mercado(instrument, max_age_ms=ORDERS_MAX_QUOTE_AGE_MS)
             if not market_data:
                 return 0.0
             
             if side.lower() == "sell":
                 # Para venta, necesitamos liquidez en bid (donde vendemos)
-                return float(market_data.get('bid_size', 0))
+                return float(market_data.get('bid_size') or 0)
             else:
                 # Para compra, necesitamos liquidez en offer (donde compramos)
-                return float(market_data.get('offer_size', 0))
+                return float(market_data.get('offer_size') or 0)
                 
         except Exception as e:
             print(f"[DEBUG] Error obteniendo liquidez actual: {e}")
@@ -364,15 +632,17 @@ class RealRatioOperationManager:
         """Ejecuta orden con verificación de liquidez en tiempo real"""
         try:
             # Verificar liquidez actual ANTES de enviar la orden
-            current_liquidity = self._get_current_liquidity(instrument, side)
+            current_liquidity = self._get_current_liquidity(instrument, side, price)
+            # Reservar sobre lo que no tomaron otras operaciones (se libera al volver la orden)
+            free_liquidity = arbiter.reserve(operation_id, instrument, side, quantity, current_liquidity)
             
             self._add_message(operation_id, f"🔍 Verificando liquidez actual para {side.upper()} {instrument}:")
-            self._add_message(operation_id, f"   📊 Liquidez disponible: {current_liquidity}")
+            self._add_message(operation_id, f"   📊 Liquidez disponible: {current_liquidity} (libre: {free_liquidity})")
             self._add_message(operation_id, f"   📦 Cantidad solicitada: {quantity}")
             
-            if current_liquidity < quantity:
+            if free_liquidity < quantity:
                 # Ajustar cantidad a la liquidez disponible
-                adjusted_quantity = current_liquidity
+                adjusted_quantity = free_liquidity
                 self._add_message(operation_id, f"⚠️ Liquidez insuficiente: {quantity} → {adjusted_quantity}")
                 
                 if adjusted_quantity <= 0:
@@ -388,6 +658,8 @@ class RealRatioOperationManager:
         except Exception as e:
             self._add_message(operation_id, f"❌ Error verificando liquidez: {str(e)}")
             return await self._execute_real_order(operation_id, instrument, side, quantity, price)
+        finally:
+            arbiter.release(operation_id, instrument, side)
     
     async def _handle_partial_execution(self, operation_id: str, expected_quantity: float, actual_quantity: float, instrument: str, side: str) -> float:
         """Maneja ejecuciones parciales cuando la liquidez es insuficiente"""
@@ -427,7 +699,8 @@ class RealRatioOperationManager:
             self._add_message(operation_id, f"📤 Enviando orden {side.upper()} para {instrument}: {quantity} @ {price}")
             
             # Preparar parámetros para la orden
-            client_order_id = f"{operation_id}_{side}_{datetime.now().strftime('%H%M%S')}"
+            self._order_seq += 1
+            client_order_id = f"{operation_id}_{side}_{datetime.now().strftime('%H%M%S')}_{self._order_seq}"
             order_params = {
                 "instrument": instrument,
                 "side": side,
@@ -440,6 +713,8 @@ class RealRatioOperationManager:
             
             # Ejecutar orden real usando ws_rofex
             if hasattr(ws_rofex, 'manager') and hasattr(ws_rofex.manager, 'send_order'):
+                self._ensure_order_listener()
+                self._order_owner[client_order_id] = operation_id
                 result = ws_rofex.manager.send_order(
                     symbol=instrument,
                     side=side.upper(),
@@ -464,9 +739,10 @@ class RealRatioOperationManager:
                     )
                     self._add_message(operation_id, f"✅ Orden {side.upper()} aceptada por broker: {order_execution.order_id}")
                     
-                    # Esperar y verificar el estado real de la orden
-                    await asyncio.sleep(2)  # Esperar un poco para que llegue el order report
-                    real_status = await self._verify_order_status(operation_id, client_order_id, order_execution)
+                    # Esperar el order report decisivo de esta orden (sin sleep fijo)
+                    real_status = await self._verify_order_status(
+                        operation_id, client_order_id, order_execution, statuses=DECISIVE_STATUSES
+                    )
                     
                     return order_execution
                 else:
@@ -488,66 +764,44 @@ class RealRatioOperationManager:
             print(f"[DEBUG] Error ejecutando orden: {e}")
             return None
     
-    async def _verify_order_status(self, operation_id: str, client_order_id: str, order_execution: OrderExecution) -> str:
-        """Verifica el estado real de una orden consultando los order reports"""
+    async def _verify_order_status(self, operation_id: str, client_order_id: str, order_execution: OrderExecution,
+                                   timeout: float = ORDER_REPORT_TIMEOUT, statuses=None) -> str:
+        """Verifica el estado real de una orden con su propio order report (índice por client order id)"""
         try:
             self._add_message(operation_id, f"🔍 Verificando estado real de orden: {client_order_id}")
-            
-            # Intentar múltiples veces para obtener el order report correcto
-            max_attempts = 5
-            for attempt in range(max_attempts):
-                if hasattr(ws_rofex, 'manager') and hasattr(ws_rofex.manager, 'last_order_report'):
-                    last_report = ws_rofex.manager.last_order_report()
-                    
-                    if last_report:
-                        # Buscar el client order ID en diferentes campos posibles
-                        report_client_id = (last_report.get("wsClOrdId") or 
-                                          last_report.get("clOrdId") or 
-                                          last_report.get("clientId") or 
-                                          last_report.get("client_order_id"))
-                        
-                        if report_client_id == client_order_id:
-                            order_status = last_report.get('status', 'UNKNOWN')
-                            self._add_message(operation_id, f"📊 Estado real de orden {client_order_id}: {order_status}")
-                            
-                            # Mapear estados del broker a estados internos
-                            if order_status in ['FILLED', 'PARTIALLY_FILLED']:
-                                order_execution.status = "filled"
-                                self._add_message(operation_id, f"✅ Orden {client_order_id} EJECUTADA en el mercado")
-                                return order_execution.status
-                            elif order_status in ['PENDING_NEW', 'NEW', 'PENDING_CANCEL']:
-                                order_execution.status = "pending"
-                                self._add_message(operation_id, f"⏳ Orden {client_order_id} PENDIENTE en el mercado")
-                                return order_execution.status
-                            elif order_status in ['CANCELLED', 'REJECTED']:
-                                order_execution.status = "rejected"
-                                self._add_message(operation_id, f"❌ Orden {client_order_id} RECHAZADA/CANCELADA")
-                                return order_execution.status
-                            else:
-                                order_execution.status = "unknown"
-                                self._add_message(operation_id, f"❓ Orden {client_order_id} estado desconocido: {order_status}")
-                                return order_execution.status
-                        else:
-                            if attempt < max_attempts - 1:
-                                self._add_message(operation_id, f"⏳ Esperando order report para {client_order_id}... (intento {attempt + 1}/{max_attempts})")
-                                await asyncio.sleep(1)  # Esperar un poco más
-                                continue
-                            else:
-                                self._add_message(operation_id, f"⚠️ Order report no coincide con {client_order_id} (encontrado: {report_client_id})")
-                    else:
-                        if attempt < max_attempts - 1:
-                            self._add_message(operation_id, f"⏳ Esperando order report... (intento {attempt + 1}/{max_attempts})")
-                            await asyncio.sleep(1)
-                            continue
-                        else:
-                            self._add_message(operation_id, f"⚠️ No hay order report disponible para verificar {client_order_id}")
-                else:
-                    self._add_message(operation_id, f"⚠️ No se puede verificar estado de orden - ws_rofex no disponible")
-                    break
-            
-            # Si no se puede verificar después de todos los intentos, usar lógica alternativa
-            return await self._fallback_order_status_check(operation_id, client_order_id, order_execution)
-            
+
+            manager = getattr(ws_rofex, 'manager', None)
+            if manager is None or not hasattr(manager, 'wait_order_report'):
+                self._add_message(operation_id, f"⚠️ No se puede verificar estado de orden - ws_rofex no disponible")
+                return await self._fallback_order_status_check(operation_id, client_order_id, order_execution)
+
+            # Espera sin polling: vuelve apenas llega un reporte de ESTA orden (o al timeout)
+            report = await manager.wait_order_report(client_order_id, timeout=timeout, statuses=statuses)
+            if report is None and statuses is not None:
+                # No llegó un estado decisivo: usar el último reporte conocido (p.ej. NEW)
+                report = manager.order_report(client_order_id)
+            if report is None:
+                self._add_message(operation_id, f"⚠️ Sin order report para {client_order_id} en {timeout:.0f}s")
+                return await self._fallback_order_status_check(operation_id, client_order_id, order_execution)
+
+            order_status = report.get('status', 'UNKNOWN')
+            self._add_message(operation_id, f"📊 Estado real de orden {client_order_id}: {order_status}")
+
+            # Mapear estados del broker a estados internos
+            if order_status in ['FILLED', 'PARTIALLY_FILLED']:
+                order_execution.status = "filled"
+                self._add_message(operation_id, f"✅ Orden {client_order_id} EJECUTADA en el mercado")
+            elif order_status in ['PENDING_NEW', 'NEW', 'PENDING_CANCEL']:
+                order_execution.status = "pending"
+                self._add_message(operation_id, f"⏳ Orden {client_order_id} PENDIENTE en el mercado")
+            elif order_status in ['CANCELLED', 'REJECTED']:
+                order_execution.status = "rejected"
+                self._add_message(operation_id, f"❌ Orden {client_order_id} RECHAZADA/CANCELADA")
+            else:
+                order_execution.status = "unknown"
+                self._add_message(operation_id, f"❓ Orden {client_order_id} estado desconocido: {order_status}")
+            return order_execution.status
+
         except Exception as e:
             self._add_message(operation_id, f"❌ Error verificando estado de orden: {str(e)}")
             order_execution.status = "pending"
@@ -665,6 +919,13 @@ class RealRatioOperationManager:
             
             if not pending_orders:
                 self._add_message(operation_id, "✅ No hay órdenes pendientes para monitorear")
+                self._forget_operation_orders(operation_id)
+                return
+            
+            current = self.monitoring_tasks.get(operation_id)
+            if current is not None and not current.done():
+                # Un solo loop por operación: el que corre toma la nueva lista de pendientes
+                self.pending_orders_monitor[operation_id] = pending_orders
                 return
             
             self.pending_orders_monitor[operation_id] = pending_orders
@@ -683,13 +944,13 @@ class RealRatioOperationManager:
         """Loop de monitoreo continuo de órdenes pendientes"""
         try:
             max_monitoring_time = 1800  # 30 minutos máximo
-            check_interval = 10  # Verificar cada 10 segundos
+            check_interval = 10  # Fallback si no llegan order reports
             start_time = time.time()
             
             self._add_message(operation_id, f"⏰ MONITOREO CONTINUO INICIADO")
             self._add_message(operation_id, f"   🎯 Objetivo: Completar TODOS los nominales solicitados")
             self._add_message(operation_id, f"   ⏱️ Duración máxima: {max_monitoring_time/60:.0f} minutos")
-            self._add_message(operation_id, f"   🔄 Verificación cada: {check_interval} segundos")
+            self._add_message(operation_id, f"   🔄 Verificación por order report (fallback cada {check_interval} segundos)")
             
             while time.time() - start_time < max_monitoring_time:
                 try:
@@ -705,8 +966,8 @@ class RealRatioOperationManager:
                     
                     for order in pending_orders:
                         if order.status == "pending":
-                            # Verificar estado actual
-                            await self._verify_order_status(operation_id, order.order_id, order)
+                            # Verificar estado actual (el reporte ya está en el índice, no esperar)
+                            await self._verify_order_status(operation_id, order.order_id, order, timeout=0)
                             
                             if order.status == "filled":
                                 newly_filled.append(order)
@@ -739,12 +1000,12 @@ class RealRatioOperationManager:
                                 self._add_message(operation_id, f"⚠️ Órdenes ejecutadas pero faltan nominales: {progress.completed_nominales}/{progress.original_request.nominales}")
                                 # Continuar monitoreo para ejecutar más lotes
                     
-                    # Esperar antes del siguiente check
-                    await asyncio.sleep(check_interval)
+                    # Esperar el próximo order report de la operación (o el fallback)
+                    await self._wait_order_event(operation_id, check_interval)
                     
                 except Exception as e:
                     self._add_message(operation_id, f"❌ Error en monitoreo: {str(e)}")
-                    await asyncio.sleep(check_interval)
+                    await self._wait_order_event(operation_id, check_interval)
             
             # Limpiar monitoreo
             if operation_id in self.pending_orders_monitor:
@@ -755,6 +1016,7 @@ class RealRatioOperationManager:
             
             if operation_id in self.monitoring_tasks:
                 del self.monitoring_tasks[operation_id]
+            self._forget_operation_orders(operation_id)
                 
         except Exception as e:
             self._add_message(operation_id, f"❌ Error en loop de monitoreo: {str(e)}")
@@ -819,7 +1081,8 @@ class RealRatioOperationManager:
             buy_quotes = quotes.get(buy_instrument, {})
             
             # Calcular tamaño de lote adicional con factor de seguridad
-            lot_size = self._calculate_lot_size(sell_quotes, buy_quotes, remaining_nominales, operation_id)
+            lot_size = self._calculate_lot_size(sell_quotes, buy_quotes, remaining_nominales, operation_id,
+                                                request.instrument_to_sell, buy_instrument)
             
             if lot_size <= 0:
                 self._add_message(operation_id, f"⚠️ Sin liquidez para lote adicional - nominales restantes: {remaining_nominales}")
@@ -851,7 +1114,7 @@ class RealRatioOperationManager:
                 request.instrument_to_sell, 
                 "sell", 
                 lot_size, 
-                sell_price
+                self._limit_price(sell_price, "sell")  # con deslizamiento toma los niveles contados en el lote
             )
             
             if not sell_order:
@@ -862,9 +1125,6 @@ class RealRatioOperationManager:
             if operation_id in self.active_operations:
                 self.active_operations[operation_id].sell_orders.append(sell_order)
             
-            # Esperar un poco
-            await asyncio.sleep(1)
-            
             # PASO 2: Comprar instrumento complementario
             if "TX26" in request.instrument_to_sell:
                 buy_price = buy_quotes.get('offer', 0)
@@ -880,7 +1140,7 @@ class RealRatioOperationManager:
                 buy_instrument, 
                 "buy", 
                 lot_size, 
-                buy_price
+                self._limit_price(buy_price, "buy")
             )
             
             if not buy_order:
@@ -900,18 +1160,198 @@ class RealRatioOperationManager:
         except Exception as e:
             self._add_message(operation_id, f"❌ Error ejecutando lote adicional: {str(e)}")
     
-    async def execute_ratio_operation_batch(self, request: RatioOperationRequest) -> OperationProgress:
-        """Ejecuta una operación de ratio con órdenes reales"""
-        print("=" * 80)
-        print("🚀🚀🚀 EJECUTANDO OPERACIONES DE RATIO REALES 🚀🚀🚀")
-        print("=" * 80)
+    def _create_algo(self, request: RatioOperationRequest) -> ExecutionAlgo:
+        """Algoritmo de ejecución de la operación (ValueError si el nombre o los parámetros no sirven)"""
+        name = (getattr(request, "algo", "") or RATIO_EXEC_ALGO).lower()
+        params = dict(getattr(request, "algo_params", None) or {})
+        if name == "adaptive":
+            # Los reintentos históricos: 10 esperas de RATIO_QUOTE_WAIT_SECONDS
+            params.setdefault("retry_wait_s", RATIO_QUOTE_WAIT_SECONDS)
+            params.setdefault("max_wait_s", 10 * RATIO_QUOTE_WAIT_SECONDS)
+        return create_algo(name, params, should_execute=self._should_execute_now)
+    
+    def _leg_mode(self, request: RatioOperationRequest) -> str:
+        mode = (getattr(request, "leg_mode", "") or RATIO_LEG_MODE).lower()
+        return mode if mode in LEG_MODES else "sequential"
+    
+    def _hedge_policy(self, request: RatioOperationRequest) -> str:
+        policy = (getattr(request, "hedge_policy", "") or RATIO_HEDGE_POLICY).lower()
+        return policy if policy in HEDGE_POLICIES else "none"
+    
+    def _leg_prices(self, request: RatioOperationRequest, sell_quotes: Dict, buy_quotes: Dict):
+        """(precio de venta, instrumento a comprar, precio de compra) de la estrategia normal (TX26) o inversa (TX28)"""
+        if "TX26" in request.instrument_to_sell:
+            return sell_quotes.get('bid', 0), "MERV - XMEV - TX28 - 24hs", buy_quotes.get('offer', 0)
+        if "TX28" in request.instrument_to_sell:
+            return buy_quotes.get('bid', 0), "MERV - XMEV - TX26 - 24hs", sell_quotes.get('offer', 0)
+        return None
+    
+    def _filled_quantity(self, order: Optional[OrderExecution]) -> float:
+        """Cantidad ejecutada según el último order report (cumQty); sin reporte, todo o nada por estado"""
+        if order is None:
+            return 0.0
+        manager = getattr(ws_rofex, 'manager', None)
+        report = manager.order_report(order.order_id) if manager is not None and hasattr(manager, 'order_report') else None
+        if report and report.get('cumQty') is not None:
+            try:
+                return min(float(report['cumQty']), order.quantity)
+            except (TypeError, ValueError):
+                pass
+        return order.quantity if order.status == "filled" else 0.0
+    
+    async def _cancel_remainder(self, operation_id: str, order: OrderExecution) -> float:
+        """Cancela lo no ejecutado de una orden; si la orden terminó, queda por lo ejecutado (cantidad y avgPx).
+
+        Devuelve la cantidad ejecutada.
+        """
+        filled = self._filled_quantity(order)
+        manager = getattr(ws_rofex, 'manager', None)
+        if manager is None or not hasattr(manager, 'cancel_order'):
+            return filled
+        report = manager.order_report(order.order_id)
+        if filled < order.quantity and (not report or report.get('status') not in TERMINAL_STATUSES):
+            result = manager.cancel_order(order.order_id)
+            if result.get('status') != 'ok':
+                self._add_message(operation_id, f"⚠️ No se pudo cancelar {order.order_id}: {result.get('message')}")
+                return filled
+            self._add_message(operation_id, f"🚫 Cancelando remanente de {order.order_id}: {order.quantity - filled}")
+            report = await manager.wait_order_report(order.order_id, timeout=ORDER_REPORT_TIMEOUT, statuses=TERMINAL_STATUSES)
+        if report and report.get('status') in TERMINAL_STATUSES:
+            filled = self._filled_quantity(order)
+            order.quantity = filled
+            order.status = "filled" if filled > 0 else "rejected"
+            if filled > 0 and report.get('avgPx'):
+                order.price = float(report['avgPx'])
+        return filled
+    
+    async def _hedge_order(self, operation_id: str, instrument: str, side: str, quantity: float, ref_price: float) -> Optional[OrderExecution]:
+        """Orden de cobertura que toma el libro hasta RATIO_HEDGE_MAX_BPS del precio de referencia"""
+        if ref_price:
+            # Límite de protección: ejecuta contra los niveles del libro hasta ese precio
+            factor = RATIO_HEDGE_MAX_BPS / 10000.0
+            price = ref_price * (1 - factor) if side == "sell" else ref_price * (1 + factor)
+        else:
+            quotes = self._get_real_quotes([instrument]).get(instrument, {})
+            price = quotes.get('bid' if side == "sell" else 'offer')
+        if not price:
+            self._add_message(operation_id, f"❌ Sin precio para cubrir {side.upper()} {instrument}")
+            return None
+        self._add_message(operation_id, f"🛡️ COBERTURA: {side.upper()} {quantity} {instrument} @ {price}")
+        order = await self._execute_real_order(operation_id, instrument, side, quantity, price)
+        if order is not None:
+            # La cobertura no queda colgada: lo que no se ejecutó se cancela
+            await self._cancel_remainder(operation_id, order)
+        return order
+    
+    async def _hedge_legs(self, operation_id: str, progress: OperationProgress, policy: str, ratio: float,
+                          sell_filled: float, buy_filled: float, sell_instrument: str, buy_instrument: str,
+                          sell_price: float, buy_price: float):
+        """Equilibra las patas de un lote (compra = venta * ratio). Devuelve (venta, compra) ejecutadas"""
+        gap = sell_filled * ratio - buy_filled  # > 0: falta compra, < 0: falta venta
+        if abs(gap) < 1e-9:
+            return sell_filled, buy_filled
+        self._add_message(operation_id, f"⚠️ Patas desbalanceadas: venta {sell_filled} / compra {buy_filled} (política {policy})")
+        if policy == "chase":
+            if gap > 0:
+                order = await self._hedge_order(operation_id, buy_instrument, "buy", gap, buy_price)
+                if order is not None and order.status != "rejected":
+                    progress.buy_orders.append(order)
+                    buy_filled += self._filled_quantity(order)
+            else:
+                order = await self._hedge_order(operation_id, sell_instrument, "sell", -gap / ratio, sell_price)
+                if order is not None and order.status != "rejected":
+                    progress.sell_orders.append(order)
+                    sell_filled += self._filled_quantity(order)
+        elif policy == "unwind":
+            # Se deshace contra el lado opuesto al de la pata original: los precios del lote
+            # (bid del vendido, offer del comprado) quedan fuera de la banda si el spread es ancho
+            if gap > 0:
+                # Se vendió de más: recomprar el exceso del instrumento vendido
+                ref = self._get_real_quotes([sell_instrument]).get(sell_instrument, {}).get('offer') or 0.0
+                order = await self._hedge_order(operation_id, sell_instrument, "buy", gap / ratio, ref)
+                if order is not None:
+                    progress.hedge_orders.append(order)
+                    sell_filled -= self._filled_quantity(order)
+            else:
+                # Se compró de más: vender el exceso del instrumento comprado
+                ref = self._get_real_quotes([buy_instrument]).get(buy_instrument, {}).get('bid') or 0.0
+                order = await self._hedge_order(operation_id, buy_instrument, "sell", -gap, ref)
+                if order is not None:
+                    progress.hedge_orders.append(order)
+                    buy_filled -= self._filled_quantity(order)
+        if abs(sell_filled * ratio - buy_filled) >= 1e-9:
+            self._add_message(operation_id, f"⚠️ Cobertura incompleta: venta {sell_filled} / compra {buy_filled}")
+        return sell_filled, buy_filled
+    
+    async def _execute_lot_legs(self, operation_id: str, request: RatioOperationRequest, progress: OperationProgress,
+                                lot_number: int, mode: str, lot_size: float, sell_price: float,
+                                buy_instrument: str, buy_price: float) -> Optional[float]:
+        """Ejecuta las patas de un lote en paralelo (parallel) o con la compra disparada por el fill (on_fill).
+
+        Devuelve los nominales comprados que quedaron cubiertos por la venta, o None si no se pudo enviar.
+        """
+        sell_instrument = request.instrument_to_sell
+        # pyRofex opera nominales enteros
+        lot_size = float(int(lot_size))
+        if lot_size < 1:
+            self._add_message(operation_id, f"⚠️ LOTE #{lot_number} - Menos de un nominal disponible")
+            return 0.0
+        buy_quantity = request.buy_qty if 0 < request.buy_qty <= lot_size else lot_size
+        ratio = buy_quantity / lot_size
+        policy = self._hedge_policy(request)
+        # Límites con deslizamiento: toman los niveles del libro con los que se dimensionó el lote
+        sell_limit, buy_limit = self._limit_price(sell_price, "sell"), self._limit_price(buy_price, "buy")
         
-        operation_id = request.operation_id
-        self._add_message(operation_id, "🚀 INICIANDO operación de ratio con órdenes reales")
+        if mode == "parallel":
+            self._add_message(operation_id, f"⚡ LOTE #{lot_number} - Venta {lot_size} @ {sell_price} y compra {buy_quantity} @ {buy_price} en paralelo")
+            sell_order, buy_order = await asyncio.gather(
+                self._execute_real_order_with_liquidity_check(operation_id, sell_instrument, "sell", lot_size, sell_limit),
+                self._execute_real_order_with_liquidity_check(operation_id, buy_instrument, "buy", buy_quantity, buy_limit),
+            )
+            if sell_order is None and buy_order is None:
+                return None
+            sell_filled = await self._cancel_remainder(operation_id, sell_order) if sell_order else 0.0
+            buy_filled = await self._cancel_remainder(operation_id, buy_order) if buy_order else 0.0
+        else:
+            self._add_message(operation_id, f"📤 LOTE #{lot_number} - Venta {lot_size} @ {sell_price}; la compra sale con el fill")
+            sell_order = await self._execute_real_order_with_liquidity_check(operation_id, sell_instrument, "sell", lot_size, sell_limit)
+            if sell_order is None:
+                return None
+            sell_filled = await self._cancel_remainder(operation_id, sell_order)
+            buy_order = None
+            buy_filled = 0.0
+            if sell_filled > 0:
+                buy_order = await self._execute_real_order_with_liquidity_check(
+                    operation_id, buy_instrument, "buy", float(int(sell_filled * ratio)), buy_limit
+                )
+                buy_filled = await self._cancel_remainder(operation_id, buy_order) if buy_order else 0.0
+        
+        # Las órdenes que terminaron sin ejecutar nada no cuentan para la operación
+        if sell_order is not None and sell_order.status != "rejected":
+            progress.sell_orders.append(sell_order)
+        if buy_order is not None and buy_order.status != "rejected":
+            progress.buy_orders.append(buy_order)
         
-        # Crear el progreso
-        progress = OperationProgress(
-            operation_id=operation_id,
+        sell_filled, buy_filled = await self._hedge_legs(
+            operation_id, progress, policy, ratio, sell_filled, buy_filled,
+            sell_instrument, buy_instrument, sell_price, buy_price
+        )
+        
+        # Totales con lo que efectivamente quedó en cada pata
+        progress.total_sold_amount = sum(o.quantity * o.price for o in progress.sell_orders)
+        progress.total_bought_amount = sum(o.quantity * o.price for o in progress.buy_orders)
+        sold = sum(o.quantity for o in progress.sell_orders)
+        bought = sum(o.quantity for o in progress.buy_orders)
+        progress.average_sell_price = progress.total_sold_amount / sold if sold else 0.0
+        progress.average_buy_price = progress.total_bought_amount / bought if bought else 0.0
+        
+        self._add_message(operation_id, f"✅ LOTE #{lot_number} - Ejecutado: venta {sell_filled} / compra {buy_filled}")
+        return min(buy_filled, sell_filled * ratio)
+    
+    def _new_progress(self, request: RatioOperationRequest) -> OperationProgress:
+        """Progreso inicial (PENDING) de una operación"""
+        return OperationProgress(
+            operation_id=request.operation_id,
             status=OperationStatus.PENDING,
             current_step=OperationStep.INITIALIZING,
             progress_percentage=0,
@@ -942,6 +1382,20 @@ class RealRatioOperationManager:
             real_quotes={},
             original_request=request
         )
+    
+    async def execute_ratio_operation_batch(self, request: RatioOperationRequest) -> OperationProgress:
+        """Ejecuta una operación de ratio con órdenes reales"""
+        print("=" * 80)
+        print("🚀🚀🚀 EJECUTANDO OPERACIONES DE RATIO REALES 🚀🚀🚀")
+        print("=" * 80)
+        
+        operation_id = request.operation_id
+        self._add_message(operation_id, "🚀 INICIANDO operación de ratio con órdenes reales")
+        
+        # Progreso creado al encolar (submit_operation) o nuevo si se llama directo
+        progress = self.active_operations.get(operation_id)
+        if progress is None or progress.status != OperationStatus.PENDING:
+            progress = self._new_progress(request)
         
         # Agregar a operaciones activas
         self.active_operations[operation_id] = progress
@@ -990,72 +1444,90 @@ class RealRatioOperationManager:
         self._add_message(operation_id, "⚡ INICIANDO operación por lotes adaptativos")
         self._add_message(operation_id, f"🎯 Objetivo total: {request.nominales} nominales")
         
-        # Bucle principal de lotes
+        # Bucle principal de lotes: el algoritmo de ejecución decide con cada cotización nueva del par
         lot_number = 0
-        wait_attempts = 0
-        max_wait_attempts = 10  # Máximo 10 intentos de espera por lote
+        max_empty_lots = 10  # Lotes seguidos sin ejecución antes de abandonar (parallel / on_fill)
+        algo = self._create_algo(request)
+        leg_mode = self._leg_mode(request)
+        empty_lots = 0
+        last_reason = None
+        self._add_message(operation_id, f"🧠 Algoritmo de ejecución: {algo.describe()}")
+        if leg_mode != "sequential":
+            self._add_message(operation_id, f"🔀 Modo de patas: {leg_mode} (cobertura: {self._hedge_policy(request)})")
         
         while progress.remaining_nominales > 0:
-            lot_number += 1
-            progress.batch_count = lot_number
-            
-            self._add_message(operation_id, f"🔄 LOTE #{lot_number} - Nominales restantes: {progress.remaining_nominales}")
-            self._add_message(operation_id, f"⏰ Intentos de espera: {wait_attempts}/{max_wait_attempts}")
-            
-            # Obtener cotizaciones actualizadas para este lote
+            # Obtener cotizaciones actualizadas (y su seq, para esperar solo cambios posteriores)
+            seen = self._quote_seqs(instruments)
             quotes = self._get_real_quotes(instruments)
             progress.real_quotes = quotes
             sell_quotes = quotes.get(request.instrument_to_sell, {})
             buy_quotes = quotes.get(buy_instrument, {})
             
-            # Calcular tamaño de lote basado en liquidez disponible con factor de seguridad
-            lot_size = self._calculate_lot_size(sell_quotes, buy_quotes, progress.remaining_nominales, operation_id)
-            
-            if lot_size <= 0:
-                self._add_message(operation_id, "⚠️ Sin liquidez suficiente para continuar")
-                progress.status = OperationStatus.PARTIALLY_COMPLETED
-                break
-            
-            progress.current_batch_size = lot_size
-            self._add_message(operation_id, f"📊 Lote #{lot_number}: {lot_size} nominales (liquidez adaptativa)")
-            
-            # Calcular ratio actual para este lote
+            # Liquidez libre de cada pata (publicada menos lo reservado por otras operaciones) y ratio actual
+            sell_published, buy_published = self._published_liquidity(
+                sell_quotes, buy_quotes, request.instrument_to_sell, buy_instrument
+            )
+            sell_liquidity = arbiter.available(operation_id, request.instrument_to_sell, "sell", sell_published)
+            buy_liquidity = arbiter.available(operation_id, buy_instrument, "buy", buy_published)
+            if (sell_liquidity <= 0 or buy_liquidity <= 0) and sell_published > 0 and buy_published > 0:
+                # Hay libro pero lo tomó otra operación en curso: esperar a que lo libere, no abandonar
+                progress.current_step = OperationStep.WAITING_FOR_BETTER_PRICES
+                reason = "Liquidez reservada por otra operación en curso"
+                if reason != last_reason:
+                    self._add_message(operation_id, f"⏳ ESPERAR: {reason} (venta {sell_liquidity} / compra {buy_liquidity} libres)")
+                    last_reason = reason
+                await self._wait_quote_change(instruments, RATIO_RESERVATION_WAIT_SECONDS, seen)
+                continue
             current_ratio = self._calculate_current_ratio(sell_quotes, buy_quotes, request.instrument_to_sell)
             progress.current_ratio = current_ratio
             
             # Obtener ratio ponderado actual de todos los lotes ejecutados
             current_weighted_ratio = progress.weighted_average_ratio if progress.weighted_average_ratio > 0 else current_ratio
             
-            # EVALUAR OPTIMIZACIÓN - ¿Es el momento óptimo de ejecutar?
-            should_execute, execution_reason = self._should_execute_now(
-                current_ratio, 
-                request.target_ratio, 
-                request.condition,
-                current_weighted_ratio,
-                progress.batch_count - 1,  # lotes ya ejecutados
-                lot_size,  # tamaño del lote actual
-                progress.remaining_nominales  # nominales restantes
+            # EVALUAR CON EL ALGORITMO - ¿cuánto ejecutar ahora?
+            ctx = AlgoContext(
+                nominales=request.nominales,
+                remaining=progress.remaining_nominales,
+                executed=progress.completed_nominales,
+                lots=lot_number,
+                sell_liquidity=sell_liquidity,
+                buy_liquidity=buy_liquidity,
+                current_ratio=current_ratio,
+                weighted_ratio=current_weighted_ratio,
+                target_ratio=request.target_ratio,
+                condition=request.condition,
+                quote_seq=sum(seen.values()),
             )
+            decision = algo.decide(ctx)
+            lot_size = float(int(decision.quantity))  # pyRofex opera nominales enteros
+            
+            if decision.stop:
+                self._add_message(operation_id, f"⚠️ {decision.reason}")
+                progress.status = OperationStatus.PARTIALLY_COMPLETED
+                break
+            
+            if lot_size < 1:
+                # Esperar la próxima cotización del par (sin repetir mensajes si la razón no cambió)
+                progress.current_step = OperationStep.WAITING_FOR_BETTER_PRICES
+                if decision.reason != last_reason:
+                    self._add_message(operation_id, f"📈 Ratio actual: {current_ratio:.6f} | 📊 Ratio ponderado: {current_weighted_ratio:.6f}")
+                    self._add_message(operation_id, f"⏳ ESPERAR: {decision.reason} (re-evalúa con la próxima cotización, máx {decision.wait_s:g}s)")
+                    last_reason = decision.reason
+                await self._wait_quote_change(instruments, decision.wait_s, seen)
+                continue
+            
+            last_reason = None
+            lot_number += 1
+            progress.batch_count = lot_number
+            progress.current_step = OperationStep.EXECUTING_BATCH
+            progress.current_batch_size = lot_size
             
+            self._add_message(operation_id, f"🔄 LOTE #{lot_number} - Nominales restantes: {progress.remaining_nominales}")
+            self._add_message(operation_id, f"📊 Liquidez libre: venta {sell_liquidity} / compra {buy_liquidity}")
             self._add_message(operation_id, f"📈 Ratio actual: {current_ratio:.6f}")
             self._add_message(operation_id, f"📊 Ratio ponderado: {current_weighted_ratio:.6f}")
-            self._add_message(operation_id, f"🎯 Decisión: {'✅ EJECUTAR' if should_execute else '⏳ ESPERAR'}")
-            self._add_message(operation_id, f"💭 Razón: {execution_reason}")
-            
-            if not should_execute:
-                # Esperar por mejores precios
-                wait_attempts += 1
-                self._add_message(operation_id, f"⏳ ESPERANDO por mejores precios... (intento {wait_attempts}/{max_wait_attempts})")
-                
-                if wait_attempts >= max_wait_attempts:
-                    # Forzar ejecución después de muchos intentos
-                    self._add_message(operation_id, f"⚠️ TIMEOUT: Ejecutando lote después de {max_wait_attempts} intentos de espera")
-                    self._add_message(operation_id, f"🎯 Ejecutando con ratio actual: {current_ratio:.6f}")
-                    wait_attempts = 0  # Reset para el siguiente lote
-                else:
-                    self._add_message(operation_id, f"🔄 Reintentando en 5 segundos...")
-                    await asyncio.sleep(5)
-                    continue
+            self._add_message(operation_id, f"🎯 Decisión: ✅ EJECUTAR {lot_size:.0f} nominales")
+            self._add_message(operation_id, f"💭 Razón: {decision.reason}")
             
             # EJECUTAR LOTE - Condición óptima cumplida
             # PASO 1: Vender instrumento al precio de compra (bid)
@@ -1072,79 +1544,98 @@ class RealRatioOperationManager:
                 progress.status = OperationStatus.FAILED
                 break
             
-            sell_order = await self._execute_real_order_with_liquidity_check(
-                operation_id, 
-                request.instrument_to_sell, 
-                "sell", 
-                lot_size, 
-                sell_price
-            )
-            
-            if not sell_order:
-                self._add_message(operation_id, f"❌ LOTE #{lot_number} - Error en venta")
-                progress.status = OperationStatus.FAILED
-                progress.error = f"Error ejecutando venta en lote {lot_number}"
-                break
+            if leg_mode != "sequential":
+                _, buy_instrument, buy_price = self._leg_prices(request, sell_quotes, buy_quotes)
+                executed = await self._execute_lot_legs(
+                    operation_id, request, progress, lot_number, leg_mode, lot_size, sell_price, buy_instrument, buy_price
+                )
+                if executed is None:
+                    self._add_message(operation_id, f"❌ LOTE #{lot_number} - Error enviando órdenes")
+                    progress.status = OperationStatus.FAILED
+                    progress.error = f"Error ejecutando lote {lot_number}"
+                    break
+                if executed <= 0:
+                    empty_lots += 1
+                    if empty_lots >= max_empty_lots:
+                        self._add_message(operation_id, f"⚠️ {empty_lots} lotes seguidos sin ejecución - deteniendo")
+                        progress.status = OperationStatus.PARTIALLY_COMPLETED
+                        break
+                    await self._wait_quote_change(instruments, RATIO_QUOTE_WAIT_SECONDS, seen)
+                    continue
+                empty_lots = 0
+                buy_quantity = executed
+            else:
+                sell_order = await self._execute_real_order_with_liquidity_check(
+                    operation_id, 
+                    request.instrument_to_sell, 
+                    "sell", 
+                    lot_size, 
+                    self._limit_price(sell_price, "sell")  # con deslizamiento toma los niveles contados en el lote
+                )
             
-            # Actualizar progreso de venta
-            progress.sell_orders.append(sell_order)
-            progress.total_sold_amount += sell_order.quantity * sell_order.price
-            progress.average_sell_price = (
-                progress.total_sold_amount / sum(order.quantity for order in progress.sell_orders)
-                if progress.sell_orders else 0.0
-            )
+                if not sell_order:
+                    self._add_message(operation_id, f"❌ LOTE #{lot_number} - Error en venta")
+                    progress.status = OperationStatus.FAILED
+                    progress.error = f"Error ejecutando venta en lote {lot_number}"
+                    break
             
-            self._add_message(operation_id, f"✅ LOTE #{lot_number} - PASO 1 COMPLETADO: Venta {sell_order.order_id}")
+                # Actualizar progreso de venta
+                progress.sell_orders.append(sell_order)
+                progress.total_sold_amount += sell_order.quantity * sell_order.price
+                progress.average_sell_price = (
+                    progress.total_sold_amount / sum(order.quantity for order in progress.sell_orders)
+                    if progress.sell_orders else 0.0
+                )
             
-            # Esperar un poco para procesar la venta
-            await asyncio.sleep(1)
+                self._add_message(operation_id, f"✅ LOTE #{lot_number} - PASO 1 COMPLETADO: Venta {sell_order.order_id}")
             
-            # PASO 2: Comprar instrumento complementario al precio de venta (offer)
-            # Usar buy_qty si está especificado y es válido, sino usar cantidad vendida
-            if request.buy_qty > 0 and request.buy_qty <= sell_order.quantity:
-                buy_quantity = request.buy_qty
-                self._add_message(operation_id, f"🎯 LOTE #{lot_number} - Usando buy_qty específico: {buy_quantity}")
-            else:
-                buy_quantity = sell_order.quantity  # Usar cantidad efectivamente vendida
+                # PASO 2: Comprar instrumento complementario al precio de venta (offer)
+                # Usar buy_qty si está especificado y es válido, sino usar cantidad vendida
+                if request.buy_qty > 0 and request.buy_qty <= sell_order.quantity:
+                    buy_quantity = request.buy_qty
+                    self._add_message(operation_id, f"🎯 LOTE #{lot_number} - Usando buy_qty específico: {buy_quantity}")
+                else:
+                    buy_quantity = sell_order.quantity  # Usar cantidad efectivamente vendida
+            
+                if "TX26" in request.instrument_to_sell:
+                    # ESTRATEGIA NORMAL - Comprar TX28
+                    buy_instrument = "MERV - XMEV - TX28 - 24hs"
+                    buy_price = buy_quotes.get('offer', 0)  # Precio offer TX28
+                    self._add_message(operation_id, f"📥 LOTE #{lot_number} - PASO 2: Comprando TX28 @ {buy_price} (offer)")
+                elif "TX28" in request.instrument_to_sell:
+                    # ESTRATEGIA INVERSA - Comprar TX26
+                    buy_instrument = "MERV - XMEV - TX26 - 24hs"
+                    buy_price = sell_quotes.get('offer', 0)  # Precio offer TX26
+                    self._add_message(operation_id, f"📥 LOTE #{lot_number} - PASO 2: Comprando TX26 @ {buy_price} (offer)")
+                else:
+                    self._add_message(operation_id, f"❌ Error: no se puede determinar instrumento a comprar")
+                    progress.status = OperationStatus.FAILED
+                    break
             
-            if "TX26" in request.instrument_to_sell:
-                # ESTRATEGIA NORMAL - Comprar TX28
-                buy_instrument = "MERV - XMEV - TX28 - 24hs"
-                buy_price = buy_quotes.get('offer', 0)  # Precio offer TX28
-                self._add_message(operation_id, f"📥 LOTE #{lot_number} - PASO 2: Comprando TX28 @ {buy_price} (offer)")
-            elif "TX28" in request.instrument_to_sell:
-                # ESTRATEGIA INVERSA - Comprar TX26
-                buy_instrument = "MERV - XMEV - TX26 - 24hs"
-                buy_price = sell_quotes.get('offer', 0)  # Precio offer TX26
-                self._add_message(operation_id, f"📥 LOTE #{lot_number} - PASO 2: Comprando TX26 @ {buy_price} (offer)")
-            else:
-                self._add_message(operation_id, f"❌ Error: no se puede determinar instrumento a comprar")
-                progress.status = OperationStatus.FAILED
-                break
+                buy_order = await self._execute_real_order_with_liquidity_check(
+                    operation_id, 
+                    buy_instrument, 
+                    "buy", 
+                    buy_quantity, 
+                    self._limit_price(buy_price, "buy")
+                )
             
-            buy_order = await self._execute_real_order_with_liquidity_check(
-                operation_id, 
-                buy_instrument, 
-                "buy", 
-                buy_quantity, 
-                buy_price
-            )
+                if not buy_order:
+                    self._add_message(operation_id, f"❌ LOTE #{lot_number} - Error en compra")
+                    progress.status = OperationStatus.FAILED
+                    progress.error = f"Error ejecutando compra en lote {lot_number}"
+                    break
             
-            if not buy_order:
-                self._add_message(operation_id, f"❌ LOTE #{lot_number} - Error en compra")
-                progress.status = OperationStatus.FAILED
-                progress.error = f"Error ejecutando compra en lote {lot_number}"
-                break
+                # Actualizar progreso de compra
+                progress.buy_orders.append(buy_order)
+                progress.total_bought_amount += buy_order.quantity * buy_order.price
+                progress.average_buy_price = (
+                    progress.total_bought_amount / sum(order.quantity for order in progress.buy_orders)
+                    if progress.buy_orders else 0.0
+                )
             
-            # Actualizar progreso de compra
-            progress.buy_orders.append(buy_order)
-            progress.total_bought_amount += buy_order.quantity * buy_order.price
-            progress.average_buy_price = (
-                progress.total_bought_amount / sum(order.quantity for order in progress.buy_orders)
-                if progress.buy_orders else 0.0
-            )
+                self._add_message(operation_id, f"✅ LOTE #{lot_number} - PASO 2 COMPLETADO: Compra {buy_order.order_id}")
             
-            self._add_message(operation_id, f"✅ LOTE #{lot_number} - PASO 2 COMPLETADO: Compra {buy_order.order_id}")
             
             # Actualizar nominales completados y restantes
             progress.completed_nominales += buy_quantity
@@ -1161,8 +1652,7 @@ class RealRatioOperationManager:
                 self._add_message(operation_id, f"   💵 Precio promedio venta: {progress.average_sell_price:.2f}")
                 self._add_message(operation_id, f"   💵 Precio promedio compra: {progress.average_buy_price:.2f}")
             
-            # Resetear contador de espera para el siguiente lote
-            wait_attempts = 0
+            algo.on_lot(ctx, buy_quantity)
             
             # Notificar progreso del lote
             progress.progress_percentage = min(90, 50 + (progress.completed_nominales / request.nominales) * 40)
@@ -1173,9 +1663,9 @@ class RealRatioOperationManager:
                 self._add_message(operation_id, "🎉 ¡TODOS LOS NOMINALES COMPLETADOS!")
                 break
             
-            # Esperar antes del siguiente lote para obtener nuevas cotizaciones
-            self._add_message(operation_id, f"⏳ Esperando 3 segundos antes del siguiente lote...")
-            await asyncio.sleep(3)
+            # Esperar la próxima cotización (el libro refleja lo consumido) antes del siguiente lote
+            self._add_message(operation_id, f"⏳ Esperando nueva cotización antes del siguiente lote (máx 3s)...")
+            await self._wait_quote_change(instruments, min(3.0, RATIO_QUOTE_WAIT_SECONDS), seen)
         
         # Verificar estado real de todas las órdenes antes de finalizar
         self._add_message(operation_id, "🔍 VERIFICANDO ESTADO REAL DE TODAS LAS ÓRDENES...")
@@ -1221,9 +1711,6 @@ class RealRatioOperationManager:
                 self._add_message(operation_id, f"   ⏳ Órdenes pendientes:")
                 for pending in pending_orders:
                     self._add_message(operation_id, f"      {pending}")
-            
-            # Iniciar monitoreo continuo de órdenes pendientes
-            await self._start_pending_orders_monitoring(operation_id, progress)
         
         progress.current_step = OperationStep.FINALIZING
         progress.progress_percentage = 100
@@ -1260,6 +1747,7 @@ class RealRatioOperationManager:
             await self._start_pending_orders_monitoring(operation_id, progress)
         else:
             self._add_message(operation_id, "✅ Todas las órdenes ejecutadas - no se requiere monitoreo")
+            self._forget_operation_orders(operation_id)
         
         print(f"[DEBUG] Operación {operation_id} completada: {progress.completed_nominales}/{request.nominales} nominales")
         return progress
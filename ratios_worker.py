@@ -1,11 +1,11 @@
 # ratios_worker.py — con warm-start de ventanas
+import os
 import threading
 import time
-import math
-from collections import deque
+from collections.abc import Mapping
 from datetime import datetime, timezone
 
-from supabase_client import get_active_pairs, guardar_en_supabase  # wrappers
+from supabase_client import get_active_pairs, WriteBuffer  # wrappers
 try:
     from strategy_engine import evaluateAndAlert as _evaluate_and_alert
 except Exception:
@@ -17,15 +17,34 @@ try:
 except Exception:
     supabase = None
 
-from quotes_cache import quotes_cache
+from quotes_cache import quotes_cache, QUOTES_MAX_AGE_MS
+from rolling_stats import RollingWindow
 
 _worker_thread = None
 _stop_event = threading.Event()
 _session_user = None
 
-# Buffers rodantes por par (clave: (base, quote, user, client))
-_rolling: dict[tuple, dict[str, deque]] = {}
+# Ventanas rodantes por par (clave: (base, quote, user, client)); sumas corridas O(1)
+_rolling: dict[tuple, dict[str, RollingWindow]] = {}
 _hydrated_keys: set[tuple] = set()  # para no re-hidratar
+# Un lock por par: el hilo de barras agrega a las ventanas y el de eventos las lee
+_rolling_locks: dict[tuple, threading.Lock] = {}
+_rolling_locks_guard = threading.Lock()
+
+# Modo por eventos: símbolos con tick nuevo y pares afectados por cada símbolo
+_event_thread = None
+_dirty_symbols: set[str] = set()
+_dirty_cond = threading.Condition()
+_pairs_by_symbol: dict[str, list[tuple]] = {}
+_pairs_lock = threading.Lock()
+
+# Último cálculo en memoria por par (lo actualizan ambos modos)
+_live_ratios: dict[tuple, dict] = {}
+_live_lock = threading.Lock()
+
+# Listeners de ratios recalculados (copy-on-write: se leen sin lock)
+_ratio_listeners: list = []
+_ratio_listeners_lock = threading.Lock()
 
 # --------------------------- Parámetros --------------------------------------
 INTERVAL_SECONDS   = 10
@@ -35,6 +54,10 @@ BAND_K             = 1.5   # Bandas ±K·σ (σ180)
 WARMSTART_BARS     = 180   # cuántas filas traer para precalcular todo
 VERBOSE_FIRST_PAIR = True
 
+# Recalcular ratios/alertas en memoria ante cada tick (el historial sigue por barras)
+EVENT_MODE             = os.getenv("RATIOS_EVENT_MODE", "0") == "1"
+EVENT_MIN_INTERVAL_MS  = int(os.getenv("RATIOS_EVENT_MIN_INTERVAL_MS", "250"))  # coalescencia de ráfagas
+
 # ------------------------------- Helpers -------------------------------------
 def _is_num(x):
     try:
@@ -51,36 +74,32 @@ def _safe_div(a, b):
     except Exception:
         return None
 
-def _sma_last(values: deque, window: int):
-    if not values:
-        return None
-    n = min(len(values), window)
-    if n <= 0:
-        return None
-    sub = list(values)[-n:]
-    return sum(sub) / n
-
-def _std_last(values: deque, window: int):
-    """σ poblacional (ddof=0); None si no hay ≥2 datos."""
-    if not values:
-        return None
-    sub = list(values)[-min(len(values), window):]
-    n = len(sub)
-    if n < 2:
-        return None
-    m = sum(sub) / n
-    var = sum((x - m)**2 for x in sub) / n
-    return math.sqrt(var)
+def _new_buffers() -> dict[str, RollingWindow]:
+    """mid lleva además la sub-ventana σ60; bid/ask solo SMA/σ180."""
+    return {
+        "mid": RollingWindow(SMA_WINDOW, (STD_SHORT_WINDOW,)),
+        "bid": RollingWindow(SMA_WINDOW),
+        "ask": RollingWindow(SMA_WINDOW),
+    }
+
+def _pair_lock(key: tuple) -> threading.Lock:
+    """Lock de las ventanas del par (append/_resync y lecturas de media/σ no se intercalan)."""
+    lock = _rolling_locks.get(key)
+    if lock is None:
+        with _rolling_locks_guard:
+            lock = _rolling_locks.setdefault(key, threading.Lock())
+    return lock
 
 def set_session(user_id: str):
     """Setea un user_id por sesión si no viene en los pares."""
     global _session_user
     _session_user = user_id
 
-def obtener_datos_mercado(symbol: str) -> dict | None:
-    """Devuelve el dict del cache si hay last/bid/offer; si no, None."""
-    datos = quotes_cache.get(symbol)
-    if not isinstance(datos, dict):
+def obtener_datos_mercado(symbol: str, max_age_ms: int | None = QUOTES_MAX_AGE_MS) -> Mapping | None:
+    """Devuelve la cotización del cache (Quote inmutable, sin copia) si hay last/bid/offer
+    y no es más vieja que max_age_ms; si no, None."""
+    datos = quotes_cache.get(symbol, max_age_ms=max_age_ms)
+    if not isinstance(datos, Mapping):
         return None
     if any(datos.get(k) is not None for k in ("last", "bid", "offer")):
         return datos
@@ -116,27 +135,209 @@ def _hydrate_from_db(base_symbol: str, quote_symbol: str, user_id: str, client_i
 
         buf = _rolling.get(key)
         if buf is None:
-            buf = {"mid": deque(maxlen=SMA_WINDOW), "bid": deque(maxlen=SMA_WINDOW), "ask": deque(maxlen=SMA_WINDOW)}
+            buf = _new_buffers()
             _rolling[key] = buf
 
         added_mid = added_bid = added_ask = 0
-        for r in rows:
-            m = r.get("mid_ratio"); b = r.get("bid_ratio"); a = r.get("ask_ratio")
-            if _is_num(m): buf["mid"].append(float(m)); added_mid += 1
-            if _is_num(b): buf["bid"].append(float(b)); added_bid += 1
-            if _is_num(a): buf["ask"].append(float(a)); added_ask += 1
+        with _pair_lock(key):
+            for r in rows:
+                m = r.get("mid_ratio"); b = r.get("bid_ratio"); a = r.get("ask_ratio")
+                if _is_num(m): buf["mid"].append(float(m)); added_mid += 1
+                if _is_num(b): buf["bid"].append(float(b)); added_bid += 1
+                if _is_num(a): buf["ask"].append(float(a)); added_ask += 1
 
         _hydrated_keys.add(key)
         print(f"[warmstart] {base_symbol}/{quote_symbol} ← {added_mid}/{added_bid}/{added_ask} (mid/bid/ask) filas")
     except Exception as e:
         print(f"[warmstart] error hidratando {base_symbol}/{quote_symbol}: {e}")
 
+# ------------------------------ Cálculo por par ------------------------------
+def _compute_pair(key: tuple, base: dict, quote: dict, buf: dict, *, append: bool) -> dict | None:
+    """Calcula ratios e indicadores de un par.
+
+    append=True (barra): agrega los ratios a las ventanas antes de calcular.
+    append=False (evento): usa las ventanas tal como quedaron en la última barra.
+    Devuelve {"row", "snapshot"} o None si no hay ningún ratio calculable.
+    """
+    base_symbol, quote_symbol, user_id, client_id = key
+
+    # --- Precios L1
+    A_bid, A_ask, A_last = base.get("bid"), base.get("offer"), base.get("last")
+    B_bid, B_ask, B_last = quote.get("bid"), quote.get("offer"), quote.get("last")
+
+    # --- Tamaños (según cache)
+    A_bid_sz = float(base["bid_size"])   if _is_num(base.get("bid_size"))   else None
+    A_ask_sz = float(base["offer_size"]) if _is_num(base.get("offer_size")) else None
+    B_bid_sz = float(quote["bid_size"])  if _is_num(quote.get("bid_size"))  else None
+    B_ask_sz = float(quote["offer_size"])if _is_num(quote.get("offer_size"))else None
+
+    # --- Ratios execution-aware
+    bid_ratio = _safe_div(A_bid, B_ask) if (_is_num(A_bid) and _is_num(B_ask)) else None
+    ask_ratio = _safe_div(A_ask, B_bid) if (_is_num(A_ask) and _is_num(B_bid)) else None
+
+    # --- mid_ratio (preferentemente mid; si no hay, last)
+    mid_A = ((float(A_bid)+float(A_ask))/2.0) if (_is_num(A_bid) and _is_num(A_ask)) else (float(A_last) if _is_num(A_last) else None)
+    mid_B = ((float(B_bid)+float(B_ask))/2.0) if (_is_num(B_bid) and _is_num(B_ask)) else (float(B_last) if _is_num(B_last) else None)
+    mid_ratio = _safe_div(mid_A, mid_B)
+
+    # --- Ratio desde últimos valores operados (last)
+    last_ratio = _safe_div(A_last, B_last) if (_is_num(A_last) and _is_num(B_last)) else None
+
+    if not any(x is not None for x in (mid_ratio, bid_ratio, ask_ratio)):
+        return None
+
+    # --- Ventanas + indicadores bajo el lock del par (lectura consistente entre hilos)
+    with _pair_lock(key):
+        if append:
+            if mid_ratio is not None: buf["mid"].append(mid_ratio)
+            if bid_ratio is not None: buf["bid"].append(bid_ratio)
+            if ask_ratio is not None: buf["ask"].append(ask_ratio)
+
+        # --- Indicadores (mid para z/vol; bid/ask para bandas de ejecución)
+        mid_sma180  = buf["mid"].mean(SMA_WINDOW)
+        mid_std60   = buf["mid"].std(STD_SHORT_WINDOW)
+        mid_std180  = buf["mid"].std(SMA_WINDOW)
+
+        bid_sma180  = buf["bid"].mean(SMA_WINDOW)
+        bid_std180  = buf["bid"].std(SMA_WINDOW)
+
+        ask_sma180  = buf["ask"].mean(SMA_WINDOW)
+        ask_std180  = buf["ask"].std(SMA_WINDOW)
+
+    # --- Bandas ±K·σ
+    bb_bid_upper = (bid_sma180 + BAND_K * bid_std180) if (_is_num(bid_sma180) and _is_num(bid_std180)) else None
+    bb_bid_lower = (bid_sma180 - BAND_K * bid_std180) if (_is_num(bid_sma180) and _is_num(bid_std180)) else None
+    bb_mid_upper = (mid_sma180 + BAND_K * mid_std180) if (_is_num(mid_sma180) and _is_num(mid_std180)) else None
+    bb_mid_lower = (mid_sma180 - BAND_K * mid_std180) if (_is_num(mid_sma180) and _is_num(mid_std180)) else None
+    bb_ask_upper = (ask_sma180 + BAND_K * ask_std180) if (_is_num(ask_sma180) and _is_num(ask_std180)) else None
+    bb_ask_lower = (ask_sma180 - BAND_K * ask_std180) if (_is_num(ask_sma180) and _is_num(ask_std180)) else None
+
+    # --- z-scores (vs mid)
+    z_bid_val = ((bid_ratio - mid_sma180) / mid_std60) if (_is_num(bid_ratio) and _is_num(mid_sma180) and _is_num(mid_std60) and mid_std60 > 0) else None
+    z_ask_val = ((ask_ratio - mid_sma180) / mid_std60) if (_is_num(ask_ratio) and _is_num(mid_sma180) and _is_num(mid_std60) and mid_std60 > 0) else None
+
+    # --- vol_ratio (régimen)
+    vol_ratio = (mid_std60 / mid_std180) if (_is_num(mid_std60) and _is_num(mid_std180) and mid_std180 > 0) else None
+
+    # --- spread del ratio
+    ratio_spread = (ask_ratio - bid_ratio) if (_is_num(ask_ratio) and _is_num(bid_ratio)) else None
+    if append and _is_num(ratio_spread) and ratio_spread < -1e-9:
+        print(f"[ratios_worker][WARN] ratio_spread NEGATIVO en {base_symbol}/{quote_symbol}: {ratio_spread:.6g}")
+
+    # --- Construir row
+    row = {
+        "user_id":        user_id,
+        "client_id":      client_id,
+        "base_symbol":    base_symbol,
+        "quote_symbol":   quote_symbol,
+        "asof":           datetime.now(timezone.utc).isoformat(),
+
+        # Ratios
+        "mid_ratio":      float(mid_ratio)   if _is_num(mid_ratio)   else None,
+        "bid_ratio":      float(bid_ratio)   if _is_num(bid_ratio)   else None,
+        "ask_ratio":      float(ask_ratio)   if _is_num(ask_ratio)   else None,
+        "last_ratio":     float(last_ratio)  if _is_num(last_ratio)  else None,
+
+        # Precios crudos
+        "bid_price_base":   float(A_bid) if _is_num(A_bid) else None,
+        "bid_price_quote":  float(B_bid) if _is_num(B_bid) else None,
+        "offer_price_base": float(A_ask) if _is_num(A_ask) else None,
+        "offer_price_quote":float(B_ask) if _is_num(B_ask) else None,
+        "last_price_base":  float(A_last) if _is_num(A_last) else None,
+        "last_price_quote": float(B_last) if _is_num(B_last) else None,
+
+        # Tamaños
+        "bid_size_base":    A_bid_sz,
+        "bid_size_quote":   B_bid_sz,
+        "offer_size_base":  A_ask_sz,
+        "offer_size_quote": B_ask_sz,
+
+        # SMA / Bandas
+        "sma180_bid":        float(bid_sma180)  if _is_num(bid_sma180)  else None,
+        "sma180_offer":      float(ask_sma180)  if _is_num(ask_sma180)  else None,
+        "sma180_mid":        float(mid_sma180)  if _is_num(mid_sma180)  else None,
+        "bb180_bid_upper":   float(bb_bid_upper) if _is_num(bb_bid_upper) else None,
+        "bb180_bid_lower":   float(bb_bid_lower) if _is_num(bb_bid_lower) else None,
+        "bb180_offer_upper": float(bb_ask_upper) if _is_num(bb_ask_upper) else None,
+        "bb180_offer_lower": float(bb_ask_lower) if _is_num(bb_ask_lower) else None,
+        "bb180_mid_upper":   float(bb_mid_upper) if _is_num(bb_mid_upper) else None,
+        "bb180_mid_lower":   float(bb_mid_lower) if _is_num(bb_mid_lower) else None,
+
+        # Volatilidades / z / spread / régimen
+        "std60_mid":         float(mid_std60)   if _is_num(mid_std60)   else None,
+        "std180_mid":        float(mid_std180)  if _is_num(mid_std180)  else None,
+        "z_bid":             float(z_bid_val)   if _is_num(z_bid_val)   else None,
+        "z_ask":             float(z_ask_val)   if _is_num(z_ask_val)   else None,
+        "ratio_spread":      float(ratio_spread)if _is_num(ratio_spread)else None,
+        "vol_ratio":         float(vol_ratio)   if _is_num(vol_ratio)   else None,
+    }
+
+    snapshot = {
+        "base": base,
+        "quote": quote,
+        "ratios": {
+            "mid": mid_ratio,
+            "bid": bid_ratio,
+            "ask": ask_ratio,
+            "sma180_mid": mid_sma180,
+            "std60_mid": mid_std60,
+            "std180_mid": mid_std180,
+        }
+    }
+
+    with _live_lock:
+        _live_ratios[key] = row
+
+    for listener in _ratio_listeners:
+        try:
+            listener(row)
+        except Exception as e:
+            print(f"[ratios_worker] error en ratio listener: {e}")
+
+    return {"row": row, "snapshot": snapshot}
+
+def _evaluate_rules(key: tuple, snapshot: dict):
+    """Evalúa reglas del par y notifica (Telegram) si matchean."""
+    base_symbol, quote_symbol, user_id, client_id = key
+    try:
+        matched = _evaluate_and_alert(
+            user_id=str(user_id),
+            client_id=str(client_id),
+            base_symbol=str(base_symbol),
+            quote_symbol=str(quote_symbol),
+            snapshot=snapshot,
+        )
+        if matched:
+            print(f"[ratios_worker] 🔔 {matched} regla(s) cumplida(s) para {base_symbol}/{quote_symbol}")
+    except Exception as e:
+        print(f"[ratios_worker] error evaluando alertas: {e}")
+
+def add_ratio_listener(callback):
+    """Registra un callback(row: dict) que se llama con cada ratio recalculado."""
+    global _ratio_listeners
+    with _ratio_listeners_lock:
+        if callback not in _ratio_listeners:
+            _ratio_listeners = _ratio_listeners + [callback]
+
+def remove_ratio_listener(callback):
+    global _ratio_listeners
+    with _ratio_listeners_lock:
+        _ratio_listeners = [cb for cb in _ratio_listeners if cb is not callback]
+
+def get_live_ratios() -> list[dict]:
+    """Último cálculo en memoria de cada par (barra o evento, el más reciente)."""
+    with _live_lock:
+        return [dict(r) for r in _live_ratios.values()]
+
 # --------------------------------- Loop --------------------------------------
 def _worker_loop():
     while not _stop_event.is_set():
+        # Un insert por tabla por ciclo (no uno por par)
+        buffer = WriteBuffer()
         try:
             pairs = get_active_pairs()
             print(f"[ratios_worker] pares activos={len(pairs)}")
+            by_symbol: dict[str, list[tuple]] = {}
 
             for i, pair in enumerate(pairs):
                 if VERBOSE_FIRST_PAIR and i == 0:
@@ -152,6 +353,8 @@ def _worker_loop():
                     continue
 
                 key = (base_symbol, quote_symbol, user_id, client_id)
+                by_symbol.setdefault(base_symbol, []).append(key)
+                by_symbol.setdefault(quote_symbol, []).append(key)
 
                 # --- Warm-start (una sola vez por par)
                 if key not in _hydrated_keys:
@@ -168,174 +371,105 @@ def _worker_loop():
                     print(f"[ratios_worker] ❌ No hay datos para {base_symbol}/{quote_symbol}")
                     continue
 
-                # --- Precios L1
-                A_bid, A_ask, A_last = base.get("bid"), base.get("offer"), base.get("last")
-                B_bid, B_ask, B_last = quote.get("bid"), quote.get("offer"), quote.get("last")
-
-                # --- Tamaños (según cache)
-                A_bid_sz = float(base["bid_size"])   if _is_num(base.get("bid_size"))   else None
-                A_ask_sz = float(base["offer_size"]) if _is_num(base.get("offer_size")) else None
-                B_bid_sz = float(quote["bid_size"])  if _is_num(quote.get("bid_size"))  else None
-                B_ask_sz = float(quote["offer_size"])if _is_num(quote.get("offer_size"))else None
-
-                # --- Ratios execution-aware
-                bid_ratio = _safe_div(A_bid, B_ask) if (_is_num(A_bid) and _is_num(B_ask)) else None
-                ask_ratio = _safe_div(A_ask, B_bid) if (_is_num(A_ask) and _is_num(B_bid)) else None
-
-                # --- mid_ratio (preferentemente mid; si no hay, last)
-                mid_A = ((float(A_bid)+float(A_ask))/2.0) if (_is_num(A_bid) and _is_num(A_ask)) else (float(A_last) if _is_num(A_last) else None)
-                mid_B = ((float(B_bid)+float(B_ask))/2.0) if (_is_num(B_bid) and _is_num(B_ask)) else (float(B_last) if _is_num(B_last) else None)
-                mid_ratio = _safe_div(mid_A, mid_B)
-
-                # --- Ratio desde últimos valores operados (last)
-                last_ratio = _safe_div(A_last, B_last) if (_is_num(A_last) and _is_num(B_last)) else None
-
-                if not any(x is not None for x in (mid_ratio, bid_ratio, ask_ratio)):
-                    print(f"[ratios_worker] ❌ No se pudo calcular ningún ratio para {base_symbol}/{quote_symbol}")
-                    continue
-
                 # --- Buffers del par
                 buf = _rolling.get(key)
                 if buf is None:
-                    buf = {"mid": deque(maxlen=SMA_WINDOW), "bid": deque(maxlen=SMA_WINDOW), "ask": deque(maxlen=SMA_WINDOW)}
+                    buf = _new_buffers()
                     _rolling[key] = buf
 
-                if mid_ratio is not None: buf["mid"].append(mid_ratio)
-                if bid_ratio is not None: buf["bid"].append(bid_ratio)
-                if ask_ratio is not None: buf["ask"].append(ask_ratio)
-
-                # --- Indicadores (mid para z/vol; bid/ask para bandas de ejecución)
-                mid_sma180  = _sma_last(buf["mid"], SMA_WINDOW)
-                mid_std60   = _std_last(buf["mid"], STD_SHORT_WINDOW)
-                mid_std180  = _std_last(buf["mid"], SMA_WINDOW)
-
-                bid_sma180  = _sma_last(buf["bid"], SMA_WINDOW)
-                bid_std180  = _std_last(buf["bid"], SMA_WINDOW)
-
-                ask_sma180  = _sma_last(buf["ask"], SMA_WINDOW)
-                ask_std180  = _std_last(buf["ask"], SMA_WINDOW)
-
-                # --- Bandas ±K·σ
-                bb_bid_upper = (bid_sma180 + BAND_K * bid_std180) if (_is_num(bid_sma180) and _is_num(bid_std180)) else None
-                bb_bid_lower = (bid_sma180 - BAND_K * bid_std180) if (_is_num(bid_sma180) and _is_num(bid_std180)) else None
-                bb_mid_upper = (mid_sma180 + BAND_K * mid_std180) if (_is_num(mid_sma180) and _is_num(mid_std180)) else None
-                bb_mid_lower = (mid_sma180 - BAND_K * mid_std180) if (_is_num(mid_sma180) and _is_num(mid_std180)) else None
-                bb_ask_upper = (ask_sma180 + BAND_K * ask_std180) if (_is_num(ask_sma180) and _is_num(ask_std180)) else None
-                bb_ask_lower = (ask_sma180 - BAND_K * ask_std180) if (_is_num(ask_sma180) and _is_num(ask_std180)) else None
-
-                # --- z-scores (vs mid)
-                z_bid_val = ((bid_ratio - mid_sma180) / mid_std60) if (_is_num(bid_ratio) and _is_num(mid_sma180) and _is_num(mid_std60) and mid_std60 > 0) else None
-                z_ask_val = ((ask_ratio - mid_sma180) / mid_std60) if (_is_num(ask_ratio) and _is_num(mid_sma180) and _is_num(mid_std60) and mid_std60 > 0) else None
-
-                # --- vol_ratio (régimen)
-                vol_ratio = (mid_std60 / mid_std180) if (_is_num(mid_std60) and _is_num(mid_std180) and mid_std180 > 0) else None
-
-                # --- spread del ratio
-                ratio_spread = (ask_ratio - bid_ratio) if (_is_num(ask_ratio) and _is_num(bid_ratio)) else None
-                if _is_num(ratio_spread) and ratio_spread < -1e-9:
-                    print(f"[ratios_worker][WARN] ratio_spread NEGATIVO en {base_symbol}/{quote_symbol}: {ratio_spread:.6g}")
-
-                # --- Construir row
-                row = {
-                    "user_id":        user_id,
-                    "client_id":      client_id,
-                    "base_symbol":    base_symbol,
-                    "quote_symbol":   quote_symbol,
-                    "asof":           datetime.now(timezone.utc).isoformat(),
-
-                    # Ratios
-                    "mid_ratio":      float(mid_ratio)   if _is_num(mid_ratio)   else None,
-                    "bid_ratio":      float(bid_ratio)   if _is_num(bid_ratio)   else None,
-                    "ask_ratio":      float(ask_ratio)   if _is_num(ask_ratio)   else None,
-                    "last_ratio":     float(last_ratio)  if _is_num(last_ratio)  else None,
-
-                    # Precios crudos
-                    "bid_price_base":   float(A_bid) if _is_num(A_bid) else None,
-                    "bid_price_quote":  float(B_bid) if _is_num(B_bid) else None,
-                    "offer_price_base": float(A_ask) if _is_num(A_ask) else None,
-                    "offer_price_quote":float(B_ask) if _is_num(B_ask) else None,
-                    "last_price_base":  float(A_last) if _is_num(A_last) else None,
-                    "last_price_quote": float(B_last) if _is_num(B_last) else None,
-
-                    # Tamaños
-                    "bid_size_base":    A_bid_sz,
-                    "bid_size_quote":   B_bid_sz,
-                    "offer_size_base":  A_ask_sz,
-                    "offer_size_quote": B_ask_sz,
-
-                    # SMA / Bandas
-                    "sma180_bid":        float(bid_sma180)  if _is_num(bid_sma180)  else None,
-                    "sma180_offer":      float(ask_sma180)  if _is_num(ask_sma180)  else None,
-                    "sma180_mid":        float(mid_sma180)  if _is_num(mid_sma180)  else None,
-                    "bb180_bid_upper":   float(bb_bid_upper) if _is_num(bb_bid_upper) else None,
-                    "bb180_bid_lower":   float(bb_bid_lower) if _is_num(bb_bid_lower) else None,
-                    "bb180_offer_upper": float(bb_ask_upper) if _is_num(bb_ask_upper) else None,
-                    "bb180_offer_lower": float(bb_ask_lower) if _is_num(bb_ask_lower) else None,
-                    "bb180_mid_upper":   float(bb_mid_upper) if _is_num(bb_mid_upper) else None,
-                    "bb180_mid_lower":   float(bb_mid_lower) if _is_num(bb_mid_lower) else None,
-
-                    # Volatilidades / z / spread / régimen
-                    "std60_mid":         float(mid_std60)   if _is_num(mid_std60)   else None,
-                    "std180_mid":        float(mid_std180)  if _is_num(mid_std180)  else None,
-                    "z_bid":             float(z_bid_val)   if _is_num(z_bid_val)   else None,
-                    "z_ask":             float(z_ask_val)   if _is_num(z_ask_val)   else None,
-                    "ratio_spread":      float(ratio_spread)if _is_num(ratio_spread)else None,
-                    "vol_ratio":         float(vol_ratio)   if _is_num(vol_ratio)   else None,
-                }
+                result = _compute_pair(key, base, quote, buf, append=True)
+                if result is None:
+                    print(f"[ratios_worker] ❌ No se pudo calcular ningún ratio para {base_symbol}/{quote_symbol}")
+                    continue
+                row = result["row"]
 
                 if VERBOSE_FIRST_PAIR and i == 0:
                     print("[sizes-debug]",
                           base_symbol, {"bid": row["bid_size_base"], "ask": row["offer_size_base"]},
                           "|", quote_symbol, {"bid": row["bid_size_quote"], "ask": row["offer_size_quote"]})
 
-                # --- Guardar (si hay algún ratio)
+                # --- Encolar para guardar (si hay algún ratio); se inserta en lote al final del ciclo
                 if any(row[k] is not None for k in ("mid_ratio","bid_ratio","ask_ratio")):
-                    try:
-                        result = guardar_en_supabase("terminal_ratios_history", row)
-                        if result is None:
-                            print("[ratios_worker] ❌ Error al guardar row (None)")
-                        else:
-                            print(f"[ratios_worker] ✅ Guardado {base_symbol}/{quote_symbol} "
-                                  f"R_bid={row['bid_ratio']}, R_ask={row['ask_ratio']}, mid={row['mid_ratio']}")
-                    except Exception as e:
-                        print(f"[ratios_worker] error guardando ratio: {e}")
+                    buffer.add("terminal_ratios_history", row)
                 else:
                     print(f"[ratios_worker] ⚠️ No hay ratios válidos para guardar en {base_symbol}/{quote_symbol}")
 
-                # --- Evaluar reglas y notificar (Telegram) si matchean
-                try:
-                    snapshot = {
-                        "base": base,
-                        "quote": quote,
-                        "ratios": {
-                            "mid": mid_ratio,
-                            "bid": bid_ratio,
-                            "ask": ask_ratio,
-                            "sma180_mid": mid_sma180,
-                            "std60_mid": mid_std60,
-                            "std180_mid": mid_std180,
-                        }
-                    }
-                    matched = _evaluate_and_alert(
-                        user_id=str(user_id),
-                        client_id=str(client_id),
-                        base_symbol=str(base_symbol),
-                        quote_symbol=str(quote_symbol),
-                        snapshot=snapshot,
-                    )
-                    if matched:
-                        print(f"[ratios_worker] 🔔 {matched} regla(s) cumplida(s) para {base_symbol}/{quote_symbol}")
-                except Exception as e:
-                    print(f"[ratios_worker] error evaluando alertas: {e}")
+                # --- Evaluar reglas (en modo eventos las evalúa el hilo de eventos)
+                if not EVENT_MODE:
+                    _evaluate_rules(key, result["snapshot"])
+
+            with _pairs_lock:
+                _pairs_by_symbol.clear()
+                _pairs_by_symbol.update(by_symbol)
 
         except Exception as e:
             print(f"[ratios_worker] error en loop: {e}")
 
-        time.sleep(INTERVAL_SECONDS)
+        # --- Guardar todas las filas del ciclo en un solo request
+        try:
+            pendientes = buffer.pending()
+            if pendientes:
+                guardadas = buffer.flush().get("terminal_ratios_history", 0)
+                if guardadas:
+                    print(f"[ratios_worker] ✅ Guardadas {guardadas}/{pendientes} filas de ratios en lote")
+                else:
+                    print(f"[ratios_worker] ❌ Error al guardar lote de {pendientes} filas")
+        except Exception as e:
+            print(f"[ratios_worker] error guardando lote de ratios: {e}")
+
+        _stop_event.wait(INTERVAL_SECONDS)
+
+# ------------------------------ Modo por eventos -----------------------------
+def mark_dirty(symbol: str):
+    """Marca un símbolo con tick nuevo (llamado desde ws_rofex, hilo de pyRofex)."""
+    if not symbol:
+        return
+    with _dirty_cond:
+        _dirty_symbols.add(symbol)
+        _dirty_cond.notify()
+
+def _on_tick(tick: dict):
+    mark_dirty(tick.get("symbol"))
+
+def _event_loop():
+    """Recalcula solo los pares cuyo base o quote tickeó, a lo sumo cada EVENT_MIN_INTERVAL_MS."""
+    min_interval = EVENT_MIN_INTERVAL_MS / 1000.0
+    while not _stop_event.is_set():
+        with _dirty_cond:
+            while not _dirty_symbols and not _stop_event.is_set():
+                _dirty_cond.wait(timeout=1.0)
+            dirty = set(_dirty_symbols)
+            _dirty_symbols.clear()
+        if _stop_event.is_set():
+            break
+
+        t0 = time.monotonic()
+        with _pairs_lock:
+            keys = {k for sym in dirty for k in _pairs_by_symbol.get(sym, ())}
+
+        for key in keys:
+            try:
+                buf = _rolling.get(key)
+                if buf is None:
+                    continue  # todavía sin barra/warm-start: lo inicializa el loop por barras
+                base  = obtener_datos_mercado(key[0])
+                quote = obtener_datos_mercado(key[1])
+                if not base or not quote:
+                    continue
+                result = _compute_pair(key, base, quote, buf, append=False)
+                if result is not None:
+                    _evaluate_rules(key, result["snapshot"])
+            except Exception as e:
+                print(f"[ratios_worker] error recalculando {key[0]}/{key[1]} por evento: {e}")
+
+        # Coalescer ráfagas: los ticks que lleguen mientras tanto se procesan juntos
+        remaining = min_interval - (time.monotonic() - t0)
+        if remaining > 0:
+            _stop_event.wait(remaining)
 
 # -------------------------------- Control ------------------------------------
 def start():
-    global _worker_thread
+    global _worker_thread, _event_thread
     if _worker_thread and _worker_thread.is_alive():
         return
     _stop_event.clear()
@@ -343,5 +477,27 @@ def start():
     _worker_thread.start()
     print("[ratios_worker] Worker iniciado - procesando pares activos")
 
-def stop():
+    if EVENT_MODE:
+        try:
+            import ws_rofex
+            ws_rofex.add_tick_listener(_on_tick)
+        except Exception as e:
+            print(f"[ratios_worker] No se pudo registrar listener de ticks: {e}")
+        _event_thread = threading.Thread(target=_event_loop, daemon=True)
+        _event_thread.start()
+        print(f"[ratios_worker] Modo eventos activo (intervalo mínimo {EVENT_MIN_INTERVAL_MS} ms)")
+
+def stop(timeout: float = 5.0):
     _stop_event.set()
+    with _dirty_cond:
+        _dirty_cond.notify_all()
+    if EVENT_MODE:
+        try:
+            import ws_rofex
+            ws_rofex.remove_tick_listener(_on_tick)
+        except Exception:
+            pass
+    # Esperar a ambos hilos (el de barras puede estar en un request a la DB)
+    for t in (_worker_thread, _event_thread):
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=timeout)
@@ -0,0 +1,96 @@
+# rolling_stats.py
+# Estadísticas rodantes O(1) por actualización para ratios_worker.
+# - Una sola deque de tamaño máximo y sumas corridas por cada sub-ventana
+# - Sumas sobre (x - K) con K = referencia móvil, para no perder precisión
+#   cuando la varianza es chica frente al nivel (ratios ~1.0)
+# - Resincronización periódica para acotar el error acumulado de punto flotante
+
+from __future__ import annotations
+
+import math
+from collections import deque
+from typing import Dict, Iterable, Optional
+
+
+class RollingWindow:
+    """Ventana rodante con media y σ poblacional (ddof=0) en O(1).
+
+    maxlen es la ventana mayor; windows agrega sub-ventanas sobre las últimas N
+    muestras (p.ej. σ60 sobre la misma serie que SMA180).
+    """
+
+    __slots__ = ("maxlen", "_buf", "_windows", "_s1", "_s2", "_k", "_updates")
+
+    def __init__(self, maxlen: int, windows: Iterable[int] = ()) -> None:
+        self.maxlen = int(maxlen)
+        self._buf: deque = deque(maxlen=self.maxlen)
+        self._windows = sorted({int(w) for w in windows if 0 < int(w) < self.maxlen} | {self.maxlen})
+        self._s1: Dict[int, float] = {w: 0.0 for w in self._windows}
+        self._s2: Dict[int, float] = {w: 0.0 for w in self._windows}
+        self._k = 0.0
+        self._updates = 0
+
+    def __len__(self) -> int:
+        return len(self._buf)
+
+    def values(self) -> list:
+        return list(self._buf)
+
+    def append(self, x: float) -> None:
+        x = float(x)
+        buf = self._buf
+        n = len(buf)
+        if n == 0:
+            self._k = x
+
+        k = self._k
+        d = x - k
+        for w in self._windows:
+            if n >= w:
+                # Sale de la ventana w el elemento en -w (antes de agregar x)
+                old = buf[-w] - k
+                self._s1[w] += d - old
+                self._s2[w] += d * d - old * old
+            else:
+                self._s1[w] += d
+                self._s2[w] += d * d
+        buf.append(x)
+
+        self._updates += 1
+        if self._updates >= self.maxlen:
+            self._resync()
+
+    def _resync(self) -> None:
+        """Recalcula las sumas desde cero re-centrando K en la media actual."""
+        self._updates = 0
+        if not self._buf:
+            return
+        vals = list(self._buf)
+        self._k = k = sum(vals) / len(vals)
+        for w in self._windows:
+            sub = vals[-w:]
+            self._s1[w] = sum(v - k for v in sub)
+            self._s2[w] = sum((v - k) * (v - k) for v in sub)
+
+    def _window(self, window: Optional[int]) -> int:
+        w = self.maxlen if window is None else int(window)
+        if w not in self._s1:
+            raise ValueError(f"ventana {w} no registrada (disponibles: {self._windows})")
+        return w
+
+    def mean(self, window: Optional[int] = None) -> Optional[float]:
+        w = self._window(window)
+        n = min(len(self._buf), w)
+        if n <= 0:
+            return None
+        return self._k + self._s1[w] / n
+
+    def std(self, window: Optional[int] = None) -> Optional[float]:
+        """σ poblacional (ddof=0); None si no hay ≥2 datos."""
+        w = self._window(window)
+        n = min(len(self._buf), w)
+        if n < 2:
+            return None
+        s1 = self._s1[w]
+        var = (self._s2[w] - s1 * s1 / n) / n
+        return math.sqrt(var) if var > 0 else 0.0
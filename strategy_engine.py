@@ -1,14 +1,33 @@
 # strategy_engine.py
 # Evaluación de reglas basadas en 'expr' (en params) y envío de alertas.
 # - Carga reglas desde Supabase (trading_rules) filtradas por user/client/símbolos
+#   a través de un cache en memoria con TTL (un request por user/client, no por par)
 # - Evalúa expr con contexto: base.*, quote.* y helpers
 # - Notifica vía telegram_control.notify si existe; si no, imprime
 
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, List
+import ast
+import functools
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, List, Tuple
 from supabase_client import list_rules
 
+try:
+    from supabase_client import on_rules_changed
+except Exception:
+    def on_rules_changed(callback):
+        pass
+
+RULES_TTL_SECONDS = float(os.getenv("RULES_TTL_SECONDS", "60"))
+# Alertas por flanco: defaults si la regla no trae params.cooldown_s / hysteresis / hysteresis_s
+ALERT_COOLDOWN_SECONDS   = float(os.getenv("ALERT_COOLDOWN_SECONDS", "300"))
+ALERT_HYSTERESIS         = int(os.getenv("ALERT_HYSTERESIS", "1"))            # evaluaciones falsas seguidas
+ALERT_HYSTERESIS_SECONDS = float(os.getenv("ALERT_HYSTERESIS_SECONDS", "0"))  # segundos falsa seguidos
+
 # Notificador opcional (Telegram)
 def _get_notifier():
     try:
@@ -49,15 +68,125 @@ _ALLOWED_FUNCS = {
     "round": round,
 }
 
-def _eval_expr(expr: str, *, base: Dict[str, Any], quote: Dict[str, Any], ratios: Dict[str, Any]) -> bool:
-    """
-    Evalúa expr en un entorno muy limitado.
-    Variables disponibles:
-      - base (dict con bid/offer/last/bid_size/offer_size/...)
-      - quote (...)
-      - ratios (mid, bid, ask, sma180_mid, std60_mid, std180_mid, ...)
-      - funciones: mid(), div(), abs(), min(), max(), round()
+# Nombres y nodos permitidos en las expresiones de reglas (whitelist de AST)
+_CONTEXT_NAMES = {"base", "quote", "ratios"}
+_ALLOWED_METHODS = {"get"}  # base.get("bid"), ratios.get("mid", 0)
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Is, ast.IsNot, ast.In, ast.NotIn,
+    ast.IfExp, ast.Call, ast.Name, ast.Load, ast.Constant, ast.Subscript, ast.Attribute,
+    ast.Tuple, ast.List, ast.keyword,
+)
+# Potencias: solo con exponente numérico literal acotado y sin anidar (9**9**9 colgaría el hilo)
+_MAX_POW_EXPONENT = 4
+
+# Cache de código compilado: (rule_id, sha1(expr)) -> code; las anónimas, en un LRU de este tamaño
+COMPILED_ANON_MAX = 256
+_compiled: Dict[Tuple[Any, str], Any] = {}
+_compiled_lock = threading.Lock()
+# Reglas rechazadas al cargar: rule_id -> {"expr", "error"}
+_invalid_rules: Dict[Any, Dict[str, Any]] = {}
+
+def _expr_hash(expr: str) -> str:
+    return hashlib.sha1(expr.encode("utf-8")).hexdigest()
+
+def compile_rule_expr(expr: str, rule_id: Any = None):
+    """Parsea, valida contra la whitelist y compila expr. Lanza ValueError si no es válida."""
+    if not isinstance(expr, str) or not expr.strip():
+        raise ValueError("expr vacía")
+    try:
+        tree = ast.parse(expr.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ValueError(f"sintaxis inválida: {e.msg}") from None
+
+    allowed_names = _CONTEXT_NAMES | set(_ALLOWED_FUNCS) | {"True", "False", "None"}
+    # Los atributos solo se permiten como método llamado (base.get(...)), nunca sueltos
+    called = {id(n.func) for n in ast.walk(tree) if isinstance(n, ast.Call)}
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ValueError(f"construcción no permitida: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in allowed_names:
+            raise ValueError(f"nombre no permitido: {node.id}")
+        if isinstance(node, ast.Attribute):
+            if (node.attr not in _ALLOWED_METHODS or id(node) not in called
+                    or not (isinstance(node.value, ast.Name) and node.value.id in _CONTEXT_NAMES)):
+                raise ValueError(f"atributo no permitido: .{node.attr}")
+        if isinstance(node, ast.Call):
+            fn = node.func
+            if isinstance(fn, ast.Name):
+                if fn.id not in _ALLOWED_FUNCS:
+                    raise ValueError(f"función no permitida: {fn.id}")
+            elif not isinstance(fn, ast.Attribute):
+                raise ValueError("llamada no permitida")
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Pow):
+            exp = node.right
+            if isinstance(exp, ast.UnaryOp) and isinstance(exp.op, (ast.USub, ast.UAdd)):
+                exp = exp.operand
+            if (not isinstance(exp, ast.Constant) or isinstance(exp.value, bool)
+                    or not isinstance(exp.value, (int, float)) or abs(exp.value) > _MAX_POW_EXPONENT):
+                raise ValueError(f"potencia no permitida: el exponente debe ser un número de hasta {_MAX_POW_EXPONENT}")
+            if any(isinstance(n, ast.BinOp) and isinstance(n.op, ast.Pow) for n in ast.walk(node.left)):
+                raise ValueError("potencia no permitida: potencias anidadas")
+
+    return compile(tree, f"<rule {rule_id}>", "eval")
+
+@functools.lru_cache(maxsize=COMPILED_ANON_MAX)
+def _compile_anonymous(expr: str):
+    return compile_rule_expr(expr)
+
+def _get_compiled(expr: str, rule_id: Any = None):
+    """Devuelve el código compilado (cacheado por rule_id + hash de expr).
+
+    Las expresiones sin regla (_eval_expr) van a un LRU acotado: no hay borrado que las pode.
     """
+    if rule_id is None:
+        return _compile_anonymous(expr)
+    key = (rule_id, _expr_hash(expr))
+    code = _compiled.get(key)
+    if code is None:
+        code = compile_rule_expr(expr, rule_id)
+        with _compiled_lock:
+            if rule_id is not None:
+                # La expr de la regla cambió: descartar versiones anteriores
+                for old in [k for k in _compiled if k[0] == rule_id]:
+                    del _compiled[old]
+            _compiled[key] = code
+    return code
+
+def _prepare_rule(rule: Dict[str, Any], scope: Optional[Tuple[str, str]] = None) -> bool:
+    """Compila la expr de una regla al cargarla. Registra y descarta las inválidas."""
+    rule_id = rule.get("id")
+    expr = (rule.get("params") or {}).get("expr")
+    try:
+        _get_compiled(expr, rule_id)
+        _invalid_rules.pop(rule_id, None)
+        return True
+    except ValueError as e:
+        prev = _invalid_rules.get(rule_id)
+        if not prev or prev.get("expr") != expr:
+            print(f"[strategy] ❌ Regla #{rule_id} inválida ({e}): {expr!r}")
+        _invalid_rules[rule_id] = {
+            "rule_id": rule_id,
+            "expr": expr,
+            "error": str(e),
+            "base_symbol": rule.get("base_symbol"),
+            "quote_symbol": rule.get("quote_symbol"),
+            "scope": scope,
+        }
+        return False
+
+def _prune_invalid_rules(scope: Tuple[str, str], rule_ids) -> None:
+    """Olvida las reglas inválidas del scope que ya no están (borradas o corregidas)."""
+    for rule_id, info in list(_invalid_rules.items()):
+        if info.get("scope") == scope and rule_id not in rule_ids:
+            _invalid_rules.pop(rule_id, None)
+
+def invalid_rules() -> List[Dict[str, Any]]:
+    """Reglas rechazadas en la última carga, con el motivo."""
+    return list(_invalid_rules.values())
+
+def _eval_code(code, *, base: Dict[str, Any], quote: Dict[str, Any], ratios: Dict[str, Any]) -> bool:
     safe_globals = {"__builtins__": {}}
     safe_locals = {
         "base": base,
@@ -66,10 +195,232 @@ def _eval_expr(expr: str, *, base: Dict[str, Any], quote: Dict[str, Any], ratios
         **_ALLOWED_FUNCS,
     }
     try:
-        result = eval(expr, safe_globals, safe_locals)
-        return bool(result)
+        return bool(eval(code, safe_globals, safe_locals))
     except Exception:
+        # Errores de datos (None en comparaciones, división, etc.) → no cumple
+        return False
+
+def _eval_expr(expr: str, *, base: Dict[str, Any], quote: Dict[str, Any], ratios: Dict[str, Any]) -> bool:
+    """
+    Evalúa expr en un entorno muy limitado (compilada una sola vez y cacheada).
+    Variables disponibles:
+      - base (dict con bid/offer/last/bid_size/offer_size/...)
+      - quote (...)
+      - ratios (mid, bid, ask, sma180_mid, std60_mid, std180_mid, ...)
+      - funciones: mid(), div(), abs(), min(), max(), round()
+    """
+    try:
+        code = _get_compiled(expr)
+    except ValueError:
         return False
+    return _eval_code(code, base=base, quote=quote, ratios=ratios)
+
+class RuleCache:
+    """Reglas activas indexadas por (user_id, client_id, base_symbol, quote_symbol).
+
+    Se cargan de a un scope (user_id, client_id) con una sola llamada a list_rules
+    y se refrescan al vencer el TTL o al invalidar (create_rule/delete_rule).
+    """
+
+    def __init__(self, loader=list_rules, ttl: float = RULES_TTL_SECONDS) -> None:
+        self._loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._index: Dict[Tuple[str, str, str, str], List[Dict[str, Any]]] = {}
+        self._loaded_at: Dict[Tuple[str, str], float] = {}
+        # Cargas en curso por scope: el resto espera (o usa lo anterior) sin tomar el lock
+        self._loading: Dict[Tuple[str, str], threading.Event] = {}
+        self._generation = 0  # sube con cada invalidate()
+        self.loads = 0
+        self.hits = 0
+
+    def _load_scope(self, user_id: str, client_id: str) -> Dict[Tuple[str, str, str, str], List[Dict[str, Any]]]:
+        """Trae y compila las reglas del scope. Se llama SIN el lock (list_rules va a la red)."""
+        rules = self._loader(user_id=user_id, client_id=client_id, active=True) or []
+        by_pair: Dict[Tuple[str, str, str, str], List[Dict[str, Any]]] = {}
+        for r in rules:
+            if r.get("rule_type", "expr") != "expr":
+                continue
+            # Validar y compilar al cargar: las inválidas quedan reportadas y fuera del índice
+            if not _prepare_rule(r, (user_id, client_id)):
+                continue
+            k = (user_id, client_id, r.get("base_symbol"), r.get("quote_symbol"))
+            by_pair.setdefault(k, []).append(r)
+        _prune_invalid_rules((user_id, client_id), {r.get("id") for r in rules})
+        _prune_rule_states((user_id, client_id), {r.get("id") for rs in by_pair.values() for r in rs})
+        return by_pair
+
+    def _install_scope(self, scope: Tuple[str, str], by_pair, generation: int) -> None:
+        """Reemplaza las entradas del scope (con el lock tomado)."""
+        for k in [k for k in self._index if k[0] == scope[0] and k[1] == scope[1]]:
+            del self._index[k]
+        self._index.update(by_pair)
+        if generation == self._generation:
+            self._loaded_at[scope] = time.monotonic()
+        else:
+            # Las reglas cambiaron durante la carga: lo instalado puede ser viejo, recargar
+            self._loaded_at.pop(scope, None)
+        self.loads += 1
+
+    def get(self, user_id: str, client_id: str, base_symbol: str, quote_symbol: str) -> List[Dict[str, Any]]:
+        scope = (user_id, client_id)
+        key = (user_id, client_id, base_symbol, quote_symbol)
+        while True:
+            with self._lock:
+                loaded = self._loaded_at.get(scope)
+                if loaded is not None and time.monotonic() - loaded <= self.ttl:
+                    self.hits += 1
+                    return self._index.get(key, [])
+                pending = self._loading.get(scope)
+                if pending is None:
+                    pending = self._loading[scope] = threading.Event()
+                    generation = self._generation
+                    break
+                if loaded is not None:
+                    # Ya hay una carga en curso: usar las reglas anteriores en vez de esperar
+                    self.hits += 1
+                    return self._index.get(key, [])
+            pending.wait()
+
+        by_pair = None
+        try:
+            by_pair = self._load_scope(user_id, client_id)
+        except Exception as e:
+            print(f"[strategy] error cargando reglas de {user_id}/{client_id}: {e}")
+        finally:
+            with self._lock:
+                if by_pair is not None:  # si falló se conservan las reglas anteriores
+                    self._install_scope(scope, by_pair, generation)
+                del self._loading[scope]
+            pending.set()
+        with self._lock:
+            return self._index.get(key, [])
+
+    def invalidate(self) -> None:
+        """Fuerza recarga en la próxima consulta de cada scope."""
+        with self._lock:
+            self._generation += 1
+            self._loaded_at.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "scopes": len(self._loaded_at),
+                "indexed_pairs": len(self._index),
+                "rules": sum(len(v) for v in self._index.values()),
+                "loads": self.loads,
+                "hits": self.hits,
+                "ttl_seconds": self.ttl,
+                "compiled": len(_compiled),
+                "invalid": len(_invalid_rules),
+            }
+
+_rule_cache = RuleCache()
+on_rules_changed(_rule_cache.invalidate)
+
+def rules_cache_stats() -> Dict[str, Any]:
+    return _rule_cache.stats()
+
+# ------------------------- Estado de reglas (flancos) -------------------------
+# rule_id -> estado; solo la transición falso→verdadero (armada y fuera de cooldown) notifica
+_rule_states: Dict[Any, Dict[str, Any]] = {}
+_rule_states_lock = threading.Lock()
+
+def _param_num(params: Dict[str, Any], key: str, default, cast):
+    try:
+        v = params.get(key)
+        return cast(v) if v is not None else default
+    except Exception:
+        return default
+
+def _update_rule_state(rule: Dict[str, Any], ok: bool, pair: str, now: Optional[float] = None,
+                       scope: Optional[Tuple[str, str]] = None) -> bool:
+    """Actualiza el estado de la regla y devuelve True si corresponde notificar.
+
+    - Solo notifica en el flanco falso→verdadero.
+    - Histéresis: tras activarse, la regla se re-arma recién cuando estuvo falsa
+      `hysteresis_s` segundos seguidos Y `hysteresis` evaluaciones seguidas (evita
+      rebotes en el umbral). Las evaluaciones son una por barra (INTERVAL_SECONDS) en
+      el loop, pero hasta una por tick coalescido en modo eventos: para un umbral
+      estable en tiempo usar hysteresis_s.
+    - Cooldown: como mínimo `cooldown_s` segundos entre notificaciones.
+    """
+    params = rule.get("params") or {}
+    cooldown = _param_num(params, "cooldown_s", ALERT_COOLDOWN_SECONDS, float)
+    hysteresis = max(1, _param_num(params, "hysteresis", ALERT_HYSTERESIS, int))
+    hysteresis_s = max(0.0, _param_num(params, "hysteresis_s", ALERT_HYSTERESIS_SECONDS, float))
+    rule_id = rule.get("id")
+    if now is None:
+        now = time.time()
+
+    with _rule_states_lock:
+        st = _rule_states.get(rule_id)
+        if st is None:
+            st = _rule_states[rule_id] = {
+                "rule_id": rule_id,
+                "pair": pair,
+                "scope": scope,
+                "active": False,
+                "armed": True,
+                "false_streak": 0,
+                "false_since": None,
+                "active_since": None,
+                "last_change_at": None,
+                "last_fired_at": None,
+                "fired": 0,
+                "suppressed": 0,
+                "evaluations": 0,
+            }
+        st["evaluations"] += 1
+        st["last_eval_at"] = now
+        st["cooldown_s"] = cooldown
+        st["hysteresis"] = hysteresis
+        st["hysteresis_s"] = hysteresis_s
+
+        if not ok:
+            st["false_streak"] += 1
+            if st["false_since"] is None:
+                st["false_since"] = now
+            if st["active"]:
+                st["active"] = False
+                st["active_since"] = None
+                st["last_change_at"] = now
+            if (not st["armed"] and st["false_streak"] >= hysteresis
+                    and now - st["false_since"] >= hysteresis_s):
+                st["armed"] = True
+            return False
+
+        st["false_streak"] = 0
+        st["false_since"] = None
+        if st["active"]:
+            return False  # sigue verdadera: no es flanco
+
+        st["active"] = True
+        st["active_since"] = now
+        st["last_change_at"] = now
+        if not st["armed"]:
+            st["suppressed"] += 1
+            return False
+        last = st["last_fired_at"]
+        if last is not None and now - last < cooldown:
+            st["suppressed"] += 1
+            return False
+
+        st["armed"] = False
+        st["last_fired_at"] = now
+        st["fired"] += 1
+        return True
+
+def _prune_rule_states(scope: Tuple[str, str], rule_ids) -> None:
+    """Olvida el estado de las reglas del scope que ya no están activas (borradas o inválidas)."""
+    with _rule_states_lock:
+        for rule_id in [k for k, st in _rule_states.items() if st.get("scope") == scope and k not in rule_ids]:
+            del _rule_states[rule_id]
+
+def rule_states() -> List[Dict[str, Any]]:
+    """Estado en memoria de cada regla evaluada (para inspección)."""
+    with _rule_states_lock:
+        return [dict(st) for st in _rule_states.values()]
 
 def evaluateAndAlert(
     *,
@@ -81,18 +432,10 @@ def evaluateAndAlert(
 ) -> int:
     """
     Carga reglas para (user_id, client_id, base_symbol, quote_symbol),
-    evalúa y dispara alertas. Retorna cantidad de reglas que matchearon.
+    evalúa y dispara alertas solo en el flanco de activación (ver _update_rule_state).
+    Retorna cantidad de reglas que matchearon (estén o no notificando).
     """
-    rules = list_rules(user_id=user_id, client_id=client_id, active=True)
-    if not rules:
-        return 0
-
-    # Filtrar por símbolos
-    filtered = [
-        r for r in rules
-        if r.get("base_symbol") == base_symbol and r.get("quote_symbol") == quote_symbol
-        and r.get("rule_type", "expr") == "expr"
-    ]
+    filtered = _rule_cache.get(user_id, client_id, base_symbol, quote_symbol)
     if not filtered:
         return 0
 
@@ -107,9 +450,14 @@ def evaluateAndAlert(
         if not isinstance(expr, str) or not expr.strip():
             continue
 
-        ok = _eval_expr(expr, base=base, quote=quote, ratios=ratios)
+        try:
+            code = _get_compiled(expr, r.get("id"))
+        except ValueError:
+            continue
+        ok = _eval_code(code, base=base, quote=quote, ratios=ratios)
         if ok:
             matched += 1
+        if _update_rule_state(r, ok, f"{base_symbol}/{quote_symbol}", scope=(user_id, client_id)):
             try:
                 _notify(
                     f"✅ Regla #{r.get('id')} cumplida\n"
@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 from dotenv import load_dotenv
 from supabase import create_client, Client
 
@@ -54,9 +56,29 @@ def list_rules(user_id: str, client_id: str = None, active: bool = True):
         return []
 
 
+# Callbacks a invocar cuando cambian las reglas (p.ej. invalidar caches)
+_rules_listeners = []
+
+
+def on_rules_changed(callback):
+    """Registra un callback() que se llama tras crear/borrar reglas."""
+    if callback not in _rules_listeners:
+        _rules_listeners.append(callback)
+
+
+def _notify_rules_changed():
+    for cb in list(_rules_listeners):
+        try:
+            cb()
+        except Exception as e:
+            print(f"[supabase] error en listener de reglas: {e}")
+
+
 def create_rule(rule: dict):
     try:
-        return supabase.table("trading_rules").insert(rule).execute()
+        resp = supabase.table("trading_rules").insert(rule).execute()
+        _notify_rules_changed()
+        return resp
     except Exception as e:
         print(f"[supabase] error create_rule: {e}")
         return None
@@ -64,7 +86,9 @@ def create_rule(rule: dict):
 
 def delete_rule(rule_id: int):
     try:
-        return supabase.table("trading_rules").delete().eq("id", rule_id).execute()
+        resp = supabase.table("trading_rules").delete().eq("id", rule_id).execute()
+        _notify_rules_changed()
+        return resp
     except Exception as e:
         print(f"[supabase] error delete_rule: {e}")
         return None
@@ -134,4 +158,121 @@ def guardar_en_supabase(tabla: str, row: dict):
         
     except Exception as e:
         print(f"[supabase] error guardar_en_supabase en {tabla}: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+# ------------------------------- Escritura en lote ----------------------------
+_lote_stats: dict = {}
+_lote_stats_lock = threading.Lock()
+
+
+def _limpiar_valor(value):
+    """None para inf/NaN (no serializables a JSON); el resto sin tocar."""
+    if isinstance(value, float) and (value != value or value in (float('inf'), float('-inf'))):
+        return None
+    return value
+
+
+def _registrar_lote(tabla: str, filas: int, elapsed_ms: float, ok: bool, error: str = None):
+    with _lote_stats_lock:
+        st = _lote_stats.setdefault(tabla, {
+            "batches": 0, "rows": 0, "failed_batches": 0, "failed_rows": 0,
+            "last_batch_rows": 0, "last_batch_ms": None, "max_batch_ms": 0.0,
+            "last_error": None, "last_at": None,
+        })
+        st["last_batch_rows"] = filas
+        st["last_batch_ms"] = round(elapsed_ms, 2)
+        st["max_batch_ms"] = round(max(st["max_batch_ms"], elapsed_ms), 2)
+        st["last_at"] = time.time()
+        if ok:
+            st["batches"] += 1
+            st["rows"] += filas
+        else:
+            st["failed_batches"] += 1
+            st["failed_rows"] += filas
+            st["last_error"] = error
+
+
+def get_lote_stats() -> dict:
+    """Métricas de inserción en lote por tabla (latencia y fallos)."""
+    with _lote_stats_lock:
+        return {t: dict(st) for t, st in _lote_stats.items()}
+
+
+def _insertar_grupo(tabla: str, clean_rows: list):
+    """Un insert múltiple (todas las filas con las mismas claves). Respuesta o None."""
+    t0 = time.perf_counter()
+    try:
+        resp = supabase.table(tabla).insert(clean_rows).execute()
+    except Exception as e:
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+        _registrar_lote(tabla, len(clean_rows), elapsed_ms, False, str(e))
+        print(f"[supabase] error guardar_lote en {tabla} ({len(clean_rows)} filas, {elapsed_ms:.0f} ms): {e}")
+        return None
+
+    elapsed_ms = (time.perf_counter() - t0) * 1000.0
+    ok = isinstance(getattr(resp, "data", None), list) and len(resp.data) > 0
+    _registrar_lote(tabla, len(clean_rows), elapsed_ms, ok, None if ok else "sin datos en respuesta")
+    if not ok:
+        print(f"[supabase] ❌ Lote sin confirmar en {tabla} ({len(clean_rows)} filas, {elapsed_ms:.0f} ms)")
+        return None
+    return resp
+
+
+def guardar_lote(tabla: str, rows: list):
+    """Inserta varias filas con UNA request por conjunto de columnas.
+
+    Igual que guardar_en_supabase, se omiten las claves None/inf/NaN para que apliquen
+    los defaults de la DB. PostgREST exige las mismas claves en todas las filas de un
+    insert múltiple (si no, manda null explícito), por eso se agrupan las filas por
+    conjunto de claves. Lo habitual es un único grupo.
+    Devuelve la respuesta (la del último grupo) si se insertó todo, None si algo falló.
+    """
+    if not tabla or not rows:
+        return None
+
+    grupos = {}
+    for row in rows:
+        clean_row = {k: v for k, v in row.items() if _limpiar_valor(v) is not None}
+        if clean_row:
+            grupos.setdefault(frozenset(clean_row), []).append(clean_row)
+    if not grupos:
+        return None
+
+    resp = None
+    ok = True
+    for clean_rows in grupos.values():
+        r = _insertar_grupo(tabla, clean_rows)
+        if r is None:
+            ok = False
+        else:
+            resp = r
+    return resp if ok else None
+
+
+class WriteBuffer:
+    """Acumula filas por tabla y las inserta con un request por tabla en flush()."""
+
+    def __init__(self):
+        self._rows: dict = {}
+        self._lock = threading.Lock()
+
+    def add(self, tabla: str, row: dict):
+        if not tabla or not row:
+            return
+        with self._lock:
+            self._rows.setdefault(tabla, []).append(row)
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(r) for r in self._rows.values())
+
+    def flush(self) -> dict:
+        """Inserta lo acumulado. Devuelve {tabla: filas_guardadas (0 si falló)}."""
+        with self._lock:
+            por_tabla, self._rows = self._rows, {}
+        resultado = {}
+        for tabla, rows in por_tabla.items():
+            resp = guardar_lote(tabla, rows)
+            resultado[tabla] = len(rows) if resp is not None else 0
+        return resultado
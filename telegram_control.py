@@ -1,8 +1,10 @@
 # telegram_control.py - Version final funcional
 import os
 import json
+import queue
 import threading
 import tempfile
+import time
 import atexit
 from typing import Any, Dict, Optional, Callable
 
@@ -27,6 +29,14 @@ API_BASE = os.getenv("API_BASE", "http://127.0.0.1:8000")
 BOT_TOKEN = os.getenv("TELEGRAM_TOKEN")
 ADMIN_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+# Cola de notificaciones salientes (un solo hilo envía; nadie bloquea en Telegram)
+NOTIFY_QUEUE_MAX         = int(os.getenv("TELEGRAM_NOTIFY_QUEUE_MAX", "1000"))
+NOTIFY_COALESCE_SECONDS  = float(os.getenv("TELEGRAM_NOTIFY_COALESCE_SECONDS", "2.0"))
+NOTIFY_MIN_INTERVAL      = float(os.getenv("TELEGRAM_NOTIFY_MIN_INTERVAL", "1.1"))  # ~1 msg/s por chat
+NOTIFY_MAX_RETRIES       = int(os.getenv("TELEGRAM_NOTIFY_MAX_RETRIES", "5"))
+NOTIFY_FLUSH_SECONDS     = float(os.getenv("TELEGRAM_NOTIFY_FLUSH_SECONDS", "5.0"))  # máximo para vaciar la cola al cerrar
+TELEGRAM_MAX_CHARS       = 4096
+
 # Estado interno
 _bot = None
 _bot_thread = None
@@ -304,6 +314,9 @@ def shutdown():
     print("[telegram] Iniciando shutdown del bot...")
     _started = False
     
+    # Antes de soltar el bot: enviar las alertas que quedaron en la cola
+    _flush_notifications(NOTIFY_FLUSH_SECONDS)
+    
     if _bot:
         try:
             print("[telegram] Deteniendo polling del bot...")
@@ -325,9 +338,222 @@ def shutdown():
     _cleanup_lock()
     print("[telegram] Shutdown del bot completado")
 
-def notify(text):
-    if _bot and ADMIN_CHAT_ID:
+# ------------------------- Notificaciones asíncronas --------------------------
+_notify_queue = queue.Queue(maxsize=NOTIFY_QUEUE_MAX)
+_sender_thread = None
+_sender_lock = threading.Lock()
+_sender_stop = threading.Event()  # shutdown: el sender vacía la cola y termina
+_flush_deadline = None            # monotonic hasta el que se intenta vaciar la cola
+_notify_stats_lock = threading.Lock()
+_notify_stats = {
+    "enqueued": 0,
+    "dropped": 0,
+    "sent_messages": 0,
+    "sent_alerts": 0,
+    "coalesced": 0,
+    "retries": 0,
+    "rate_limited": 0,
+    "failed": 0,
+    "unsent_on_shutdown": 0,
+    "max_depth": 0,
+    "last_send_ms": None,
+    "last_sent_at": None,
+    "last_error": None,
+}
+
+def _incr_stat(key, n=1):
+    with _notify_stats_lock:
+        _notify_stats[key] += n
+
+def _ensure_sender():
+    global _sender_thread, _flush_deadline
+    with _sender_lock:
+        if _sender_thread and _sender_thread.is_alive():
+            return
+        _sender_stop.clear()
+        _flush_deadline = None
+        _sender_thread = threading.Thread(target=_sender_loop, name="telegram-sender", daemon=True)
+        _sender_thread.start()
+
+def _coalesce(first):
+    """Junta los mensajes que lleguen dentro de la ventana en uno solo (≤ 4096 chars)."""
+    parts = [first]
+    size = len(first)
+    # Al cerrar no se espera la ventana: se junta solo lo que ya está en la cola
+    stopping = _sender_stop.is_set()
+    deadline = time.monotonic() + (0.0 if stopping else NOTIFY_COALESCE_SECONDS)
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 and not stopping:
+            break
         try:
-            _bot.send_message(int(ADMIN_CHAT_ID), text)
-        except:
-            pass
+            nxt = _notify_queue.get(timeout=remaining) if remaining > 0 else _notify_queue.get_nowait()
+        except queue.Empty:
+            break
+        if nxt is None:
+            break  # _flush_notifications: enviar lo juntado sin esperar la ventana
+        if size + len(nxt) + 2 > TELEGRAM_MAX_CHARS:
+            # No entra: queda para el próximo mensaje
+            _requeue_front(nxt)
+            break
+        parts.append(nxt)
+        size += len(nxt) + 2
+    return parts
+
+_carry = []  # mensaje que no entró en el último lote (solo lo toca el hilo sender)
+
+def _requeue_front(text):
+    _carry.append(text)
+
+def _retry_after_seconds(exc):
+    """Segundos a esperar si Telegram respondió 429 (retry_after); None si no es rate limit."""
+    code = getattr(exc, "error_code", None)
+    if code != 429:
+        return None
+    try:
+        return float(exc.result_json["parameters"]["retry_after"])
+    except Exception:
+        return 5.0
+
+def _is_transient(exc):
+    """5xx y errores de red se reintentan; 400/403 (chat o token inválidos) no se arreglan reintentando."""
+    code = getattr(exc, "error_code", None)
+    if isinstance(code, int):
+        return code >= 500
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                            ConnectionError, TimeoutError))
+
+def _send_with_retry(text):
+    delay = 1.0
+    for attempt in range(NOTIFY_MAX_RETRIES + 1):
+        bot, chat = _bot, ADMIN_CHAT_ID
+        if not (bot and chat):
+            return False
+        t0 = time.perf_counter()
+        try:
+            bot.send_message(int(chat), text)
+            with _notify_stats_lock:
+                _notify_stats["last_send_ms"] = round((time.perf_counter() - t0) * 1000.0, 1)
+                _notify_stats["last_sent_at"] = time.time()
+            return True
+        except Exception as e:
+            with _notify_stats_lock:
+                _notify_stats["last_error"] = str(e)
+            if attempt >= NOTIFY_MAX_RETRIES:
+                break
+            wait = _retry_after_seconds(e)
+            if wait is not None:
+                _incr_stat("rate_limited")
+            elif _is_transient(e):
+                wait = delay
+                delay = min(delay * 2, 30.0)
+            else:
+                print(f"[telegram] Notificación descartada ({e})")
+                break
+            if _flush_deadline is not None and time.monotonic() + wait > _flush_deadline:
+                break  # cerrando: no esperar más allá del límite del flush
+            _incr_stat("retries")
+            time.sleep(wait)
+    return False
+
+def _sender_loop():
+    last_send = 0.0
+    while True:
+        if _sender_stop.is_set():
+            if not _carry and _notify_queue.empty():
+                return
+            if time.monotonic() >= _flush_deadline:
+                _discard_pending()
+                return
+        if _carry:
+            first = _carry.pop(0)
+        else:
+            try:
+                first = _notify_queue.get(timeout=60)
+            except queue.Empty:
+                continue
+            if first is None:  # despertador de _flush_notifications
+                continue
+        parts = _coalesce(first)
+
+        # Respetar el límite de Telegram por chat
+        wait = NOTIFY_MIN_INTERVAL - (time.monotonic() - last_send)
+        if wait > 0:
+            time.sleep(wait)
+
+        text = "\n\n".join(parts)
+        if _send_with_retry(text):
+            _incr_stat("sent_messages")
+            _incr_stat("sent_alerts", len(parts))
+            if len(parts) > 1:
+                _incr_stat("coalesced", len(parts) - 1)
+        else:
+            _incr_stat("failed", len(parts))
+        last_send = time.monotonic()
+
+def _discard_pending():
+    """Cuenta y descarta lo que no llegó a enviarse antes del límite del flush."""
+    n = len(_carry)
+    _carry.clear()
+    while True:
+        try:
+            if _notify_queue.get_nowait() is not None:
+                n += 1
+        except queue.Empty:
+            break
+    if n:
+        _incr_stat("unsent_on_shutdown", n)
+        print(f"[telegram] {n} notificaciones sin enviar al cerrar")
+
+def _flush_notifications(timeout):
+    """Vacía la cola (como mucho `timeout` segundos) y detiene el hilo sender."""
+    global _flush_deadline
+    t = _sender_thread
+    if not (t and t.is_alive()):
+        return
+    _flush_deadline = time.monotonic() + timeout
+    _sender_stop.set()
+    try:
+        _notify_queue.put_nowait(None)  # por si el sender espera en get()
+    except queue.Full:
+        pass
+    t.join(timeout + 1.0)
+
+def notify(text):
+    """Encola una notificación para el admin. No bloquea al llamador."""
+    if not (_bot and ADMIN_CHAT_ID):
+        return
+    text = str(text)[:TELEGRAM_MAX_CHARS]
+    try:
+        _notify_queue.put_nowait(text)
+    except queue.Full:
+        _incr_stat("dropped")
+        return
+    with _notify_stats_lock:
+        _notify_stats["enqueued"] += 1
+        depth = _notify_queue.qsize()
+        if depth > _notify_stats["max_depth"]:
+            _notify_stats["max_depth"] = depth
+    _ensure_sender()
+
+def notify_stats():
+    """Métricas de la cola de notificaciones."""
+    with _notify_stats_lock:
+        out = dict(_notify_stats)
+    out["queue_depth"] = _notify_queue.qsize() + len(_carry)
+    out["queue_max"] = NOTIFY_QUEUE_MAX
+    out["sender_alive"] = bool(_sender_thread and _sender_thread.is_alive())
+    out["coalesce_seconds"] = NOTIFY_COALESCE_SECONDS
+    out["min_interval_seconds"] = NOTIFY_MIN_INTERVAL
+    return out
+
+def current_status():
+    """Estado del bot para /cotizaciones/telegram_diag."""
+    return {
+        "started": _started,
+        "bot_active": _bot is not None,
+        "polling_alive": bool(_bot_thread and _bot_thread.is_alive()),
+        "has_chat_id": bool(ADMIN_CHAT_ID),
+        "lock_path": _lock_path,
+        "notify_queue": notify_stats(),
+    }
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para broker_simulator: matching precio-tiempo, parciales, IOC/FOK, rechazos,
+cancelaciones y carga de punta a punta a través de MarketDataManager (sin pyRofex).
+"""
+
+import asyncio
+import threading
+import time
+
+import ws_rofex
+from broker_simulator import BrokerSimulator, OrderBook, SimOrder, Side, OrderType, TimeInForce, MAKER
+
+TX26 = "MERV - XMEV - TX26 - 24hs"
+TX28 = "MERV - XMEV - TX28 - 24hs"
+
+
+def _o(oid, side, qty, price, tif=TimeInForce.DAY.value, otype=OrderType.LIMIT.value, account="A"):
+    return SimOrder(oid, TX26, side, qty, price, otype, tif, account)
+
+
+def test_prioridad_precio_tiempo():
+    book = OrderBook(TX26)
+    book.add(_o("s1", Side.SELL.value, 10, 101.0))
+    book.add(_o("s2", Side.SELL.value, 10, 100.0))
+    book.add(_o("s3", Side.SELL.value, 10, 100.0))   # mismo precio, llegó después
+    buy = _o("b1", Side.BUY.value, 25, 101.0)
+    fills = book.match(buy)
+    assert [(m.order_id, p, q) for m, p, q in fills] == [("s2", 100.0, 10), ("s3", 100.0, 10), ("s1", 101.0, 5)]
+    assert buy.leaves == 0 and abs(buy.avg_px - (2000 + 505) / 25) < 1e-12
+    assert book.depth(Side.SELL.value, 5) == [{"price": 101.0, "size": 5}]
+    # Límite que no cruza: no ejecuta
+    assert book.match(_o("b2", Side.BUY.value, 5, 100.5)) == []
+    print("✅ Prioridad precio-tiempo y VWAP OK")
+
+
+def _sim_con_handlers(**kw):
+    sim = BrokerSimulator(latency_ms=1, mm_interval=0, **kw)
+    reports, md = [], []
+    sim.initialize(account="ACC")
+    sim.init_websocket_connection(market_data_handler=md.append,
+                                  order_report_handler=lambda m: reports.append(m["orderReport"]))
+    sim.order_report_subscription()
+    return sim, reports, md
+
+
+def _espera(cond, timeout=2.0):
+    t0 = time.time()
+    while not cond():
+        if time.time() - t0 > timeout:
+            raise AssertionError("timeout")
+        time.sleep(0.002)
+
+
+def test_parciales_ioc_fok_rechazos_cancelacion():
+    sim, reports, md = _sim_con_handlers()
+    try:
+        sim.seed_book(TX26, bids=[(99.0, 100)], offers=[(100.0, 50), (100.5, 50)])
+        sim.market_data_subscription([TX26], depth=5)
+        por_id = lambda cid: [r for r in reports if r.get("wsClOrdId") == cid]
+
+        # Parcial que queda en el libro y después se cancela
+        sim.send_order_via_websocket(TX26, 80, Side.BUY, OrderType.LIMIT, price=100.0, ws_client_order_id="p1")
+        _espera(lambda: len(por_id("p1")) >= 2)
+        assert [r["status"] for r in por_id("p1")] == ["NEW", "PARTIALLY_FILLED"]
+        assert por_id("p1")[-1]["cumQty"] == 50 and por_id("p1")[-1]["leavesQty"] == 30
+        sim.cancel_order_via_websocket("p1")
+        _espera(lambda: por_id("p1")[-1]["status"] == "CANCELLED")
+
+        # IOC: ejecuta lo que hay y cancela el resto
+        sim.send_order_via_websocket(TX26, 80, "BUY", "LIMIT", price=100.5, time_in_force=TimeInForce.IMMEDIATE_OR_CANCEL,
+                                     ws_client_order_id="i1")
+        _espera(lambda: por_id("i1") and por_id("i1")[-1]["status"] == "CANCELLED")
+        assert por_id("i1")[-1]["cumQty"] == 50
+
+        # FOK sin cantidad suficiente: no ejecuta nada
+        sim.send_order_via_websocket(TX26, 150, Side.SELL, OrderType.LIMIT, price=99.0,
+                                     time_in_force=TimeInForce.FILL_OR_KILL, ws_client_order_id="f1")
+        _espera(lambda: por_id("f1"))
+        assert por_id("f1")[-1]["status"] == "CANCELLED" and por_id("f1")[-1]["cumQty"] == 0
+
+        # Rechazos
+        sim.send_order_via_websocket("NO EXISTE", 1, Side.BUY, OrderType.LIMIT, price=1, ws_client_order_id="r1")
+        sim.send_order_via_websocket(TX26, 0, Side.BUY, OrderType.LIMIT, price=1, ws_client_order_id="r2")
+        _espera(lambda: por_id("r1") and por_id("r2"))
+        assert por_id("r1")[-1]["status"] == por_id("r2")[-1]["status"] == "REJECTED"
+
+        # La market data refleja el libro
+        _espera(lambda: md and md[-1]["marketData"]["OF"] == [])
+        assert md[-1]["marketData"]["BI"] == [{"price": 99.0, "size": 100.0}]
+    finally:
+        sim.close_websocket_connection()
+    print("✅ Parciales, IOC, FOK, rechazos, cancelación y market data OK")
+
+
+def test_latencia_configurable():
+    sim, reports, _ = _sim_con_handlers()
+    sim.latency_ms = 50
+    try:
+        sim.seed_book(TX26, offers=[(100.0, 10)])
+        t0 = time.perf_counter()
+        sim.send_order_via_websocket(TX26, 1, Side.BUY, OrderType.LIMIT, price=100.0, ws_client_order_id="l1")
+        _espera(lambda: reports)
+        dt = time.perf_counter() - t0
+    finally:
+        sim.close_websocket_connection()
+    assert 0.09 <= dt < 0.5, dt   # ida (orden) + vuelta (reporte)
+    print(f"✅ Latencia 50 ms por tramo: primer reporte a los {dt * 1000:.0f} ms")
+
+
+def test_carga_de_punta_a_punta():
+    """300 operaciones concurrentes (venta TX26 + compra TX28) contra el simulador vía MarketDataManager."""
+    sim = BrokerSimulator(latency_ms=2, mm_interval=0)
+    sim.seed_book(TX26, bids=[(1000.0 - i, 100_000) for i in range(5)], offers=[(1001.0 + i, 100_000) for i in range(5)])
+    sim.seed_book(TX28, bids=[(900.0 - i, 100_000) for i in range(5)], offers=[(901.0 + i, 100_000) for i in range(5)])
+    manager = ws_rofex.MarketDataManager()
+    res = manager.start(user="sim", password="-", account="SIM", instrumentos=[TX26, TX28], pyrofex=sim)
+    assert res["status"] == "started", res
+    n = 300
+
+    async def operacion(i):
+        ids = (f"op{i}_sell", f"op{i}_buy")
+        for cid, sym, side, px in ((ids[0], TX26, "SELL", 999.0), (ids[1], TX28, "BUY", 902.0)):
+            r = manager.send_order(symbol=sym, side=side, size=10, price=px, client_order_id=cid)
+            assert r["status"] == "ok", r
+        out = []
+        for cid in ids:
+            rep = await manager.wait_order_report(cid, timeout=10, statuses=("FILLED", "REJECTED", "CANCELLED"))
+            out.append(rep and rep["status"])
+        return out
+
+    async def run():
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(operacion(i) for i in range(n)))
+        return results, time.perf_counter() - t0
+
+    try:
+        results, dt = asyncio.run(run())
+        _espera(lambda: ws_rofex.quotes_cache.get(TX26) is not None)
+    finally:
+        manager.stop()
+    assert all(r == ["FILLED", "FILLED"] for r in results), [r for r in results if r != ["FILLED", "FILLED"]][:3]
+    assert sim.status()["fills"] >= 2 * n
+    print(f"✅ {n} operaciones concurrentes ({2 * n} órdenes) completas en {dt:.2f}s "
+          f"({2 * n / dt:,.0f} órdenes/s)")
+
+
+if __name__ == "__main__":
+    test_prioridad_precio_tiempo()
+    test_parciales_ioc_fok_rechazos_cancelacion()
+    test_latencia_configurable()
+    test_carga_de_punta_a_punta()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para DepthBook: armado desde niveles de pyRofex, volumen hasta un precio,
+VWAP por cantidad y acceso desde el cache de cotizaciones.
+"""
+
+from depth_book import DepthBook
+from quotes_cache import QuoteStore
+
+BIDS = [{"price": 100.0, "size": 10}, {"price": 99.5, "size": 20}, {"price": 99.0, "size": 30}]
+OFFERS = [{"price": 100.5, "size": 5}, {"price": 101.0, "size": 15}, {"price": 101.5, "size": 40}]
+
+
+def test_armado_y_limite_de_niveles():
+    book = DepthBook.from_levels("X", BIDS + [{"price": None, "size": 3}, {"price": 98.5, "size": 0}], OFFERS, max_levels=2)
+    assert book.levels("sell") == [(100.0, 10.0), (99.5, 20.0)]
+    assert book.levels("buy") == [(100.5, 5.0), (101.0, 15.0)]
+    alt = DepthBook.from_levels("X", [{"p": 1, "s": 2}, (0.9, 4)], {"price": 1.1, "size": 3})
+    assert alt.levels("bid") == [(1.0, 2.0), (0.9, 4.0)] and alt.levels("offer") == [(1.1, 3.0)]
+    assert DepthBook.from_levels("X", None, 7).levels("bid") == []
+    print("✅ Armado del libro y límite de niveles OK")
+
+
+def test_volumen_hasta_precio():
+    book = DepthBook.from_levels("X", BIDS, OFFERS)
+    assert book.volume_up_to("sell", 100.0) == 10
+    assert book.volume_up_to("sell", 99.5) == 30
+    assert book.volume_up_to("sell", 100.1) == 0
+    assert book.volume_up_to("buy", 101.0) == 20
+    assert book.volume_up_to("buy", 200.0) == 60
+    print("✅ volume_up_to OK")
+
+
+def test_vwap_por_cantidad():
+    book = DepthBook.from_levels("X", BIDS, OFFERS)
+    vwap, filled = book.vwap_for_size("sell", 25)
+    assert filled == 25 and abs(vwap - (10 * 100.0 + 15 * 99.5) / 25) < 1e-12
+    vwap, filled = book.vwap_for_size("buy", 100)   # no alcanza la profundidad
+    assert filled == 60 and abs(vwap - (5 * 100.5 + 15 * 101.0 + 40 * 101.5) / 60) < 1e-12
+    assert DepthBook.from_levels("X", [], []).vwap_for_size("buy", 1) == (None, 0.0)
+    print("✅ vwap_for_size OK")
+
+
+def test_desde_el_cache():
+    qc = QuoteStore()
+    qc.set_depth(DepthBook.from_levels("X", BIDS, OFFERS))
+    qc.set("X", bid=100.0, bid_size=10, offer=100.5, offer_size=5)
+    assert qc.depth("X").volume_up_to("sell", 99.0) == 60
+    assert qc.depth("X", max_age_ms=60_000) is not None
+    assert qc.depth("Y") is None
+    q = qc["X"]
+    object.__setattr__(q, "received_ms", q.received_ms - 3_600_000)
+    assert qc.depth("X", max_age_ms=60_000) is None    # libro de una cotización vieja
+    del qc["X"]
+    assert qc.depth("X") is None
+    print("✅ Libro accesible desde el cache con control de frescura")
+
+
+if __name__ == "__main__":
+    test_armado_y_limite_de_niveles()
+    test_volumen_hasta_precio()
+    test_vwap_por_cantidad()
+    test_desde_el_cache()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para execution_algos: decisiones de adaptive / twap / pov / threshold sobre
+contextos armados a mano, y operaciones completas contra el simulador de broker.
+Requiere las dependencias del servicio (ratios_worker importa supabase_client).
+"""
+
+import asyncio
+import threading
+import time
+
+import ws_rofex
+from execution_algos import AlgoContext, ALGOS, create_algo, improvement_bps
+from ratio_operations_real import RealRatioOperationManager, RatioOperationRequest, OperationStatus
+from test_ratio_legs import TX26, TX28, _sesion
+
+
+def _ctx(**kw):
+    base = dict(nominales=1000, remaining=1000, executed=0, lots=0, sell_liquidity=500, buy_liquidity=400,
+                current_ratio=1.10, weighted_ratio=1.10, target_ratio=1.05, condition=">=", quote_seq=1)
+    base.update(kw)
+    return AlgoContext(**base)
+
+
+def test_registro():
+    assert set(ALGOS) >= {"adaptive", "twap", "pov", "threshold"}
+    for nombre, params in (("vwap", {}), ("twap", {"inexistente": 1}), ("pov", {"participation": "x"})):
+        try:
+            create_algo(nombre, params)
+        except ValueError:
+            continue
+        raise AssertionError(f"{nombre} {params} debió fallar")
+    assert create_algo("TWAP", {"slices": 4}).describe() == "twap(duration_s=300.0, slices=4, max_fraction=1.0)"
+    print("✅ Registro y validación de parámetros OK")
+
+
+def test_adaptive():
+    algo = create_algo("adaptive", {"max_wait_s": 0.05, "retry_wait_s": 0.01})
+    d = algo.decide(_ctx())
+    assert d.quantity == 320 and not d.stop, d  # 80% de la pata más corta
+    assert algo.decide(_ctx(sell_liquidity=0)).stop
+    d = algo.decide(_ctx(current_ratio=1.0))
+    assert d.quantity == 0 and d.wait_s == 0.01, d
+    time.sleep(0.06)
+    d = algo.decide(_ctx(current_ratio=1.0))
+    assert d.quantity == 320 and d.reason.startswith("TIMEOUT"), d
+    # Con el hook del manager decide la heurística de ratio ponderado
+    algo = create_algo("adaptive", {}, should_execute=lambda *a: (False, "no"))
+    assert algo.decide(_ctx()).quantity == 0
+    recibidos = []
+    algo = create_algo("adaptive", {}, should_execute=lambda *a: recibidos.append(a) or (True, "ok"))
+    algo.decide(_ctx(executed=600, remaining=400, lots=2))
+    assert recibidos[0][-2:] == (400, 600), recibidos
+    # La heurística del manager pondera con los nominales ejecutados de la operación (no sobre 100):
+    # 900 a 1.04 + 50 a 1.06 dejan el promedio debajo de 1.05
+    rrm = RealRatioOperationManager()
+    ok, motivo = rrm._should_execute_now(1.06, 1.05, ">=", 1.04, 3, 50, 100, 900)
+    assert not ok and motivo.startswith("Nuevo promedio ponderado no cumple: 1.041053"), motivo
+    print("✅ adaptive: lote 80%, espera acotada y hook OK")
+
+
+def test_twap():
+    algo = create_algo("twap", {"duration_s": 1.0, "slices": 4})
+    d = algo.decide(_ctx())
+    assert d.quantity == 250 and 0 < d.wait_s <= 0.25, d
+    # Tramo cubierto: esperar al siguiente
+    d = algo.decide(_ctx(executed=250, remaining=750))
+    assert d.quantity == 0 and d.wait_s <= 0.25, d
+    # Lo atrasado se recupera, acotado por la liquidez libre
+    algo.started_at -= 0.6
+    assert algo.decide(_ctx(executed=0)).quantity == 400
+    assert algo.decide(_ctx(current_ratio=1.0)).quantity == 0
+    print("✅ twap: tramos, espera al próximo tramo y recuperación OK")
+
+
+def test_pov():
+    algo = create_algo("pov", {"participation": 0.25})
+    ctx = _ctx(quote_seq=7)
+    d = algo.decide(ctx)
+    assert d.quantity == 100, d
+    algo.on_lot(ctx, d.quantity)
+    # Mismo libro: no vuelve a tomar hasta una cotización nueva
+    assert algo.decide(_ctx(quote_seq=7)).quantity == 0
+    assert algo.decide(_ctx(quote_seq=8)).quantity == 100
+    assert algo.decide(_ctx(quote_seq=8, sell_liquidity=2)).quantity == 0  # menor al lote mínimo
+    print("✅ pov: participación sobre libros nuevos OK")
+
+
+def test_threshold():
+    assert round(improvement_bps(1.10, 1.0, ">="), 6) == 1000
+    assert round(improvement_bps(0.90, 1.0, "<="), 6) == 1000
+    algo = create_algo("threshold", {"improve_bps": 400, "max_fraction": 0.5})
+    assert algo.decide(_ctx(current_ratio=1.08)).quantity == 0  # ~286 bps
+    assert algo.decide(_ctx(current_ratio=1.10)).quantity == 200
+    print("✅ threshold: toma solo con mejora suficiente OK")
+
+
+def _operar(algo, algo_params, nominales=1000):
+    """Libro de 500 nominales por lado repuesto cada 20 ms, como en test_ratio_legs."""
+    tx26_bids, tx28_offers = [(1000.0, 500), (999.0, 10_000)], [(901.0, 500), (902.0, 10_000)]
+    sim = _sesion(tx26_bids, tx28_offers)
+    stop = threading.Event()
+
+    def reponer():
+        while not stop.wait(0.02):
+            sim.seed_book(TX26, bids=tx26_bids, offers=[(1001.0, 10_000)])
+            sim.seed_book(TX28, bids=[(899.0, 10_000)], offers=tx28_offers)
+
+    threading.Thread(target=reponer, daemon=True).start()
+    rrm = RealRatioOperationManager()
+    request = RatioOperationRequest(
+        operation_id=f"{algo}1", pair=[TX26, TX28], instrument_to_sell=TX26, client_id="test",
+        nominales=nominales, target_ratio=1.0, condition=">=", leg_mode="parallel",
+        algo=algo, algo_params=algo_params,
+    )
+
+    async def run():
+        t0 = time.perf_counter()
+        progress = await rrm.submit_operation(request)
+        return progress, time.perf_counter() - t0
+
+    try:
+        return asyncio.run(run())
+    finally:
+        stop.set()
+        ws_rofex.manager.stop()
+
+
+def test_operaciones_con_algoritmo():
+    progress, dt = _operar("twap", {"duration_s": 0.5, "slices": 5})
+    assert progress.status == OperationStatus.COMPLETED and progress.completed_nominales == 1000
+    # 5 tramos repartidos en ~0.5s: ni todo junto ni esperas de 5s
+    assert progress.batch_count >= 5 and 0.3 < dt < 2.0, (progress.batch_count, dt)
+    print(f"✅ twap: 1000 nominales en {progress.batch_count} lotes, {dt:.2f}s")
+
+    progress, dt = _operar("pov", {"participation": 0.1})
+    assert progress.status == OperationStatus.COMPLETED and progress.completed_nominales == 1000
+    assert max(o.quantity for o in progress.sell_orders) <= 50 and dt < 5.0, dt
+    print(f"✅ pov: 1000 nominales en {progress.batch_count} lotes, {dt:.2f}s")
+
+    rrm = RealRatioOperationManager()
+    request = RatioOperationRequest(
+        operation_id="x", pair=[TX26, TX28], instrument_to_sell=TX26, client_id="test",
+        nominales=10, target_ratio=1.0, condition=">=", algo="inexistente",
+    )
+    try:
+        asyncio.run(rrm.submit_operation(request))
+    except ValueError:
+        assert "x" not in rrm.active_operations
+    else:
+        raise AssertionError("algoritmo desconocido debió fallar al encolar")
+    print("✅ Algoritmo desconocido rechazado al encolar")
+
+
+def test_reserva_ajena_no_termina_la_operacion():
+    """Dos operaciones venden TX26: mientras la primera tiene el nivel reservado, la segunda espera."""
+    # 500 en el mejor bid (todo lo que ve la primera); el segundo nivel queda después del fill
+    _sesion([(1000.0, 500), (999.0, 10_000)], [(901.0, 10_000)], latency_ms=50)
+    rrm = RealRatioOperationManager()
+
+    def pedido(op_id, nominales, algo, params=None):
+        return RatioOperationRequest(
+            operation_id=op_id, pair=[TX26, TX28], instrument_to_sell=TX26, client_id="test",
+            nominales=nominales, target_ratio=1.0, condition=">=", algo=algo, algo_params=params,
+        )
+
+    async def run():
+        primera = rrm.submit_operation(pedido("res1", 500, "threshold", {"max_fraction": 1.0}))
+        segunda = rrm.submit_operation(pedido("res2", 200, "adaptive"))
+        return await asyncio.wait_for(asyncio.gather(primera, segunda), 10.0)
+
+    try:
+        p1, p2 = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    assert p1.status == OperationStatus.COMPLETED and p1.completed_nominales == 500, (p1.status, p1.completed_nominales)
+    assert p2.status == OperationStatus.COMPLETED and p2.completed_nominales == 200, (p2.status, p2.messages[-5:])
+    assert any("Liquidez reservada por otra operación" in m for m in p2.messages), p2.messages
+    print("✅ Reserva de otra operación: la segunda espera y completa en lugar de abandonar")
+
+
+if __name__ == "__main__":
+    test_registro()
+    test_adaptive()
+    test_twap()
+    test_pov()
+    test_threshold()
+    test_operaciones_con_algoritmo()
+    test_reserva_ajena_no_termina_la_operacion()
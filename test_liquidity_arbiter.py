@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para LiquidityArbiter: dos operaciones sobre el mismo instrumento no pueden
+reservar más que la liquidez publicada; liberación por pata y por operación; uso concurrente.
+"""
+
+import threading
+
+from liquidity_arbiter import LiquidityArbiter
+
+TX26 = "MERV - XMEV - TX26 - 24hs"
+TX28 = "MERV - XMEV - TX28 - 24hs"
+
+
+def test_reservas_no_superan_lo_publicado():
+    arb = LiquidityArbiter()
+    assert arb.reserve("op1", TX26, "sell", 60, 100) == 60
+    # La segunda operación solo ve lo que dejó libre la primera
+    assert arb.available("op2", TX26, "sell", 100) == 40
+    assert arb.reserve("op2", TX26, "sell", 60, 100) == 40
+    assert arb.reserve("op3", TX26, "sell", 10, 100) == 0
+    # Otro lado u otro instrumento no compiten
+    assert arb.reserve("op3", TX26, "buy", 10, 100) == 10
+    assert arb.reserve("op3", TX28, "sell", 10, 100) == 10
+    # "bid" y "sell" son el mismo lado consumido
+    assert arb.reserved(TX26, "bid") == 100
+    assert arb.snapshot()["denied"] == 1 and arb.snapshot()["trimmed"] == 1
+    print("✅ Reservas acotadas por la liquidez publicada")
+
+
+def test_liberacion():
+    arb = LiquidityArbiter()
+    arb.reserve("op1", TX26, "sell", 50, 100)
+    arb.reserve("op1", TX28, "buy", 50, 100)
+    arb.reserve("op2", TX26, "sell", 30, 100)
+    # Re-reservar reemplaza la reserva anterior del mismo dueño
+    assert arb.reserve("op1", TX26, "sell", 20, 100) == 20
+    assert arb.reserved(TX26, "sell") == 50
+    arb.release("op1", TX26, "sell")
+    assert arb.reserved(TX26, "sell") == 30 and arb.reserved(TX28, "buy") == 50
+    arb.release("op1")
+    arb.release("op2")
+    assert arb.snapshot()["reserved"] == {}
+    print("✅ Liberación por pata y por operación OK")
+
+
+def test_concurrencia():
+    arb = LiquidityArbiter()
+    concedido = []
+    lock = threading.Lock()
+
+    def worker(i):
+        q = arb.reserve(f"op{i}", TX26, "sell", 7, 100)
+        with lock:
+            concedido.append(q)
+
+    hilos = [threading.Thread(target=worker, args=(i,)) for i in range(50)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    assert sum(concedido) == 100 and arb.reserved(TX26, "sell") == 100
+    print(f"✅ 50 operaciones concurrentes: {sum(1 for q in concedido if q)} con reserva, total 100")
+
+
+if __name__ == "__main__":
+    test_reservas_no_superan_lo_publicado()
+    test_liberacion()
+    test_concurrencia()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para md_parser: equivalencia del parser nativo con los extractores
+genéricos (incluidos los niveles de profundidad) y detección de esquema.
+El micro-benchmark de ticks/segundo solo corre con MD_PARSER_BENCH=1 (o --bench): los
+tiempos dependen de la máquina y no se usan como aserción.
+Los mensajes se generan con el formato que entrega pyRofex (type "Md").
+"""
+
+import os
+import random
+import sys
+import time
+
+from md_parser import (
+    MDParser, parse_generic, parse_native, detect_schema, SCHEMA_NATIVE, SCHEMA_GENERIC,
+)
+
+SIMBOLOS = ["MERV - XMEV - TX26 - 24hs", "MERV - XMEV - TX28 - 24hs",
+            "MERV - XMEV - AL30 - 24hs", "MERV - XMEV - GD30 - 24hs"]
+
+
+def _mensaje_rofex(rnd, profundidad=5):
+    sym = rnd.choice(SIMBOLOS)
+    base = rnd.uniform(900, 1600)
+    md = {
+        "BI": [{"price": round(base - i * 0.5, 2), "size": rnd.randint(1, 5000)} for i in range(profundidad)],
+        "OF": [{"price": round(base + 0.5 + i * 0.5, 2), "size": rnd.randint(1, 5000)} for i in range(profundidad)],
+        "LA": {"price": round(base, 2), "size": rnd.randint(1, 500), "date": 1726750000000},
+        "CL": {"price": round(base * 0.99, 2), "size": 0, "date": 1726660000000},
+        "OP": round(base * 1.001, 2),
+    }
+    # Libros vacíos de vez en cuando
+    if rnd.random() < 0.05:
+        md["BI"] = []
+    if rnd.random() < 0.05:
+        md["OF"] = None
+    return {
+        "type": "Md",
+        "timestamp": 1726750000000 + rnd.randint(0, 10_000_000),
+        "instrumentId": {"marketId": "ROFX", "symbol": sym},
+        "marketData": md,
+    }
+
+
+def _grabados(n=20000, seed=7):
+    rnd = random.Random(seed)
+    return [_mensaje_rofex(rnd) for _ in range(n)]
+
+
+def test_equivalencia_con_extractores():
+    """El parser nativo devuelve exactamente lo mismo que los extractores genéricos."""
+    for msg in _grabados(5000):
+        assert parse_native(msg) == parse_generic(msg), msg
+    print("✅ parse_native == parse_generic en 5000 mensajes")
+
+
+def test_profundidad_en_el_mismo_recorrido():
+    """El registro trae las listas BI/OF completas (None si el lado viene vacío)."""
+    parser = MDParser()
+    for msg in _grabados(2000, seed=11):
+        rec = parser.parse(msg)
+        md = msg["marketData"]
+        assert rec.bids == (md["BI"] or None) and rec.offers == (md["OF"] or None)
+        if rec.bids:
+            assert rec.bids[0]["price"] == rec.bid and len(rec.bids) == 5
+    print("✅ Niveles de profundidad devueltos por el parser en el mismo recorrido")
+
+
+def test_deteccion_y_fallback():
+    nativo = _grabados(1)[0]
+    alternativo = {"symbol": "X", "ts": 1726750000, "bids": [{"p": 10, "s": 2}], "offers": [{"p": 11, "s": 3}],
+                   "last": {"p": 10.5, "s": 1}, "closingPrice": 9.9}
+    assert detect_schema(nativo) == SCHEMA_NATIVE
+    assert detect_schema(alternativo) == SCHEMA_GENERIC
+
+    p = MDParser()
+    rec = p.parse(alternativo)
+    assert p.schema == SCHEMA_GENERIC
+    assert (rec.symbol, rec.bid, rec.offer, rec.last, rec.cl, rec.ts_ms) == ("X", 10.0, 11.0, 10.5, 9.9, 1726750000000)
+
+    p = MDParser()
+    p.parse(nativo)
+    assert p.schema == SCHEMA_NATIVE
+    # La conexión cambia de formato: ese mensaje va por el genérico y se re-detecta
+    assert p.parse(alternativo) == parse_generic(alternativo)
+    assert p.fallbacks == 1
+    p.parse(alternativo)
+    assert p.schema == SCHEMA_GENERIC
+    print("✅ Detección de esquema y fallback OK")
+
+
+def bench(n=50000):
+    msgs = _grabados(n)
+
+    def viejo(m):
+        # Lo que hacía _handle_md: cinco extractores independientes
+        return parse_generic(m)
+
+    parser = MDParser()
+    resultados = {}
+    for nombre, fn in (("extractores", viejo), ("MDParser", parser.parse)):
+        t0 = time.perf_counter()
+        for m in msgs:
+            fn(m)
+        dt = time.perf_counter() - t0
+        resultados[nombre] = n / dt
+    return resultados
+
+
+def test_benchmark():
+    if not os.getenv("MD_PARSER_BENCH"):
+        print("⏭️  benchmark omitido (MD_PARSER_BENCH=1 para correrlo)")
+        return
+    msgs = _grabados(2000, seed=3)
+    parser = MDParser()
+    assert [parser.parse(m) for m in msgs] == [parse_generic(m) for m in msgs]
+    r = bench()
+    mejora = r["MDParser"] / r["extractores"]
+    print(f"✅ extractores: {r['extractores']:,.0f} ticks/s | MDParser: {r['MDParser']:,.0f} ticks/s ({mejora:.1f}x)")
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        os.environ["MD_PARSER_BENCH"] = "1"
+    test_equivalencia_con_extractores()
+    test_profundidad_en_el_mismo_recorrido()
+    test_deteccion_y_fallback()
+    test_benchmark()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para MDRecorder: grabación en segundo plano, rotación, índice por día
+y lectura de lo grabado (incluso con el último archivo truncado).
+"""
+
+import gzip
+import os
+import tempfile
+import time
+
+from md_recorder import MDRecorder, read_index, recorded_files, iter_records, KIND_MD, KIND_OR
+
+
+def _md(i):
+    return {"type": "Md", "timestamp": 1726750000000 + i,
+            "instrumentId": {"marketId": "ROFX", "symbol": "MERV - XMEV - TX26 - 24hs"},
+            "marketData": {"BI": [{"price": 1000.0 + i, "size": 10}], "OF": [{"price": 1001.0 + i, "size": 5}]}}
+
+
+def test_graba_y_relee_en_orden():
+    with tempfile.TemporaryDirectory() as d:
+        rec = MDRecorder(d, rotate_bytes=4_000, flush_interval=0.05)  # tamaño comprimido
+        rec.start()
+        t0 = time.perf_counter()
+        for i in range(2000):
+            rec.record(KIND_MD, _md(i))
+            if i % 500 == 0:
+                rec.record(KIND_OR, {"type": "or", "orderReport": {"clOrdId": f"c{i}", "status": "NEW"}})
+        encolar_us = (time.perf_counter() - t0) / 2004 * 1e6
+        rec.stop()
+        st = rec.stats()
+        assert st["written"] == 2004 and st["dropped"] == 0 and st["errors"] == 0
+
+        files = recorded_files(d)
+        assert len(files) > 1, files                      # rotó por tamaño
+        day_dir = os.path.dirname(files[0])
+        index = read_index(day_dir)
+        assert [e["file"] for e in index] == [os.path.basename(f) for f in files]
+        assert sum(e["records"] for e in index) == 2004
+        assert sum(e.get("or", 0) for e in index) == 4
+        # La rotación mira el tamaño en disco: sin comprimir cada archivo es mucho más grande
+        for e in index[:-1]:
+            assert 4_000 <= e["compressed_bytes"] < 4_000 * 4, e
+            assert e["bytes"] > 4 * 4_000, e
+
+        md = [m for _, _, m in iter_records(files, kinds=[KIND_MD])]
+        assert [m["timestamp"] for m in md] == [1726750000000 + i for i in range(2000)]
+        assert md[7] == _md(7)
+        orders = [m for _, k, m in iter_records(files) if k == KIND_OR]
+        assert [o["orderReport"]["clOrdId"] for o in orders] == ["c0", "c500", "c1000", "c1500"]
+        comprimido = sum(e["compressed_bytes"] for e in index)
+        print(f"✅ {len(files)} archivos, 2004 mensajes en orden, {encolar_us:.1f} µs por encolado, "
+              f"{sum(e['bytes'] for e in index) / comprimido:.0f}x de compresión")
+
+
+def test_cola_llena_descarta():
+    with tempfile.TemporaryDirectory() as d:
+        rec = MDRecorder(d, max_queue=10)  # sin start: nadie vacía la cola
+        ok = [rec.record(KIND_MD, _md(i)) for i in range(15)]
+        assert ok.count(True) == 10 and rec.stats()["dropped"] == 5
+        print("✅ Cola llena: descarta sin bloquear")
+
+
+def test_archivo_truncado():
+    with tempfile.TemporaryDirectory() as d:
+        rec = MDRecorder(d)
+        rec.start()
+        for i in range(300):
+            rec.record(KIND_MD, _md(i))
+        rec.stop()
+        path = recorded_files(d)[0]
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[: len(data) * 2 // 3])
+        leidos = list(iter_records([path]))
+        assert 0 < len(leidos) < 300
+        assert [m["timestamp"] for _, _, m in leidos] == [1726750000000 + i for i in range(len(leidos))]
+        print(f"✅ Archivo truncado: se leyeron {len(leidos)} mensajes completos")
+
+
+if __name__ == "__main__":
+    test_graba_y_relee_en_orden()
+    test_cola_llena_descarta()
+    test_archivo_truncado()
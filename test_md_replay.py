@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para MDReplay: replay determinístico a través de MarketDataManager,
+control de velocidad y métricas de throughput/latencia.
+No requiere pyRofex: los mensajes se graban con el formato nativo en un directorio temporal.
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import time
+
+import ws_rofex
+from quotes_cache import quotes_cache
+from md_replay import parse_speed, SPEED_MAX
+
+SIMBOLOS = ["MERV - XMEV - TX26 - 24hs", "MERV - XMEV - TX28 - 24hs"]
+
+
+def _grabar(directorio, n, paso_ms):
+    """Archivo con el formato de md_recorder: {"t", "k", "m"} por línea."""
+    path = os.path.join(directorio, "md-20250919-110000-0000.ndjson.gz")
+    t0 = 1726750000000
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for i in range(n):
+            sym = SIMBOLOS[i % 2]
+            m = {"type": "Md", "timestamp": t0 + i * paso_ms,
+                 "instrumentId": {"marketId": "ROFX", "symbol": sym},
+                 "marketData": {"BI": [{"price": 1000.0 + i, "size": 10}, {"price": 999.0 + i, "size": 20}],
+                                "OF": [{"price": 1001.0 + i, "size": 5}],
+                                "LA": {"price": 1000.5 + i, "size": 1}}}
+            f.write(json.dumps({"t": t0 + i * paso_ms, "k": "md", "m": m}) + "\n")
+        f.write(json.dumps({"t": t0 + n * paso_ms, "k": "or",
+                            "m": {"type": "or", "orderReport": {"clOrdId": "r1", "status": "FILLED"}}}) + "\n")
+    return path
+
+
+def _replay(path, speed, instrumentos=()):
+    manager = ws_rofex.MarketDataManager()
+    ticks = []
+    listener = lambda t: ticks.append((t["symbol"], t["bid"], t["offer"]))
+    ws_rofex.add_tick_listener(listener)
+    try:
+        res = manager.start_replay(path=path, speed=speed, instrumentos=instrumentos)
+        assert res["status"] == "started", res
+        assert manager.wait_replay(30)
+        return manager, manager.stop()["replay"], ticks
+    finally:
+        ws_rofex.remove_tick_listener(listener)
+
+
+def test_parse_speed():
+    assert parse_speed("max") == SPEED_MAX and parse_speed(0) == SPEED_MAX
+    assert parse_speed("10x") == 10.0 and parse_speed("realtime") == 1.0 and parse_speed(2.5) == 2.5
+    print("✅ parse_speed OK")
+
+
+def test_replay_deterministico():
+    with tempfile.TemporaryDirectory() as d:
+        _grabar(d, 2000, 1)
+        manager, st1, ticks1 = _replay(d, "max")
+        _, st2, ticks2 = _replay(d, "max")
+    assert ticks1 == ticks2 and len(ticks1) == 2000
+    assert st1["messages"] == {"md": 2000, "or": 1, "skipped": 0}
+    assert quotes_cache.get(SIMBOLOS[1])["bid"] == 1000.0 + 1999
+    assert quotes_cache.depth(SIMBOLOS[1]).volume_up_to("sell", 999.0 + 1999) == 30
+    assert manager.order_report("r1")["status"] == "FILLED"
+    for etapa in ("decode", "handle_md", "parse_store"):
+        assert st1["stages"][etapa]["count"] >= 2000, (etapa, st1["stages"][etapa])
+    hm = st1["stages"]["handle_md"]
+    print(f"✅ Replay determinístico: {st1['throughput_msgs_s']:,.0f} msg/s, "
+          f"handle_md p50={hm['p50_us']} µs p99={hm['p99_us']} µs")
+
+
+def test_velocidad_y_filtro():
+    with tempfile.TemporaryDirectory() as d:
+        _grabar(d, 100, 10)                      # ~1 s de mercado
+        t0 = time.perf_counter()
+        _, st, ticks = _replay(d, 10, instrumentos=[SIMBOLOS[0]])
+        dt = time.perf_counter() - t0
+    assert 0.08 <= dt < 0.6, dt                  # 10x: ~0.1 s
+    assert {s for s, _, _ in ticks} == {SIMBOLOS[0]} and len(ticks) == 50
+    assert st["messages"]["skipped"] == 50
+    print(f"✅ Velocidad 10x: 1 s grabado en {dt:.2f} s, filtro por instrumento OK")
+
+
+def test_replay_sin_grabaciones():
+    with tempfile.TemporaryDirectory() as d:
+        res = ws_rofex.MarketDataManager().start_replay(path=d)
+    assert res["status"] == "error"
+    print("✅ Directorio sin grabaciones: error claro")
+
+
+def test_reinicio_no_bloquea_el_manager():
+    """start_replay detiene el replay anterior (join) sin tener tomado el lock del manager."""
+    import threading
+    with tempfile.TemporaryDirectory() as d:
+        _grabar(d, 100, 1000)                    # 100 s de mercado en tiempo real
+        manager = ws_rofex.MarketDataManager()
+        assert manager.start_replay(path=d, speed=1)["status"] == "started"
+        anterior = manager._replay
+        stop_original = anterior.stop
+
+        def stop_lento(timeout=5.0):
+            time.sleep(0.3)                      # replay que tarda en terminar
+            stop_original(timeout)
+
+        anterior.stop = stop_lento
+        resultado = {}
+        h = threading.Thread(target=lambda: resultado.update(manager.start_replay(path=d, speed="max")))
+        h.start()
+        time.sleep(0.05)
+        t0 = time.perf_counter()
+        manager.status()                         # toma el lock del manager
+        espera = time.perf_counter() - t0
+        h.join(5)
+        assert resultado["status"] == "started", resultado
+        assert manager.wait_replay(30) and manager._replay is not anterior
+        manager.stop()
+    assert espera < 0.1, espera
+    print(f"✅ Reinicio de replay: status() respondió en {espera * 1000:.1f} ms mientras se detenía el anterior")
+
+
+def test_sesion_real_corta_el_replay_sin_bloquear():
+    """start() desengancha el replay en curso y lo detiene fuera del lock del manager."""
+    import threading
+    from broker_simulator import BrokerSimulator
+    with tempfile.TemporaryDirectory() as d:
+        _grabar(d, 100, 1000)
+        manager = ws_rofex.MarketDataManager()
+        assert manager.start_replay(path=d, speed=1)["status"] == "started"
+        anterior = manager._replay
+        stop_original = anterior.stop
+
+        def stop_lento(timeout=5.0):
+            time.sleep(0.3)
+            stop_original(timeout)
+
+        anterior.stop = stop_lento
+        sim = BrokerSimulator(latency_ms=1, mm_interval=0)
+        resultado = {}
+        h = threading.Thread(target=lambda: resultado.update(
+            manager.start(user="sim", password="-", account="SIM", instrumentos=SIMBOLOS, pyrofex=sim)))
+        h.start()
+        time.sleep(0.05)
+        t0 = time.perf_counter()
+        manager.status()
+        espera = time.perf_counter() - t0
+        h.join(5)
+        assert resultado.get("status") != "error", resultado
+        assert manager._replay is None and not anterior.is_running()
+        manager.stop()
+    assert espera < 0.1, espera
+    print(f"✅ Sesión real: el replay se detuvo fuera del lock (status() en {espera * 1000:.1f} ms)")
+
+
+if __name__ == "__main__":
+    test_parse_speed()
+    test_replay_deterministico()
+    test_velocidad_y_filtro()
+    test_replay_sin_grabaciones()
+    test_reinicio_no_bloquea_el_manager()
+    test_sesion_real_corta_el_replay_sin_bloquear()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para el seguimiento de órdenes por order reports en RealRatioOperationManager:
+una orden ejecutada vuelve con su propio reporte (sin sleep fijo) y el monitoreo de órdenes
+pendientes despierta con el reporte de la operación, no con el fallback de 10 s.
+Requiere las dependencias del servicio (ratios_worker importa supabase_client).
+"""
+
+import asyncio
+import time
+
+import ws_rofex
+from ratio_operations_real import (
+    RealRatioOperationManager, RatioOperationRequest, OperationStatus, OrderExecution,
+)
+from test_ratio_legs import TX26, TX28, _sesion
+
+
+def test_orden_ejecutada_sin_sleep():
+    _sesion([(1000.0, 1000)], [(901.0, 1000)])
+    rrm = RealRatioOperationManager()
+
+    async def run():
+        t0 = time.perf_counter()
+        order = await rrm._execute_real_order("mon1", TX28, "buy", 10, 901.0)
+        return order, time.perf_counter() - t0
+
+    try:
+        order, dt = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    assert order is not None and order.status == "filled", order
+    # Antes: sleep fijo de 2 s antes de mirar el estado
+    assert dt < 0.5, dt
+    print(f"✅ Orden ejecutada confirmada por su order report en {dt * 1000:.0f} ms")
+
+
+def test_monitoreo_despierta_con_order_report():
+    _sesion([(1000.0, 1000)], [(901.0, 1000)])
+    rrm = RealRatioOperationManager()
+    request = RatioOperationRequest(
+        operation_id="mon2", pair=[TX26, TX28], instrument_to_sell=TX26, client_id="test",
+        nominales=10, target_ratio=1.0, condition=">=",
+    )
+
+    async def run():
+        progress = rrm._new_progress(request)
+        progress.original_request = request
+        rrm.active_operations["mon2"] = progress
+        rrm._ensure_order_listener()
+        # Compra que queda en el libro (mejor bid, sin contraparte): pendiente
+        cid = "mon2_buy_1"
+        rrm._order_owner[cid] = "mon2"
+        assert ws_rofex.manager.send_order(symbol=TX28, side="BUY", size=10, price=900.0,
+                                           client_order_id=cid)["status"] == "ok"
+        assert (await ws_rofex.manager.wait_order_report(cid, timeout=2, statuses=("NEW",)))["status"] == "NEW"
+        progress.sell_orders.append(OrderExecution(TX26, 10, 1000.0, "mon2_sell_0", side="sell", status="filled"))
+        progress.buy_orders.append(OrderExecution(TX28, 10, 900.0, cid, side="buy", status="pending"))
+
+        await rrm._start_pending_orders_monitoring("mon2", progress)
+        task = rrm.monitoring_tasks["mon2"]
+        await asyncio.sleep(0.1)
+        assert progress.status != OperationStatus.COMPLETED
+
+        # Otro participante vende contra nuestra compra: llega el FILLED
+        t0 = time.perf_counter()
+        ws_rofex.manager.send_order(symbol=TX28, side="SELL", size=10, price=900.0, client_order_id="otro_1")
+        await asyncio.wait_for(task, 3.0)
+        return progress, time.perf_counter() - t0
+
+    try:
+        progress, dt = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    assert progress.status == OperationStatus.COMPLETED, progress.status
+    assert progress.completed_nominales == 10
+    # El fallback es de 10 s: el monitoreo reaccionó al order report
+    assert dt < 1.0, dt
+    assert "mon2" not in rrm.pending_orders_monitor and not rrm._order_owner
+    print(f"✅ Monitoreo despertado por el order report en {dt * 1000:.0f} ms")
+
+
+def test_un_solo_monitoreo_del_scheduler():
+    _sesion([(1000.0, 1000)], [(901.0, 1000)])
+    rrm = RealRatioOperationManager()
+    request = RatioOperationRequest(
+        operation_id="mon3", pair=[TX26, TX28], instrument_to_sell=TX26, client_id="test",
+        nominales=10, target_ratio=1.0, condition=">=",
+    )
+    creadas = []
+    create_task = asyncio.create_task
+
+    async def batch(req):
+        # Lote con la compra pendiente; el monitoreo se pide dos veces, como al finalizar
+        progress = rrm.active_operations["mon3"]
+        progress.original_request = req
+        rrm._ensure_order_listener()
+        cid = "mon3_buy_1"
+        rrm._order_owner[cid] = "mon3"
+        ws_rofex.manager.send_order(symbol=TX28, side="BUY", size=10, price=900.0, client_order_id=cid)
+        await ws_rofex.manager.wait_order_report(cid, timeout=2, statuses=("NEW",))
+        progress.sell_orders.append(OrderExecution(TX26, 10, 1000.0, "mon3_sell_0", side="sell", status="filled"))
+        progress.buy_orders.append(OrderExecution(TX28, 10, 900.0, cid, side="buy", status="pending"))
+        await rrm._start_pending_orders_monitoring("mon3", progress)
+        await rrm._start_pending_orders_monitoring("mon3", progress)
+        return progress
+
+    async def run():
+        def contar(coro, **kw):
+            task = create_task(coro, **kw)
+            if coro.__qualname__.endswith("_monitor_pending_orders_loop"):
+                creadas.append(task)
+            return task
+
+        rrm.execute_ratio_operation_batch = batch
+        asyncio.create_task = contar
+        try:
+            task = rrm.submit_operation(request)
+            await asyncio.sleep(0.2)
+        finally:
+            asyncio.create_task = create_task
+        # La operación sigue ocupando su lugar mientras monitorea
+        assert not task.done() and rrm.get_scheduler_status()["running"] == ["mon3"]
+        ws_rofex.manager.send_order(symbol=TX28, side="SELL", size=10, price=900.0, client_order_id="otro_3")
+        return await asyncio.wait_for(task, 3.0)
+
+    try:
+        progress = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    assert len(creadas) == 1, creadas
+    assert progress.status == OperationStatus.COMPLETED, progress.status
+    assert not rrm.monitoring_tasks and not rrm.operation_tasks
+    print("✅ Un solo loop de monitoreo por operación, a cargo del scheduler")
+
+
+if __name__ == "__main__":
+    test_orden_ejecutada_sin_sleep()
+    test_monitoreo_despierta_con_order_report()
+    test_un_solo_monitoreo_del_scheduler()
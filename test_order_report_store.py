@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para OrderReportStore: índice por client order id, alias y espera sin polling.
+No requiere pyRofex: los reportes se inyectan a mano desde otro hilo.
+"""
+
+import asyncio
+import threading
+import time
+
+from order_report_store import OrderReportStore
+
+
+def _or(cl_ord_id, status, **extra):
+    rep = {"wsClOrdId": cl_ord_id, "status": status}
+    rep.update(extra)
+    return {"type": "or", "orderReport": rep}
+
+
+def test_indice_por_orden_y_alias():
+    """Cada orden tiene su historial; el clOrdId del broker apunta a la misma orden."""
+    st = OrderReportStore()
+    st.add(_or("A", "PENDING_NEW"))
+    st.add(_or("B", "NEW"))
+    st.add(_or("A", "NEW", clOrdId="BRK-1"))
+    st.add({"type": "or", "orderReport": {"clOrdId": "BRK-1", "status": "FILLED"}})
+
+    assert st.get("A")["status"] == "FILLED"
+    assert st.get("BRK-1")["status"] == "FILLED"
+    assert st.get("B")["status"] == "NEW"
+    assert [r["status"] for r in st.history("A")] == ["PENDING_NEW", "NEW", "FILLED"]
+    assert st.get("Z") is None
+    print("✅ Índice por orden y alias OK")
+
+
+def test_fusion_de_entradas():
+    """Un reporte que une dos entradas (wsClOrdId y clOrdId vistos por separado) las fusiona."""
+    st = OrderReportStore()
+    st.add(_or("A", "PENDING_NEW"))
+    st.add({"type": "or", "orderReport": {"clOrdId": "BRK-9", "status": "NEW"}})
+    assert st.stats()["orders"] == 2
+    st.add(_or("A", "PARTIALLY_FILLED", clOrdId="BRK-9"))
+    assert st.stats()["orders"] == 1
+    assert [r["status"] for r in st.history("A")] == ["PENDING_NEW", "NEW", "PARTIALLY_FILLED"]
+    assert st.history("BRK-9") == st.history("A")
+    # Los reportes siguientes por cualquiera de los dos ids van a la misma entrada
+    st.add({"type": "or", "orderReport": {"clOrdId": "BRK-9", "status": "FILLED"}})
+    assert st.get("A")["status"] == "FILLED"
+    print("✅ Entradas de la misma orden fusionadas")
+
+
+def test_lru_acotado():
+    st = OrderReportStore(max_orders=3)
+    for i in range(5):
+        st.add(_or(f"O{i}", "NEW"))
+    assert st.get("O0") is None and st.get("O1") is None
+    assert st.get("O4")["status"] == "NEW"
+    assert st.stats()["orders"] == 3
+    print("✅ LRU acotado OK")
+
+
+def test_espera_sin_polling():
+    """wait_for vuelve apenas llega el reporte de ESA orden, no por reportes de otras."""
+    st = OrderReportStore()
+
+    async def run():
+        def emitir():
+            time.sleep(0.05)
+            st.add(_or("OTRA", "FILLED"))
+            time.sleep(0.05)
+            st.add(_or("MIA", "NEW"))
+
+        threading.Thread(target=emitir, daemon=True).start()
+        t0 = time.perf_counter()
+        rep = await st.wait_for("MIA", timeout=2.0)
+        return rep, time.perf_counter() - t0
+
+    rep, elapsed = asyncio.run(run())
+    assert rep["status"] == "NEW"
+    assert elapsed < 0.5, elapsed
+    assert st.stats()["waiters"] == 0
+    print(f"✅ Reporte recibido en {elapsed*1000:.0f} ms")
+
+
+def test_espera_por_estado_y_timeout():
+    st = OrderReportStore()
+    st.add(_or("X", "NEW"))
+
+    async def run():
+        # Ya existe un reporte: vuelve sin esperar
+        inmediato = await st.wait_for("X", timeout=0.01)
+        # Filtra por estado: NEW no alcanza, vence el timeout
+        vencido = await st.wait_for("X", timeout=0.05, statuses={"FILLED"})
+        return inmediato, vencido
+
+    inmediato, vencido = asyncio.run(run())
+    assert inmediato["status"] == "NEW"
+    assert vencido is None
+    assert st.stats()["waiters"] == 0
+    print("✅ Filtro por estado y timeout OK")
+
+
+if __name__ == "__main__":
+    test_indice_por_orden_y_alias()
+    test_fusion_de_entradas()
+    test_lru_acotado()
+    test_espera_sin_polling()
+    test_espera_por_estado_y_timeout()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para QuoteStore: registros inmutables, seq por símbolo, changed_since,
+lecturas consistentes con escrituras concurrentes y frescura.
+"""
+
+import json
+import threading
+import time
+
+import quotes_cache as qc_mod
+from quotes_cache import QuoteStore, Quote
+
+
+def test_uso_tipo_dict():
+    """Los scripts existentes usan el cache como dict: tiene que seguir funcionando."""
+    qc = QuoteStore()
+    qc["X"] = {"bid": 100.0, "offer": 100.5, "last": 100.2, "timestamp": 1234, "volumen": 7}
+    q = qc["X"]
+    assert isinstance(q, Quote)
+    assert q["bid"] == 100.0 and q.get("offer") == 100.5 and q.get("cl") is None
+    assert q["timestamp"] == 1234 and q["volumen"] == 7
+    assert "X" in qc and "Y" not in qc and len(qc) == 1 and list(qc.keys()) == ["X"]
+    assert qc.get("Y") is None
+    json.dumps(dict(q))  # serializable
+    try:
+        q.bid = 1.0
+        raise AssertionError("Quote debería ser inmutable")
+    except AttributeError:
+        pass
+    print("✅ Uso tipo dict OK")
+
+
+def test_seq_y_changed_since():
+    qc = QuoteStore()
+    qc.set("X", bid=1.0)
+    qc.set("Y", bid=2.0)
+    _, v = qc.changed_since(0)
+    qc.set("X", bid=1.1)
+    qc.set("X", bid=1.2)
+    assert qc["X"].seq == 3 and qc["Y"].seq == 1
+    cambios, v2 = qc.changed_since(v)
+    assert [c.symbol for c in cambios] == ["X"] and cambios[0].bid == 1.2
+    assert qc.changed_since(v2) == ([], v2)
+    print("✅ seq por símbolo y changed_since OK")
+
+
+def test_lecturas_consistentes_concurrentes():
+    """Un lector nunca ve un registro mezclado (bid y offer de escrituras distintas)."""
+    qc = QuoteStore()
+    qc.set("X", bid=0.0, offer=0.0)
+    stop = threading.Event()
+
+    def escritor():
+        i = 0
+        while not stop.is_set():
+            i += 1
+            qc.set("X", bid=float(i), offer=float(i))
+
+    t = threading.Thread(target=escritor)
+    t.start()
+    inconsistentes = 0
+    for _ in range(200000):
+        q = qc.get("X")
+        if q["bid"] != q["offer"]:
+            inconsistentes += 1
+    stop.set()
+    t.join()
+    assert inconsistentes == 0
+    print(f"✅ 200000 lecturas sin lock, 0 inconsistentes (seq final {qc['X'].seq})")
+
+
+def test_benchmark_snapshot():
+    """snapshot() sin copiar registros vs la copia profunda anterior."""
+    qc = QuoteStore()
+    viejo = {}
+    for i in range(50):
+        d = {"bid": 1.0, "bid_size": 1, "offer": 1.1, "offer_size": 1, "last": 1.05,
+             "last_size": 1, "cl": 1.0, "op": 1.0, "timestamp": 1}
+        qc[f"S{i}"] = d
+        viejo[f"S{i}"] = d
+    n = 20000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        {k: dict(v) for k, v in viejo.items()}
+    t_viejo = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    for _ in range(n):
+        qc.snapshot()
+    t_nuevo = time.perf_counter() - t0
+    assert t_nuevo < t_viejo
+    print(f"✅ snapshot 50 símbolos: {t_viejo / n * 1e6:.1f} µs (copia) -> {t_nuevo / n * 1e6:.2f} µs")
+
+
+def test_frescura():
+    """max_age_ms en lecturas y barrido que marca/desmarca símbolos viejos."""
+    qc = QuoteStore()
+    qc.set("VIVO", bid=1.0)
+    viejo = qc.set("MUERTO", bid=2.0)
+    object.__setattr__(viejo, "received_ms", viejo.received_ms - 3_600_000)  # hace 1 hora
+
+    assert qc.get("MUERTO") is viejo                      # sin límite: se lee igual
+    assert qc.get("MUERTO", max_age_ms=60_000) is None
+    assert qc.get("VIVO", max_age_ms=60_000)["bid"] == 1.0
+    assert qc.sweep(60_000) == ["MUERTO"]
+    assert qc.sweep(60_000) == []                         # ya marcado
+    assert list(qc.stale()) == ["MUERTO"] and qc.stale()["MUERTO"]["age_ms"] >= 3_600_000
+    qc.set("MUERTO", bid=2.1)
+    assert qc.stale() == {}
+    print("✅ Frescura: max_age_ms, barrido y desmarcado OK")
+
+
+def test_accesos_publicos_devuelven_copias():
+    """get_quote/get_snapshot devuelven dicts que se pueden modificar sin tocar el cache."""
+    qc_mod.quotes_cache.clear()
+    qc_mod.set_quote("COPIA", {"bid": 10.0, "offer": 11.0})
+    q = qc_mod.get_quote("COPIA")
+    assert type(q) is dict and q["bid"] == 10.0 and q["seq"] == 1
+    q["bid"] = 0.0
+    q["extra"] = 1
+    snap = qc_mod.get_snapshot()
+    assert type(snap["COPIA"]) is dict
+    snap["COPIA"]["offer"] = 0.0
+    assert qc_mod.quotes_cache["COPIA"]["bid"] == 10.0 and qc_mod.quotes_cache["COPIA"]["offer"] == 11.0
+    assert qc_mod.get_quote("NADA") is None
+    # Los registros inmutables se exponen por separado
+    rec = qc_mod.get_quote_record("COPIA")
+    assert isinstance(rec, Quote) and rec is qc_mod.get_snapshot_records()["COPIA"]
+    qc_mod.quotes_cache.clear()
+    print("✅ get_quote/get_snapshot devuelven copias; Quote vía get_quote_record/get_snapshot_records")
+
+
+if __name__ == "__main__":
+    test_uso_tipo_dict()
+    test_seq_y_changed_since()
+    test_lecturas_consistentes_concurrentes()
+    test_benchmark_snapshot()
+    test_frescura()
+    test_accesos_publicos_devuelven_copias()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para los modos de patas de RealRatioOperationManager (parallel / on_fill),
+la política de cobertura y MarketDataManager.cancel_order, contra el simulador de broker.
+Requiere las dependencias del servicio (ratios_worker importa supabase_client).
+"""
+
+import asyncio
+import threading
+import time
+
+import ws_rofex
+from broker_simulator import BrokerSimulator
+from ratio_operations_real import RealRatioOperationManager, RatioOperationRequest, OperationStatus
+
+TX26 = "MERV - XMEV - TX26 - 24hs"
+TX28 = "MERV - XMEV - TX28 - 24hs"
+
+
+def _sesion(tx26_bids, tx28_offers, tx26_offers=((1001.0, 10_000),), tx28_bids=((899.0, 10_000),), latency_ms=2):
+    ws_rofex.quotes_cache.clear()  # sin libros de la sesión anterior
+    sim = BrokerSimulator(latency_ms=latency_ms, mm_interval=0)
+    sim.seed_book(TX26, bids=tx26_bids, offers=list(tx26_offers))
+    sim.seed_book(TX28, bids=list(tx28_bids), offers=tx28_offers)
+    res = ws_rofex.manager.start(user="sim", password="-", account="SIM", instrumentos=[TX26, TX28], pyrofex=sim)
+    assert res["status"] == "started", res
+    t0 = time.time()
+    while ws_rofex.quotes_cache.get(TX26) is None or ws_rofex.quotes_cache.get(TX28) is None:
+        assert time.time() - t0 < 2, "sin cotizaciones"
+        time.sleep(0.005)
+    return sim
+
+
+def _request(op_id, nominales, leg_mode, hedge_policy=""):
+    return RatioOperationRequest(
+        operation_id=op_id, pair=[TX26, TX28], instrument_to_sell=TX26, client_id="test",
+        nominales=nominales, target_ratio=1.0, condition=">=", leg_mode=leg_mode, hedge_policy=hedge_policy,
+    )
+
+
+def _correr(leg_mode, nominales=2000):
+    """Mejor nivel de 500 nominales por lado, repuesto cada 20 ms: la operación necesita varios lotes."""
+    tx26_bids, tx28_offers = [(1000.0, 500), (999.0, 10_000)], [(901.0, 500), (902.0, 10_000)]
+    sim = _sesion(tx26_bids, tx28_offers)
+    stop = threading.Event()
+
+    def reponer():
+        while not stop.wait(0.02):
+            sim.seed_book(TX26, bids=tx26_bids, offers=[(1001.0, 10_000)])
+            sim.seed_book(TX28, bids=[(899.0, 10_000)], offers=tx28_offers)
+
+    threading.Thread(target=reponer, daemon=True).start()
+    rrm = RealRatioOperationManager()
+
+    async def run():
+        t0 = time.perf_counter()
+        progress = await rrm.submit_operation(_request(f"{leg_mode}1", nominales, leg_mode))
+        return progress, time.perf_counter() - t0
+
+    try:
+        progress, dt = asyncio.run(run())
+    finally:
+        stop.set()
+        ws_rofex.manager.stop()
+    return sim, progress, dt
+
+
+def test_patas_en_paralelo():
+    sim, progress, dt = _correr("parallel")
+    assert progress.completed_nominales == 2000, progress.completed_nominales
+    assert progress.status == OperationStatus.COMPLETED, progress.status
+    assert sum(o.quantity for o in progress.sell_orders) == sum(o.quantity for o in progress.buy_orders) == 2000
+    # Sin esperas fijas: cada lote cuesta el ida y vuelta al broker y la próxima cotización
+    assert progress.batch_count >= 5 and dt < 2.0, (progress.batch_count, dt)
+    print(f"✅ parallel: 2000 nominales en {progress.batch_count} lotes, {dt:.2f}s ({sim.status()['fills']} fills)")
+
+
+def test_compra_con_el_fill():
+    sim, progress, dt = _correr("on_fill")
+    assert progress.completed_nominales == 2000, progress.completed_nominales
+    assert progress.status == OperationStatus.COMPLETED, progress.status
+    assert progress.batch_count >= 5 and dt < 2.0, (progress.batch_count, dt)
+    print(f"✅ on_fill: 2000 nominales en {progress.batch_count} lotes, {dt:.2f}s")
+
+
+def test_cobertura():
+    # TX28 a 901 solo 10 nominales; el resto a 903 (dentro de RATIO_HEDGE_MAX_BPS)
+    _sesion([(1000.0, 10_000)], [(901.0, 10), (903.0, 10_000)])
+    rrm = RealRatioOperationManager()
+
+    async def run():
+        chase = rrm._new_progress(_request("chase1", 100, "parallel", "chase"))
+        rrm.active_operations["chase1"] = chase
+        s_chase = await rrm._hedge_legs("chase1", chase, "chase", 1.0, 30, 10, TX26, TX28, 1000.0, 901.0)
+        unwind = rrm._new_progress(_request("unwind1", 100, "parallel", "unwind"))
+        rrm.active_operations["unwind1"] = unwind
+        s_unwind = await rrm._hedge_legs("unwind1", unwind, "unwind", 1.0, 30, 10, TX26, TX28, 1000.0, 901.0)
+        return chase, s_chase, unwind, s_unwind
+
+    try:
+        chase, s_chase, unwind, s_unwind = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    # chase: se compran los 20 faltantes de TX28; unwind: se recompran 20 TX26
+    assert s_chase == (30, 30), s_chase
+    assert [(o.instrument, o.side, o.quantity) for o in chase.buy_orders] == [(TX28, "buy", 20)]
+    assert s_unwind == (10, 10), s_unwind
+    assert [(o.instrument, o.side, o.quantity) for o in unwind.hedge_orders] == [(TX26, "buy", 20)]
+    print("✅ Cobertura chase / unwind OK")
+
+
+def test_unwind_con_spread_ancho():
+    # Spreads de ~200 bps en ambos instrumentos, más anchos que RATIO_HEDGE_MAX_BPS
+    _sesion([(1000.0, 10_000)], [(901.0, 10_000)], tx26_offers=[(1020.0, 10_000)], tx28_bids=[(883.0, 10_000)])
+    rrm = RealRatioOperationManager()
+
+    async def run():
+        venta = rrm._new_progress(_request("unwind_v", 100, "parallel", "unwind"))
+        rrm.active_operations["unwind_v"] = venta
+        s_venta = await rrm._hedge_legs("unwind_v", venta, "unwind", 1.0, 30, 10, TX26, TX28, 1000.0, 901.0)
+        compra = rrm._new_progress(_request("unwind_c", 100, "parallel", "unwind"))
+        rrm.active_operations["unwind_c"] = compra
+        s_compra = await rrm._hedge_legs("unwind_c", compra, "unwind", 1.0, 10, 30, TX26, TX28, 1000.0, 901.0)
+        return venta, s_venta, compra, s_compra
+
+    try:
+        venta, s_venta, compra, s_compra = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    # La recompra de TX26 cruza contra el offer y la venta de TX28 contra el bid
+    assert s_venta == (10, 10), s_venta
+    assert [(o.instrument, o.side, o.quantity, o.price) for o in venta.hedge_orders] == [(TX26, "buy", 20, 1020.0)]
+    assert s_compra == (10, 10), s_compra
+    assert [(o.instrument, o.side, o.quantity, o.price) for o in compra.hedge_orders] == [(TX28, "sell", 20, 883.0)]
+    print("✅ Unwind con spread ancho OK")
+
+
+def test_cancel_order():
+    _sesion([(1000.0, 100)], [(901.0, 100)])
+
+    async def run():
+        m = ws_rofex.manager
+        assert m.send_order(symbol=TX26, side="BUY", size=5, price=950.0, client_order_id="c1")["status"] == "ok"
+        assert (await m.wait_order_report("c1", timeout=2, statuses=("NEW",)))["status"] == "NEW"
+        assert m.cancel_order("c1")["status"] == "ok"
+        return await m.wait_order_report("c1", timeout=2, statuses=("CANCELLED",))
+
+    try:
+        rep = asyncio.run(run())
+    finally:
+        ws_rofex.manager.stop()
+    assert rep and rep["status"] == "CANCELLED", rep
+    assert ws_rofex.manager.cancel_order("c1")["message"] == "ws_not_connected"
+    print("✅ cancel_order OK")
+
+
+def test_lote_recorre_dos_niveles():
+    """Con deslizamiento, el lote se dimensiona con la profundidad y las órdenes la toman."""
+    import ratio_operations_real as ror
+    bps_original, ror.ORDERS_DEPTH_SLIPPAGE_BPS = ror.ORDERS_DEPTH_SLIPPAGE_BPS, 50.0
+    try:
+        for leg_mode in ("sequential", "parallel", "on_fill"):
+            sim = _sesion([(1000.0, 300), (999.0, 10_000)], [(901.0, 300), (902.0, 10_000)])
+            rrm = RealRatioOperationManager()
+
+            async def run():
+                return await rrm.submit_operation(_request(f"prof_{leg_mode}", 1000, leg_mode))
+
+            try:
+                progress = asyncio.run(run())
+            finally:
+                ws_rofex.manager.stop()
+            # Un solo lote de 1000 (más que los 300 del primer nivel) ejecutado en dos niveles
+            assert progress.completed_nominales == 1000, (leg_mode, progress.completed_nominales, progress.messages[-5:])
+            assert [o.quantity for o in progress.sell_orders] == [1000], (leg_mode, progress.sell_orders)
+            assert [o.quantity for o in progress.buy_orders] == [1000], (leg_mode, progress.buy_orders)
+            venta, compra = sim.order(progress.sell_orders[0].order_id), sim.order(progress.buy_orders[0].order_id)
+            assert venta.cum_qty == 1000 and 999.0 < venta.avg_px < 1000.0, (leg_mode, venta.cum_qty, venta.avg_px)
+            assert compra.cum_qty == 1000 and 901.0 < compra.avg_px < 902.0, (leg_mode, compra.cum_qty, compra.avg_px)
+    finally:
+        ror.ORDERS_DEPTH_SLIPPAGE_BPS = bps_original
+    print("✅ Lote de 1000 con 300 en el primer nivel: cada pata se ejecuta en dos niveles")
+
+
+if __name__ == "__main__":
+    test_cancel_order()
+    test_cobertura()
+    test_unwind_con_spread_ancho()
+    test_patas_en_paralelo()
+    test_compra_con_el_fill()
+    test_lote_recorre_dos_niveles()
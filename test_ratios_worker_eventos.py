@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para el modo por eventos de ratios_worker: recálculo solo de los pares
+afectados, sin tocar las ventanas, lectura consistente bajo el lock del par y stop() que
+espera a los hilos. Requiere las dependencias del servicio (importa supabase_client).
+"""
+
+import threading
+import time
+
+import ratios_worker as rw
+from quotes_cache import quotes_cache
+
+A, B, C = "EVT - A", "EVT - B", "EVT - C"
+KEY_AB = (A, B, "u1", "default")
+KEY_BC = (B, C, "u1", "default")
+
+
+def _cotizar(symbol, bid, offer):
+    quotes_cache.set(symbol, {"bid": bid, "offer": offer, "last": (bid + offer) / 2,
+                              "bid_size": 10, "offer_size": 10})
+
+
+def _preparar():
+    rw._stop_event.clear()
+    rw._rolling.clear()
+    rw._live_ratios.clear()
+    with rw._pairs_lock:
+        rw._pairs_by_symbol.clear()
+        rw._pairs_by_symbol.update({A: [KEY_AB], B: [KEY_AB, KEY_BC], C: [KEY_BC]})
+    _cotizar(A, 99.0, 101.0)
+    _cotizar(B, 49.0, 51.0)
+    _cotizar(C, 24.0, 26.0)
+    for key in (KEY_AB, KEY_BC):
+        buf = rw._new_buffers()
+        rw._rolling[key] = buf
+        rw._compute_pair(key, rw.obtener_datos_mercado(key[0]), rw.obtener_datos_mercado(key[1]), buf, append=True)
+
+
+def test_recalculo_por_evento():
+    _preparar()
+    evaluados = []
+    evaluate_original = rw._evaluate_and_alert
+    rw._evaluate_and_alert = lambda **kw: evaluados.append((kw["base_symbol"], kw["quote_symbol"])) or 0
+    filas = []
+    listo = threading.Event()
+
+    def listener(row):
+        filas.append(row)
+        listo.set()
+
+    rw.add_ratio_listener(listener)
+    try:
+        rw._event_thread = threading.Thread(target=rw._event_loop, daemon=True)
+        rw._event_thread.start()
+        _cotizar(A, 109.0, 111.0)
+        rw.mark_dirty(A)
+        assert listo.wait(2.0), "sin recálculo por evento"
+        time.sleep(0.05)
+        # Solo el par que contiene A; las ventanas siguen con la muestra de la barra
+        assert evaluados == [(A, B)], evaluados
+        assert abs(filas[-1]["mid_ratio"] - 110.0 / 50.0) < 1e-12
+        assert len(rw._rolling[KEY_AB]["mid"]) == 1
+        assert any(abs(r["mid_ratio"] - 2.2) < 1e-12 for r in rw.get_live_ratios())
+    finally:
+        rw.remove_ratio_listener(listener)
+        rw.stop()
+        rw._evaluate_and_alert = evaluate_original
+    # stop() espera al hilo de eventos
+    assert not rw._event_thread.is_alive()
+    print("✅ Evento: se recalcula solo el par afectado, sin agregar a las ventanas; stop() espera al hilo")
+
+
+def test_lectura_bajo_lock_del_par():
+    _preparar()
+    buf = rw._rolling[KEY_AB]
+    terminado = threading.Event()
+
+    def leer():
+        rw._compute_pair(KEY_AB, rw.obtener_datos_mercado(A), rw.obtener_datos_mercado(B), buf, append=False)
+        terminado.set()
+
+    # Mientras el hilo de barras tiene el lock (append/_resync) la lectura espera
+    with rw._pair_lock(KEY_AB):
+        threading.Thread(target=leer, daemon=True).start()
+        assert not terminado.wait(0.1)
+    assert terminado.wait(1.0)
+    print("✅ Lectura por evento espera al append del par")
+
+
+def test_indicadores_consistentes_con_concurrencia():
+    _preparar()
+    buf = rw._rolling[KEY_AB]
+    stop = threading.Event()
+    malos = []
+
+    def barras():
+        i = 0
+        while not stop.is_set():
+            # Ratio mid alterna entre 1.0 y 3.0 (resync cada 180 appends)
+            _cotizar(A, 49.0 if i % 2 else 149.0, 51.0 if i % 2 else 151.0)
+            rw._compute_pair(KEY_AB, rw.obtener_datos_mercado(A), rw.obtener_datos_mercado(B), buf, append=True)
+            i += 1
+
+    def eventos():
+        while not stop.is_set():
+            r = rw._compute_pair(KEY_AB, rw.obtener_datos_mercado(A), rw.obtener_datos_mercado(B), buf, append=False)
+            sma, std = r["row"]["sma180_mid"], r["row"]["std180_mid"]
+            if sma is not None and not (1.0 - 1e-9 <= sma <= 3.0 + 1e-9):
+                malos.append(("sma", sma))
+            if std is not None and std > 1.0 + 1e-9:
+                malos.append(("std", std))
+
+    hilos = [threading.Thread(target=barras), threading.Thread(target=eventos)]
+    for h in hilos:
+        h.start()
+    time.sleep(0.5)
+    stop.set()
+    for h in hilos:
+        h.join()
+    assert not malos, malos[:5]
+    print("✅ SMA/σ leídos por evento siempre consistentes con las barras concurrentes")
+
+
+if __name__ == "__main__":
+    test_recalculo_por_evento()
+    test_lectura_bajo_lock_del_par()
+    test_indicadores_consistentes_con_concurrencia()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Script de prueba: RollingWindow (O(1)) contra el cálculo original de ratios_worker
+(_sma_last/_std_last re-sumando la ventana completa en cada ciclo).
+La comparación de tiempos solo se verifica con ROLLING_STATS_BENCH=1 (o --bench): depende
+de la carga de la máquina; por defecto solo se imprime.
+"""
+
+import math
+import os
+import random
+import sys
+import time
+from collections import deque
+
+from rolling_stats import RollingWindow
+
+SMA_WINDOW = 180
+STD_SHORT_WINDOW = 60
+
+
+# Implementación original, como referencia
+def _sma_last(values: deque, window: int):
+    if not values:
+        return None
+    n = min(len(values), window)
+    if n <= 0:
+        return None
+    sub = list(values)[-n:]
+    return sum(sub) / n
+
+def _std_last(values: deque, window: int):
+    if not values:
+        return None
+    sub = list(values)[-min(len(values), window):]
+    n = len(sub)
+    if n < 2:
+        return None
+    m = sum(sub) / n
+    var = sum((x - m)**2 for x in sub) / n
+    return math.sqrt(var)
+
+
+def _close(a, b, rel=1e-9, abs_tol=1e-12):
+    if a is None or b is None:
+        return a is b
+    return math.isclose(a, b, rel_tol=rel, abs_tol=abs_tol)
+
+
+def test_equivalencia_con_implementacion_original():
+    """SMA180, σ60 y σ180 coinciden con el cálculo original en cada paso."""
+    rnd = random.Random(42)
+    ref = deque(maxlen=SMA_WINDOW)
+    rw = RollingWindow(SMA_WINDOW, (STD_SHORT_WINDOW,))
+    x = 0.97
+    for i in range(2000):
+        x += rnd.gauss(0, 1e-4)  # ratios ~1 con σ chica: caso de cancelación numérica
+        ref.append(x)
+        rw.append(x)
+        assert _close(rw.mean(SMA_WINDOW), _sma_last(ref, SMA_WINDOW)), i
+        assert _close(rw.mean(STD_SHORT_WINDOW), _sma_last(ref, STD_SHORT_WINDOW)), i
+        assert _close(rw.std(SMA_WINDOW), _std_last(ref, SMA_WINDOW), rel=1e-6), i
+        assert _close(rw.std(STD_SHORT_WINDOW), _std_last(ref, STD_SHORT_WINDOW), rel=1e-6), i
+    print("✅ RollingWindow coincide con _sma_last/_std_last en 2000 pasos")
+
+
+def test_bordes():
+    """Sin datos → None; un dato → media sin σ; serie constante → σ=0."""
+    rw = RollingWindow(SMA_WINDOW, (STD_SHORT_WINDOW,))
+    assert rw.mean() is None and rw.std() is None
+    rw.append(1.5)
+    assert rw.mean() == 1.5 and rw.std() is None
+    for _ in range(300):
+        rw.append(1.5)
+    assert rw.std(STD_SHORT_WINDOW) == 0.0 and rw.std() == 0.0
+    print("✅ Casos borde OK")
+
+
+def test_costo_constante_por_actualizacion():
+    """Benchmark simple: costo por ciclo vs recalcular la ventana completa."""
+    rnd = random.Random(1)
+    vals = [1 + rnd.random() * 1e-3 for _ in range(5000)]
+
+    ref = deque(maxlen=SMA_WINDOW)
+    t0 = time.perf_counter()
+    for v in vals:
+        ref.append(v)
+        _sma_last(ref, SMA_WINDOW); _std_last(ref, STD_SHORT_WINDOW); _std_last(ref, SMA_WINDOW)
+    t_ref = time.perf_counter() - t0
+
+    rw = RollingWindow(SMA_WINDOW, (STD_SHORT_WINDOW,))
+    t0 = time.perf_counter()
+    for v in vals:
+        rw.append(v)
+        rw.mean(); rw.std(STD_SHORT_WINDOW); rw.std()
+    t_new = time.perf_counter() - t0
+
+    print(f"📊 original: {t_ref*1e6/len(vals):.1f} µs/ciclo | rolling: {t_new*1e6/len(vals):.1f} µs/ciclo")
+    if os.getenv("ROLLING_STATS_BENCH"):
+        assert t_new < t_ref
+
+
+if __name__ == "__main__":
+    if "--bench" in sys.argv:
+        os.environ["ROLLING_STATS_BENCH"] = "1"
+    test_equivalencia_con_implementacion_original()
+    test_bordes()
+    test_costo_constante_por_actualizacion()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para strategy_engine: cache de reglas (TTL, invalidación, cargas fuera
+del lock), whitelist de expresiones y alertas por flanco (histéresis, cooldown).
+Requiere las dependencias del servicio (importa supabase_client); las reglas salen de
+un loader en memoria.
+"""
+
+import threading
+import time
+
+import strategy_engine as se
+
+
+def _regla(rule_id, base="A", quote="B", expr="ratios.get('mid', 0) > 1"):
+    return {"id": rule_id, "base_symbol": base, "quote_symbol": quote, "rule_type": "expr",
+            "params": {"expr": expr}}
+
+
+class _Loader:
+    def __init__(self, reglas_por_user):
+        self.reglas = reglas_por_user
+        self.llamadas = []
+        self.bloquear = {}  # user_id -> Event que la carga espera
+
+    def __call__(self, user_id, client_id=None, active=True):
+        self.llamadas.append((user_id, client_id))
+        ev = self.bloquear.get(user_id)
+        if ev is not None:
+            ev.wait(2.0)
+        return list(self.reglas.get(user_id, []))
+
+
+def test_cache_ttl_e_invalidacion():
+    loader = _Loader({"u1": [_regla(1), _regla(2, "C", "D")]})
+    cache = se.RuleCache(loader=loader, ttl=0.1)
+    assert [r["id"] for r in cache.get("u1", "c", "A", "B")] == [1]
+    assert [r["id"] for r in cache.get("u1", "c", "C", "D")] == [2]
+    assert cache.get("u1", "c", "X", "Y") == []
+    assert len(loader.llamadas) == 1 and cache.hits == 2
+    # Vence el TTL: una recarga
+    time.sleep(0.12)
+    cache.get("u1", "c", "A", "B")
+    assert len(loader.llamadas) == 2
+    # create_rule/delete_rule invalidan: la próxima consulta ve la regla nueva
+    loader.reglas["u1"].append(_regla(3))
+    cache.invalidate()
+    assert [r["id"] for r in cache.get("u1", "c", "A", "B")] == [1, 3]
+    assert len(loader.llamadas) == 3
+    print("✅ RuleCache: una carga por scope, TTL e invalidación OK")
+
+
+def test_carga_lenta_no_bloquea_otros_scopes():
+    loader = _Loader({"lento": [_regla(10)], "rapido": [_regla(20)]})
+    liberar = threading.Event()
+    loader.bloquear["lento"] = liberar
+    cache = se.RuleCache(loader=loader, ttl=60)
+    resultados = {}
+
+    def consultar(user, nombre):
+        resultados[nombre] = [r["id"] for r in cache.get(user, "c", "A", "B")]
+
+    h1 = threading.Thread(target=consultar, args=("lento", "lento1"))
+    h1.start()
+    time.sleep(0.05)
+    # Otro scope responde mientras la carga lenta sigue en curso
+    t0 = time.perf_counter()
+    consultar("rapido", "rapido")
+    assert resultados["rapido"] == [20] and time.perf_counter() - t0 < 0.5
+    # Una segunda consulta del scope lento espera la misma carga (no hace otra)
+    h2 = threading.Thread(target=consultar, args=("lento", "lento2"))
+    h2.start()
+    time.sleep(0.05)
+    assert "lento2" not in resultados
+    liberar.set()
+    h1.join(2.0)
+    h2.join(2.0)
+    assert resultados["lento1"] == resultados["lento2"] == [10]
+    assert loader.llamadas.count(("lento", "c")) == 1
+    print("✅ RuleCache: carga lenta fuera del lock, sin bloquear otros scopes ni duplicar requests")
+
+
+def test_invalidacion_durante_la_carga():
+    loader = _Loader({"u1": [_regla(1)]})
+    liberar = threading.Event()
+    loader.bloquear["u1"] = liberar
+    cache = se.RuleCache(loader=loader, ttl=60)
+    h = threading.Thread(target=cache.get, args=("u1", "c", "A", "B"))
+    h.start()
+    time.sleep(0.05)
+    # La regla cambia mientras la carga (con datos viejos) sigue en curso
+    cache.invalidate()
+    liberar.set()
+    h.join(2.0)
+    del loader.bloquear["u1"]
+    loader.reglas["u1"].append(_regla(2))
+    assert [r["id"] for r in cache.get("u1", "c", "A", "B")] == [1, 2]
+    assert len(loader.llamadas) == 2
+    print("✅ RuleCache: invalidar durante una carga fuerza la recarga")
+
+
+def test_whitelist_de_expresiones():
+    ctx = {"base": {"bid": 10.0, "offer": 12.0}, "quote": {"bid": 5.0, "offer": 6.0}, "ratios": {"mid": 2.0}}
+    validas = [
+        "ratios.get('mid', 0) > 1.5",
+        "div(mid(base), mid(quote)) >= 2 and abs(ratios['mid'] - 2) < 0.1",
+        "max(base.get('bid'), 0) in (10.0, 11.0) if base.get('bid') is not None else False",
+        "(ratios['mid'] - 1) ** 2 == 1 and base['bid'] ** -1 == 0.1",
+    ]
+    for expr in validas:
+        assert se._eval_code(se.compile_rule_expr(expr), **ctx) is True, expr
+    rechazadas = [
+        "().__class__",                                   # escape por atributos dunder
+        "().__class__.__bases__[0].__subclasses__()",
+        "ratios.mid > 1",                                 # atributos sobre el contexto
+        "ratios.keys()",
+        "ratios.get",                                     # método sin llamar
+        "ratios.get.__self__",
+        "base.__class__",
+        "[x for x in ratios]",                            # comprensiones
+        "sum(x for x in (1, 2))",
+        "{k: 1 for k in base}",
+        "__import__('os')",                               # llamadas fuera de la whitelist
+        "eval('1')",
+        "open('/etc/passwd')",
+        "base['x']()",
+        "(lambda: 1)()",
+        "mid.__call__(base)",
+        "x = 1",
+        "9 ** 9 ** 9",                                    # potencias que cuelgan el hilo
+        "(9 ** 4) ** 4",
+        "2 ** 100",
+        "base['bid'] ** ratios['mid']",
+        "",
+    ]
+    for expr in rechazadas:
+        try:
+            se.compile_rule_expr(expr)
+        except ValueError:
+            continue
+        raise AssertionError(f"expresión aceptada: {expr!r}")
+    print(f"✅ Whitelist: {len(validas)} válidas, {len(rechazadas)} rechazadas")
+
+
+def test_reglas_invalidas_se_podan():
+    loader = _Loader({"u9": [_regla(90), _regla(91, expr="().__class__")]})
+    cache = se.RuleCache(loader=loader, ttl=60)
+    assert [r["id"] for r in cache.get("u9", "c", "A", "B")] == [90]
+    assert 91 in {r["rule_id"] for r in se.invalid_rules()}
+    # La regla inválida se borra: desaparece del reporte en la próxima carga
+    loader.reglas["u9"] = [_regla(90)]
+    cache.invalidate()
+    cache.get("u9", "c", "A", "B")
+    assert 91 not in {r["rule_id"] for r in se.invalid_rules()}
+    print("✅ Reglas inválidas borradas se quitan del reporte al recargar")
+
+
+def test_estado_de_reglas_borradas_se_poda():
+    se._rule_states.pop(95, None)
+    se._rule_states.pop(96, None)
+    loader = _Loader({"u8": [_regla(95), _regla(96)]})
+    cache_original = se._rule_cache
+    se._rule_cache = se.RuleCache(loader=loader, ttl=60)
+    try:
+        se.evaluateAndAlert(user_id="u8", client_id="c", base_symbol="A", quote_symbol="B",
+                            snapshot={"ratios": {"mid": 0.5}})
+        assert {95, 96} <= {st["rule_id"] for st in se.rule_states()}
+        loader.reglas["u8"] = [_regla(95)]
+        se._rule_cache.invalidate()
+        se._rule_cache.get("u8", "c", "A", "B")
+    finally:
+        se._rule_cache = cache_original
+    ids = {st["rule_id"] for st in se.rule_states()}
+    assert 95 in ids and 96 not in ids, ids
+    print("✅ El estado de flancos de una regla borrada se descarta al recargar")
+
+
+def _estado(rule_id, **params):
+    se._rule_states.pop(rule_id, None)
+    return {"id": rule_id, "params": params}
+
+
+def test_flanco_cooldown_e_histeresis_por_evaluaciones():
+    r = _estado(100, cooldown_s=10, hysteresis=2)
+    f = lambda ok, t: se._update_rule_state(r, ok, "A/B", now=t)
+    assert f(True, 0) is True          # flanco falso→verdadero
+    assert f(True, 1) is False         # sigue verdadera: no repite
+    assert f(False, 2) is False        # 1 falsa: todavía no re-arma (hysteresis=2)
+    assert f(True, 3) is False         # rebote en el umbral: suprimida
+    assert f(False, 4) is False and f(False, 5) is False   # 2 falsas seguidas: re-armada
+    assert f(True, 6) is False         # armada pero dentro del cooldown
+    assert f(False, 7) is False and f(False, 8) is False
+    assert f(True, 11) is True         # armada y fuera del cooldown
+    st = next(s for s in se.rule_states() if s["rule_id"] == 100)
+    assert st["fired"] == 2 and st["suppressed"] == 2, st
+    print("✅ Alertas: flanco, histéresis por evaluaciones y cooldown OK")
+
+
+def test_histeresis_en_segundos():
+    r = _estado(101, cooldown_s=0, hysteresis=1, hysteresis_s=5)
+    f = lambda ok, t: se._update_rule_state(r, ok, "A/B", now=t)
+    assert f(True, 0) is True
+    # Muchas evaluaciones falsas en poco tiempo (modo eventos) no re-arman
+    for t in (1.0, 1.1, 1.2, 1.3, 1.4):
+        assert f(False, t) is False
+    assert f(True, 2) is False
+    # Falsa durante 5 s seguidos: re-armada, sin importar cuántas evaluaciones hubo
+    assert f(False, 3) is False and f(False, 8) is False
+    assert f(True, 8.5) is True
+    print("✅ Alertas: histéresis en segundos independiente de la tasa de evaluación")
+
+
+def test_evaluate_and_alert_notifica_solo_en_el_flanco():
+    se._rule_states.pop(200, None)
+    loader = _Loader({"u2": [{"id": 200, "base_symbol": "A", "quote_symbol": "B",
+                              "params": {"expr": "ratios.get('mid', 0) > 1", "cooldown_s": 0}}]})
+    mensajes = []
+    cache_original, notify_original = se._rule_cache, se._notify
+    se._rule_cache, se._notify = se.RuleCache(loader=loader, ttl=60), mensajes.append
+    try:
+        snap = lambda mid: {"base": {}, "quote": {}, "ratios": {"mid": mid}}
+        llamar = lambda mid: se.evaluateAndAlert(user_id="u2", client_id="c", base_symbol="A",
+                                                 quote_symbol="B", snapshot=snap(mid))
+        assert [llamar(m) for m in (1.2, 1.3, 1.4, 0.9, 1.1)] == [1, 1, 1, 0, 1]
+    finally:
+        se._rule_cache, se._notify = cache_original, notify_original
+    assert len(mensajes) == 2 and "Regla #200" in mensajes[0], mensajes
+    print("✅ evaluateAndAlert: matchea en cada evaluación, notifica solo en los flancos")
+
+
+def test_expresiones_anonimas_en_cache_acotado():
+    ctx = {"base": {}, "quote": {}, "ratios": {"mid": 2.0}}
+    for i in range(se.COMPILED_ANON_MAX + 50):
+        assert se._eval_expr(f"ratios.get('mid', 0) > {i}", **ctx) is (i < 2)
+    assert not any(k[0] is None for k in se._compiled)
+    assert se._compile_anonymous.cache_info().currsize <= se.COMPILED_ANON_MAX
+    print("✅ Expresiones anónimas: cache LRU acotado, sin crecer el cache por regla")
+
+
+if __name__ == "__main__":
+    test_cache_ttl_e_invalidacion()
+    test_carga_lenta_no_bloquea_otros_scopes()
+    test_invalidacion_durante_la_carga()
+    test_whitelist_de_expresiones()
+    test_reglas_invalidas_se_podan()
+    test_estado_de_reglas_borradas_se_poda()
+    test_flanco_cooldown_e_histeresis_por_evaluaciones()
+    test_histeresis_en_segundos()
+    test_evaluate_and_alert_notifica_solo_en_el_flanco()
+    test_expresiones_anonimas_en_cache_acotado()
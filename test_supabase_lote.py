@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para supabase_client.guardar_lote / WriteBuffer: se omiten None/inf/NaN
+(aplican los defaults de la DB) y se envía un insert por conjunto de columnas.
+Requiere las dependencias del servicio; la DB se reemplaza por un cliente en memoria.
+"""
+
+import supabase_client
+
+
+class _Resp:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Tabla:
+    def __init__(self, db, nombre):
+        self.db, self.nombre, self.rows = db, nombre, None
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        if self.db.fallar:
+            raise RuntimeError("db caída")
+        self.db.inserts.append((self.nombre, self.rows))
+        return _Resp([dict(r, id=i) for i, r in enumerate(self.rows)])
+
+
+class _DB:
+    def __init__(self):
+        self.inserts = []
+        self.fallar = False
+
+    def table(self, nombre):
+        return _Tabla(self, nombre)
+
+
+def _con_db():
+    db = _DB()
+    supabase_client.supabase = db
+    return db
+
+
+def test_sin_nulls_explicitos():
+    db = _con_db()
+    rows = [
+        {"symbol": "A", "bid": 1.0, "offer": 2.0},
+        {"symbol": "B", "bid": None, "offer": 3.0},          # bid queda al default de la DB
+        {"symbol": "C", "bid": float("inf"), "offer": 4.0},  # inf tampoco se envía
+        {"symbol": "D", "bid": 5.0, "offer": 6.0},
+        {"symbol": None},                                     # fila vacía: se descarta
+    ]
+    assert supabase_client.guardar_lote("ticks", rows) is not None
+    # Un insert por conjunto de claves, sin ninguna clave en null
+    assert len(db.inserts) == 2, db.inserts
+    enviadas = [r for _, lote in db.inserts for r in lote]
+    assert all(v is not None for r in enviadas for v in r.values())
+    assert sorted(r["symbol"] for r in enviadas) == ["A", "B", "C", "D"]
+    assert {frozenset(r) for _, lote in db.inserts for r in lote} == {
+        frozenset({"symbol", "bid", "offer"}), frozenset({"symbol", "offer"})}
+    print("✅ guardar_lote: sin nulls explícitos, un insert por conjunto de columnas")
+
+
+def test_un_solo_insert_si_las_claves_coinciden():
+    db = _con_db()
+    assert supabase_client.guardar_lote("ticks", [{"symbol": str(i), "bid": i} for i in range(50)]) is not None
+    assert len(db.inserts) == 1 and len(db.inserts[0][1]) == 50
+    print("✅ guardar_lote: 50 filas homogéneas en una request")
+
+
+def test_write_buffer_y_fallos():
+    db = _con_db()
+    buf = supabase_client.WriteBuffer()
+    buf.add("ratios", {"a": 1})
+    buf.add("ratios", {"a": 2, "b": None})
+    buf.add("otra", {"x": 1})
+    assert buf.pending() == 3
+    assert buf.flush() == {"ratios": 2, "otra": 1} and buf.pending() == 0
+    assert [t for t, _ in db.inserts] == ["ratios", "otra"]
+    db.fallar = True
+    buf.add("ratios", {"a": 3})
+    assert buf.flush() == {"ratios": 0}
+    assert supabase_client.get_lote_stats()["ratios"]["failed_batches"] >= 1
+    print("✅ WriteBuffer: un insert por tabla, fallos contabilizados")
+
+
+if __name__ == "__main__":
+    test_sin_nulls_explicitos()
+    test_un_solo_insert_si_las_claves_coinciden()
+    test_write_buffer_y_fallos()
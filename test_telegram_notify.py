@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para la cola de notificaciones de telegram_control: notify() no bloquea,
+los mensajes de una ventana se juntan en uno (≤ 4096 chars), un 429 espera retry_after,
+los errores permanentes (400/403) no se reintentan y shutdown() vacía la cola con un límite.
+No requiere Telegram: usa un bot en memoria.
+"""
+
+import threading
+import time
+
+import telegram_control as tc
+
+
+class _RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too Many Requests: retry after {retry_after}")
+        self.error_code = 429
+        self.result_json = {"parameters": {"retry_after": retry_after}}
+
+
+class _ApiError(Exception):
+    def __init__(self, code):
+        super().__init__(f"Error code: {code}")
+        self.error_code = code
+
+
+class _Bot:
+    def __init__(self, errores=(), demora=0.0):
+        self.enviados = []
+        self.intentos = 0
+        self.errores = list(errores)
+        self.demora = demora
+        self.recibido = threading.Event()
+
+    def send_message(self, chat_id, text):
+        self.intentos += 1
+        time.sleep(self.demora)
+        if self.errores:
+            raise self.errores.pop(0)
+        self.enviados.append(text)
+        self.recibido.set()
+
+
+def _configurar(bot):
+    tc._bot = bot
+    tc.ADMIN_CHAT_ID = "1"
+    tc.NOTIFY_COALESCE_SECONDS = 0.1
+    tc.NOTIFY_MIN_INTERVAL = 0.0
+    for k in ("sent_messages", "sent_alerts", "coalesced", "retries", "rate_limited", "failed", "unsent_on_shutdown"):
+        tc._notify_stats[k] = 0
+
+
+def _esperar(cond, timeout=3.0):
+    t0 = time.monotonic()
+    while not cond():
+        assert time.monotonic() - t0 < timeout, "timeout esperando al sender"
+        time.sleep(0.01)
+
+
+def test_coalescencia_sin_bloquear():
+    bot = _Bot(demora=0.2)  # Telegram lento
+    _configurar(bot)
+    t0 = time.perf_counter()
+    for i in range(5):
+        tc.notify(f"alerta {i}")
+    assert time.perf_counter() - t0 < 0.05, "notify() bloqueó"
+    _esperar(lambda: tc.notify_stats()["sent_alerts"] >= 5)
+    # Las 5 alertas de la ventana salen en un solo mensaje, en orden
+    assert bot.enviados == ["\n\n".join(f"alerta {i}" for i in range(5))], bot.enviados
+    st = tc.notify_stats()
+    assert st["sent_messages"] == 1 and st["coalesced"] == 4, st
+    print("✅ notify: no bloquea y junta 5 alertas en 1 mensaje")
+
+
+def test_limite_de_4096_chars():
+    bot = _Bot()
+    _configurar(bot)
+    for _ in range(3):
+        tc.notify("x" * 3000)
+    _esperar(lambda: len(bot.enviados) >= 3)
+    assert all(len(t) <= tc.TELEGRAM_MAX_CHARS for t in bot.enviados)
+    assert sum(t.count("x") for t in bot.enviados) == 9000
+    print("✅ notify: mensajes que no entran en 4096 chars salen en el siguiente envío")
+
+
+def test_429_espera_retry_after():
+    bot = _Bot(errores=[_RateLimited(0.2)])
+    _configurar(bot)
+    t0 = time.monotonic()
+    tc.notify("con rate limit")
+    assert bot.recibido.wait(3.0)
+    dt = time.monotonic() - t0
+    assert bot.enviados == ["con rate limit"] and bot.intentos == 2
+    assert dt >= 0.2 + tc.NOTIFY_COALESCE_SECONDS - 0.02, dt
+    st = tc.notify_stats()
+    assert st["rate_limited"] == 1 and st["retries"] == 1 and st["failed"] == 0, st
+    print(f"✅ notify: 429 reintenta tras retry_after ({dt:.2f}s)")
+
+
+def test_reintentos_agotados():
+    tc.NOTIFY_MAX_RETRIES, max_original = 1, tc.NOTIFY_MAX_RETRIES
+    try:
+        bot = _Bot(errores=[_RateLimited(0.01), _RateLimited(0.01)])
+        _configurar(bot)
+        tc.notify("se pierde")
+        _esperar(lambda: tc.notify_stats()["failed"] >= 1)
+        assert bot.enviados == [] and bot.intentos == 2
+    finally:
+        tc.NOTIFY_MAX_RETRIES = max_original
+    print("✅ notify: tras NOTIFY_MAX_RETRIES el mensaje se cuenta como fallido")
+
+
+def test_errores_permanentes_no_se_reintentan():
+    bot = _Bot(errores=[_ApiError(403)])
+    _configurar(bot)
+    tc.notify("chat bloqueado")
+    _esperar(lambda: tc.notify_stats()["failed"] >= 1)
+    assert bot.intentos == 1 and tc.notify_stats()["retries"] == 0
+    # Un 5xx sí se reintenta (backoff de 1 s)
+    bot = _Bot(errores=[_ApiError(502)])
+    _configurar(bot)
+    tc.notify("servidor caído")
+    assert bot.recibido.wait(3.0)
+    assert bot.intentos == 2 and tc.notify_stats()["retries"] == 1
+    print("✅ notify: 403 se descarta sin reintentar; 502 se reintenta")
+
+
+def test_shutdown_vacia_la_cola():
+    bot = _Bot()
+    _configurar(bot)
+    tc.NOTIFY_COALESCE_SECONDS = 10.0  # el sender queda esperando la ventana
+    for i in range(3):
+        tc.notify(f"pendiente {i}")
+    time.sleep(0.05)
+    t0 = time.monotonic()
+    tc.shutdown()
+    dt = time.monotonic() - t0
+    assert bot.enviados == ["\n\n".join(f"pendiente {i}" for i in range(3))], bot.enviados
+    assert dt < 1.0, dt
+    assert not tc.notify_stats()["sender_alive"]
+
+    # Con límite: lo que no llega a salir se cuenta y se descarta
+    bot = _Bot(demora=0.3)
+    _configurar(bot)
+    for _ in range(3):
+        tc.notify("x" * 3000)  # no entran juntos: tres envíos de 0.3 s
+    time.sleep(0.05)
+    tc._flush_notifications(0.1)
+    st = tc.notify_stats()
+    assert len(bot.enviados) == 1 and st["unsent_on_shutdown"] == 2 and st["queue_depth"] == 0, st
+    print(f"✅ shutdown: cola vaciada en {dt * 1000:.0f} ms; con límite se descarta el resto")
+
+
+if __name__ == "__main__":
+    test_coalescencia_sin_bloquear()
+    test_limite_de_4096_chars()
+    test_429_espera_retry_after()
+    test_reintentos_agotados()
+    test_errores_permanentes_no_se_reintentan()
+    test_shutdown_vacia_la_cola()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para el TickWriter: lotes por tamaño/tiempo, descarte y flush al detener.
+No requiere DB: usa una función de inserción en memoria.
+"""
+
+import threading
+import time
+
+from tick_writer import TickWriter, DROP_OLDEST, DROP_NEWEST
+
+
+def test_lote_por_tamano_y_flush_final():
+    """Los ticks se agrupan en lotes y stop() vacía lo pendiente."""
+    lotes = []
+
+    def insert(rows):
+        lotes.append(list(rows))
+        return rows
+
+    w = TickWriter(insert, batch_size=10, flush_interval=0.05)
+    w.start()
+    for i in range(25):
+        assert w.submit({"symbol": "X", "ts_ms": i})
+    w.stop()
+
+    total = sum(len(l) for l in lotes)
+    assert total == 25, total
+    assert all(len(l) <= 10 for l in lotes)
+    st = w.stats()
+    assert st["written"] == 25 and st["dropped"] == 0
+    print(f"✅ {len(lotes)} lotes, {total} ticks escritos")
+
+
+def test_ingesta_independiente_de_latencia_db():
+    """Una DB lenta no frena a quien encola."""
+    bloqueo = threading.Event()
+
+    def insert_lenta(rows):
+        bloqueo.wait(1.0)
+        return rows
+
+    w = TickWriter(insert_lenta, max_queue=1000, batch_size=100, flush_interval=0.01)
+    w.start()
+    t0 = time.perf_counter()
+    for i in range(500):
+        w.submit({"symbol": "X", "ts_ms": i})
+    elapsed = time.perf_counter() - t0
+    bloqueo.set()
+    w.stop()
+    assert elapsed < 0.5, elapsed
+    print(f"✅ 500 ticks encolados en {elapsed*1000:.1f} ms con DB bloqueada")
+
+
+def test_politicas_de_descarte():
+    """Cola llena: drop_oldest conserva lo nuevo, drop_newest lo descarta."""
+    w = TickWriter(lambda rows: rows, max_queue=3, drop_policy=DROP_OLDEST)
+    for i in range(5):
+        assert w.submit({"ts_ms": i})
+    assert w.stats()["dropped"] == 2
+    assert [w._queue.get_nowait()["ts_ms"] for _ in range(3)] == [2, 3, 4]
+
+    w = TickWriter(lambda rows: rows, max_queue=3, drop_policy=DROP_NEWEST)
+    res = [w.submit({"ts_ms": i}) for i in range(5)]
+    assert res == [True, True, True, False, False]
+    assert w.stats()["dropped"] == 2
+    print("✅ Políticas de descarte OK")
+
+
+def test_desactiva_tras_fallos():
+    """Tras N lotes fallidos seguidos deja de escribir."""
+    w = TickWriter(lambda rows: None, batch_size=1, flush_interval=0.01, max_consecutive_failures=2)
+    w.start()
+    for i in range(3):
+        w.submit({"ts_ms": i})
+        time.sleep(0.05)
+    w.stop()
+    st = w.stats()
+    assert st["disabled"] is True
+    assert st["failed_batches"] == 2
+    assert not w.submit({"ts_ms": 99})
+    print("✅ Desactivación por fallos OK")
+
+
+if __name__ == "__main__":
+    test_lote_por_tamano_y_flush_final()
+    test_ingesta_independiente_de_latencia_db()
+    test_politicas_de_descarte()
+    test_desactiva_tras_fallos()
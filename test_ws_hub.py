@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Script de prueba para WSHub: suscripciones por símbolo/canal y filtrado del fan-out.
+No requiere FastAPI: las conexiones son objetos cualquiera.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from ws_hub import WSHub, DROP_OLDEST, CONFLATE, DISCONNECT, tick_delta
+
+
+class FakeWS:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+class SlowWS:
+    """Socket asíncrono que tarda `delay` por envío (o queda bloqueado hasta `gate`)."""
+
+    def __init__(self, delay=0.0, gate=None):
+        self.delay = delay
+        self.gate = gate
+        self.sent = []
+        self.closed = None
+
+    async def send_text(self, text):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(text))
+
+    async def close(self, code=1000, reason=""):
+        self.closed = (code, reason)
+
+
+def _tick(sym):
+    return {"type": "tick", "symbol": sym, "bid": 1.0}
+
+
+def test_legacy_recibe_todo():
+    """Sin subscribe la conexión recibe ticks y order reports (compatibilidad), no ratios."""
+    hub = WSHub()
+    a = FakeWS("a")
+    assert hub.add(a)
+    assert hub.targets(_tick("X")) == [a]
+    assert hub.targets({"type": "order_report", "report": {}}) == [a]
+    assert hub.targets({"type": "connection"}) == [a]
+    ratio = {"type": "ratio", "base_symbol": "X", "quote_symbol": "W"}
+    assert hub.targets(ratio, owner=("u1", "c1")) == []
+    print("✅ Conexión sin subscribe recibe ticks y order reports, pero no ratios")
+
+
+def test_filtrado_por_simbolo_y_canal():
+    hub = WSHub()
+    a, b, c = FakeWS("a"), FakeWS("b"), FakeWS("c")
+    for ws in (a, b, c):
+        hub.add(ws)
+    hub.subscribe(a, ["X"], ["ticks"])
+    hub.subscribe(b, ["Y"])                     # canales por defecto (sin ratios)
+    hub.subscribe(c, channels=["order_reports"])  # sin símbolos = "*"
+
+    assert hub.targets(_tick("X")) == [a]
+    assert hub.targets(_tick("Y")) == [b]
+    assert hub.targets(_tick("Z")) == []
+    assert set(hub.targets({"type": "order_report", "report": {}})) == {b, c}
+    ratio = {"type": "ratio", "base_symbol": "Y", "quote_symbol": "W"}
+    assert hub.targets(ratio, owner=("u1", "c1")) == []
+    hub.subscribe(b, ["Y"], ["ratios"], user_id="u1")
+    assert hub.targets(ratio, owner=("u1", "c1")) == [b]
+
+    hub.unsubscribe(b, ["Y"])
+    assert hub.targets(_tick("Y")) == []
+    hub.remove(a)
+    assert hub.targets(_tick("X")) == []
+    assert hub.stats()["symbols_indexed"] == 0
+    print("✅ Filtrado por símbolo y canal OK")
+
+
+def test_limite_y_canal_invalido():
+    hub = WSHub(max_connections=1)
+    a = FakeWS("a")
+    assert hub.add(a) and not hub.add(FakeWS("b"))
+    try:
+        hub.subscribe(a, ["X"], ["nope"])
+        raise AssertionError("debió fallar")
+    except ValueError:
+        pass
+    print("✅ Límite de conexiones y validación de canales OK")
+
+
+def test_ratios_acotados_por_usuario():
+    """Los ratios solo llegan a quien se suscribió con el user_id (y client_id) del dueño."""
+    hub = WSHub()
+    u1, u1c1, u2, legacy = FakeWS("u1"), FakeWS("u1c1"), FakeWS("u2"), FakeWS("legacy")
+    for ws in (u1, u1c1, u2, legacy):
+        hub.add(ws)
+    hub.subscribe(u1, channels=["ratios"], user_id="u1")                    # todos sus clientes
+    hub.subscribe(u1c1, channels=["ratios"], user_id="u1", client_id="c1")
+    hub.subscribe(u2, channels=["ratios", "ticks"], user_id="u2")
+    ratio = {"type": "ratio", "base_symbol": "A", "quote_symbol": "B"}
+    assert set(hub.targets(ratio, owner=("u1", "c1"))) == {u1, u1c1}
+    assert hub.targets(ratio, owner=("u1", "c2")) == [u1]
+    assert hub.targets(ratio, owner=("u2", "default")) == [u2]
+    assert hub.targets(ratio) == []                       # sin dueño no se difunde
+    assert hub.subscription(u1c1)["client_id"] == "c1"
+    # Sin user_id el canal ratios se rechaza
+    try:
+        hub.subscribe(legacy, channels=["ratios"])
+        raise AssertionError("debió fallar")
+    except ValueError:
+        pass
+
+    async def run():
+        hub2 = WSHub()
+        a, b = SlowWS(), SlowWS()
+        for ws, user in ((a, "u1"), (b, "u2")):
+            hub2.add(ws)
+            hub2.subscribe(ws, channels=["ratios"], user_id=user)
+            hub2.start_writer(ws)
+        hub2.publish({"type": "ratio", "base_symbol": "A", "quote_symbol": "B", "mid_ratio": 1.5},
+                     owner=("u1", "default"))
+        await asyncio.sleep(0.05)
+        return a, b
+
+    a, b = asyncio.run(run())
+    assert b.sent == [] and len(a.sent) == 1
+    assert "user_id" not in a.sent[0] and "client_id" not in a.sent[0]
+    print("✅ Ratios acotados por user_id/client_id y sin identidad en el payload")
+
+
+def test_reduccion_fanout():
+    """100 conexiones, 20 instrumentos, 2 por conexión: ~10x menos envíos."""
+    symbols = [f"S{i}" for i in range(20)]
+    hub = WSHub()
+    for i in range(100):
+        ws = FakeWS(f"c{i}")
+        hub.add(ws)
+        hub.subscribe(ws, [symbols[i % 20], symbols[(i + 1) % 20]], ["ticks"])
+
+    ticks = [_tick(symbols[i % 20]) for i in range(2000)]
+    t0 = time.perf_counter()
+    sent = sum(len(hub.targets(t)) for t in ticks)
+    elapsed = time.perf_counter() - t0
+    antes = 100 * len(ticks)
+    assert sent * 10 <= antes, (sent, antes)
+    print(f"✅ Envíos: {sent} vs {antes} sin filtro ({antes / sent:.0f}x menos), "
+          f"{elapsed / len(ticks) * 1e6:.1f} µs por tick")
+
+
+def _run_hub(policy, max_queue, n_ticks, symbols=("X",)):
+    """Publica n_ticks desde otro hilo hacia un cliente rápido y uno bloqueado."""
+    async def run():
+        hub = WSHub(max_queue=max_queue, slow_policy=policy)
+        gate = asyncio.Event()
+        fast, slow = SlowWS(), SlowWS(gate=gate)
+        for ws in (fast, slow):
+            hub.add(ws)
+            hub.start_writer(ws)
+
+        def productor():
+            for i in range(n_ticks):
+                hub.publish({"type": "tick", "symbol": symbols[i % len(symbols)], "i": i})
+                time.sleep(0.0005)  # ritmo que el cliente rápido puede seguir
+
+        t = threading.Thread(target=productor)
+        t.start()
+        await asyncio.get_running_loop().run_in_executor(None, t.join)
+        await asyncio.sleep(0.05)
+        gate.set()
+        await asyncio.sleep(0.05)
+        return hub, fast, slow
+
+    return asyncio.run(run())
+
+
+def test_cola_acotada_drop_oldest():
+    """El cliente lento no frena al rápido ni acumula más de max_queue."""
+    hub, fast, slow = _run_hub(DROP_OLDEST, max_queue=10, n_ticks=200)
+    assert len(fast.sent) == 200
+    assert [m["i"] for m in slow.sent][-10:] == list(range(190, 200))
+    assert len(slow.sent) <= 11  # el que estaba en vuelo + la cola
+    st = hub.stats()
+    assert st["published"] == 200 and st["dropped"] >= 189
+    print(f"✅ drop_oldest: lento recibió {len(slow.sent)}/200, descartes={st['dropped']}")
+
+
+def test_cola_conflate():
+    """Con conflate el lento recibe el último estado de cada símbolo."""
+    hub, fast, slow = _run_hub(CONFLATE, max_queue=10, n_ticks=300, symbols=("X", "Y", "Z"))
+    assert len(fast.sent) == 300
+    last = {}
+    for m in slow.sent:
+        last[m["symbol"]] = m["i"]
+    assert last == {"X": 297, "Y": 298, "Z": 299}, last
+    assert len(slow.sent) <= 4
+    assert hub.stats()["conflated"] > 0
+    print(f"✅ conflate: lento recibió {len(slow.sent)} mensajes con el último estado por símbolo")
+
+
+def test_cola_disconnect():
+    hub, fast, slow = _run_hub(DISCONNECT, max_queue=5, n_ticks=50)
+    assert len(fast.sent) == 50
+    assert slow.closed and slow.closed[0] == 1013
+    assert len(hub) == 1 and hub.stats()["slow_disconnects"] == 1
+    print("✅ disconnect: cliente lento desconectado")
+
+
+def test_conflacion_por_tasa():
+    """Ráfaga de 1000 ticks en ~0.5 s a 10 Hz: pocos envíos por símbolo y el último siempre llega."""
+    async def run():
+        hub = WSHub()
+        ws = SlowWS()
+        hub.add(ws)
+        hub.start_writer(ws)
+        hub.set_conflation(ws, 10)
+
+        def productor():
+            for i in range(1000):
+                hub.publish({"type": "tick", "symbol": "XY"[i % 2], "i": i})
+                time.sleep(0.0005)
+
+        t = threading.Thread(target=productor)
+        t.start()
+        await asyncio.get_running_loop().run_in_executor(None, t.join)
+        await asyncio.sleep(0.25)  # dejar vencer el último intervalo
+        return hub, ws
+
+    hub, ws = asyncio.run(run())
+    por_simbolo = {"X": [], "Y": []}
+    for m in ws.sent:
+        por_simbolo[m["symbol"]].append(m["i"])
+    for sym, ids in por_simbolo.items():
+        assert ids == sorted(ids)
+        assert len(ids) <= 12, (sym, len(ids))
+    assert por_simbolo["X"][-1] == 998 and por_simbolo["Y"][-1] == 999
+    print(f"✅ Conflación 10 Hz: {len(ws.sent)} envíos para 1000 ticks, último estado entregado")
+
+
+def _full_tick(sym, seq, **campos):
+    t = {"type": "tick", "symbol": sym, "bid": 100.0, "bid_size": 10, "offer": 100.5,
+         "offer_size": 12, "last": 100.2, "last_size": 1, "cl": 99.0, "op": 99.5,
+         "ts_ms": 1000 + seq, "seq": seq}
+    t.update(campos)
+    return t
+
+
+def test_tick_delta():
+    prev = _full_tick("X", 1)
+    d = tick_delta(prev, _full_tick("X", 2, bid=100.1))
+    assert d == {"type": "tick_delta", "symbol": "X", "seq": 2, "ts_ms": 1002, "bid": 100.1}
+    assert tick_delta(prev, _full_tick("X", 3)) is None   # hueco: va completo
+    assert tick_delta(None, prev) is None
+    print("✅ tick_delta OK")
+
+
+def test_modo_delta_reconstruye_estado():
+    """Un cliente delta (snapshot + deltas) termina con el mismo estado que uno full."""
+    async def run():
+        hub = WSHub()
+        full_ws, delta_ws = SlowWS(), SlowWS()
+        for ws in (full_ws, delta_ws):
+            hub.add(ws)
+            hub.start_writer(ws)
+        hub.publish(_full_tick("X", 1))
+        await asyncio.sleep(0.01)
+
+        hub.subscribe(full_ws, ["X"], ["ticks"])
+        hub.subscribe(delta_ws, ["X"], ["ticks"], mode="delta")
+        assert hub.send_snapshot(delta_ws) == 1
+        for seq in range(2, 200):
+            hub.publish(_full_tick("X", seq, bid=100.0 + (seq % 3) * 0.1, last_size=seq))
+        await asyncio.sleep(0.05)
+        return full_ws, delta_ws
+
+    full_ws, delta_ws = asyncio.run(run())
+    estado, ultimo_seq = {}, None
+    for m in delta_ws.sent:
+        if m["type"] == "tick":
+            estado = {k: v for k, v in m.items() if k not in ("type", "snapshot")}
+        else:
+            assert m["seq"] == ultimo_seq + 1
+            estado.update({k: v for k, v in m.items() if k != "type"})
+        ultimo_seq = m["seq"]
+    esperado = {k: v for k, v in full_ws.sent[-1].items() if k != "type"}
+    assert estado == esperado, (estado, esperado)
+
+    bytes_full = sum(len(json.dumps(m)) for m in full_ws.sent)
+    bytes_delta = sum(len(json.dumps(m)) for m in delta_ws.sent)
+    assert bytes_delta < bytes_full * 0.6, (bytes_delta, bytes_full)
+    print(f"✅ Delta: {bytes_delta} vs {bytes_full} bytes ({bytes_delta / bytes_full:.0%}) con el mismo estado final")
+
+
+def test_snapshot_al_suscribir_sin_huecos_ni_duplicados():
+    """Suscripción en medio del flujo: snapshot del cache y luego seq consecutivas."""
+    async def run():
+        hub = WSHub()
+        ws = SlowWS()
+        hub.add(ws)
+        hub.start_writer(ws)
+        cache, lock = {}, threading.Lock()
+        listo = threading.Event()
+
+        def productor():
+            for seq in range(1, 3001):
+                for sym in ("X", "Y"):
+                    with lock:  # como _handle_md: primero el cache, después la difusión
+                        cache[sym] = {"bid": float(seq), "timestamp": seq, "seq": seq}
+                    hub.publish(_full_tick(sym, seq, bid=float(seq)))
+                if seq == 500:
+                    listo.set()
+
+        t = threading.Thread(target=productor)
+        t.start()
+        await asyncio.get_running_loop().run_in_executor(None, listo.wait)
+        hub.subscribe(ws, ["X", "Y"], ["ticks"])
+        with lock:
+            snap = {k: dict(v) for k, v in cache.items()}
+        assert hub.send_snapshot(ws, None, snap) == 2
+        await asyncio.get_running_loop().run_in_executor(None, t.join)
+        await asyncio.sleep(0.1)
+        return hub, ws
+
+    hub, ws = asyncio.run(run())
+    por_simbolo = {"X": [], "Y": []}
+    for m in ws.sent:
+        seqs = por_simbolo[m["symbol"]]
+        if m.get("snapshot"):
+            seqs.clear()  # lo anterior llegó sin filtro (conexión sin subscribe)
+        seqs.append((m["seq"], m.get("snapshot", False)))
+    for sym, seqs in por_simbolo.items():
+        assert seqs[0][1] is True, seqs[:3]
+        nums = [n for n, _ in seqs]
+        assert nums == list(range(nums[0], 3001)), (sym, nums[:5])
+    print(f"✅ Snapshot en seq {por_simbolo['X'][0][0]}/{por_simbolo['Y'][0][0]}, "
+          f"luego consecutivas hasta 3000 (duplicados descartados: {hub.stats()['skipped']})")
+
+
+def test_piso_de_seq_se_reinicia():
+    """Tras clear()/nueva sesión el cache vuelve a seq 1: no se descartan ticks nuevos."""
+    async def run():
+        hub = WSHub()
+        ws = SlowWS()
+        hub.add(ws)
+        hub.start_writer(ws)
+        hub.subscribe(ws, ["X", "Y"], ["ticks"])
+        for seq in range(1, 51):
+            hub.publish(_full_tick("X", seq, bid=float(seq)))
+        await asyncio.sleep(0.05)
+        assert hub.send_snapshot(ws, None, {"X": {"bid": 50.0, "seq": 50}, "Y": {"bid": 1.0, "seq": 40}}) == 2
+        # Sesión nueva: X vuelve a numerar desde 1
+        for seq in range(1, 4):
+            hub.publish(_full_tick("X", seq, bid=100.0 + seq))
+        # Y: resync con el cache vacío (clear) descarta el piso de 40
+        assert hub.send_snapshot(ws, ["Y"], {}) == 0
+        hub.publish(_full_tick("Y", 1, bid=2.0))
+        await asyncio.sleep(0.1)
+        return ws
+
+    ws = asyncio.run(run())
+    vivos = [(m["symbol"], m["seq"]) for m in ws.sent if not m.get("snapshot")]
+    assert vivos[-4:] == [("X", 1), ("X", 2), ("X", 3), ("Y", 1)], vivos[-6:]
+    print("✅ Piso de seq reiniciado con el resync y al volver a numerar el cache")
+
+
+def test_delta_rechaza_limite_de_tasa():
+    """Los deltas no pasan por la conflación: pedir max_rate_hz en modo delta es un error."""
+    def rechaza(fn, *a, **kw):
+        try:
+            fn(*a, **kw)
+        except ValueError:
+            return
+        raise AssertionError(f"{fn.__name__} {a} {kw} debió fallar")
+
+    async def run():
+        hub = WSHub()
+        ws = SlowWS()
+        hub.add(ws)
+        hub.start_writer(ws)
+        hub.subscribe(ws, ["X"], ["ticks"], mode="delta")
+        rechaza(hub.set_conflation, ws, 10)
+        assert hub.set_conflation(ws, 0) == 0
+        hub.subscribe(ws, ["X"], ["ticks"], mode="full", max_rate_hz=10)
+        rechaza(hub.subscribe, ws, ["Y"], ["ticks"], mode="delta")
+        rechaza(hub.subscribe, ws, ["Y"], ["ticks"], mode="delta", max_rate_hz=5)
+        # El rechazo no deja la suscripción a medias
+        assert hub.subscription(ws)["mode"] == "full" and hub.subscription(ws)["symbols"] == ["X"]
+        assert hub.subscribe(ws, ["Y"], ["ticks"], mode="delta", max_rate_hz=0)["mode"] == "delta"
+
+        # Con conflación por defecto del hub, delta exige max_rate_hz=0 explícito
+        hub = WSHub(conflate_hz=5)
+        ws = SlowWS()
+        hub.add(ws)
+        hub.start_writer(ws)
+        rechaza(hub.subscribe, ws, ["X"], ["ticks"], mode="delta")
+        assert hub.subscribe(ws, ["X"], ["ticks"], mode="delta", max_rate_hz=0)["mode"] == "delta"
+
+    asyncio.run(run())
+    print("✅ Modo delta con max_rate_hz rechazado sin tocar la suscripción")
+
+
+if __name__ == "__main__":
+    test_legacy_recibe_todo()
+    test_filtrado_por_simbolo_y_canal()
+    test_limite_y_canal_invalido()
+    test_ratios_acotados_por_usuario()
+    test_reduccion_fanout()
+    test_cola_acotada_drop_oldest()
+    test_cola_conflate()
+    test_cola_disconnect()
+    test_conflacion_por_tasa()
+    test_tick_delta()
+    test_modo_delta_reconstruye_estado()
+    test_snapshot_al_suscribir_sin_huecos_ni_duplicados()
+    test_piso_de_seq_se_reinicia()
+    test_delta_rechaza_limite_de_tasa()
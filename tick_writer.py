@@ -0,0 +1,194 @@
+# tick_writer.py
+# Etapa de persistencia de ticks desacoplada del callback de pyRofex.
+# - _handle_md solo encola (O(1), no bloquea)
+# - Un hilo flusher inserta en lote por tamaño o por tiempo
+# - Cola acotada con política de descarte y contadores
+
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+PRINT_PREFIX = "[tick_writer]"
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+
+class TickWriter:
+    """Escritor de ticks en lote con cola acotada.
+
+    insert_batch(rows) debe devolver algo truthy si el lote se guardó y None si falló.
+    """
+
+    def __init__(
+        self,
+        insert_batch: Callable[[List[Dict[str, Any]]], Any],
+        *,
+        max_queue: int = 10000,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        drop_policy: str = DROP_OLDEST,
+        max_consecutive_failures: int = 3,
+    ) -> None:
+        self._insert_batch = insert_batch
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max_queue)
+        self.max_queue = max_queue
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+        self.max_consecutive_failures = max_consecutive_failures
+
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._disabled = False
+        self._consecutive_failures = 0
+        self._stats = {
+            "enqueued": 0,
+            "dropped": 0,
+            "written": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "failed_rows": 0,
+            "last_batch_size": 0,
+            "last_batch_ms": None,
+            "last_flush_at": None,
+        }
+
+    # ------------------------------ Control ---------------------------------
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="tick-writer", daemon=True)
+        self._thread.start()
+        print(f"{PRINT_PREFIX} Iniciado (batch={self.batch_size}, intervalo={self.flush_interval}s, cola={self.max_queue})")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Detiene el flusher y vacía lo pendiente antes de salir."""
+        self._stop_event.set()
+        t = self._thread
+        if t and t.is_alive():
+            t.join(timeout=timeout)
+            if t.is_alive():
+                print(f"{PRINT_PREFIX} Flusher no terminó en {timeout}s")
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    # ------------------------------- Entrada --------------------------------
+    def submit(self, row: Dict[str, Any]) -> bool:
+        """Encola un tick sin bloquear. Devuelve False si se descartó."""
+        if self._disabled:
+            return False
+        try:
+            self._queue.put_nowait(row)
+            self._incr("enqueued")
+            return True
+        except queue.Full:
+            pass
+
+        if self.drop_policy == DROP_OLDEST:
+            # Liberar el más viejo y reintentar una vez
+            try:
+                self._queue.get_nowait()
+                self._incr("dropped")
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait(row)
+                self._incr("enqueued")
+                return True
+            except queue.Full:
+                pass
+        self._incr("dropped")
+        return False
+
+    # ------------------------------- Flusher --------------------------------
+    def _drain(self, first: Dict[str, Any]) -> List[Dict[str, Any]]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _drain_nowait(self) -> List[Dict[str, Any]]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            self._flush(self._drain(first))
+
+        # Flush final al detener
+        while True:
+            batch = self._drain_nowait()
+            if not batch:
+                break
+            self._flush(batch)
+
+    def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        if self._disabled:
+            self._incr("dropped", len(batch))
+            return
+        t0 = time.perf_counter()
+        try:
+            result = self._insert_batch(batch)
+        except Exception as e:
+            print(f"{PRINT_PREFIX} fallo insert lote: {e}")
+            result = None
+        elapsed_ms = (time.perf_counter() - t0) * 1000.0
+
+        with self._stats_lock:
+            self._stats["last_batch_size"] = len(batch)
+            self._stats["last_batch_ms"] = round(elapsed_ms, 2)
+            self._stats["last_flush_at"] = time.time()
+            if result is None:
+                self._stats["failed_batches"] += 1
+                self._stats["failed_rows"] += len(batch)
+                self._consecutive_failures += 1
+            else:
+                self._stats["batches"] += 1
+                self._stats["written"] += len(batch)
+                self._consecutive_failures = 0
+
+        if result is None and self._consecutive_failures >= self.max_consecutive_failures:
+            # Igual que antes: si la tabla no existe o la DB falla de forma sostenida, desactivar
+            self._disabled = True
+            print(f"{PRINT_PREFIX} {self._consecutive_failures} lotes fallidos seguidos, desactivando guardado de ticks")
+
+    # -------------------------------- Stats ---------------------------------
+    def _incr(self, key: str, n: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self._stats)
+        out["queue_size"] = self._queue.qsize()
+        out["queue_max"] = self.max_queue
+        out["drop_policy"] = self.drop_policy
+        out["running"] = self.is_running()
+        out["disabled"] = self._disabled
+        return out
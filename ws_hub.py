@@ -0,0 +1,716 @@
+# ws_hub.py
+# Registro de conexiones de /ws/cotizaciones con suscripciones por conexión.
+# - Canales: ticks, order_reports, ratios
+# - Índice símbolo -> conexiones para que un tick solo vaya a quien lo pidió
+# - Conexiones que nunca enviaron subscribe reciben ticks y order reports (compatibilidad)
+# - Ratios solo para quien se suscribe explícitamente al canal, con su user_id
+#   (y opcionalmente client_id); el mensaje no lleva la identidad del dueño
+# - Cada mensaje se serializa una vez; cada conexión tiene una cola acotada
+#   que vacía una única tarea escritora, con política para clientes lentos
+# - Modo delta: snapshot completo al suscribir y luego solo campos cambiados,
+#   con seq por símbolo para que el cliente detecte huecos y pida resync
+# - Snapshot al suscribir desde el cache de cotizaciones; los ticks en vivo con
+#   seq <= seq del snapshot se descartan (ni huecos ni duplicados); el piso se
+#   reinicia con cada resync y cuando el cache vuelve a numerar (clear / nueva sesión)
+
+from __future__ import annotations
+
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from collections.abc import Mapping
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+PRINT_PREFIX = "[ws_hub]"
+
+CHANNELS = ("ticks", "order_reports", "ratios")
+# Canales de las conexiones sin subscribe y de un subscribe sin "channels"
+DEFAULT_CHANNELS = ("ticks", "order_reports")
+
+# Políticas ante cola llena (cliente lento)
+DROP_OLDEST = "drop_oldest"
+CONFLATE = "conflate"
+DISCONNECT = "disconnect"
+POLICIES = (DROP_OLDEST, CONFLATE, DISCONNECT)
+
+# Protocolo de ticks por conexión
+MODE_FULL = "full"
+MODE_DELTA = "delta"
+MODES = (MODE_FULL, MODE_DELTA)
+
+# Campos de estado de un tick que viajan en el delta solo si cambiaron
+DELTA_FIELDS = ("bid", "bid_size", "offer", "offer_size", "last", "last_size", "cl", "op")
+
+# type del mensaje -> canal
+_CHANNEL_BY_TYPE = {
+    "tick": "ticks",
+    "order_report": "order_reports",
+    "ratio": "ratios",
+}
+
+
+class _Outbox:
+    """Cola acotada de mensajes ya serializados de una conexión (solo desde el event loop).
+
+    Con CONFLATE, un mensaje con la misma clave (p.ej. tick de un símbolo) reemplaza
+    al pendiente en su lugar: el cliente recibe el último estado, no los intermedios.
+
+    Con rate_hz > 0 cada clave sale a lo sumo rate_hz veces por segundo; lo que llega
+    antes queda como "último estado" diferido y se libera al vencer el intervalo.
+    """
+
+    __slots__ = ("maxsize", "policy", "rate_hz", "on_full", "_items", "_by_key", "_event",
+                 "_next_at", "_deferred", "_timers", "closed",
+                 "enqueued", "sent", "dropped", "conflated", "skipped", "send_errors", "max_depth")
+
+    def __init__(self, maxsize: int, policy: str, rate_hz: float = 0.0) -> None:
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.rate_hz = max(0.0, float(rate_hz or 0))
+        self.on_full: Optional[Callable[[], None]] = None  # DISCONNECT al liberar un diferido
+        self._items: deque = deque()           # slots [clave, texto]
+        self._by_key: Dict[Any, list] = {}     # clave -> slot pendiente
+        self._event = asyncio.Event()
+        self._next_at: Dict[Any, float] = {}   # clave -> próximo envío permitido (loop.time)
+        self._deferred: Dict[Any, str] = {}    # clave -> último texto retenido por tasa
+        self._timers: Dict[Any, asyncio.TimerHandle] = {}
+        self.closed = False
+        self.enqueued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.skipped = 0
+        self.send_errors = 0
+        self.max_depth = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, text: str, key: Any = None) -> bool:
+        """Encola; False si la cola está llena y la política es DISCONNECT."""
+        if self.closed:
+            return True
+        self.enqueued += 1
+        if self.rate_hz and key is not None:
+            loop = asyncio.get_running_loop()
+            now = loop.time()
+            due = self._next_at.get(key, 0.0)
+            if now < due:
+                if key in self._deferred:
+                    self.conflated += 1
+                self._deferred[key] = text
+                if key not in self._timers:
+                    self._timers[key] = loop.call_at(due, self._release, key)
+                return True
+            self._next_at[key] = now + 1.0 / self.rate_hz
+        return self._enqueue(text, key)
+
+    def _release(self, key: Any) -> None:
+        """Vence el intervalo de la clave: encola el último estado retenido."""
+        self._timers.pop(key, None)
+        text = self._deferred.pop(key, None)
+        if text is None or self.closed:
+            return
+        self._next_at[key] = asyncio.get_running_loop().time() + 1.0 / self.rate_hz
+        if not self._enqueue(text, key) and self.on_full is not None:
+            self.on_full()
+
+    def set_rate(self, rate_hz: float) -> None:
+        self.rate_hz = max(0.0, float(rate_hz or 0))
+        if not self.rate_hz:
+            # Sin límite: liberar lo retenido ya mismo
+            for key in list(self._timers):
+                self._timers.pop(key).cancel()
+                text = self._deferred.pop(key, None)
+                if text is not None:
+                    self._enqueue(text, key)
+            self._next_at.clear()
+
+    def _enqueue(self, text: str, key: Any) -> bool:
+        conflate = (self.policy == CONFLATE or self.rate_hz > 0) and key is not None
+        if conflate:
+            slot = self._by_key.get(key)
+            if slot is not None:
+                slot[1] = text
+                self.conflated += 1
+                return True
+        if len(self._items) >= self.maxsize:
+            self.dropped += 1
+            if self.policy == DISCONNECT:
+                return False
+            self._pop()
+        slot = [key if conflate else None, text]
+        self._items.append(slot)
+        if conflate:
+            self._by_key[key] = slot
+        if len(self._items) > self.max_depth:
+            self.max_depth = len(self._items)
+        self._event.set()
+        return True
+
+    def _pop(self) -> str:
+        slot = self._items.popleft()
+        if slot[0] is not None and self._by_key.get(slot[0]) is slot:
+            del self._by_key[slot[0]]
+        return slot[1]
+
+    async def get(self) -> Optional[str]:
+        """Próximo mensaje; None cuando la cola se cerró."""
+        while not self._items:
+            if self.closed:
+                return None
+            self._event.clear()
+            await self._event.wait()
+        return self._pop()
+
+    def close(self) -> None:
+        self.closed = True
+        self._items.clear()
+        self._by_key.clear()
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        self._deferred.clear()
+        self._event.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._items),
+            "deferred": len(self._deferred),
+            "max_queue": self.maxsize,
+            "max_rate_hz": self.rate_hz,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "skipped": self.skipped,
+            "send_errors": self.send_errors,
+        }
+
+
+class _Conn:
+    __slots__ = ("ws", "symbols", "all_symbols", "channels", "subscribed", "connected_at",
+                 "outbox", "writer", "mode", "seq_floor", "scope")
+
+    def __init__(self, ws: Any) -> None:
+        self.ws = ws
+        self.symbols: Set[str] = set()
+        self.all_symbols = False
+        self.channels: Set[str] = set()
+        self.subscribed = False
+        self.connected_at = time.time()
+        self.outbox: Optional[_Outbox] = None
+        self.writer: Optional[asyncio.Task] = None
+        self.mode = MODE_FULL
+        self.seq_floor: Dict[str, int] = {}  # símbolo -> seq del snapshot enviado
+        self.scope: Optional[tuple] = None   # (user_id, client_id o None) para el canal ratios
+
+
+def _norm_symbols(symbols: Optional[Iterable[str]]) -> List[str]:
+    if not symbols:
+        return []
+    if isinstance(symbols, str):
+        symbols = [symbols]
+    return [str(s).strip() for s in symbols if str(s).strip()]
+
+
+def _norm_channels(channels: Optional[Iterable[str]]) -> List[str]:
+    if not channels:
+        return []
+    if isinstance(channels, str):
+        channels = [channels]
+    out = []
+    for c in channels:
+        c = str(c).strip().lower()
+        if c not in CHANNELS:
+            raise ValueError(f"canal desconocido: {c} (disponibles: {', '.join(CHANNELS)})")
+        out.append(c)
+    return out
+
+
+def _norm_rate(max_rate_hz: Any) -> float:
+    rate = float(max_rate_hz or 0)
+    if rate < 0:
+        raise ValueError("max_rate_hz debe ser >= 0")
+    return rate
+
+
+def _check_delta_rate(mode: str, rate: float) -> None:
+    """Los deltas no se conflacionan (perder uno es un hueco de seq): no admiten límite de tasa."""
+    if mode == MODE_DELTA and rate > 0:
+        raise ValueError("el modo delta no admite max_rate_hz > 0 (usar mode full para conflación)")
+
+
+def message_symbols(message: Dict[str, Any]) -> List[str]:
+    """Símbolos a los que pertenece un mensaje (vacío = no filtra por símbolo)."""
+    sym = message.get("symbol")
+    if sym:
+        return [sym]
+    return [s for s in (message.get("base_symbol"), message.get("quote_symbol")) if s]
+
+
+def tick_delta(prev: Optional[Dict[str, Any]], tick: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Delta de tick respecto del anterior del mismo símbolo.
+
+    None si no hay anterior o las secuencias no son consecutivas (va el tick completo).
+    El cliente aplica un delta solo si seq == su seq + 1; si no, pide resync.
+    """
+    seq = tick.get("seq")
+    if prev is None or seq is None or prev.get("seq") is None or seq != prev["seq"] + 1:
+        return None
+    delta = {"type": "tick_delta", "symbol": tick.get("symbol"), "seq": seq, "ts_ms": tick.get("ts_ms")}
+    for f in DELTA_FIELDS:
+        v = tick.get(f)
+        if v != prev.get(f):
+            delta[f] = v
+    return delta
+
+
+def quote_to_tick(symbol: str, quote: Dict[str, Any]) -> Dict[str, Any]:
+    """Entrada de quotes_cache -> mensaje tick (mismo formato que _handle_md)."""
+    tick = {"type": "tick", "symbol": symbol}
+    for f in DELTA_FIELDS:
+        tick[f] = quote.get(f)
+    tick["ts_ms"] = quote.get("timestamp", quote.get("ts_ms"))
+    tick["seq"] = quote.get("seq")
+    return tick
+
+
+def conflation_key(message: Dict[str, Any], owner: Optional[tuple] = None) -> Optional[tuple]:
+    """Clave de estado "último gana": ticks por símbolo y ratios por par y dueño."""
+    mtype = message.get("type")
+    if mtype == "tick" and message.get("symbol"):
+        return ("tick", message["symbol"])
+    if mtype == "ratio" and message.get("base_symbol"):
+        return ("ratio", message.get("base_symbol"), message.get("quote_symbol"), owner)
+    return None
+
+
+def _scope_matches(scope: Optional[tuple], owner: Optional[tuple]) -> bool:
+    """¿La conexión (user_id, client_id|None) puede ver un ratio de owner (user_id, client_id)?"""
+    if scope is None or owner is None or scope[0] is None:
+        return False
+    if str(scope[0]) != str(owner[0]):
+        return False
+    return scope[1] is None or str(scope[1]) == str(owner[1])
+
+
+class WSHub:
+    """Conexiones WebSocket y sus suscripciones (símbolos + canales)."""
+
+    def __init__(self, max_connections: int = 100, max_queue: int = 1000,
+                 slow_policy: str = DROP_OLDEST, conflate_hz: float = 0.0) -> None:
+        if slow_policy not in POLICIES:
+            raise ValueError(f"política desconocida: {slow_policy} (disponibles: {', '.join(POLICIES)})")
+        self.max_connections = max_connections
+        self.max_queue = max_queue
+        self.slow_policy = slow_policy
+        self.conflate_hz = conflate_hz  # tasa máxima por símbolo por defecto (0 = sin límite)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._counters = {"published": 0, "encoded_bytes": 0, "deliveries": 0, "slow_disconnects": 0}
+        self._lock = threading.Lock()
+        self._conns: Dict[int, _Conn] = {}           # id(ws) -> conexión
+        self._legacy: Set[int] = set()                # sin subscribe: reciben todo
+        self._by_symbol: Dict[str, Set[int]] = {}     # símbolo -> conexiones
+        self._all_symbols: Set[int] = set()           # suscriptas a "*"
+        self._by_channel: Dict[str, Set[int]] = {c: set() for c in CHANNELS}
+        self._last_tick: Dict[str, Dict[str, Any]] = {}  # símbolo -> último tick completo
+
+    # ------------------------------ Conexiones ------------------------------
+    def add(self, ws: Any) -> bool:
+        """Registra una conexión; False si se alcanzó el límite."""
+        with self._lock:
+            if len(self._conns) >= self.max_connections:
+                return False
+            key = id(ws)
+            if key not in self._conns:
+                self._conns[key] = _Conn(ws)
+                self._legacy.add(key)
+            return True
+
+    def start_writer(self, ws: Any) -> None:
+        """Crea la cola y la tarea escritora de la conexión (llamar desde el event loop)."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            conn = self._conns.get(id(ws))
+            if conn is None or conn.writer is not None:
+                return
+            self._loop = loop
+            conn.outbox = _Outbox(self.max_queue, self.slow_policy, self.conflate_hz)
+            conn.outbox.on_full = lambda: self._slow(conn)
+            conn.writer = loop.create_task(self._writer(conn))
+
+    def set_conflation(self, ws: Any, max_rate_hz: float) -> float:
+        """Modo conflación de la conexión: a lo sumo max_rate_hz envíos por símbolo (0 = apagado).
+
+        Llamar desde el event loop.
+        """
+        rate = _norm_rate(max_rate_hz)
+        with self._lock:
+            conn = self._conns.get(id(ws))
+        if conn is None or conn.outbox is None:
+            raise KeyError("conexión no registrada")
+        _check_delta_rate(conn.mode, rate)
+        conn.outbox.set_rate(rate)
+        return conn.outbox.rate_hz
+
+    def remove(self, ws: Any) -> None:
+        with self._lock:
+            conn = self._conns.pop(id(ws), None)
+            if conn is not None:
+                self._unindex(id(ws), conn)
+        if conn is not None:
+            self._close_outbox(conn)
+
+    def _close_outbox(self, conn: _Conn) -> None:
+        if conn.outbox is None or self._loop is None:
+            return
+        try:
+            self._loop.call_soon_threadsafe(conn.outbox.close)
+        except RuntimeError:
+            pass  # loop cerrado
+
+    def clear(self) -> None:
+        with self._lock:
+            conns = list(self._conns.values())
+            self._conns.clear()
+            self._legacy.clear()
+            self._by_symbol.clear()
+            self._all_symbols.clear()
+            for s in self._by_channel.values():
+                s.clear()
+        for conn in conns:
+            self._close_outbox(conn)
+
+    def __len__(self) -> int:
+        return len(self._conns)
+
+    def websockets(self) -> List[Any]:
+        with self._lock:
+            return [c.ws for c in self._conns.values()]
+
+    # ----------------------------- Suscripciones ----------------------------
+    def subscribe(self, ws: Any, symbols: Optional[Iterable[str]] = None,
+                  channels: Optional[Iterable[str]] = None, mode: Optional[str] = None,
+                  user_id: Optional[str] = None, client_id: Optional[str] = None,
+                  max_rate_hz: Optional[float] = None) -> Dict[str, Any]:
+        """Agrega símbolos/canales. "*" = todos los símbolos; sin canales = DEFAULT_CHANNELS.
+
+        El primer subscribe sin símbolos equivale a "*". El canal "ratios" hay que pedirlo
+        explícitamente y requiere user_id: solo llegan los ratios de ese usuario (y de
+        client_id, si se indica). max_rate_hz como en set_conflation; el modo delta
+        no admite límite de tasa (ValueError).
+        """
+        syms = _norm_symbols(symbols)
+        chans = _norm_channels(channels) or list(DEFAULT_CHANNELS)
+        if mode is not None and mode not in MODES:
+            raise ValueError(f"modo desconocido: {mode} (disponibles: {', '.join(MODES)})")
+        rate = _norm_rate(max_rate_hz) if max_rate_hz is not None else None
+        with self._lock:
+            key = id(ws)
+            conn = self._conns.get(key)
+            if conn is None:
+                raise KeyError("conexión no registrada")
+            if rate is not None and conn.outbox is None:
+                raise KeyError("conexión no registrada")
+            current_rate = conn.outbox.rate_hz if conn.outbox is not None else self.conflate_hz
+            _check_delta_rate(mode or conn.mode, current_rate if rate is None else rate)
+            if rate is not None:
+                conn.outbox.set_rate(rate)
+            if user_id:
+                conn.scope = (str(user_id), str(client_id) if client_id else None)
+            if "ratios" in chans and conn.scope is None:
+                raise ValueError("el canal ratios requiere user_id")
+            if mode is not None:
+                conn.mode = mode
+            if not syms and not conn.symbols:
+                syms = ["*"]
+            if not conn.subscribed:
+                conn.subscribed = True
+                self._legacy.discard(key)
+            for c in chans:
+                conn.channels.add(c)
+                self._by_channel[c].add(key)
+            for s in syms:
+                if s == "*":
+                    conn.all_symbols = True
+                    self._all_symbols.add(key)
+                elif s not in conn.symbols:
+                    conn.symbols.add(s)
+                    self._by_symbol.setdefault(s, set()).add(key)
+            return self._describe(conn)
+
+    def unsubscribe(self, ws: Any, symbols: Optional[Iterable[str]] = None,
+                    channels: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Quita símbolos y/o canales. Sin argumentos quita todo (queda sin recibir datos)."""
+        syms = _norm_symbols(symbols)
+        chans = _norm_channels(channels)
+        with self._lock:
+            key = id(ws)
+            conn = self._conns.get(key)
+            if conn is None:
+                raise KeyError("conexión no registrada")
+            if not conn.subscribed:
+                conn.subscribed = True
+                self._legacy.discard(key)
+                if not syms and not chans:
+                    return self._describe(conn)
+                # Pasa de "todo" a explícito: partir de los canales por defecto y todos los símbolos
+                conn.channels = set(DEFAULT_CHANNELS)
+                conn.all_symbols = True
+                self._all_symbols.add(key)
+                for c in DEFAULT_CHANNELS:
+                    self._by_channel[c].add(key)
+            if not syms and not chans:
+                self._unindex(key, conn)
+                conn.symbols.clear()
+                conn.channels.clear()
+                conn.all_symbols = False
+                return self._describe(conn)
+            for c in chans:
+                conn.channels.discard(c)
+                self._by_channel[c].discard(key)
+            for s in syms:
+                if s == "*":
+                    conn.all_symbols = False
+                    self._all_symbols.discard(key)
+                elif s in conn.symbols:
+                    conn.symbols.discard(s)
+                    self._drop_symbol(s, key)
+            return self._describe(conn)
+
+    def subscription(self, ws: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._conns.get(id(ws))
+            return self._describe(conn) if conn else None
+
+    # ------------------------------- Fan-out --------------------------------
+    def targets(self, message: Dict[str, Any], owner: Optional[tuple] = None) -> List[Any]:
+        """Conexiones interesadas en el mensaje (usa el índice por símbolo)."""
+        return [c.ws for c in self._target_conns(message, owner)]
+
+    def publish(self, message: Dict[str, Any], owner: Optional[tuple] = None) -> int:
+        """Difunde desde cualquier hilo: serializa una vez y encola en cada conexión.
+
+        owner = (user_id, client_id) del ratio: solo lo reciben las conexiones con ese
+        scope (el mensaje no debe incluir la identidad). Devuelve la cantidad de destinos.
+        """
+        prev = None
+        renumbered = False
+        if message.get("type") == "tick" and message.get("symbol"):
+            with self._lock:
+                prev = self._last_tick.get(message["symbol"])
+                self._last_tick[message["symbol"]] = message
+            # seq que no avanza: el cache volvió a numerar (clear o nueva sesión)
+            seq, prev_seq = message.get("seq"), prev.get("seq") if prev else None
+            renumbered = seq is not None and prev_seq is not None and seq <= prev_seq
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return 0
+        if renumbered:
+            try:
+                loop.call_soon_threadsafe(self._reset_floors, message["symbol"])
+            except RuntimeError:
+                return 0  # loop cerrado
+        conns = [c for c in self._target_conns(message, owner) if c.outbox is not None]
+        if not conns:
+            return 0
+
+        full, delta = conns, []
+        if message.get("type") == "tick":
+            delta = [c for c in conns if c.mode == MODE_DELTA]
+            if delta:
+                full = [c for c in conns if c.mode != MODE_DELTA]
+
+        text = json.dumps(message)
+        key = conflation_key(message, owner)
+        sym, seq = (message.get("symbol"), message.get("seq")) if message.get("type") == "tick" else (None, None)
+        batches = []
+        if full:
+            batches.append((full, text, key, sym, seq))
+        if delta:
+            d = tick_delta(prev, message)
+            # Los deltas no se conflacionan: perder uno es un hueco de seq (resync)
+            batches.append((delta, json.dumps(d) if d is not None else text, None, sym, seq))
+        with self._lock:
+            self._counters["published"] += 1
+            self._counters["deliveries"] += len(conns)
+            for b in batches:
+                self._counters["encoded_bytes"] += len(b[1])
+        try:
+            for b in batches:
+                loop.call_soon_threadsafe(self._deliver, *b)
+        except RuntimeError:
+            return 0  # loop cerrado
+        return len(conns)
+
+    def send_snapshot(self, ws: Any, symbols: Optional[Iterable[str]] = None,
+                      quotes: Optional[Dict[str, Dict[str, Any]]] = None) -> int:
+        """Encola el estado completo de cada símbolo (subscribe / resync).
+
+        quotes es una copia de quotes_cache (get_snapshot()); sin ella se usa el último
+        tick difundido. Sin símbolos usa los de la suscripción (o todos los conocidos).
+        Desde acá los ticks en vivo con seq <= al del snapshot no se envían a la conexión.
+        Llamar desde el event loop y después de subscribe (para no dejar huecos).
+        """
+        with self._lock:
+            conn = self._conns.get(id(ws))
+            if conn is None or conn.outbox is None:
+                raise KeyError("conexión no registrada")
+            if quotes is None:
+                source = dict(self._last_tick)
+            else:
+                source = {s: quote_to_tick(s, q) for s, q in quotes.items() if isinstance(q, Mapping)}
+            syms = _norm_symbols(symbols)
+            if "*" in syms or (not syms and (conn.all_symbols or not conn.subscribed)):
+                syms = sorted(source)
+            elif not syms:
+                syms = sorted(conn.symbols)
+            ticks = [source[s] for s in syms if s in source]
+        # El piso anterior no sirve si el cache volvió a numerar: lo define este snapshot
+        for sym in syms:
+            conn.seq_floor.pop(sym, None)
+        for tick in ticks:
+            if tick.get("seq") is not None:
+                conn.seq_floor[tick["symbol"]] = tick["seq"]
+            conn.outbox.put(json.dumps({**tick, "snapshot": True}), None)
+        return len(ticks)
+
+    def _reset_floors(self, symbol: str) -> None:
+        """Corre en el event loop: olvida el seq del snapshot de symbol en todas las conexiones."""
+        with self._lock:
+            conns = list(self._conns.values())
+        for conn in conns:
+            conn.seq_floor.pop(symbol, None)
+
+    def _deliver(self, conns: List[_Conn], text: str, key: Any,
+                 symbol: Optional[str] = None, seq: Optional[int] = None) -> None:
+        """Corre en el event loop: reparte el texto ya serializado a las colas."""
+        for conn in conns:
+            outbox = conn.outbox
+            if outbox is None or outbox.closed:
+                continue
+            if seq is not None:
+                floor = conn.seq_floor.get(symbol)
+                if floor is not None and seq <= floor:
+                    outbox.skipped += 1  # ya incluido en el snapshot
+                    continue
+            if not outbox.put(text, key):
+                self._slow(conn)
+
+    def _slow(self, conn: _Conn) -> None:
+        conn.outbox.close()
+        asyncio.ensure_future(self._disconnect_slow(conn))
+
+    async def _writer(self, conn: _Conn) -> None:
+        """Única tarea que escribe en el socket: vacía la cola en orden."""
+        outbox = conn.outbox
+        try:
+            while True:
+                text = await outbox.get()
+                if text is None:
+                    break
+                await conn.ws.send_text(text)
+                outbox.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            outbox.send_errors += 1
+            print(f"{PRINT_PREFIX} error enviando, se quita la conexión: {e}")
+            self.remove(conn.ws)
+
+    async def _disconnect_slow(self, conn: _Conn) -> None:
+        with self._lock:
+            self._counters["slow_disconnects"] += 1
+        print(f"{PRINT_PREFIX} cliente lento (cola llena con {self.max_queue}), desconectando")
+        self.remove(conn.ws)
+        try:
+            await conn.ws.close(code=1013, reason="Slow consumer")
+        except Exception:
+            pass
+
+    def _target_conns(self, message: Dict[str, Any], owner: Optional[tuple] = None) -> List[_Conn]:
+        channel = _CHANNEL_BY_TYPE.get(message.get("type"))
+        with self._lock:
+            if channel is None:
+                return list(self._conns.values())
+            keys = set(self._legacy) if channel in DEFAULT_CHANNELS else set()
+            in_channel = self._by_channel[channel]
+            if channel == "ratios":
+                in_channel = {k for k in in_channel if _scope_matches(self._conns[k].scope, owner)}
+            if in_channel:
+                syms = message_symbols(message) if channel != "order_reports" else []
+                if syms:
+                    cand = set(self._all_symbols)
+                    for s in syms:
+                        idx = self._by_symbol.get(s)
+                        if idx:
+                            cand |= idx
+                    keys |= cand & in_channel
+                else:
+                    keys |= in_channel
+            conns = self._conns
+            return [conns[k] for k in keys if k in conns]
+
+    # -------------------------------- Estado --------------------------------
+    def connection_stats(self, ws: Any) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            conn = self._conns.get(id(ws))
+            if conn is None:
+                return None
+            out = self._describe(conn)
+            if conn.outbox is not None:
+                out["queue"] = conn.outbox.stats()
+            return out
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            totals = {"queued": 0, "sent": 0, "dropped": 0, "conflated": 0, "skipped": 0, "send_errors": 0}
+            for conn in self._conns.values():
+                if conn.outbox is not None:
+                    st = conn.outbox.stats()
+                    for k in totals:
+                        totals[k] += st[k]
+            return {
+                "connections": len(self._conns),
+                "max_connections": self.max_connections,
+                "max_queue": self.max_queue,
+                "slow_policy": self.slow_policy,
+                "conflate_hz": self.conflate_hz,
+                "legacy": len(self._legacy),
+                "symbols_indexed": len(self._by_symbol),
+                "by_channel": {c: len(s) for c, s in self._by_channel.items()},
+                **self._counters,
+                **totals,
+            }
+
+    # ------------------------------- Internos -------------------------------
+    def _describe(self, conn: _Conn) -> Dict[str, Any]:
+        if not conn.subscribed:
+            return {"symbols": ["*"], "channels": list(DEFAULT_CHANNELS), "filtered": False}
+        syms = sorted(conn.symbols)
+        if conn.all_symbols:
+            syms = ["*"] + syms
+        out = {"symbols": syms, "channels": [c for c in CHANNELS if c in conn.channels],
+               "filtered": True, "mode": conn.mode}
+        if conn.scope is not None:
+            out["user_id"], out["client_id"] = conn.scope
+        return out
+
+    def _drop_symbol(self, symbol: str, key: int) -> None:
+        idx = self._by_symbol.get(symbol)
+        if idx is not None:
+            idx.discard(key)
+            if not idx:
+                del self._by_symbol[symbol]
+
+    def _unindex(self, key: int, conn: _Conn) -> None:
+        self._legacy.discard(key)
+        self._all_symbols.discard(key)
+        for s in conn.symbols:
+            self._drop_symbol(s, key)
+        for c in CHANNELS:
+            self._by_channel[c].discard(key)
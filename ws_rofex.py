@@ -2,12 +2,10 @@ from __future__ import annotations
 import time
 import threading
 import json
-from typing import Any, Dict, Iterable, Optional, Tuple
+import os
+from typing import Any, Dict, Iterable, Optional
 
-try:
-    from quotes_cache import quotes_cache
-except ImportError:
-    quotes_cache = {}
+from quotes_cache import quotes_cache
 
 try:
     from params_store import set_last_params
@@ -44,11 +42,29 @@ class SimpleBroadcaster:
 
 broadcaster = SimpleBroadcaster()
 
-_guardar_tick = None
+from tick_writer import TickWriter, DROP_OLDEST
+from order_report_store import OrderReportStore, unwrap_report
+from md_parser import MDParser
+from depth_book import DepthBook, MD_DEPTH_LEVELS
+from md_recorder import MDRecorder, MD_RECORD_DIR, KIND_MD, KIND_OR
+from md_replay import MDReplay
+
+# Persistencia de ticks en lote (fuera del hilo de pyRofex)
+TICKS_TABLE          = "ticks"
+TICKS_QUEUE_MAX      = int(os.getenv("TICKS_QUEUE_MAX", "10000"))
+TICKS_BATCH_SIZE     = int(os.getenv("TICKS_BATCH_SIZE", "500"))
+TICKS_FLUSH_SECONDS  = float(os.getenv("TICKS_FLUSH_SECONDS", "1.0"))
+TICKS_DROP_POLICY    = os.getenv("TICKS_DROP_POLICY", DROP_OLDEST)
+
+_insertar_ticks = None
 try:
-    from supabase_client import guardar_en_supabase as _guardar_tick
+    from supabase_client import guardar_lote as _guardar_lote
+
+    def _insertar_ticks(rows):
+        """Inserta un lote de ticks en una sola request."""
+        return _guardar_lote(TICKS_TABLE, rows)
 except Exception:
-    print(f"{PRINT_PREFIX} supabase_client.guardar_en_supabase no disponible; no se guardarán ticks en DB.")
+    print(f"{PRINT_PREFIX} supabase_client.guardar_lote no disponible; no se guardarán ticks en DB.")
 
 # Callback opcional para difundir ticks a otros componentes (p.ej. WebSocket HTTP)
 _broadcast_callback = None  # type: Optional[callable]
@@ -58,89 +74,22 @@ def set_broadcast_callback(callback):
     global _broadcast_callback
     _broadcast_callback = callback
 
-def _first_price_and_size(levels: Any) -> Tuple[Optional[float], Optional[float]]:
-    if not levels:
-        return None, None
-    if isinstance(levels, dict):
-        price = levels.get("price") or levels.get("p")
-        size = levels.get("size") or levels.get("s")
-        try:
-            return float(price) if price else None, float(size) if size else None
-        except Exception:
-            return None, None
-    if isinstance(levels, list):
-        first = levels[0]
-        if isinstance(first, dict):
-            price = first.get("price") or first.get("p")
-            size = first.get("size") or first.get("s")
-            try:
-                return float(price) if price else None, float(size) if size else None
-            except Exception:
-                return None, None
-    return None, None
-
-def _extract_symbol(message: Dict[str, Any]) -> Optional[str]:
-    inst = message.get("instrumentId")
-    if isinstance(inst, dict) and "symbol" in inst:
-        return inst["symbol"]
-    return message.get("symbol")
-
-def _extract_ts(message: Dict[str, Any]) -> int:
-    for k in ("timestamp", "ts", "mdTimestamp", "time"):
-        v = message.get(k)
-        if isinstance(v, (int, float)):
-            if v < 10_000_000_000:
-                return int(v * 1000)
-            return int(v)
-    return int(time.time() * 1000)
-
-def _extract_levels(message: Dict[str, Any]):
-    md = message.get("marketData") or message.get("md") or message
-    bids = md.get("BI") or md.get("bids") or md.get("bid")
-    offs = md.get("OF") or md.get("offers") or md.get("ask") or md.get("offer")
-    last = md.get("LA") or md.get("last")
-    b_price, b_size = _first_price_and_size(bids)
-    a_price, a_size = _first_price_and_size(offs)
-    l_price, l_size = _first_price_and_size(last)
-    return (b_price, b_size), (a_price, a_size), (l_price, l_size)
-
-def _extract_closing_price(message: Dict[str, Any]) -> Optional[float]:
-    """Intenta extraer el precio de cierre de la rueda anterior.
-    Soporta varias claves posibles según la fuente del mensaje.
-    """
-    md = message.get("marketData") or message.get("md") or message
-    for key in ("CL", "cl", "closingPrice", "previousClose", "prev_close"):
-        v = md.get(key)
-        try:
-            if v is None:
-                continue
-            # Puede venir como dict {"price": x}
-            if isinstance(v, dict):
-                vp = v.get("price") or v.get("p")
-                return float(vp) if vp is not None else None
-            # O valor directo
-            return float(v)
-        except Exception:
-            continue
-    return None
-
-def _extract_opening_price(message: Dict[str, Any]) -> Optional[float]:
-    """Intenta extraer el precio de apertura de la rueda actual.
-    Acepta claves comunes: OP/op/openPrice/open.
-    """
-    md = message.get("marketData") or message.get("md") or message
-    for key in ("OP", "op", "openPrice", "open"):
-        v = md.get(key)
-        try:
-            if v is None:
-                continue
-            if isinstance(v, dict):
-                vp = v.get("price") or v.get("p")
-                return float(vp) if vp is not None else None
-            return float(v)
-        except Exception:
-            continue
-    return None
+# Listeners de ticks dentro del proceso (p.ej. ratios_worker en modo eventos).
+# Se invocan en el hilo de pyRofex: deben ser O(1) y no bloquear.
+_tick_listeners: list = []
+_listeners_lock = threading.Lock()
+
+def add_tick_listener(callback):
+    """Registra un callback(tick: dict) que se llama con cada tick."""
+    global _tick_listeners
+    with _listeners_lock:
+        if callback not in _tick_listeners:
+            _tick_listeners = _tick_listeners + [callback]
+
+def remove_tick_listener(callback):
+    global _tick_listeners
+    with _listeners_lock:
+        _tick_listeners = [cb for cb in _tick_listeners if cb is not callback]
 
 class MarketDataManager:
     def __init__(self) -> None:
@@ -153,6 +102,26 @@ class MarketDataManager:
         self._last_params: Optional[Dict[str, Any]] = None
         # Order reports buffer
         self._last_order_report: Optional[Dict[str, Any]] = None
+        # Índice de order reports por client order id (historial + espera por orden)
+        self._order_reports = OrderReportStore()
+        # Esquema de market data detectado por conexión
+        self._md_parser = MDParser()
+        # Escritor de ticks en lote (None si no hay DB)
+        self._tick_writer: Optional[TickWriter] = None
+        if _insertar_ticks:
+            self._tick_writer = TickWriter(
+                _insertar_ticks,
+                max_queue=TICKS_QUEUE_MAX,
+                batch_size=TICKS_BATCH_SIZE,
+                flush_interval=TICKS_FLUSH_SECONDS,
+                drop_policy=TICKS_DROP_POLICY,
+            )
+        # Grabación del feed crudo (None si MD_RECORD_DIR no está configurado)
+        self._recorder: Optional[MDRecorder] = MDRecorder(MD_RECORD_DIR) if MD_RECORD_DIR else None
+        # Replay de una grabación en lugar de pyRofex (None en sesión real)
+        self._replay: Optional[MDReplay] = None
+        # Solo se guardan en DB los ticks de una sesión pyRofex real (no replay ni simulador)
+        self._persist_ticks = True
 
     def start(
         self,
@@ -162,7 +131,17 @@ class MarketDataManager:
         account: str,
         instrumentos: Iterable[str],
         force_ws: bool = True,
+        pyrofex: Any = None,
     ):
+        """Conecta con pyRofex; `pyrofex` permite inyectar otro módulo con la misma interfaz
+        (p.ej. broker_simulator.BrokerSimulator) para pruebas sin conexión."""
+        # Sesión real: cortar un replay en curso. Se desengancha con el lock y se detiene
+        # fuera de él, porque el hilo del replay toma el lock en _handle_or.
+        with self._lock:
+            anterior, self._replay = self._replay, None
+        if anterior:
+            anterior.stop()
+
         with self._lock:
             # Guardar parámetros para restart
             params = {
@@ -171,23 +150,29 @@ class MarketDataManager:
                 "account": account,
                 "instrumentos": list(instrumentos)
             }
-            self._last_params = params
+            # El módulo inyectado no se persiste, pero sí se reutiliza en restart_last
+            self._last_params = {**params, "pyrofex": pyrofex} if pyrofex is not None else params
             set_last_params(params)
             
-            try:
-                import pyRofex as pr
-                self._pyrofex = pr
-                
-                # Deshabilitar verificación SSL para macOS
-                import ssl
-                import urllib3
-                urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-                ssl._create_default_https_context = ssl._create_unverified_context
-                print(f"{PRINT_PREFIX} SSL verification disabled for macOS")
-                
-            except Exception as e:
-                print(f"{PRINT_PREFIX} No se pudo importar pyRofex: {e}")
-                return {"status": "error", "error": "pyRofex not available", "ws": "disabled"}
+            self._persist_ticks = pyrofex is None
+            if pyrofex is not None:
+                self._pyrofex = pyrofex
+                print(f"{PRINT_PREFIX} Usando {type(pyrofex).__name__} en lugar de pyRofex")
+            else:
+                try:
+                    import pyRofex as pr
+                    self._pyrofex = pr
+                    
+                    # Deshabilitar verificación SSL para macOS
+                    import ssl
+                    import urllib3
+                    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+                    ssl._create_default_https_context = ssl._create_unverified_context
+                    print(f"{PRINT_PREFIX} SSL verification disabled for macOS")
+                    
+                except Exception as e:
+                    print(f"{PRINT_PREFIX} No se pudo importar pyRofex: {e}")
+                    return {"status": "error", "error": "pyRofex not available", "ws": "disabled"}
 
             self.user = user
 
@@ -201,9 +186,21 @@ class MarketDataManager:
                 print(f"{PRINT_PREFIX} Error inicializando pyRofex con LIVE: {e}")
                 return {"status": "error", "error": str(e), "ws": "disabled"}
 
+            # Conexión nueva: re-detectar el esquema de market data
+            self._md_parser.reset()
+
+            recorder = self._recorder
+
             def md_handler(msg: Dict[str, Any]):
+                if recorder:
+                    recorder.record(KIND_MD, msg)
                 self._handle_md(msg)
 
+            def or_handler(msg: Dict[str, Any]):
+                if recorder:
+                    recorder.record(KIND_OR, msg)
+                self._handle_or(msg)
+
             def error_handler(msg):
                 print(f"{PRINT_PREFIX} Error Message Received: {msg}")
 
@@ -220,7 +217,7 @@ class MarketDataManager:
                 # Inicializar WebSocket siguiendo el ejemplo oficial con contexto SSL
                 self._pyrofex.init_websocket_connection(
                     market_data_handler=md_handler,
-                    order_report_handler=self._handle_or,
+                    order_report_handler=or_handler,
                     error_handler=error_handler,
                     exception_handler=exception_handler,
                     ssl_context=ssl_context
@@ -242,7 +239,7 @@ class MarketDataManager:
                     print(f"{PRINT_PREFIX} Intentando sin contexto SSL...")
                     self._pyrofex.init_websocket_connection(
                         market_data_handler=md_handler,
-                        order_report_handler=self._handle_or,
+                        order_report_handler=or_handler,
                         error_handler=error_handler,
                         exception_handler=exception_handler
                     )
@@ -262,6 +259,11 @@ class MarketDataManager:
 
             self._subscribe_many(instrumentos)
 
+            if self._tick_writer and self._persist_ticks:
+                self._tick_writer.start()
+            if self._recorder:
+                self._recorder.start()
+
             return {
                 "status": "started",
                 "user_id": self.user,
@@ -269,13 +271,62 @@ class MarketDataManager:
                 "ws": "ok" if self._ws_open else "disabled",
             }
 
+    def start_replay(self, *, path: str, speed: Any = 1.0, instrumentos: Iterable[str] = (), user: str = "replay"):
+        """Alimenta el manager con una grabación (md_recorder) en lugar de pyRofex.
+
+        Los ticks recorren el mismo camino que en vivo (cache, listeners, difusión) pero no se
+        guardan en DB ni se vuelven a grabar.
+        """
+        with self._lock:
+            if self._ws_open:
+                return {"status": "error", "error": "Hay una sesión pyRofex activa; detenerla antes del replay"}
+            anterior, self._replay = self._replay, None
+        # Fuera del lock: el join del replay anterior no debe bloquear al manager
+        if anterior:
+            anterior.stop()
+        with self._lock:
+            if self._ws_open:
+                return {"status": "error", "error": "Hay una sesión pyRofex activa; detenerla antes del replay"}
+            try:
+                replay = MDReplay(self, path, speed=speed, symbols=instrumentos)
+            except (OSError, ValueError) as e:
+                return {"status": "error", "error": str(e), "ws": "disabled"}
+            self.user = user
+            self._subscribed = set(instrumentos)
+            self._md_parser.reset()
+            self._persist_ticks = False
+            self._replay = replay
+            replay.start()
+            return {
+                "status": "started",
+                "source": "replay",
+                "user_id": self.user,
+                "instruments": list(instrumentos),
+                "replay": {"path": path, "files": len(replay.files), "speed": replay.speed},
+                "ws": "disabled",
+            }
+
+    def wait_replay(self, timeout: Optional[float] = None) -> bool:
+        replay = self._replay
+        return replay.wait(timeout) if replay else True
+
     def stop(self):
         with self._lock:
             if self._pyrofex and self._ws_open:
                 self._pyrofex.close_websocket_connection()
             self._ws_open = False
             self._subscribed.clear()
-            return {"status": "stopped", "ws": "disabled"}
+            replay, self._replay = self._replay, None
+        # Fuera del lock: el flush final puede tardar lo que tarde la DB
+        if self._tick_writer:
+            self._tick_writer.stop()
+        if self._recorder:
+            self._recorder.stop()
+        result = {"status": "stopped", "ws": "disabled"}
+        if replay:
+            replay.stop()
+            result["replay"] = replay.stats()
+        return result
 
     def restart_last(self):
         """Reinicia con los últimos parámetros usados"""
@@ -297,6 +348,12 @@ class MarketDataManager:
                 "last_md_ms": self.last_marketdata_at_ms,
                 "subscribers": broadcaster.subscribers(),
                 "last_order_report": self._last_order_report,
+                "order_reports": self._order_reports.stats(),
+                "md_parser": self._md_parser.stats(),
+                "tick_writer": self._tick_writer.stats() if self._tick_writer else None,
+                "md_recorder": self._recorder.stats() if self._recorder else None,
+                "source": "replay" if self._replay else "rofex",
+                "replay": self._replay.stats() if self._replay else None,
             }
 
     def _subscribe_many(self, instrumentos: Iterable[str]):
@@ -312,31 +369,32 @@ class MarketDataManager:
         for sym in instrumentos:
             if sym not in self._subscribed:
                 try:
-                    self._pyrofex.market_data_subscription(tickers=[sym], entries=entries)
+                    self._pyrofex.market_data_subscription(tickers=[sym], entries=entries, depth=MD_DEPTH_LEVELS)
                     self._subscribed.add(sym)
                     print(f"{PRINT_PREFIX} Suscripto {sym}")
                 except Exception as e:
                     print(f"{PRINT_PREFIX} Error al suscribir {sym}: {e}")
 
     def _handle_md(self, message: Dict[str, Any]):
-        global _guardar_tick  # Declarar global al inicio
-        
-        symbol = _extract_symbol(message)
-        if not symbol:
+        rec = self._md_parser.parse(message)
+        if rec is None:
             return
-        (bid_p, bid_sz), (ask_p, ask_sz), (last_p, last_sz) = _extract_levels(message)
-        ts_ms = _extract_ts(message)
-        cl_price = _extract_closing_price(message)
-        op_price = _extract_opening_price(message)
+        symbol, bid_p, bid_sz, ask_p, ask_sz, last_p, last_sz, cl_price, op_price, ts_ms, bids, offers = rec
         self.last_marketdata_at_ms = ts_ms
-        quotes_cache[symbol] = {
-            "bid": bid_p, "bid_size": bid_sz,
-            "offer": ask_p, "offer_size": ask_sz,
-            "last": last_p, "last_size": last_sz,
-            "cl": cl_price,
-            "op": op_price,
-            "timestamp": ts_ms,
-        }
+        # Libro completo (niveles del mismo recorrido del parser) antes que la cotización:
+        # quien lee la cotización nueva ya ve su libro
+        quotes_cache.set_depth(DepthBook.from_levels(symbol, bids, offers, MD_DEPTH_LEVELS, ts_ms))
+        # El store asigna la seq por símbolo (detecta huecos en clientes delta)
+        quote = quotes_cache.set(
+            symbol,
+            bid=bid_p, bid_size=bid_sz,
+            offer=ask_p, offer_size=ask_sz,
+            last=last_p, last_size=last_sz,
+            cl=cl_price,
+            op=op_price,
+            ts_ms=ts_ms,
+        )
+        seq = quote.seq
 
         # Construir payload de tick estandarizado para difusión
         tick = {
@@ -351,53 +409,48 @@ class MarketDataManager:
             "cl": cl_price,
             "op": op_price,
             "ts_ms": ts_ms,
+            "seq": seq,
         }
 
+        # Notificar listeners internos (lista copy-on-write: se lee sin lock)
+        for listener in _tick_listeners:
+            try:
+                listener(tick)
+            except Exception as e:
+                print(f"{PRINT_PREFIX} error en tick listener: {e}")
+
         # Difundir a clientes internos (si hay callback registrado)
         try:
             if _broadcast_callback:
                 _broadcast_callback(tick)
         except Exception as e:
             print(f"{PRINT_PREFIX} error broadcast tick: {e}")
-        if _guardar_tick:
-            try:
-                # Solo guardar si la tabla existe y hay datos válidos
-                if symbol and (bid_p is not None or ask_p is not None or last_p is not None):
-                    tick_data = {
-                        "symbol": symbol, 
-                        "bid": bid_p, 
-                        "offer": ask_p, 
-                        "last": last_p, 
-                        "cl": cl_price,
-                        "op": op_price,
-                        "ts_ms": ts_ms,
-                        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")
-                    }
-                    # Intentar guardar pero no fallar si la tabla no existe
-                    result = _guardar_tick("ticks", tick_data)
-                    if result is None:
-                        # La tabla no existe, desactivar guardado
-                        print(f"{PRINT_PREFIX} Tabla 'ticks' no existe, desactivando guardado de ticks")
-                        # Desactivar guardado para futuras llamadas
-                        _guardar_tick = None
-            except Exception as e:
-                print(f"{PRINT_PREFIX} fallo insert: {e}")
-                # Desactivar guardado en caso de error
-                _guardar_tick = None
+
+        # Persistencia: solo encolar; el TickWriter inserta en lote en su propio hilo
+        writer = self._tick_writer if self._persist_ticks else None
+        if writer and (bid_p is not None or ask_p is not None or last_p is not None):
+            writer.submit({
+                "symbol": symbol,
+                "bid": bid_p,
+                "offer": ask_p,
+                "last": last_p,
+                "cl": cl_price,
+                "op": op_price,
+                "ts_ms": ts_ms,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            })
 
     def _handle_or(self, message: Dict[str, Any]):
         """Order Report handler: guarda último reporte."""
         try:
             with self._lock:
                 self._last_order_report = message
-            
-            # Log del order report para debugging
-            client_order_id = (message.get("wsClOrdId") or 
-                             message.get("clOrdId") or 
-                             message.get("clientId") or 
-                             message.get("client_order_id"))
+
+            # Indexar por client order id y despertar a quien espere esta orden
+            client_order_id = self._order_reports.add(message)
             if client_order_id:
-                print(f"{PRINT_PREFIX} Order report recibido - Client Order ID: {client_order_id}, Status: {message.get('status', 'N/A')}")
+                report = unwrap_report(message)
+                print(f"{PRINT_PREFIX} Order report recibido - Client Order ID: {client_order_id}, Status: {report.get('status', 'N/A')}")
             
             # Difundir order report a interesados (vía callback genérico)
             try:
@@ -483,6 +536,24 @@ class MarketDataManager:
                 else:
                     return {"status": "error", "message": error_msg}
 
+    def cancel_order(self, client_order_id: str, proprietary: Optional[str] = None) -> Dict[str, Any]:
+        """Cancela una orden por su client order id (usa el clOrdId del broker si ya hay reporte)."""
+        with self._lock:
+            if not self._pyrofex or not self._ws_open:
+                return {"status": "error", "message": "ws_not_connected"}
+            report = self._order_reports.get(str(client_order_id)) or {}
+            cl_ord_id = str(report.get("clOrdId") or client_order_id)
+            try:
+                kwargs = {"client_order_id": cl_ord_id}
+                if proprietary:
+                    kwargs["proprietary"] = proprietary
+                self._pyrofex.cancel_order_via_websocket(**kwargs)
+                print(f"{PRINT_PREFIX} Cancelación enviada: {client_order_id} ({cl_ord_id})")
+                return {"status": "ok", "client_order_id": cl_ord_id}
+            except Exception as e:
+                print(f"{PRINT_PREFIX} Error cancelando orden {client_order_id}: {e}")
+                return {"status": "error", "message": str(e)}
+
     def check_and_reconnect(self) -> Dict[str, Any]:
         """Verifica la conexión y reconecta si es necesario"""
         with self._lock:
@@ -510,4 +581,22 @@ class MarketDataManager:
     def last_order_report(self) -> Optional[Dict[str, Any]]:
         with self._lock:
             return self._last_order_report
+
+    def order_report(self, client_order_id: str) -> Optional[Dict[str, Any]]:
+        """Último reporte de una orden puntual (no el último global)."""
+        return self._order_reports.get(client_order_id)
+
+    def order_report_history(self, client_order_id: str) -> list:
+        return self._order_reports.history(client_order_id)
+
+    async def wait_order_report(self, client_order_id: str, timeout: float = 5.0,
+                                statuses: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+        """Espera (sin polling) un reporte de la orden; None si vence el timeout."""
+        return await self._order_reports.wait_for(client_order_id, timeout, statuses)
+
+    def add_order_report_listener(self, callback) -> None:
+        self._order_reports.add_listener(callback)
+
+    def remove_order_report_listener(self, callback) -> None:
+        self._order_reports.remove_listener(callback)
 manager = MarketDataManager()
\ No newline at end of file